@@ -0,0 +1,48 @@
+"""add ingestion_templates
+
+Revision ID: 3c1f0a7d9b42
+Revises: fc7dfb5a56c7
+Create Date: 2026-03-02 10:14:05.112840
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f0a7d9b42'
+down_revision: Union[str, None] = 'fc7dfb5a56c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ingestion_templates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('file_type', sa.String(), nullable=False),
+        sa.Column('header_fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('headers', sa.JSON(), nullable=False),
+        sa.Column('column_mapping', sa.JSON(), nullable=False),
+        sa.Column('dtypes', sa.JSON(), nullable=False),
+        sa.Column('date_formats', sa.JSON(), nullable=False),
+        sa.Column('use_count', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('tenant_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('tenant_id', 'file_type', 'header_fingerprint', name='uq_ingestion_templates_layout'),
+    )
+    op.create_index(op.f('ix_ingestion_templates_id'), 'ingestion_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_ingestion_templates_tenant_id'), 'ingestion_templates', ['tenant_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ingestion_templates_tenant_id'), table_name='ingestion_templates')
+    op.drop_index(op.f('ix_ingestion_templates_id'), table_name='ingestion_templates')
+    op.drop_table('ingestion_templates')
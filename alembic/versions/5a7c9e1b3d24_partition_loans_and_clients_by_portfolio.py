@@ -0,0 +1,123 @@
+"""partition loans and clients by portfolio
+
+Revision ID: 5a7c9e1b3d24
+Revises: 8d2e4b6a1f03
+Create Date: 2026-03-16 11:02:48.390517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7c9e1b3d24'
+down_revision: Union[str, None] = '8d2e4b6a1f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# table -> (foreign keys, indexes) recreated on the new table
+TABLES = {
+    'loans': (
+        [
+            ('loans_portfolio_id_fkey', 'portfolio_id', 'portfolios(id) ON DELETE CASCADE'),
+            ('loans_subscription_id_fkey', 'subscription_id', 'tenant_subscriptions(id)'),
+            ('loans_tenant_id_fkey', 'tenant_id', 'tenants(id) ON DELETE CASCADE'),
+        ],
+        [
+            ('ix_loans_id', ['id']),
+            ('ix_loans_loan_no', ['loan_no']),
+            ('ix_loans_tenant_id', ['tenant_id']),
+            ('ix_loans_portfolio_id_id', ['portfolio_id', 'id']),
+            ('ix_loans_portfolio_id_employee_id', ['portfolio_id', 'employee_id']),
+            ('ix_loans_portfolio_id_ifrs9_stage', ['portfolio_id', 'ifrs9_stage']),
+        ],
+    ),
+    'clients': (
+        [
+            ('clients_portfolio_id_fkey', 'portfolio_id', 'portfolios(id) ON DELETE CASCADE'),
+            ('clients_tenant_id_fkey', 'tenant_id', 'tenants(id) ON DELETE CASCADE'),
+        ],
+        [
+            ('ix_clients_id', ['id']),
+            ('ix_clients_last_name', ['last_name']),
+            ('ix_clients_search_name', ['search_name']),
+            ('ix_clients_tenant_id', ['tenant_id']),
+            ('ix_clients_portfolio_id_employee_id', ['portfolio_id', 'employee_id']),
+        ],
+    ),
+}
+
+# portfolio_id is NOT NULL on the partitioned tables; downgrade restores the previous setting
+PORTFOLIO_ID_NULLABLE = {'loans': True, 'clients': False}
+
+# clients.id is no longer unique on its own, so these FKs cannot be kept
+CLIENT_REFERENCES = [
+    ('securities', 'securities_client_id_fkey', 'ix_securities_client_id'),
+    ('other_loans', 'other_loans_client_id_fkey', 'ix_other_loans_client_id'),
+]
+
+
+def _rebuild(table: str, partitioned: bool) -> None:
+    """Recreate ``table`` (partitioned by portfolio or plain) and copy its rows across."""
+    foreign_keys, indexes = TABLES[table]
+    old = f'{table}_old'
+
+    op.execute(f'ALTER TABLE {table} RENAME TO {old}')
+    if partitioned:
+        op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY LIST (portfolio_id)')
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+        # One partition per existing portfolio
+        op.execute(f"""
+            DO $$
+            DECLARE pid integer;
+            BEGIN
+                FOR pid IN SELECT id FROM portfolios LOOP
+                    EXECUTE format('CREATE TABLE %I PARTITION OF {table} FOR VALUES IN (%s)', '{table}_p' || pid, pid);
+                END LOOP;
+            END $$;
+        """)
+        # Rows without a portfolio cannot be placed in a partition (and were unreachable anyway)
+        op.execute(f'INSERT INTO {table} SELECT * FROM {old} WHERE portfolio_id IS NOT NULL')
+    else:
+        op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)')
+        op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    op.execute(f'DROP TABLE {old} CASCADE')
+
+    if partitioned or not PORTFOLIO_ID_NULLABLE[table]:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN portfolio_id SET NOT NULL')
+    else:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN portfolio_id DROP NOT NULL')
+    primary_key = '(id, portfolio_id)' if partitioned else '(id)'
+    op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY {primary_key}')
+    for name, column, target in foreign_keys:
+        op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {target}')
+    for name, columns in indexes:
+        op.create_index(name, table, columns, unique=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, constraint, index in CLIENT_REFERENCES:
+        op.drop_constraint(constraint, table, type_='foreignkey')
+        op.create_index(index, table, ['client_id'], unique=False)
+
+    _rebuild('loans', partitioned=True)
+    _rebuild('clients', partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rebuild('clients', partitioned=False)
+    _rebuild('loans', partitioned=False)
+
+    for table, constraint, index in CLIENT_REFERENCES:
+        # Without the FK, re-ingesting a portfolio could leave rows pointing at replaced
+        # clients; they are unreachable and would block the constraint
+        op.execute(f'DELETE FROM {table} t WHERE NOT EXISTS (SELECT 1 FROM clients c WHERE c.id = t.client_id)')
+        op.drop_index(index, table_name=table)
+        op.create_foreign_key(constraint, table, 'clients', ['client_id'], ['id'])
@@ -0,0 +1,45 @@
+"""add portfolio-scoped composite indexes
+
+Revision ID: 8d2e4b6a1f03
+Revises: 3c1f0a7d9b42
+Create Date: 2026-03-09 09:41:27.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e4b6a1f03'
+down_revision: Union[str, None] = '3c1f0a7d9b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (index name, table, columns) - every hot query filters by portfolio_id first
+INDEXES = [
+    ('ix_loans_portfolio_id_id', 'loans', ['portfolio_id', 'id']),
+    ('ix_loans_portfolio_id_employee_id', 'loans', ['portfolio_id', 'employee_id']),
+    ('ix_loans_portfolio_id_ifrs9_stage', 'loans', ['portfolio_id', 'ifrs9_stage']),
+    ('ix_clients_portfolio_id_employee_id', 'clients', ['portfolio_id', 'employee_id']),
+    ('ix_quality_issues_portfolio_id_issue_type_status', 'quality_issues', ['portfolio_id', 'issue_type', 'status']),
+    ('ix_staging_results_portfolio_id_type_created_at', 'staging_results', ['portfolio_id', 'staging_type', 'created_at']),
+    ('ix_calculation_results_portfolio_id_type_created_at', 'calculation_results', ['portfolio_id', 'calculation_type', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction; building this way keeps loans writable
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
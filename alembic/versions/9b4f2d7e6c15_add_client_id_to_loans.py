@@ -0,0 +1,42 @@
+"""add client_id to loans
+
+Revision ID: 9b4f2d7e6c15
+Revises: 5a7c9e1b3d24
+Create Date: 2026-03-18 09:41:12.208734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4f2d7e6c15'
+down_revision: Union[str, None] = '5a7c9e1b3d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('loans', sa.Column('client_id', sa.Integer(), nullable=True))
+
+    # Backfill from the (employee_id, portfolio_id) match the relationship used to join on
+    op.execute("""
+        UPDATE loans SET client_id = c.id
+        FROM (
+            SELECT portfolio_id, employee_id, min(id) AS id FROM clients
+            WHERE employee_id IS NOT NULL
+            GROUP BY portfolio_id, employee_id
+        ) c
+        WHERE loans.portfolio_id = c.portfolio_id AND loans.employee_id = c.employee_id
+    """)
+
+    op.create_index('ix_loans_portfolio_id_client_id', 'loans', ['portfolio_id', 'client_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_loans_portfolio_id_client_id', table_name='loans')
+    op.drop_column('loans', 'client_id')
@@ -0,0 +1,33 @@
+"""add report content keys
+
+Revision ID: a9d4e7b2c315
+Revises: f7a3d5c1e820
+Create Date: 2026-03-26 11:42:18.504113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4e7b2c315'
+down_revision: Union[str, None] = 'f7a3d5c1e820'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('portfolios', sa.Column('report_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('reports', sa.Column('content_key', sa.String(length=64), nullable=True))
+    op.create_index('uq_reports_content_key_live', 'reports', ['content_key'], unique=True,
+                    postgresql_where=sa.text("status <> 'failed'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_reports_content_key_live', table_name='reports')
+    op.drop_column('reports', 'content_key')
+    op.drop_column('portfolios', 'report_version')
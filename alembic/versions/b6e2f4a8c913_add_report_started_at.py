@@ -0,0 +1,28 @@
+"""add report started_at
+
+Revision ID: b6e2f4a8c913
+Revises: a9d4e7b2c315
+Create Date: 2026-03-27 09:15:42.208731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e2f4a8c913'
+down_revision: Union[str, None] = 'a9d4e7b2c315'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('reports', sa.Column('started_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('reports', 'started_at')
@@ -0,0 +1,67 @@
+"""enable tenant row level security
+
+Revision ID: c3e8a1f5d742
+Revises: 9b4f2d7e6c15
+Create Date: 2026-03-19 10:12:37.514206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a1f5d742'
+down_revision: Union[str, None] = '9b4f2d7e6c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Every TenantMixin table. loans and clients are partitioned; policies on the
+# parent cover all partitions, including ones swapped in later.
+TENANT_TABLES = [
+    'users',
+    'portfolios',
+    'clients',
+    'loans',
+    'guarantees',
+    'securities',
+    'quality_issues',
+    'reports',
+    'feedback',
+    'help',
+    'ingestion_templates',
+]
+
+POLICY = 'tenant_isolation'
+
+# Fail closed: without app.tenant_id a transaction sees no rows (nullif turns the
+# '' left behind by a transaction-local set_config into NULL instead of a cast
+# error). Sessions without a tenant (authentication, superadmin, background jobs)
+# switch to the BYPASSRLS role named by RLS_BYPASS_ROLE. A single equality keeps
+# the tenant-leading indexes usable.
+TENANT_SETTING = "nullif(current_setting('app.tenant_id', true), '')::integer"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Policies are only installed for TENANT_ISOLATION=rls; rerun this revision
+    # (downgrade and upgrade) after switching modes
+    if settings.TENANT_ISOLATION != 'rls':
+        return
+    for table in TENANT_TABLES:
+        op.execute(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY")
+        # Apply to the table owner too, which is usually the application role
+        op.execute(f"ALTER TABLE {table} FORCE ROW LEVEL SECURITY")
+        op.execute(f"CREATE POLICY {POLICY} ON {table} USING (tenant_id = {TENANT_SETTING})")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TENANT_TABLES:
+        op.execute(f"DROP POLICY IF EXISTS {POLICY} ON {table}")
+        op.execute(f"ALTER TABLE {table} NO FORCE ROW LEVEL SECURITY")
+        op.execute(f"ALTER TABLE {table} DISABLE ROW LEVEL SECURITY")
@@ -0,0 +1,115 @@
+"""add portfolio_stats
+
+Revision ID: e4b9c2d8f613
+Revises: c3e8a1f5d742
+Create Date: 2026-03-20 14:27:05.839164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b9c2d8f613'
+down_revision: Union[str, None] = 'c3e8a1f5d742'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _stage_totals(stage_column: str, provision_column: str) -> str:
+    return f"""
+        SELECT portfolio_id, json_object_agg({stage_column}, json_build_object(
+            'num_loans', num_loans, 'total_exposure', total_exposure, 'provision_amount', provision_amount
+        )) AS stages
+        FROM (
+            SELECT portfolio_id, {stage_column}, count(*) AS num_loans,
+                   coalesce(sum(ead), 0)::float AS total_exposure,
+                   coalesce(sum({provision_column}), 0)::float AS provision_amount
+            FROM loans WHERE {stage_column} IS NOT NULL
+            GROUP BY portfolio_id, {stage_column}
+        ) s
+        GROUP BY portfolio_id
+    """
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'portfolio_stats',
+        sa.Column('portfolio_id', sa.Integer(), nullable=False),
+        sa.Column('total_loans', sa.Integer(), nullable=False),
+        sa.Column('total_loan_value', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('average_loan_amount', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('total_outstanding_balance', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('total_final_ecl', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('total_bog_provision', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('ifrs9_stages', sa.JSON(), nullable=False),
+        sa.Column('bog_stages', sa.JSON(), nullable=False),
+        sa.Column('total_customers', sa.Integer(), nullable=False),
+        sa.Column('client_types', sa.JSON(), nullable=False),
+        sa.Column('active_customers', sa.Integer(), nullable=False),
+        sa.Column('has_quality_issues', sa.Boolean(), nullable=False),
+        sa.Column('has_open_quality_issues', sa.Boolean(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['portfolio_id'], ['portfolios.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('portfolio_id'),
+    )
+
+    # Backfill existing portfolios with the same aggregates refresh_portfolio_stats computes
+    op.execute(f"""
+        INSERT INTO portfolio_stats (
+            portfolio_id, total_loans, total_loan_value, average_loan_amount, total_outstanding_balance,
+            total_final_ecl, total_bog_provision, ifrs9_stages, bog_stages, total_customers,
+            client_types, active_customers, has_quality_issues, has_open_quality_issues
+        )
+        SELECT
+            p.id,
+            coalesce(l.total_loans, 0),
+            coalesce(l.total_loan_value, 0),
+            coalesce(l.average_loan_amount, 0),
+            coalesce(l.total_outstanding_balance, 0),
+            coalesce(l.total_final_ecl, 0),
+            coalesce(l.total_bog_provision, 0),
+            coalesce(ifrs9.stages, '{{}}'::json),
+            coalesce(bog.stages, '{{}}'::json),
+            coalesce(c.total_customers, 0),
+            coalesce(ct.client_types, '{{}}'::json),
+            coalesce(a.active_customers, 0),
+            EXISTS (SELECT 1 FROM quality_issues q WHERE q.portfolio_id = p.id),
+            EXISTS (SELECT 1 FROM quality_issues q WHERE q.portfolio_id = p.id AND q.status != 'approved')
+        FROM portfolios p
+        LEFT JOIN (
+            SELECT portfolio_id, count(*) AS total_loans, sum(ead) AS total_loan_value,
+                   avg(ead) AS average_loan_amount, sum(outstanding_loan_balance) AS total_outstanding_balance,
+                   sum(final_ecl) AS total_final_ecl, sum(bog_provision) AS total_bog_provision
+            FROM loans GROUP BY portfolio_id
+        ) l ON l.portfolio_id = p.id
+        LEFT JOIN ({_stage_totals('ifrs9_stage', 'final_ecl')}) ifrs9 ON ifrs9.portfolio_id = p.id
+        LEFT JOIN ({_stage_totals('bog_stage', 'bog_provision')}) bog ON bog.portfolio_id = p.id
+        LEFT JOIN (
+            SELECT portfolio_id, count(*) AS total_customers FROM clients GROUP BY portfolio_id
+        ) c ON c.portfolio_id = p.id
+        LEFT JOIN (
+            SELECT portfolio_id, json_object_agg(client_type, n) AS client_types
+            FROM (
+                SELECT portfolio_id, client_type, count(*) AS n FROM clients
+                WHERE client_type IS NOT NULL GROUP BY portfolio_id, client_type
+            ) t
+            GROUP BY portfolio_id
+        ) ct ON ct.portfolio_id = p.id
+        LEFT JOIN (
+            SELECT c.portfolio_id, count(*) AS active_customers
+            FROM clients c
+            WHERE c.employee_id IN (
+                SELECT l.employee_id FROM loans l WHERE l.portfolio_id = c.portfolio_id AND l.paid = false
+            )
+            GROUP BY c.portfolio_id
+        ) a ON a.portfolio_id = p.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('portfolio_stats')
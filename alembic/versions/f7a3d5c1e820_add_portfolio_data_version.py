@@ -0,0 +1,28 @@
+"""add portfolio data_version
+
+Revision ID: f7a3d5c1e820
+Revises: e4b9c2d8f613
+Create Date: 2026-03-23 09:05:44.172390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7a3d5c1e820'
+down_revision: Union[str, None] = 'e4b9c2d8f613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('portfolios', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('portfolios', 'data_version')
@@ -39,10 +39,15 @@ celery_app.conf.update(
     accept_content=["json"],
     task_track_started=True,
     task_time_limit=7200,  # 2 hour timeout as a safety buffer
+
+    # Reports run on their own workers so month-end builds don't hold up ingestion and calculations
+    task_routes={"app.tasks.reports.*": {"queue": "reports"}},
+    # Tasks run for minutes; fetch one at a time so queued work stays available to idle workers
+    worker_prefetch_multiplier=1,
 )
 
 # Dynamically set concurrency based on CPU limits
 celery_app.conf.worker_concurrency = calculate_concurrency()
 
 # We will create these modules next
-celery_app.autodiscover_tasks(["app.tasks.ingestion", "app.tasks.calculation"])
+celery_app.autodiscover_tasks(["app.tasks.ingestion", "app.tasks.calculation", "app.tasks.reports"])
@@ -15,6 +15,23 @@ class Settings:
     ACCESS_TOKEN_EXPIRE_HOURS: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_HOURS", "24"))
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     SQLALCHEMY_DATABASE_URL: str = os.getenv("SQLALCHEMY_DATABASE_URL")
+    # Optional read-only replica for dashboards, portfolio details and reports (defaults to the primary)
+    SQLALCHEMY_READ_DATABASE_URL: str = os.getenv("SQLALCHEMY_READ_DATABASE_URL")
+    # "orm" rewrites ORM queries with a tenant filter; "rls" leaves it to Postgres row-level security
+    TENANT_ISOLATION: str = os.getenv("TENANT_ISOLATION", "orm").lower()
+    # RLS mode: BYPASSRLS role that sessions without a tenant (auth, superadmin, background jobs) switch to
+    RLS_BYPASS_ROLE = os.getenv("RLS_BYPASS_ROLE")
+    # Connection pool sizing (per process; ignored for SQLite)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", os.getenv("DB_POOL_SIZE", "10")))
+    DB_READ_MAX_OVERFLOW: int = int(os.getenv("DB_READ_MAX_OVERFLOW", os.getenv("DB_MAX_OVERFLOW", "20")))
+    # Pool of the async engine used by async routes (separate from the sync pool above)
+    DB_ASYNC_POOL_SIZE: int = int(os.getenv("DB_ASYNC_POOL_SIZE", "10"))
+    DB_ASYNC_MAX_OVERFLOW: int = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "20"))
     AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
     AZURE_STORAGE_ACCOUNT_KEY = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
     CONTAINER_NAME = os.getenv("CONTAINER_NAME")
@@ -26,6 +43,27 @@ class Settings:
     MINIO_BUCKET_NAME = os.getenv("MINIO_BUCKET_NAME")
     CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
     CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/1")
+    # Report generation runs on the "reports" Celery queue
+    REPORT_TENANT_CONCURRENCY: int = int(os.getenv("REPORT_TENANT_CONCURRENCY", "2"))
+    REPORT_SLOT_TIMEOUT: int = int(os.getenv("REPORT_SLOT_TIMEOUT", "7200"))
+    # Reports still queued (pending) after this long give up their content key (see app/utils/report_keys.py)
+    REPORT_QUEUE_TIMEOUT: int = int(os.getenv("REPORT_QUEUE_TIMEOUT", "86400"))
+    REPORT_SLOT_WAIT: int = int(os.getenv("REPORT_SLOT_WAIT", "30"))
+    REPORT_RETRY_DELAY: int = int(os.getenv("REPORT_RETRY_DELAY", "30"))
+    # Report workbooks expire from MinIO after this many days (0 keeps them); see app/utils/report_keys.py
+    REPORT_RETENTION_DAYS: int = int(os.getenv("REPORT_RETENTION_DAYS", "90"))
+    # Answer report downloads with a redirect to a presigned MinIO URL instead of streaming them through the API
+    REPORT_DOWNLOAD_REDIRECT: bool = os.getenv("REPORT_DOWNLOAD_REDIRECT", "false").lower() == "true"
+    # Shared cache of dashboard, portfolio, quality-issue and report-history responses
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://redis:6379/2")
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(2 * 1024 * 1024)))
+    RESPONSE_CACHE_LOCK_TIMEOUT: float = float(os.getenv("RESPONSE_CACHE_LOCK_TIMEOUT", "10"))
+    # Split large loan files into row ranges processed by parallel Celery sub-tasks
+    INGESTION_CHUNKED_ENABLED: bool = os.getenv("INGESTION_CHUNKED_ENABLED", "false").lower() == "true"
+    INGESTION_CHUNK_ROWS: int = int(os.getenv("INGESTION_CHUNK_ROWS", "100000"))
+    STREAM_INGEST_BATCH_ROWS: int = int(os.getenv("STREAM_INGEST_BATCH_ROWS", "5000"))
     PAYSTACK_PLAN_CORE = os.getenv("PAYSTACK_PLAN_CORE")
     PAYSTACK_PLAN_PROFESSIONAL = os.getenv("PAYSTACK_PLAN_PROFESSIONAL")
     PAYSTACK_PLAN_ENTERPRISE = os.getenv("PAYSTACK_PLAN_ENTERPRISE")
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from app.config import settings
@@ -10,7 +11,7 @@ from sqlalchemy import (
 )
 from contextvars import ContextVar
 from contextlib import contextmanager
-from typing import Optional, Generator
+from typing import AsyncGenerator, Optional, Generator
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,9 +20,83 @@ logger = logging.getLogger(__name__)
 current_tenant_id: ContextVar[Optional[int]] = ContextVar('current_tenant_id', default=None)
 
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+def engine_options(url: str, pool_size: int, max_overflow: int) -> dict:
+    """Pool settings for ``create_engine``; SQLite keeps SQLAlchemy's own pool."""
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    return options
+
+
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URL,
+    **engine_options(settings.SQLALCHEMY_DATABASE_URL, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-heavy endpoints (dashboards, portfolio details, report history and generation)
+# use a replica when one is configured, with its own pool; otherwise the primary.
+if settings.SQLALCHEMY_READ_DATABASE_URL:
+    read_engine = create_engine(
+        settings.SQLALCHEMY_READ_DATABASE_URL,
+        **engine_options(settings.SQLALCHEMY_READ_DATABASE_URL, settings.DB_READ_POOL_SIZE,
+                         settings.DB_READ_MAX_OVERFLOW),
+    )
+else:
+    read_engine = engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+# Async drivers used by the async session path, by sync URL scheme
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """The async-driver equivalent of a sync database URL."""
+    scheme, separator, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{separator}{rest}"
+
+
+def create_async_engine_for(url: str):
+    return create_async_engine(
+        async_database_url(url),
+        **engine_options(url, settings.DB_ASYNC_POOL_SIZE, settings.DB_ASYNC_MAX_OVERFLOW),
+    )
+
+
+# Async routes use these so a slow query awaits on the event loop instead of blocking it.
+# Sessions wrap a regular Session, so the tenant filter and tenant_id injection below apply too.
+async_engine = create_async_engine_for(settings.SQLALCHEMY_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if settings.SQLALCHEMY_READ_DATABASE_URL:
+    async_read_engine = create_async_engine_for(settings.SQLALCHEMY_READ_DATABASE_URL)
+else:
+    async_read_engine = async_engine
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+# In RLS mode Postgres enforces tenant isolation itself (policies from the
+# enable_tenant_row_level_security migration) from the per-transaction
+# app.tenant_id setting, so the ORM query rewriting below is skipped.
+# The policies fail closed: a transaction without app.tenant_id sees no rows
+# unless it has switched to the BYPASSRLS role (RLS_BYPASS_ROLE).
+TENANT_SETTING = "app.tenant_id"
+RLS_ENABLED = settings.TENANT_ISOLATION == "rls" and engine.dialect.name == "postgresql"
+if settings.TENANT_ISOLATION == "rls" and not RLS_ENABLED:
+    logger.warning("TENANT_ISOLATION=rls needs PostgreSQL; falling back to ORM tenant filtering")
+if RLS_ENABLED and not settings.RLS_BYPASS_ROLE:
+    logger.warning("TENANT_ISOLATION=rls without RLS_BYPASS_ROLE: sessions without a tenant will see no tenant rows")
+
 Base = declarative_base()
 
 
@@ -99,12 +174,87 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """
+    Non-tenant-scoped session on the read replica (the primary if none is configured).
+
+    Only for reads: a replica may lag the primary slightly, so never read back
+    something just written in the same request through it.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Non-tenant-scoped async session, for ``async def`` routes."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Non-tenant-scoped async session on the read replica (the primary if none is configured)."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
 
 
 # Import dependencies needed for the real signature
 
 
 
+def _set_tenant_setting(connection, tenant_id: int) -> None:
+    # is_local=true: the value ends with the transaction, so it never leaks to
+    # the next user of a pooled connection
+    connection.execute(
+        text("SELECT set_config(:name, :value, true)"),
+        {"name": TENANT_SETTING, "value": str(tenant_id)},
+    )
+
+
+def _bypass_row_security(connection) -> None:
+    # SET LOCAL: the role switch ends with the transaction, like app.tenant_id
+    role = connection.dialect.identifier_preparer.quote(settings.RLS_BYPASS_ROLE)
+    connection.execute(text(f"SET LOCAL ROLE {role}"))
+
+
+@event.listens_for(Session, "after_begin")
+def receive_after_begin(session, transaction, connection):
+    """
+    In RLS mode, scope each transaction to the current tenant.
+
+    Without a tenant context the transaction switches to the RLS_BYPASS_ROLE, which
+    sees every row, matching the ORM filter, which also only applies with a tenant
+    set. A transaction that gets neither (e.g. a raw DBAPI commit ended the one
+    that had them) sees no tenant rows at all.
+    """
+    if not RLS_ENABLED:
+        return
+
+    tenant_id = current_tenant_id.get()
+    if tenant_id is not None:
+        _set_tenant_setting(connection, tenant_id)
+    elif settings.RLS_BYPASS_ROLE:
+        _bypass_row_security(connection)
+
+
+def apply_tenant_to_open_transaction(session: Session) -> None:
+    """
+    Set app.tenant_id on a transaction that began before the tenant was known
+    (e.g. authentication queries on the same request session), dropping the bypass
+    role it started with. Later transactions are covered by receive_after_begin.
+    """
+    tenant_id = current_tenant_id.get()
+    if RLS_ENABLED and tenant_id is not None and session.in_transaction():
+        connection = session.connection()
+        if settings.RLS_BYPASS_ROLE:
+            connection.execute(text("SET LOCAL ROLE NONE"))
+        _set_tenant_setting(connection, tenant_id)
+
+
 # SQLAlchemy Event Listener for Automatic Tenant Filtering
 @event.listens_for(Session, "do_orm_execute")
 def receive_do_orm_execute(orm_execute_state):
@@ -120,6 +270,10 @@ def receive_do_orm_execute(orm_execute_state):
     
     This provides automatic tenant isolation without manual filtering.
     """
+    # Postgres applies the tenant policies itself in RLS mode
+    if RLS_ENABLED:
+        return
+
     tenant_id = current_tenant_id.get()
     
     # Only apply filter if tenant context is set
@@ -1,37 +1,97 @@
 from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db, current_tenant_id
+from app.database import (
+    get_db, get_read_db, get_async_db, get_async_read_db, current_tenant_id,
+    apply_tenant_to_open_transaction,
+)
 from app.auth.utils import get_current_active_user
 
+
+def _user_tenant_id(current_user, dependency: str) -> int:
+    if not current_user:
+        # Should be caught by Depends(get_current_active_user) if it enforces auth
+        raise ValueError(f"{dependency} requires authenticated user")
+
+    # Handle both ORM object and potential Pydantic model if user flow changes
+    tenant_id = getattr(current_user, 'tenant_id', None)
+
+    if tenant_id is None:
+        raise ValueError(f"User {current_user.email} has no tenant_id")
+    return tenant_id
+
+
 async def get_tenant_db(
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Tenant-scoped database session dependency.
-    
+
     Automatically filters all queries by the current user's tenant_id.
-    
+
     Use this for:
     - All user-facing routes (portfolios, loans, reports, etc.)
     - Billing routes that query tenant-specific data
     - Any route that should only access current tenant's data
     """
-    if not current_user:
-        # Should be caught by Depends(get_current_active_user) if it enforces auth
-        raise ValueError("get_tenant_db requires authenticated user")
-    
-    # Handle both ORM object and potential Pydantic model if user flow changes
-    tenant_id = getattr(current_user, 'tenant_id', None)
-    
-    if tenant_id is None:
-        raise ValueError(f"User {current_user.email} has no tenant_id")
-    
     # Set tenant context for this request
-    token = current_tenant_id.set(tenant_id)
-    
+    token = current_tenant_id.set(_user_tenant_id(current_user, "get_tenant_db"))
+
     try:
+        # The user lookup already opened a transaction on this session
+        apply_tenant_to_open_transaction(db)
         yield db
     finally:
         # Clear tenant context after request
         current_tenant_id.reset(token)
+
+
+async def get_tenant_read_db(
+    current_user = Depends(get_current_active_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Tenant-scoped session on the read replica.
+
+    Same tenant filtering as get_tenant_db; use it for read-only routes
+    (dashboards, portfolio details, report history and report generation).
+    """
+    token = current_tenant_id.set(_user_tenant_id(current_user, "get_tenant_read_db"))
+
+    try:
+        apply_tenant_to_open_transaction(db)
+        yield db
+    finally:
+        current_tenant_id.reset(token)
+
+
+async def get_tenant_async_db(
+    current_user = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Tenant-scoped async session for ``async def`` routes.
+
+    Queries are awaited instead of blocking the event loop; tenant filtering
+    is the same as get_tenant_db.
+    """
+    token = current_tenant_id.set(_user_tenant_id(current_user, "get_tenant_async_db"))
+
+    try:
+        yield db
+    finally:
+        current_tenant_id.reset(token)
+
+
+async def get_tenant_async_read_db(
+    current_user = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Tenant-scoped async session on the read replica, for read-only ``async def`` routes."""
+    token = current_tenant_id.set(_user_tenant_id(current_user, "get_tenant_async_read_db"))
+
+    try:
+        yield db
+    finally:
+        current_tenant_id.reset(token)
@@ -12,7 +12,9 @@ from sqlalchemy import (
     JSON,
     Table,
     UniqueConstraint,
+    Index,
     and_,
+    text,
 )
 from sqlalchemy.sql import func
 from enum import Enum as PyEnum
@@ -244,6 +246,11 @@ class Portfolio(TenantMixin, Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     # Cached loan count for quick checks (authoritative count enforced via SubscriptionUsage)
     loan_count = Column(Integer, nullable=False, default=0)
+    # Bumped by every write that changes the portfolio's read endpoints; their ETags derive from it
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bumped with data_version only by writes that change what reports are built from
+    # (loans, staging/calculation results, portfolio settings); part of report content keys
+    report_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="portfolios")
     subscription = relationship("TenantSubscription", backref="portfolios")
@@ -254,6 +261,7 @@ class Portfolio(TenantMixin, Base):
     reports = relationship("Report", back_populates="portfolio", passive_deletes=True)
     staging_results = relationship("StagingResult", back_populates="portfolio", passive_deletes=True)
     calculation_results = relationship("CalculationResult", back_populates="portfolio", passive_deletes=True)
+    stats = relationship("PortfolioStats", back_populates="portfolio", uselist=False, passive_deletes=True)
     ecl_staging_config = Column(JSON, nullable=True)  # Store the configuration used for staging
     bog_staging_config = Column(JSON, nullable=True)  # Store the configuration used for staging
 
@@ -291,6 +299,11 @@ class Title(str, PyEnum):
 
 class Client(TenantMixin,Base):
     __tablename__ = "clients"
+    # On Postgres the table is LIST-partitioned by portfolio_id (see app/utils/partitions.py),
+    # with a (id, portfolio_id) primary key managed by Alembic
+    __table_args__ = (
+        Index("ix_clients_portfolio_id_employee_id", "portfolio_id", "employee_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete='CASCADE'), nullable=False)
@@ -338,13 +351,25 @@ class DeductionStatus(str, PyEnum):
 
 class Loan(TenantMixin,Base):
     __tablename__ = "loans"
+    # On Postgres the table is LIST-partitioned by portfolio_id (see app/utils/partitions.py),
+    # with a (id, portfolio_id) primary key managed by Alembic
+    __table_args__ = (
+        Index("ix_loans_portfolio_id_id", "portfolio_id", "id"),
+        Index("ix_loans_portfolio_id_employee_id", "portfolio_id", "employee_id"),
+        Index("ix_loans_portfolio_id_ifrs9_stage", "portfolio_id", "ifrs9_stage"),
+        Index("ix_loans_portfolio_id_client_id", "portfolio_id", "client_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"))
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False)
     # Subscription owning this loan data (derived from portfolio.subscription_id)
     subscription_id = Column(Integer, ForeignKey("tenant_subscriptions.id"), nullable=True)
     loan_no = Column(String, index=True, nullable=True)
     employee_id = Column(String, nullable=True)
+    # Client with this employee_id in the same portfolio, resolved in bulk at ingestion
+    # (see link_loans_to_clients). Not a database FK: clients is partitioned and its
+    # partitions are exchanged independently of the loans partitions.
+    client_id = Column(Integer, nullable=True)
     employee_name = Column(String, nullable=True)
     employer = Column(String, nullable=True)
     loan_issue_date = Column(Date, nullable=True)
@@ -387,7 +412,7 @@ class Loan(TenantMixin,Base):
     portfolio = relationship("Portfolio", back_populates="loans")
     client = relationship(
         "Client",
-        primaryjoin="and_(foreign(Loan.employee_id) == remote(Client.employee_id), foreign(Loan.portfolio_id) == remote(Client.portfolio_id))",
+        primaryjoin="and_(foreign(Loan.client_id) == remote(Client.id), foreign(Loan.portfolio_id) == remote(Client.portfolio_id))",
         viewonly=True,
     )
     ifrs9_stage = Column(String, nullable=True)
@@ -407,6 +432,32 @@ class Loan(TenantMixin,Base):
     balance_difference = Column(Numeric(precision=38, scale=2), default=0)
     calculation_date = Column(DateTime(timezone=False), nullable=True)
 
+
+# Named groups of Loan columns loaded together by scans that need only part of a loan
+# (see app/utils/loan_projection.py). ``id`` is always included.
+LOAN_COLUMN_BUNDLES = {
+    "identity": (
+        "portfolio_id", "loan_no", "employee_id", "employee_name", "client_id", "employer", "loan_type",
+    ),
+    "ecl_inputs": (
+        "loan_amount", "loan_term", "administrative_fees", "monthly_installment", "loan_issue_date",
+        "deduction_start_period", "submission_period", "maturity_period", "outstanding_loan_balance",
+        "theoretical_balance", "accumulated_arrears", "ndia",
+    ),
+    "ecl_outputs": (
+        "ifrs9_stage", "ead", "lgd", "pd", "eir", "ecl_12", "ecl_lifetime", "final_ecl",
+        "amortised_bal", "adjusted_amortised_bal", "balance_difference", "calculation_date",
+    ),
+    "bog_outputs": (
+        "bog_stage", "bog_prov_rate", "bog_provision",
+    ),
+    "repayment": (
+        "principal_due", "interest_due", "total_due", "principal_paid", "interest_paid", "total_paid",
+        "paid", "cancelled", "deduction_status", "outstanding_loan_balance", "accumulated_arrears", "ndia",
+    ),
+}
+
+
 class Guarantee(TenantMixin,Base):
     __tablename__ = "guarantees"
     id = Column(Integer, primary_key=True, index=True)
@@ -435,7 +486,8 @@ class Security(TenantMixin, Base):
     __tablename__ = "securities"
 
     id = Column(Integer, primary_key=True, index=True)
-    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    # No FK: clients is partitioned, so clients.id alone is not a unique key in the database
+    client_id = Column(Integer, nullable=False, index=True)
     collateral_description = Column(Text, nullable=True)
     collateral_value = Column(Numeric(precision=18, scale=2), nullable=False)
     forced_sale_value = Column(Numeric(precision=18, scale=2), nullable=True)
@@ -443,7 +495,7 @@ class Security(TenantMixin, Base):
     cash_or_non_cash = Column(String, default=SecurityType.NON_CASH)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    client = relationship("Client", backref="securities")
+    client = relationship("Client", primaryjoin="foreign(Security.client_id) == Client.id", backref="securities")
 
 
 class DefaultDefinition(Base):
@@ -468,12 +520,13 @@ class OtherLoans(Base):
     __tablename__ = "other_loans"
 
     id = Column(Integer, primary_key=True, index=True)
-    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    # No FK: clients is partitioned, so clients.id alone is not a unique key in the database
+    client_id = Column(Integer, nullable=False, index=True)
     loan_amount = Column(Numeric(precision=18, scale=2), nullable=False)
     extending_party = Column(String, default=ExtendingParty.BANK)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    client = relationship("Client", backref="other_loans")
+    client = relationship("Client", primaryjoin="foreign(OtherLoans.client_id) == Client.id", backref="other_loans")
 
 
 class MacroEcos(Base):
@@ -490,6 +543,9 @@ class MacroEcos(Base):
 
 class QualityIssue(TenantMixin,Base):
     __tablename__ = "quality_issues"
+    __table_args__ = (
+        Index("ix_quality_issues_portfolio_id_issue_type_status", "portfolio_id", "issue_type", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"))
@@ -524,6 +580,11 @@ class QualityIssueComment(Base):
 
 class Report(TenantMixin,Base):
     __tablename__ = "reports"
+    __table_args__ = (
+        # One live report per content key; a failed one may be requested again
+        Index("uq_reports_content_key_live", "content_key", unique=True,
+              postgresql_where=text("status <> 'failed'"), sqlite_where=text("status <> 'failed'")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(
@@ -535,7 +596,11 @@ class Report(TenantMixin,Base):
     report_data = Column(JSON, nullable=False)
     file_path = Column(String, nullable=True)
     status = Column(String, default="pending")  # pending, success, failed
+    # Hash of what the workbook is built from (see app/utils/report_keys.py); NULL for saved reports
+    content_key = Column(String(64), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # When a worker last started building it (NULL while queued)
+    started_at = Column(DateTime(timezone=True), nullable=True)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     portfolio = relationship("Portfolio", back_populates="reports")
     user = relationship("User")
@@ -620,6 +685,9 @@ class StagingResult(Base):
     Stores the results of loan staging operations, either for local impairment or ECL.
     """
     __tablename__ = "staging_results"
+    __table_args__ = (
+        Index("ix_staging_results_portfolio_id_type_created_at", "portfolio_id", "staging_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"))
@@ -637,6 +705,9 @@ class CalculationResult(Base):
     Stores the results of calculation operations, either for local impairment or ECL.
     """
     __tablename__ = "calculation_results"
+    __table_args__ = (
+        Index("ix_calculation_results_portfolio_id_type_created_at", "portfolio_id", "calculation_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"))
@@ -650,3 +721,53 @@ class CalculationResult(Base):
 
     # Relationships
     portfolio = relationship("Portfolio", back_populates="calculation_results")
+
+
+class PortfolioStats(Base):
+    """
+    Aggregates over a portfolio's loans, clients and quality issues, refreshed by the
+    steps that change them (see app/utils/portfolio_stats.py) so the portfolio list,
+    portfolio detail and dashboard read one row instead of scanning loans.
+    """
+    __tablename__ = "portfolio_stats"
+
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"), primary_key=True)
+    total_loans = Column(Integer, nullable=False, default=0)
+    total_loan_value = Column(Numeric(precision=18, scale=2), nullable=False, default=0)  # Sum of ead
+    average_loan_amount = Column(Numeric(precision=18, scale=2), nullable=False, default=0)  # Average ead
+    total_outstanding_balance = Column(Numeric(precision=18, scale=2), nullable=False, default=0)
+    total_final_ecl = Column(Numeric(precision=18, scale=2), nullable=False, default=0)
+    total_bog_provision = Column(Numeric(precision=18, scale=2), nullable=False, default=0)
+    # Stage as stored on loans -> {"num_loans", "total_exposure", "provision_amount"}
+    ifrs9_stages = Column(JSON, nullable=False, default=dict)
+    bog_stages = Column(JSON, nullable=False, default=dict)
+    total_customers = Column(Integer, nullable=False, default=0)
+    client_types = Column(JSON, nullable=False, default=dict)  # client_type -> number of clients
+    active_customers = Column(Integer, nullable=False, default=0)  # Clients with an unpaid loan
+    has_quality_issues = Column(Boolean, nullable=False, default=False)
+    has_open_quality_issues = Column(Boolean, nullable=False, default=False)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    portfolio = relationship("Portfolio", back_populates="stats")
+
+
+class IngestionTemplate(TenantMixin, Base):
+    """
+    Column mapping, read schema and date formats resolved the first time a tenant
+    ingests a given file layout, reused by later uploads with the same headers.
+    """
+    __tablename__ = "ingestion_templates"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "file_type", "header_fingerprint", name="uq_ingestion_templates_layout"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_type = Column(String, nullable=False)  # "loan_details" or "client_data"
+    header_fingerprint = Column(String(64), nullable=False)
+    headers = Column(JSON, nullable=False)  # Raw headers in file order
+    column_mapping = Column(JSON, nullable=False)  # Raw header -> model column
+    dtypes = Column(JSON, nullable=False)  # Raw header -> Polars dtype name
+    date_formats = Column(JSON, nullable=False)  # Model column -> strptime format
+    use_count = Column(Integer, default=1)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
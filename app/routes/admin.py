@@ -1,7 +1,6 @@
-import csv
-import io
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from fastapi.responses import JSONResponse, StreamingResponse
 from app.database import get_db
@@ -48,6 +47,8 @@ from app.auth.utils import (
     decode_token,
 )
 from app.utils.billing import require_active_subscription
+from app.utils.streaming_export import EXPORT_BATCH_ROWS, ExportSheet, export_response
+from app.utils.xlsx_reports import stream_rows
 from app.schemas import (
     FeedbackStatusUpdate,
     FeedbackResponse,
@@ -105,58 +106,59 @@ async def export_users_csv(
     Export all users as a CSV file.
     Only accessible to admin users.
     """
-    # Query all users
-    users = db.query(User).all()
-    
-    # Create a StringIO object to write CSV data
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header row
-    writer.writerow([
-        "ID", 
-        "First Name",
-        "Last Name",
-        "Email", 
-        "Recovery Email",
-        "Role", 
-        "Is Active", 
-        "Last Login",
-        "Created At",
-        "Updated At"
-    ])
-    
-    # Write user data
-    for user in users:
-        writer.writerow([
-            user.id,
-            user.first_name or "",
-            user.last_name or "",
-            user.email,
-            user.recovery_email or "",
-            user.role,
-            user.is_active,
-            user.last_login.strftime("%Y-%m-%d %H:%M:%S") if user.last_login else "",
-            user.created_at.strftime("%Y-%m-%d %H:%M:%S") if user.created_at else "",
-            user.updated_at.strftime("%Y-%m-%d %H:%M:%S") if user.updated_at else ""
-        ])
-    
-    # Prepare the output
-    output.seek(0)
-    
+    # Streamed from the export's own session, so filtered by tenant explicitly
+    users_query = (
+        select(
+            User.id,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.recovery_email,
+            User.role,
+            User.is_active,
+            User.last_login,
+            User.created_at,
+            User.updated_at,
+        )
+        .where(User.tenant_id == current_user.tenant_id)
+        .order_by(User.id)
+    )
+
+    def user_rows(export_db: Session):
+        for user in stream_rows(export_db, users_query, EXPORT_BATCH_ROWS):
+            yield [
+                user.id,
+                user.first_name or "",
+                user.last_name or "",
+                user.email,
+                user.recovery_email or "",
+                user.role,
+                user.is_active,
+                user.last_login.strftime("%Y-%m-%d %H:%M:%S") if user.last_login else "",
+                user.created_at.strftime("%Y-%m-%d %H:%M:%S") if user.created_at else "",
+                user.updated_at.strftime("%Y-%m-%d %H:%M:%S") if user.updated_at else ""
+            ]
+
+    sheet = ExportSheet(
+        "Users",
+        ["ID", "First Name", "Last Name", "Email", "Recovery Email", "Role", "Is Active", "Last Login",
+         "Created At", "Updated At"],
+        user_rows,
+    )
+
     # Generate filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"users_export_{timestamp}.csv"
-    
+
     # Return the CSV as a streaming response
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
+    return export_response(
+        [sheet],
+        filename,
+        export_format="csv",
         headers={
-            "Content-Disposition": f"attachment; filename={filename}",
             "Access-Control-Allow-Origin": "https://ifrs9pro.service4gh.com",
             "Access-Control-Allow-Credentials": "true"
-        }
+        },
     )
 
 
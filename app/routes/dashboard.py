@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func, select
 from typing import List, Dict, Any
 from datetime import datetime
 
 from app.database import get_db
-from app.dependencies import get_tenant_db
+from app.dependencies import get_tenant_read_db
 from app.models import Portfolio, User, Loan, Client, Report, QualityIssue, CalculationResult
+from app.utils.portfolio_stats import portfolio_stats_for
+from app.utils.response_cache import cached_response
 from app.auth.utils import get_current_active_user
 from app.calculators.ecl import (
     calculate_exposure_at_default_percentage,
@@ -23,12 +25,24 @@ from app.calculators.local_impairment import (
 router = APIRouter(tags=["dashboard"])
 
 
+def _dashboard_versions(db: Session, **_):
+    return db.query(Portfolio.id, Portfolio.data_version).all()
+
+
+def _dashboard_greeting(payload: Dict[str, Any], user: User) -> Dict[str, Any]:
+    # The cached body is shared by the tenant's users; only the name is theirs
+    return {**payload, "name": user.first_name}
+
+
 @router.get("/dashboard",  
             description="Get dashboard information including portfolio and customer overviews",
             responses={401: {"description": "Not authenticated"}},
             )
+@cached_response("dashboard", versions=_dashboard_versions, personalize=_dashboard_greeting)
 def get_dashboard(
-    db: Session = Depends(get_tenant_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_tenant_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -36,6 +50,8 @@ def get_dashboard(
     - Portfolio overview (total loans, ECL amount, risk reserve)
     - Customer overview (total customers by type)
     - Portfolio list
+
+    Cached per tenant until a portfolio's data_version changes.
     """
     # Get all portfolios for current user
     portfolios = db.query(Portfolio).all()
@@ -62,41 +78,9 @@ def get_dashboard(
     # Get portfolio IDs
     portfolio_ids = [p.id for p in portfolios]
 
-    # --- OPTIMIZATION: Use a single query to get loan counts and values by portfolio ---
-    loan_stats_by_portfolio = {}
-    loan_stats = (
-        db.query(
-            Loan.portfolio_id,
-            func.count(Loan.id).label("loan_count"),
-            func.sum(Loan.outstanding_loan_balance).label("loan_value")
-        )
-        .filter(Loan.portfolio_id.in_(portfolio_ids))
-        .group_by(Loan.portfolio_id)
-        .all()
-    )
-    
-    for stats in loan_stats:
-        loan_stats_by_portfolio[stats.portfolio_id] = {
-            "loan_count": stats.loan_count,
-            "loan_value": float(stats.loan_value) if stats.loan_value else 0
-        }
-    
-    # --- OPTIMIZATION: Use a single query to get customer counts by portfolio ---
-    customer_stats_by_portfolio = {}
-    customer_stats = (
-        db.query(
-            Client.portfolio_id,
-            func.count(Client.id).label("customer_count")
-        )
-        .filter(Client.portfolio_id.in_(portfolio_ids))
-        .group_by(Client.portfolio_id)
-        .all()
-    )
-    
-    for stats in customer_stats:
-        customer_stats_by_portfolio[stats.portfolio_id] = {
-            "customer_count": stats.customer_count
-        }
+    # Loan and customer totals come from the maintained portfolio_stats rows,
+    # so this does not grow with the number of loans
+    stats_by_portfolio = portfolio_stats_for(db, portfolio_ids)
     
     # --- OPTIMIZATION: Get all latest ECL calculations in a single query ---
     latest_ecl_calculations = {}
@@ -156,30 +140,17 @@ def get_dashboard(
     for result in local_results:
         latest_local_impairments[result.portfolio_id] = result
 
-    # --- OPTIMIZATION: Get customer type counts in a single query ---
+    # --- Customer type counts across portfolios ---
     customer_type_counts = {
         "total": 0,
         "institutional": 0,
         "individual": 0
     }
     
-    customer_type_stats = (
-        db.query(
-            Client.client_type,
-            func.count(Client.id).label("count")
-        )
-        .filter(Client.portfolio_id.in_(portfolio_ids))
-        .group_by(Client.client_type)
-        .all()
-    )
-    
-    for stats in customer_type_stats:
-        if stats.client_type == "institution":
-            customer_type_counts["institutional"] = stats.count
-        elif stats.client_type == "consumer":
-            customer_type_counts["individual"] = stats.count
-        
-        customer_type_counts["total"] += stats.count
+    for stats in stats_by_portfolio.values():
+        customer_type_counts["institutional"] += stats.client_types.get("institution", 0)
+        customer_type_counts["individual"] += stats.client_types.get("consumer", 0)
+        customer_type_counts["total"] += stats.total_customers
     
     # --- Process portfolio data ---
     total_ecl_amount = 0
@@ -190,8 +161,8 @@ def get_dashboard(
     
     for portfolio in portfolios:
         # Get loan and customer stats for this portfolio
-        loan_stats = loan_stats_by_portfolio.get(portfolio.id, {"loan_count": 0, "loan_value": 0})
-        customer_stats = customer_stats_by_portfolio.get(portfolio.id, {"customer_count": 0})
+        stats = stats_by_portfolio[portfolio.id]
+        loan_value = float(stats.total_outstanding_balance or 0)
         
         # Get latest calculation results
         latest_ecl = latest_ecl_calculations.get(portfolio.id)
@@ -208,7 +179,7 @@ def get_dashboard(
         total_ecl_amount += portfolio_ecl
         total_local_impairment += portfolio_local_impairment
         total_risk_reserve += portfolio_risk_reserve
-        total_loans += loan_stats["loan_count"]
+        total_loans += stats.total_loans
         
         portfolio_summaries.append({
             "id": portfolio.id,
@@ -216,9 +187,9 @@ def get_dashboard(
             "description": portfolio.description,
             "asset_type": portfolio.asset_type,
             "customer_type": portfolio.customer_type,
-            "total_loans": loan_stats["loan_count"],
-            "total_loan_value": loan_stats["loan_value"],
-            "total_customers": customer_stats["customer_count"],
+            "total_loans": stats.total_loans,
+            "total_loan_value": loan_value,
+            "total_customers": stats.total_customers,
             "ecl_amount": round(portfolio_ecl, 2),
             "local_impairment_amount": round(portfolio_local_impairment, 2),
             "risk_reserve": round(portfolio_risk_reserve, 2),
@@ -11,8 +11,12 @@ from fastapi import (
     Form,
     Body,
     BackgroundTasks,
+    Query,
+    Request,
+    Response,
 )
 from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import text, func, case, cast, String, and_, select
@@ -28,7 +32,7 @@ import pandas as pd
 import time
 import io
 from app.database import get_db
-from app.dependencies import get_tenant_db
+from app.dependencies import get_tenant_db, get_tenant_read_db, get_tenant_async_db, get_tenant_async_read_db
 from app.models import Portfolio, User, TenantSubscription, SubscriptionUsage, SubscriptionPlan
 from app.config import settings
 from app.auth.utils import get_current_active_user
@@ -95,7 +99,8 @@ from app.schemas import (
     CustomerSummaryModel,
     PortfolioLatestResults,
     IngestAndSaveResponse,
-    IngestPayload
+    IngestPayload,
+    StreamIngestResponse,
 
 
 )
@@ -106,7 +111,16 @@ from app.utils.background_processors import process_loan_details_with_progress a
 from app.utils.background_ingestion import (
     start_background_ingestion,
     fetch_excel_from_minio,
-    process_portfolio_ingestion_sync
+    process_portfolio_ingestion_sync,
+    recalculate_subscription_loan_usage,
+)
+from app.utils.stream_ingestion import (
+    ARROW_STREAM_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPES,
+    STREAM_RECORD_TYPES,
+    iter_arrow_records,
+    iter_ndjson_records,
+    stream_ingest_records,
 )
 from app.utils.staging import parse_days_range
 from app.utils.background_calculations import (
@@ -117,6 +131,11 @@ from app.utils.ecl_calculator import calculate_loss_given_default
 from app.utils.ingest_file_validation import validate_all_uploaded_files
 from app.utils.minio_reports_factory import upload_multiple_files_to_minio
 from app.utils.excel_utils import count_excel_rows_fast
+from app.utils.ingest_formats import ALLOWED_EXTENSIONS, describe_file, detect_file_format, file_suffix
+from app.utils.partitions import ensure_portfolio_partitions, drop_portfolio_partitions
+from app.utils.portfolio_stats import portfolio_flags, portfolio_stats_for
+from app.utils.data_versions import bump_data_version
+from app.utils.response_cache import cached_response, portfolio_versions
 import os
 
 from app.utils.minio_reports_factory import s3_client, public_s3_client
@@ -204,6 +223,7 @@ async def create_portfolio(
     db.add(usage)
     db.commit()
     db.refresh(new_portfolio)
+    ensure_portfolio_partitions(new_portfolio.id, db)
     return new_portfolio
 
 
@@ -220,7 +240,7 @@ def get_portfolios(
     limit: int = 100,
     asset_type: Optional[str] = None,
     customer_type: Optional[str] = None,
-    db: Session = Depends(get_tenant_db),
+    db: Session = Depends(get_tenant_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -243,35 +263,12 @@ def get_portfolios(
     # Apply pagination and get portfolios
     portfolios = query.offset(skip).limit(limit).all()
     
+    # Flags come from the maintained portfolio_stats rows, one query for the page
+    stats_by_portfolio = portfolio_stats_for(db, [portfolio.id for portfolio in portfolios])
+
     # Convert to response objects
     response_items = []
     for portfolio in portfolios:
-        # Check if portfolio has loans
-        has_data = db.query(Loan).filter(Loan.portfolio_id == portfolio.id).limit(1).count() > 0
-        
-        # Check if ECL calculation exists
-        total_final_ecl = db.query( func.sum(Loan.final_ecl) ).filter( Loan.portfolio_id == portfolio.id ).scalar() or 0
-        has_calculated_ecl = total_final_ecl>0
-        
-        # Check if local impairment calculation exists
-        total_bog_provision=db.query( func.sum(Loan.bog_provision) ).filter( Loan.portfolio_id == portfolio.id ).scalar() or 0
-        has_calculated_local_impairment = total_bog_provision>0
-
-    
-        # Check if portfolio has quality issues at all
-        has_issues = db.query(QualityIssue).filter(
-            QualityIssue.portfolio_id == portfolio.id
-        ).first() is not None
-
-        # Only check approval status if there are issues
-        has_all_issues_approved = None
-        if has_issues:
-            has_open_issues = db.query(QualityIssue).filter(
-                QualityIssue.portfolio_id == portfolio.id,
-                QualityIssue.status != "approved"
-            ).first() is not None
-            has_all_issues_approved = not has_open_issues
-            
         # Convert to PortfolioResponse and set flags
         portfolio_dict = portfolio.__dict__.copy()
         if '_sa_instance_state' in portfolio_dict:
@@ -280,10 +277,7 @@ def get_portfolios(
         # Create response object with all flags
         portfolio_response = PortfolioResponse(
             **portfolio_dict, 
-            has_ingested_data=has_data,
-            has_calculated_ecl=has_calculated_ecl,
-            has_calculated_local_impairment=has_calculated_local_impairment,
-            has_all_issues_approved=has_all_issues_approved
+            **portfolio_flags(stats_by_portfolio[portfolio.id]),
         )
         response_items.append(portfolio_response)
 
@@ -296,15 +290,25 @@ def get_portfolios(
             responses={404: {"description": "Help request not found"},
                        401: {"description": "Not authenticated"}},
             )
+@cached_response("portfolio", versions=portfolio_versions, response_model=PortfolioWithSummaryResponse)
 async def get_portfolio(
     portfolio_id: int,
-    db: Session = Depends(get_tenant_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_tenant_async_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     optimized endpoint for retrieving portfolio details with 70K+ loans/clients.
     Uses direct SQL queries and minimal processing to ensure fast response times.
+    Cached per tenant until the portfolio's data_version changes.
     """
+    # The summary is a long run of ORM queries; run_sync executes them on the
+    # async connection without blocking the event loop.
+    return await db.run_sync(_portfolio_summary, portfolio_id)
+
+
+def _portfolio_summary(db: Session, portfolio_id: int) -> PortfolioWithSummaryResponse:
     try:
         today = date.today()
         # Verify portfolio exists and user has access
@@ -315,72 +319,26 @@ async def get_portfolio(
         if not portfolio:
             raise HTTPException(status_code=404, detail="Portfolio not found")
         
-        #portfolio stats
-        total_loans = db.query(func.count(Loan.id)).filter(Loan.portfolio_id == portfolio_id).scalar() or 0
-        has_ingested_data = total_loans > 0
-        
-        # Check flags
-        total_final_ecl = db.query( func.sum(Loan.final_ecl) ).filter( Loan.portfolio_id == portfolio.id ).scalar() or 0
-        has_calculated_ecl = total_final_ecl>0
-        
-        # Check if local impairment calculation exists
-        total_bog_provision=db.query( func.sum(Loan.bog_provision) ).filter( Loan.portfolio_id == portfolio.id ).scalar() or 0
-        has_calculated_local_impairment = total_bog_provision>0
-        
-        # Check quality issues
-        has_issues = db.query(QualityIssue).filter(
-            QualityIssue.portfolio_id == portfolio_id
-        ).first() is not None
-
-        # Only check approval status if there are issues
-        has_all_issues_approved = None
-        if has_issues:
-            has_open_issues = db.query(QualityIssue).filter(
-                QualityIssue.portfolio_id == portfolio_id,
-                QualityIssue.status != "approved"
-            ).first() is not None
-            has_all_issues_approved = not has_open_issues
-        
-        #Get aggregate statistics in one query
-        loan_stats = db.query(
-            func.count(Loan.id).label("total_loans"),
-            func.sum(Loan.ead).label("total_loan_value"),
-            func.avg(Loan.ead).label("average_loan_amount")
-        ).filter(Loan.portfolio_id == portfolio_id).first()
-        
-        loan_count=loan_stats.total_loans or 0
-        total_loan_balance=loan_stats.total_loan_value or 0
-        loan_average=loan_stats.average_loan_amount or 0
+        # Loan, customer and issue aggregates from the maintained portfolio_stats row
+        stats = portfolio_stats_for(db, [portfolio_id])[portfolio_id]
+        flags = portfolio_flags(stats)
+
+        total_loans = stats.total_loans
+        total_loan_balance = stats.total_loan_value or 0
+        loan_average = stats.average_loan_amount or 0
 
         # Customer statistics - use the same values as in CustomerType enum
         # CustomerType values: "individuals", "institution", "mixed"
-        customer_stats = db.query(
-            func.count(Client.id).label("total_customers"),
-            func.sum(case((Client.client_type == "individuals", 1), else_=0)).label("individual_customers"),
-            func.sum(case((Client.client_type == "institution", 1), else_=0)).label("institutions"),
-            func.sum(case((Client.client_type == "mixed", 1), else_=0)).label("mixed")
-        ).filter(Client.portfolio_id == portfolio_id).first()
-        
-        total_customers = customer_stats.total_customers or 0
-        individual_customers = customer_stats.individual_customers or 0
-        institutions = customer_stats.institutions or 0
-        mixed = customer_stats.mixed or 0
+        total_customers = stats.total_customers
+        individual_customers = stats.client_types.get("individuals", 0)
+        institutions = stats.client_types.get("institution", 0)
+        mixed = stats.client_types.get("mixed", 0)
         
         # Active customers
-        active_loans = db.query(Loan.employee_id).filter(
-            Loan.portfolio_id == portfolio_id,
-            Loan.paid == False
-        ).distinct().subquery()
-        
-        active_customers = db.query(Client).filter(
-            Client.portfolio_id == portfolio_id,
-            Client.employee_id.in_(select(active_loans))
-        ).count()
+        active_customers = stats.active_customers
         
         # Get the portfolio's customer type to distribute active customers
-        portfolio_customer_type = db.query(Portfolio.customer_type).filter(
-            Portfolio.id == portfolio_id
-        ).scalar()
+        portfolio_customer_type = portfolio.customer_type
         
         # Distribute active customers based on portfolio customer type
         if portfolio_customer_type == "individuals":
@@ -418,29 +376,9 @@ async def get_portfolio(
             .all()
         )
         
-        # 1. IFRS9 calculation summary (from ifrs9_stage field)
-        ifrs9_stats = db.query(
-            Loan.ifrs9_stage,
-            func.count(Loan.id).label("num_loans"),
-            func.sum(Loan.ead).label("total_exposure_at_default"),
-            func.sum(Loan.final_ecl).label("provision_amount")
-        ).filter(
-            Loan.portfolio_id == portfolio_id
-        ).group_by(
-            Loan.ifrs9_stage
-        ).all()
-
-        # 2. BOG staging summary (from bog_stage field)
-        bog_stats = db.query(
-            Loan.bog_stage,
-            func.count(Loan.id).label("num_loans"),
-            func.sum(Loan.ead).label("total_loan_balance"),
-            func.sum(Loan.bog_provision).label("provision_amount")
-        ).filter(
-            Loan.portfolio_id == portfolio_id
-        ).group_by(
-            Loan.bog_stage
-        ).all()
+        # 1-2. IFRS9 and BOG stage totals (from the ifrs9_stage / bog_stage fields)
+        ifrs9_stats = stats.ifrs9_stages
+        bog_stats = stats.bog_stages
 
         # 3. Prepare empty bands
         ifrs9_bands = ["Stage 1", "Stage 2", "Stage 3"]
@@ -469,25 +407,25 @@ async def get_portfolio(
 
 
         # 4. Fill in IFRS9 results
-        for row in ifrs9_stats:
-            stage = (row.ifrs9_stage or "").title()  # Stage 1, Stage 2, Stage 3
+        for ifrs9_stage, row in ifrs9_stats.items():
+            stage = ifrs9_stage.title()  # Stage 1, Stage 2, Stage 3
             if stage in ecl_summary:
                 ecl_summary[stage] = {
-                    "num_loans": int(row.num_loans or 0),
-                    "outstanding_loan_balance": float(row.total_exposure_at_default or 0),
-                    "total_loan_value": float(row.total_exposure_at_default or 0),
-                    "provision_amount": float(row.provision_amount or 0)
+                    "num_loans": row["num_loans"],
+                    "outstanding_loan_balance": row["total_exposure"],
+                    "total_loan_value": row["total_exposure"],
+                    "provision_amount": row["provision_amount"]
                 }
 
         # 5. Fill in BOG results
-        for row in bog_stats:
-            stage = (row.bog_stage or "").capitalize()  # Current, OLEM, Substandard, etc
+        for bog_stage, row in bog_stats.items():
+            stage = bog_stage.capitalize()  # Current, OLEM, Substandard, etc
             if stage in local_impairment_summary:
                 local_impairment_summary[stage] = {
-                    "num_loans": int(row.num_loans or 0),
-                    "outstanding_loan_balance": float(row.total_loan_balance or 0),
-                    "total_loan_value": float(row.total_loan_balance or 0),
-                    "provision_amount": float(row.provision_amount or 0)
+                    "num_loans": row["num_loans"],
+                    "outstanding_loan_balance": row["total_exposure"],
+                    "total_loan_value": row["total_exposure"],
+                    "provision_amount": row["provision_amount"]
                 }
 
         # 6. Calculate totals
@@ -533,10 +471,7 @@ async def get_portfolio(
             credit_risk_reserve=portfolio.credit_risk_reserve,
             loan_assets=portfolio.loan_assets,
             ecl_impairment_account=portfolio.ecl_impairment_account,
-            has_ingested_data=has_ingested_data,
-            has_calculated_ecl=has_calculated_ecl,
-            has_calculated_local_impairment=has_calculated_local_impairment,
-            has_all_issues_approved=has_all_issues_approved,
+            **flags,
             # created_at=portfolio.created_at,
             updated_at=portfolio.updated_at,
             overview=OverviewModel(
@@ -607,6 +542,7 @@ async def update_portfolio(
                 setattr(portfolio, key, value)
 
         # Commit basic field updates
+        bump_data_version(portfolio_id, db)
         db.commit()
         logger.info(f"Portfolio {portfolio_id} basic fields updated successfully")
 
@@ -629,11 +565,7 @@ async def update_portfolio(
             logger.info(f"Portfolio {portfolio_id} BOG staging config updated")
 
         # --- Return complete portfolio ---
-        return await get_portfolio(
-            portfolio_id=portfolio_id,
-            db=db,
-            current_user=current_user
-        )
+        return _portfolio_summary(db, portfolio_id)
 
     except Exception as e:
         db.rollback()
@@ -668,6 +600,7 @@ def delete_portfolio(
     try:
         db.delete(portfolio)
         db.commit()
+        drop_portfolio_partitions(portfolio_id, db)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -701,7 +634,7 @@ async def accept_portfolio_data(
     subscription: TenantSubscription = Depends(require_active_subscription),
 ):
     """
-    Upload Excel files to MinIO, auto-extract headers, and return:
+    Upload Excel, CSV, CSV.gz or Parquet files to MinIO, auto-extract headers, and return:
     - file_id
     - file_url
     - object_name
@@ -732,6 +665,21 @@ async def accept_portfolio_data(
             detail="client_data file is required.",
         )
 
+    for file_type, upload in (
+        ("loan_details", loan_details),
+        ("client_data", client_data),
+        ("loan_guarantee_data", loan_guarantee_data),
+        ("loan_collateral_data", loan_collateral_data),
+    ):
+        if upload is not None and detect_file_format(upload.filename) is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=(
+                    f"{file_type} must be one of {', '.join(sorted(ALLOWED_EXTENSIONS))}. "
+                    f"Provided: {upload.filename}"
+                ),
+            )
+
     # Get subscription usage and plan
     usage = (
         db.query(SubscriptionUsage)
@@ -764,7 +712,7 @@ async def accept_portfolio_data(
         new_loan_rows = loan_row_count
         logger.info(f"Using client-provided row count: {new_loan_rows}")
     
-    # FALLBACK: Server-side Excel validation (pd.read_excel)
+    # FALLBACK: Server-side row count (Excel, CSV, CSV.gz or Parquet)
     else:
         try:
             logger.info("Client did not provide row count, performing server-side validation")
@@ -774,13 +722,12 @@ async def accept_portfolio_data(
             # Reset file pointer for later upload
             await loan_details.seek(0)
             
-            # Use pandas for robust reading
-            import pandas as pd
-            from io import BytesIO
-            
-            df = pd.read_excel(BytesIO(content))
-            new_loan_rows = len(df)
-            logger.info(f"Server-side row count (pd.read_excel): {new_loan_rows}")
+            # Count from a temp copy so the extension picks the reader
+            with tempfile.NamedTemporaryFile(suffix=file_suffix(loan_details.filename)) as tmp:
+                tmp.write(content)
+                tmp.flush()
+                _, new_loan_rows = describe_file(tmp.name)
+            logger.info(f"Server-side row count: {new_loan_rows}")
             
         except Exception as e:
             logger.error(f"Error reading loan_details file: {str(e)}")
@@ -893,6 +840,113 @@ async def ingest_portfolio_data(
         )
 
 
+@router.post("/{portfolio_id}/ingest/stream/{record_type}",
+            description="Stream loan or client records (NDJSON or Arrow IPC) from an external application into the portfolio.",
+            response_model=StreamIngestResponse,
+            responses={404: {"description": "Portfolio not found"},
+                       401: {"description": "Not authenticated"},
+                       400: {"description": "Unknown record type or portfolio is not fed by an external application"},
+                       402: {"description": "Loan data limit of the subscription plan exceeded"},
+                       403: {"description": "Portfolio does not belong to your active subscription"},
+                       415: {"description": "Unsupported body content type"},
+                       500: {"description": "A batch failed; the body carries the cursor to resume from"}
+                       },
+            status_code=status.HTTP_200_OK,
+        )
+async def stream_ingest_portfolio_data(
+    portfolio_id: int,
+    record_type: str,
+    request: Request,
+    cursor: int = Query(0, ge=0, description="Feed position of the first record in this body (from the last acknowledgement)"),
+    db: Session = Depends(get_tenant_db),
+    current_user: User = Depends(get_current_active_user),
+    subscription: TenantSubscription = Depends(require_active_subscription),
+):
+    """
+    Bulk-ingest loan or client records pushed by a loan management system:
+    - Body is NDJSON (one record per line) or an Arrow IPC stream
+    - Records are validated, coerced and merged (upsert on loan_no / employee_id) in batches
+    - Each batch is acknowledged with the cursor to resume from after an interruption
+    """
+    if record_type not in STREAM_RECORD_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"record_type must be one of {', '.join(STREAM_RECORD_TYPES)}",
+        )
+
+    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+    if portfolio.subscription_id and portfolio.subscription_id != subscription.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Portfolio does not belong to your active subscription.",
+        )
+
+    if portfolio.data_source != DataSource.EXTERNAL_APPLICATION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Streaming ingestion requires the '{DataSource.EXTERNAL_APPLICATION.value}' data source.",
+        )
+
+    # Same plan limit as file uploads: loans already held plus the new ones merged
+    loan_allowance = None
+    if record_type == "loans":
+        plan = (
+            db.query(SubscriptionPlan)
+            .filter(SubscriptionPlan.id == subscription.plan_id)
+            .first()
+        )
+        if not plan:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Subscription plan configuration missing.",
+            )
+        current_loans = db.query(Loan).filter(Loan.subscription_id == subscription.id).count()
+        loan_allowance = plan.max_loan_data - current_loans
+        if loan_allowance <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail=(
+                    f"Loan data limit reached. Your plan allows {plan.max_loan_data} loans "
+                    f"and you currently have {current_loans}. "
+                    f"Please upgrade your plan or remove some existing loans."
+                ),
+            )
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == ARROW_STREAM_MEDIA_TYPE:
+        records = iter_arrow_records(request.stream())
+    elif content_type in NDJSON_MEDIA_TYPES:
+        records = iter_ndjson_records(request.stream())
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Send records as {NDJSON_MEDIA_TYPES[0]} or {ARROW_STREAM_MEDIA_TYPE}.",
+        )
+
+    result = await stream_ingest_records(
+        records,
+        record_type,
+        portfolio_id=portfolio_id,
+        tenant_id=current_user.tenant_id,
+        db=db,
+        cursor=cursor,
+        batch_rows=settings.STREAM_INGEST_BATCH_ROWS,
+        loan_allowance=loan_allowance,
+    )
+
+    if record_type == "loans" and result["inserted"]:
+        recalculate_subscription_loan_usage(portfolio_id, db)
+
+    if result["status"] == "limit_exceeded":
+        return JSONResponse(status_code=status.HTTP_402_PAYMENT_REQUIRED, content=result)
+    if result["status"] == "failed":
+        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=result)
+    return result
+
+
 @router.get("/{portfolio_id}/calculate-ecl",  
             responses={404: {"description": "Portfolio not found"},
                        401: {"description": "Not authenticated"}},
@@ -900,7 +954,7 @@ async def ingest_portfolio_data(
 async def calculate_ecl_provision(
     portfolio_id: int,
     reporting_date: Optional[date] = None,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_db),
     current_user: User = Depends(get_current_active_user),
 ):
     
@@ -910,11 +964,7 @@ async def calculate_ecl_provision(
         reporting_date = datetime.now().date()
 
     # Verify portfolio exists and belongs to current user
-    portfolio = (
-        db.query(Portfolio)
-        .filter(Portfolio.id == portfolio_id)
-        .first()
-    )
+    portfolio = await db.scalar(select(Portfolio).where(Portfolio.id == portfolio_id))
     if not portfolio:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found"
@@ -947,15 +997,11 @@ async def calculate_ecl_provision(
             )
 async def stage_loans_ecl(
     portfolio_id: int,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_db),
     current_user: User = Depends(get_current_active_user),
 ):
 
-    portfolio = (
-        db.query(Portfolio)
-        .filter(Portfolio.id == portfolio_id)
-        .first()
-    )
+    portfolio = await db.scalar(select(Portfolio).where(Portfolio.id == portfolio_id))
     if not portfolio:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found"
@@ -976,15 +1022,11 @@ async def stage_loans_ecl(
             )
 async def stage_loans_local(
     portfolio_id: int,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_db),
     current_user: User = Depends(get_current_active_user),
 ):
 
-    portfolio = (
-        db.query(Portfolio)
-        .filter(Portfolio.id == portfolio_id)
-        .first()
-    )
+    portfolio = await db.scalar(select(Portfolio).where(Portfolio.id == portfolio_id))
     if not portfolio:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found"
@@ -1007,7 +1049,7 @@ async def stage_loans_local(
 async def calculate_local_provision(
     portfolio_id: int,
     reporting_date: Optional[date] = None,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -1020,11 +1062,7 @@ async def calculate_local_provision(
         reporting_date = datetime.now().date()
 
     # Verify portfolio exists and belongs to current user
-    portfolio = (
-        db.query(Portfolio)
-        .filter(Portfolio.id == portfolio_id)
-        .first()
-    )
+    portfolio = await db.scalar(select(Portfolio).where(Portfolio.id == portfolio_id))
     if not portfolio:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found"
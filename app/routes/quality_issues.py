@@ -5,17 +5,15 @@ from fastapi import (
     status,
     Body,
     Query,
+    Request,
+    Response,
 )
-from openpyxl import Workbook
 from sqlalchemy.orm import joinedload
-from io import BytesIO
-from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Dict, Any, Optional
+from sqlalchemy import func, select
+from typing import Iterator, List, Dict, Any, Optional
 from fastapi import HTTPException, Depends, status
 from datetime import datetime
-from io import BytesIO
 import pandas as pd
 import logging
 
@@ -34,6 +32,9 @@ from app.schemas import (
     QualityIssueSummary,
 )
 from app.utils.quality_checks import create_quality_issues_if_needed
+from app.utils.portfolio_stats import refresh_portfolio_stats
+from app.utils.response_cache import cached_response
+from app.utils.streaming_export import ExportSheet, export_response, query_rows
 
 # Create a separate router for quality issues
 router = APIRouter(prefix="/portfolios", tags=["quality-issues"])
@@ -60,26 +61,41 @@ def transform_affected_records(quality_issues: List[QualityIssue]) -> List[Quali
     return quality_issues
 
 
-def excel_safe(values):
-    """
-    Convert SQLAlchemy rows to list/tuple and safely handle complex values (dict/list)
-    and timezone-aware datetimes for OpenPyXL write-only mode.
-    openpyxl write-only mode cannot handle: dicts, lists, or timezone-aware datetimes.
-    """
-    from datetime import datetime
-    if not isinstance(values, (list, tuple)):
-        values = tuple(values)
-
-    result = []
-    for v in values:
-        if isinstance(v, (dict, list)):
-            result.append(str(v))
-        elif isinstance(v, datetime) and v.tzinfo is not None:
-            # Strip timezone info — openpyxl write-only mode rejects tz-aware datetimes
-            result.append(v.replace(tzinfo=None))
-        else:
-            result.append(v)
-    return result
+# Issue columns of the Excel downloads
+ISSUE_EXPORT_COLUMNS = (
+    QualityIssue.id,
+    QualityIssue.issue_type,
+    QualityIssue.description,
+    QualityIssue.severity,
+    QualityIssue.status,
+    QualityIssue.created_at,
+    QualityIssue.updated_at,
+)
+
+
+def affected_record_rows(db: Session, issue_id: int) -> Iterator[Dict[str, Any]]:
+    """The issue's affected records; older issues store a single record as a dict."""
+    records = db.scalar(select(QualityIssue.affected_records).where(QualityIssue.id == issue_id))
+    if isinstance(records, dict):
+        records = [records]
+    for record in records or []:
+        if isinstance(record, dict):
+            yield record
+
+
+def _quality_issue_versions(portfolio_id: int, db: Session, current_user: User, **_):
+    # --- Verify portfolio ownership (on every request, before the shared cache)
+    portfolio = (
+        db.query(Portfolio)
+        .filter(
+            Portfolio.id == portfolio_id,
+            Portfolio.user_id == current_user.id,
+        )
+        .first()
+    )
+    if not portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
+    return [(portfolio_id, portfolio.data_version)]
 
 
 @router.get(
@@ -87,25 +103,16 @@ def excel_safe(values):
     description="Get aggregated quality issues for a specific portfolio",
     response_model=List[QualityIssueSummary],
 )
+@cached_response("quality_issues", versions=_quality_issue_versions, response_model=List[QualityIssueSummary])
 def get_quality_issues(
     portfolio_id: int,
+    request: Request,
+    response: Response,
     status_type: Optional[str] = None,
     issue_type: Optional[str] = None,
     db: Session = Depends(get_tenant_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    # --- Verify portfolio ownership
-    portfolio = (
-        db.query(Portfolio)
-        .filter(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == current_user.id,
-        )
-        .first()
-    )
-    if not portfolio:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
-
     # --- Base filters
     base_filter = [QualityIssue.portfolio_id == portfolio_id]
     if status_type:
@@ -234,48 +241,24 @@ def download_all_quality_issues_excel(
         raise HTTPException(status_code=404, detail="Portfolio not found")
 
     # ---- Base query
-    query = db.query(QualityIssue).filter(QualityIssue.portfolio_id == portfolio_id)
+    query = select(*ISSUE_EXPORT_COLUMNS).where(QualityIssue.portfolio_id == portfolio_id)
 
     if status_type:
-        query = query.filter(QualityIssue.status == status_type)
+        query = query.where(QualityIssue.status == status_type)
     if issue_type:
-        query = query.filter(QualityIssue.issue_type == issue_type)
+        query = query.where(QualityIssue.issue_type == issue_type)
 
     query = query.order_by(QualityIssue.created_at.desc())
 
-    # ---- Prepare Excel streaming workbook
-    wb = Workbook(write_only=True)
-    ws = wb.create_sheet("Issues")
-
-    # ---- Header row
-    ws.append([
-        "ID", "Issue Type", "Description",
-        "Severity", "Status", "Created", "Updated"
-    ])
-
-    # ---- Stream issues in chunks
-    for issue in query.yield_per(1000):
-        ws.append(excel_safe([
-            issue.id,
-            issue.issue_type,
-            issue.description,
-            issue.severity,
-            issue.status,
-            issue.created_at,
-            issue.updated_at,
-        ]))
+    # ---- Sheets streamed from the export's own session, rows as they are read
+    sheets = [ExportSheet(
+        "Issues", ["ID", "Issue Type", "Description", "Severity", "Status", "Created", "Updated"], query_rows(query)
+    )]
 
     # ---- Comments sheet (optional)
     if include_comments:
-        ws_comments = wb.create_sheet("Comments")
-
-        ws_comments.append([
-            "Issue ID", "Comment ID", "User Email",
-            "Comment", "Created"
-        ])
-
         comments_query = (
-            db.query(
+            select(
                 QualityIssueComment.quality_issue_id,
                 QualityIssueComment.id,
                 User.email,
@@ -285,28 +268,14 @@ def download_all_quality_issues_excel(
             .join(User, User.id == QualityIssueComment.user_id)
             .join(QualityIssue,
                   QualityIssue.id == QualityIssueComment.quality_issue_id)
-            .filter(QualityIssue.portfolio_id == portfolio_id)
+            .where(QualityIssue.portfolio_id == portfolio_id)
+            .order_by(QualityIssueComment.id)
         )
+        sheets.append(ExportSheet(
+            "Comments", ["Issue ID", "Comment ID", "User Email", "Comment", "Created"], query_rows(comments_query)
+        ))
 
-        for row in comments_query.yield_per(1000):
-            ws_comments.append(excel_safe(row))
-
-    # ---- Save to memory buffer
-    buffer = BytesIO()
-    try:
-        wb.save(buffer)
-    except Exception as e:
-        logger.error(f"Failed to serialize quality issues workbook for portfolio {portfolio_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to generate Excel report: {str(e)}")
-    buffer.seek(0)
-
-    filename = f"quality_issues_{portfolio_id}.xlsx"
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return export_response(sheets, f"quality_issues_{portfolio_id}.xlsx")
 
 
 @router.get("/{portfolio_id}/quality-issues/{issue_id}", 
@@ -397,6 +366,7 @@ def update_quality_issue(
     for key, value in update_data.items():
         setattr(issue, key, value)
 
+    refresh_portfolio_stats(portfolio_id, db, issues_only=True)
     db.commit()
     db.refresh(issue)
 
@@ -628,6 +598,7 @@ def approve_quality_issue(
         )
         db.add(new_comment)
 
+    refresh_portfolio_stats(portfolio_id, db, issues_only=True)
     db.commit()
     db.refresh(issue)
 
@@ -689,6 +660,7 @@ def approve_all_quality_issues(
             )
             db.add(new_comment)
 
+    refresh_portfolio_stats(portfolio_id, db, issues_only=True)
     db.commit()
 
     return {"message": "All quality issues approved", "count": len(open_issues)}
@@ -761,84 +733,43 @@ async def download_quality_issue_excel(
     if not portfolio:
         raise HTTPException(404, "Portfolio not found")
 
-    issue = (
-        db.query(QualityIssue)
+    # Existence check without loading affected_records; the export reads them itself
+    issue_exists = db.query(
+        db.query(QualityIssue.id)
         .filter(
             QualityIssue.id == issue_id,
             QualityIssue.portfolio_id == portfolio_id
         )
-        .first()
-    )
-    if not issue:
+        .exists()
+    ).scalar()
+    if not issue_exists:
         raise HTTPException(404, "Quality issue not found")
 
-    wb = Workbook()
-    wb.remove(wb.active)  # remove default blank sheet
-
     # ---- Issue details sheet
-    ws = wb.create_sheet("Issue")
-
-    ws.append([
-        "ID", "Type", "Description",
-        "Severity", "Status", "Created", "Updated"
-    ])
+    sheets = [ExportSheet(
+        "Issue",
+        ["ID", "Type", "Description", "Severity", "Status", "Created", "Updated"],
+        query_rows(select(*ISSUE_EXPORT_COLUMNS).where(QualityIssue.id == issue_id)),
+    )]
 
-    ws.append(excel_safe([
-        issue.id,
-        issue.issue_type,
-        issue.description,
-        issue.severity,
-        issue.status,
-        issue.created_at,
-        issue.updated_at
-    ]))
-
-    # ---- Affected records sheet
-    if issue.affected_records and isinstance(issue.affected_records, list):
-        ws_records = wb.create_sheet("Affected Records")
-
-        headers = issue.affected_records[0].keys()
-        ws_records.append(list(headers))
-
-        for record in issue.affected_records:
-            ws_records.append(excel_safe(record.values()))
+    # ---- Affected records sheet (left out when there are none)
+    sheets.append(ExportSheet("Affected Records", None, lambda export_db: affected_record_rows(export_db, issue_id)))
 
     # ---- Comments sheet
     if include_comments:
-        ws_comments = wb.create_sheet("Comments")
-
-        ws_comments.append([
-            "Comment ID", "User Email",
-            "Comment", "Created"
-        ])
-
         comments_query = (
-            db.query(
+            select(
                 QualityIssueComment.id,
                 User.email,
                 QualityIssueComment.comment,
                 QualityIssueComment.created_at
             )
             .join(User, User.id == QualityIssueComment.user_id)
-            .filter(QualityIssueComment.quality_issue_id == issue_id)
+            .where(QualityIssueComment.quality_issue_id == issue_id)
+            .order_by(QualityIssueComment.id)
         )
+        sheets.append(ExportSheet(
+            "Comments", ["Comment ID", "User Email", "Comment", "Created"], query_rows(comments_query)
+        ))
 
-        for row in comments_query.yield_per(1000):
-            ws_comments.append(excel_safe(row))
-
-    # ---- Save buffer
-    buffer = BytesIO()
-    try:
-        wb.save(buffer)
-    except Exception as e:
-        logger.error(f"Failed to serialize quality issue workbook for issue {issue_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to generate Excel report: {str(e)}")
-    buffer.seek(0)
-
-    filename = f"quality_issue_{issue_id}.xlsx"
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
\ No newline at end of file
+    return export_response(sheets, f"quality_issue_{issue_id}.xlsx")
\ No newline at end of file
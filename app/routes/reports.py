@@ -4,13 +4,21 @@ from fastapi import (
     HTTPException,
     status,
     Body,
-    BackgroundTasks,
+    Request,
+    Response,
+    Header,
+    Query,
 )
-from fastapi.responses import StreamingResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import date, datetime
 from uuid import uuid4
-from typing import List, Optional, Dict, Any
+from typing import Annotated, List, Optional, Dict, Any, Tuple
+import os
 import base64
 import logging
 from io import BytesIO
@@ -18,8 +26,18 @@ import asyncio
 from urllib.parse import urlparse
 
 from app.database import get_db
-from app.dependencies import get_tenant_db
+from app.dependencies import get_tenant_db, get_tenant_read_db, get_tenant_async_db, get_tenant_async_read_db
 from app.models import Portfolio, User, Report
+from app.utils.data_versions import data_version_bump
+from app.utils.loan_export import (
+    ARROW_STREAM_MEDIA_TYPE,
+    LOAN_EXPORT_REPORT_TYPE,
+    export_columns,
+    loan_export_query,
+    stream_loan_export,
+)
+from app.utils.report_keys import report_content_key, reusable_reports
+from app.utils.response_cache import cached_response, portfolio_versions
 from app.auth.utils import get_current_active_user
 from app.utils.report_generators import (
     generate_collateral_summary,
@@ -40,15 +58,18 @@ from app.utils.report_generators import (
 )
 # Use MinIO-based factory only
 from app.utils.minio_reports_factory import (
-    run_and_save_report_task,
+    generate_presigned_url,
     generate_presigned_url_for_download,
-    download_report
+    iter_object_chunks,
+    open_report_object,
 )
 from app.config import settings
 from app.schemas import (
     ReportTypeEnum,
     ReportBase,
     ReportRequest,
+    ReportPackRequest,
+    LoanExportRequest,
     ReportSaveRequest,
     ReportCreate,
     ReportUpdate,
@@ -60,9 +81,62 @@ from app.schemas import (
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
+# Download content types by file extension; loan exports are Parquet
+REPORT_MEDIA_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".parquet": "application/vnd.apache.parquet",
+}
+
 logger = logging.getLogger(__name__)
 
 
+async def _request_reports(db: AsyncSession, portfolio_id: int, report_date: date,
+                           report_types: List[str], current_user: User) -> Tuple[List[Report], List[int]]:
+    """
+    One Report per report type (each type once, in the order given), reusing live
+    reports with the same content key. Returns the reports and the ids of the
+    ones created here, which still need a build.
+    """
+    report_version = await db.scalar(select(Portfolio.report_version).where(Portfolio.id == portfolio_id))
+    if report_version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
+    content_keys = {
+        report_type: report_content_key(portfolio_id, report_type, report_date, report_version)
+        for report_type in dict.fromkeys(report_types)
+    }
+
+    # A second pass picks up reports a concurrent request created first
+    for _ in range(2):
+        reports = await reusable_reports(db, portfolio_id, content_keys.values())
+        created = [
+            Report(
+                tenant_id=current_user.tenant_id,
+                created_by=current_user.id,
+                report_type=report_type,
+                report_date=report_date,
+                report_name=f"{report_type}_{uuid4().hex}.xlsx",
+                status="pending",
+                portfolio_id=portfolio_id,
+                report_data={},
+                content_key=content_key,
+            )
+            for report_type, content_key in content_keys.items()
+            if content_key not in reports
+        ]
+        db.add_all(created)
+        if created:
+            await db.execute(data_version_bump(portfolio_id, report_inputs=False))
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            continue
+        reports.update({report.content_key: report for report in created})
+        return [reports[content_key] for content_key in content_keys.values()], [report.id for report in created]
+
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Report is being requested concurrently, try again")
+
+
 @router.post("/{portfolio_id}/generate", 
              description="Generate various types of reports for a portfolio", 
              status_code=status.HTTP_200_OK,
@@ -71,50 +145,46 @@ logger = logging.getLogger(__name__)
 async def generate_report(
     portfolio_id: int,
     report_request: ReportRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_db),
     current_user: User = Depends(get_current_active_user),
 ):
+    """
+    Queue a report build. A request matching a live report of the same portfolio
+    data, type and date gets that report back instead (``reused``).
+    """
     logger.info("ENTER generate report")
-    filename = f"{report_request.report_type.value}_{uuid4().hex}.xlsx"
-    import tempfile
-    import os
-    file_path = os.path.join(tempfile.gettempdir(), filename)
-
     try:
         if report_request.report_type not in ["ecl_detailed_report", "ecl_report_summarised_by_stages", "BOG_impairment_detailed_report", "BOG_impairment_summary_by_stages", "journals_report"]:
             return {"error": "Invalid report type."}
 
-        # Save metadata
-        report = Report(
-            created_by=current_user.id,  # Assuming current_user has an 'id' attribute
-            report_type=report_request.report_type,
-            report_date=report_request.report_date,
-            report_name=filename,
-            file_path=file_path,
-            status="pending",
-            portfolio_id=portfolio_id,  # Save the portfolio_id
-            report_data={},  # Initialize report_data (you might populate this later)
+        (report,), created_ids = await _request_reports(
+            db, portfolio_id, report_request.report_date, [report_request.report_type.value], current_user
         )
-
-        db.add(report)
-        db.commit()
-        db.refresh(report)
+        if not created_ids:
+            logger.info(f"Report {report.id} reused for {report_request.report_type.value}")
+            return {"message": "Report already requested", "report_id": report.id, "reused": True}
 
         try:
-            # Schedule background task (uses MinIO-backed run_and_save_report_task)
-            background_tasks.add_task(run_and_save_report_task, report.id, report_request.report_type, file_path, portfolio_id)
+            # Build on the Celery "reports" queue, outside the API process
+            from app.tasks.reports import run_report_task
+
+            run_report_task.delay(
+                report_id=report.id,
+                report_type=report_request.report_type.value,
+                portfolio_id=portfolio_id,
+                tenant_id=current_user.tenant_id,
+            )
         except Exception as e:
             # Update report status to failed
             report.status = "failed"
-            db.commit()
-            raise e
-
+            await db.commit()
             raise e
 
         logger.info("EXIT generate report")
-        return {"message": "Report generation started", "report_id": report.id}
+        return {"message": "Report generation started", "report_id": report.id, "reused": False}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -122,55 +192,177 @@ async def generate_report(
         )
 
 
+@router.post("/{portfolio_id}/generate-pack",
+             description="Generate several reports of a portfolio together from one scan of its loans",
+             status_code=status.HTTP_200_OK,
+             responses={404: {"description": "Portfolio not found"},
+                        401: {"description": "Not Authenticated"}},)
+async def generate_report_pack(
+    portfolio_id: int,
+    pack_request: ReportPackRequest,
+    db: AsyncSession = Depends(get_tenant_async_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Create one pending Report per requested type and build them in a single
+    Celery job; each report gets its own file and status as usual. Types with a
+    live report of the same portfolio data and date reuse it and are not rebuilt.
+    """
+    reports, created_ids = await _request_reports(
+        db, portfolio_id, pack_request.report_date,
+        [report_type.value for report_type in pack_request.report_types], current_user,
+    )
+    report_ids = [report.id for report in reports]
+
+    if created_ids:
+        try:
+            from app.tasks.reports import run_report_pack_task
+
+            run_report_pack_task.delay(
+                report_ids=created_ids,
+                portfolio_id=portfolio_id,
+                tenant_id=current_user.tenant_id,
+            )
+        except Exception as e:
+            await db.execute(update(Report).where(Report.id.in_(created_ids)).values(status="failed"))
+            await db.commit()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error generating reports: {str(e)}",
+            )
+
+    return {
+        "message": "Report pack generation started",
+        "report_ids": report_ids,
+        "reused_report_ids": [report_id for report_id in report_ids if report_id not in created_ids],
+    }
+
+
+@router.post("/{portfolio_id}/export",
+             description="Export the portfolio's loan-level inputs and results as Parquet",
+             status_code=status.HTTP_200_OK,
+             responses={400: {"description": "Unknown export columns"},
+                        404: {"description": "Portfolio not found"},
+                        401: {"description": "Not Authenticated"}},)
+async def export_loans_parquet(
+    portfolio_id: int,
+    export_request: LoanExportRequest,
+    db: AsyncSession = Depends(get_tenant_async_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Queue a Parquet export of the portfolio's loans, with optional column
+    selection and filters. The export is a report of type ``loan_export``: poll
+    its status and download it with the returned ``report_id``.
+    """
+    try:
+        export_columns(export_request.columns)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if await db.scalar(select(Portfolio.id).where(Portfolio.id == portfolio_id)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
+
+    report = Report(
+        tenant_id=current_user.tenant_id,
+        created_by=current_user.id,
+        report_type=LOAN_EXPORT_REPORT_TYPE,
+        report_date=date.today(),
+        report_name=f"{LOAN_EXPORT_REPORT_TYPE}_{uuid4().hex}.parquet",
+        status="pending",
+        portfolio_id=portfolio_id,
+        report_data={"filters": export_request.model_dump()},
+    )
+    db.add(report)
+    await db.execute(data_version_bump(portfolio_id, report_inputs=False))
+    await db.commit()
+
+    try:
+        from app.tasks.reports import run_loan_export_task
+
+        run_loan_export_task.delay(report_id=report.id, portfolio_id=portfolio_id, tenant_id=current_user.tenant_id)
+    except Exception as e:
+        report.status = "failed"
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error starting loan export: {str(e)}",
+        )
+
+    return {"message": "Loan export started", "report_id": report.id}
+
+
+@router.get("/{portfolio_id}/export/arrow",
+            description="Stream the portfolio's loan-level inputs and results as Arrow IPC",
+            responses={400: {"description": "Unknown export columns"},
+                       404: {"description": "Portfolio not found"},
+                       401: {"description": "Not Authenticated"}},)
+async def export_loans_arrow(
+    portfolio_id: int,
+    export_request: Annotated[LoanExportRequest, Query()],
+    db: AsyncSession = Depends(get_tenant_async_read_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Stream the portfolio's loans as an Arrow IPC stream, one record batch per
+    fetch from the database. Takes the Parquet export's columns and filters as
+    query parameters (repeat a parameter for several values).
+    """
+    try:
+        query, schema = loan_export_query(portfolio_id, current_user.tenant_id, **export_request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if await db.scalar(select(Portfolio.id).where(Portfolio.id == portfolio_id)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
+
+    return StreamingResponse(
+        stream_loan_export(query, schema),
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename=loans_{portfolio_id}.arrows"},
+    )
+
+
 @router.get("/{portfolio_id}/history", 
             description="Get report history for a portfolio with optional filters", 
             response_model=ReportHistoryList,
             responses={404: {"description": "Portfolio not found"},
                        401: {"description": "Not Authenticated"}},)
+@cached_response("report_history", versions=portfolio_versions, response_model=ReportHistoryList)
 async def get_report_history(
     portfolio_id: int,
+    request: Request,
+    response: Response,
     report_type: Optional[ReportTypeEnum] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Get the report history for a specific portfolio.
     Optional filtering by report type and date range.
+    Cached per tenant until the portfolio's data_version changes; the portfolio
+    lookup happens in portfolio_versions.
     """
-    # Verify portfolio exists and belongs to current user
-    portfolio = (
-        db.query(Portfolio)
-        .filter(Portfolio.id == portfolio_id)
-        .first()
-    )
-
-    if not portfolio:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found"
-        )
-
     # Build query for reports
-    query = db.query(Report).filter(Report.portfolio_id == portfolio_id)
+    query = select(Report).where(Report.portfolio_id == portfolio_id)
 
     # Apply filters if provided
     if report_type:
-        query = query.filter(Report.report_type == report_type)
+        query = query.where(Report.report_type == report_type)
 
     if start_date:
-        query = query.filter(Report.report_date >= start_date)
+        query = query.where(Report.report_date >= start_date)
 
     if end_date:
-        query = query.filter(Report.report_date <= end_date)
+        query = query.where(Report.report_date <= end_date)
 
     # Get total count for pagination
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
 
     # Apply pagination and order
-    reports = query.order_by(Report.created_at.desc()).offset(skip).limit(limit).all()
+    reports = (await db.scalars(query.order_by(Report.created_at.desc()).offset(skip).limit(limit))).all()
 
     return {"items": reports, "total": total}
 
@@ -183,18 +375,14 @@ async def get_report_history(
 async def get_report(
     portfolio_id: int,
     report_id: int,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Get a specific report by ID.
     """
     # Verify portfolio exists and belongs to current user
-    portfolio = (
-        db.query(Portfolio)
-        .filter(Portfolio.id == portfolio_id)
-        .first()
-    )
+    portfolio = await db.scalar(select(Portfolio).where(Portfolio.id == portfolio_id))
 
     if not portfolio:
         raise HTTPException(
@@ -202,10 +390,8 @@ async def get_report(
         )
 
     # Get the report
-    report = (
-        db.query(Report)
-        .filter(Report.id == report_id, Report.portfolio_id == portfolio_id)
-        .first()
+    report = await db.scalar(
+        select(Report).where(Report.id == report_id, Report.portfolio_id == portfolio_id)
     )
 
     if not report:
@@ -226,18 +412,14 @@ async def get_report(
 async def delete_report(
     portfolio_id: int,
     report_id: int,
-    db: Session = Depends(get_tenant_db),
+    db: AsyncSession = Depends(get_tenant_async_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Delete a specific report by ID.
     """
     # Verify portfolio exists and belongs to current user
-    portfolio = (
-        db.query(Portfolio)
-        .filter(Portfolio.id == portfolio_id)
-        .first()
-    )
+    portfolio = await db.scalar(select(Portfolio).where(Portfolio.id == portfolio_id))
 
     if not portfolio:
         raise HTTPException(
@@ -245,10 +427,8 @@ async def delete_report(
         )
 
     # Get the report
-    report = (
-        db.query(Report)
-        .filter(Report.id == report_id, Report.portfolio_id == portfolio_id)
-        .first()
+    report = await db.scalar(
+        select(Report).where(Report.id == report_id, Report.portfolio_id == portfolio_id)
     )
 
     if not report:
@@ -258,34 +438,38 @@ async def delete_report(
 
     # Delete the report
     try:
-        db.delete(report)
-        db.commit()
+        await db.delete(report)
+        await db.execute(data_version_bump(portfolio_id, report_inputs=False))
+        await db.commit()
     except Exception as e:
-        db.rollback()
-        db.commit()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
 
 
 @router.get("/{portfolio_id}/report/{report_id}/download", 
             description="Download a specific report as Excel", 
             status_code=status.HTTP_200_OK,
-            responses={404: {"description": "Portfolio or Report not found"},
+            responses={206: {"description": "Requested byte range of the report"},
+                       307: {"description": "Redirect to a presigned download URL"},
+                       404: {"description": "Portfolio or Report not found"},
+                       416: {"description": "Requested range not satisfiable"},
                        401: {"description": "Not Authenticated"}},)
 async def download_report_excel(
     portfolio_id: int,
     report_id: int,
-    db: Session = Depends(get_tenant_db),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None, alias="If-Range"),
+    db: AsyncSession = Depends(get_tenant_async_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Fetch report metadata and download the actual file from MinIO.
-    Only uses `report_name` from the report object.
+    Stream a report's workbook from MinIO in chunks, without holding it in memory.
+    Supports ``Range``/``If-Range`` for resumed downloads. With
+    ``REPORT_DOWNLOAD_REDIRECT`` the client is redirected to a presigned URL instead.
     """
     # 1️⃣ Fetch report metadata
-    report = (
-        db.query(Report)
-        .filter(Report.id == report_id, Report.portfolio_id == portfolio_id)
-        .first()
+    report = await db.scalar(
+        select(Report).where(Report.id == report_id, Report.portfolio_id == portfolio_id)
     )
 
     if not report:
@@ -293,25 +477,17 @@ async def download_report_excel(
 
     # 2️⃣ Extract report_name
     report_name = report.report_name
-    bucket_name = "ifrs9pro-reports"
     object_name = f"reports/{report_name}"
+    media_type = REPORT_MEDIA_TYPES.get(os.path.splitext(report_name)[1], REPORT_MEDIA_TYPES[".xlsx"])
 
-    # 3️⃣ Download and stream the file
-    try:
-        file_data = download_report(bucket_name, object_name)
-        if asyncio.iscoroutine(file_data):
-            file_data = await file_data
-
-        return StreamingResponse(
-            file_data,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f"attachment; filename={report_name}",
-                "Access-Control-Allow-Origin": "https://ifrs9pro.service4gh.com",
-                "Access-Control-Allow-Credentials": "true"
-            }
-        )
+    # 3️⃣ Hand out a presigned URL, or stream the file
+    if settings.REPORT_DOWNLOAD_REDIRECT:
+        url = generate_presigned_url(object_name, file_name=report_name, content_type=media_type)
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
 
+    try:
+        # boto3 is blocking, so keep it off the event loop
+        download = await run_in_threadpool(open_report_object, object_name, range_header, if_range)
     except FileNotFoundError:
         # This handles the case where the file is not found in MinIO
         raise HTTPException(
@@ -326,6 +502,23 @@ async def download_report_excel(
             detail=f"Error downloading report: {str(e)}"
         )
 
+    headers = {
+        **download["headers"],
+        "Content-Disposition": f"attachment; filename={report_name}",
+        "Access-Control-Allow-Origin": "https://ifrs9pro.service4gh.com",
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges, ETag, Last-Modified",
+    }
+    if download["body"] is None:
+        return Response(status_code=download["status"], headers=headers)
+    # A sync iterator: Starlette reads each chunk in the threadpool
+    return StreamingResponse(
+        iter_object_chunks(download["body"]),
+        status_code=download["status"],
+        media_type=media_type,
+        headers=headers,
+    )
+
 
 @router.get("/status/{report_id}", 
             description="Check status of a report generation",
@@ -336,4 +529,18 @@ def get_report_status(report_id: int, db: Session = Depends(get_tenant_db)):
 
     if not status_val:
         raise HTTPException(status_code=404, detail="Report generated in earlier versions of IFRS9PRO no report status found")
-    return status_val
\ No newline at end of file
+    return status_val
+
+
+@router.get("/journal",
+            description="Consolidated journal entries across the tenant's portfolios, from each portfolio's latest ECL and local impairment calculations",
+            responses={401: {"description": "Not Authenticated"}},)
+def get_tenant_journal(
+    report_date: Optional[date] = Query(None, description="Date of the journal (defaults to today)"),
+    portfolio_ids: Optional[List[int]] = Query(None, description="Portfolios to include (all of the tenant's by default)"),
+    db: Session = Depends(get_tenant_read_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    return generate_journal_report(
+        db, portfolio_ids or [], report_date or date.today(), tenant_id=current_user.tenant_id
+    )
@@ -352,6 +352,8 @@ class ReportUpdate(BaseModel):
 
 
 class ReportInDB(ReportBase):
+    # Stored reports also include loan exports (app.utils.loan_export)
+    report_type: str
     id: int
     portfolio_id: int
     created_at: datetime
@@ -387,6 +389,22 @@ class ReportRequest(BaseModel):
     report_type: ReportTypeEnum
 
 
+class ReportPackRequest(BaseModel):
+    report_date: date
+    # Defaults to every report type, built from one scan of the portfolio
+    report_types: List[ReportTypeEnum] = Field(default_factory=lambda: list(ReportTypeEnum), min_length=1)
+
+
+class LoanExportRequest(BaseModel):
+    # Loan columns to export (app.utils.loan_export.EXPORTABLE_COLUMNS); defaults to ECL inputs and results
+    columns: Optional[List[str]] = None
+    ifrs9_stage: Optional[List[str]] = None
+    bog_stage: Optional[List[str]] = None
+    employer: Optional[List[str]] = None
+    # Only loans with a final ECL above this
+    min_ecl: Optional[float] = None
+
+
 class ReportSaveRequest(BaseModel):
     report_date: date
     report_type: ReportTypeEnum
@@ -1012,6 +1030,33 @@ class FileMapping(BaseModel):
 class IngestPayload(BaseModel):
     files: List[FileMapping] = Field(..., description="List of files to ingest with mappings")
 
+class StreamIngestRejection(BaseModel):
+    position: int = Field(..., description="Position of the rejected record in the sender's feed")
+    error: str
+
+class StreamIngestBatchAck(BaseModel):
+    batch: int
+    records: int
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    rejections: List[StreamIngestRejection] = []
+    status: str = Field(..., description="committed, failed or limit_exceeded")
+    cursor: int = Field(..., description="Feed position to resume from once this batch is acknowledged")
+    error: Optional[str] = None
+
+class StreamIngestResponse(BaseModel):
+    portfolio_id: int
+    record_type: str
+    status: str = Field(..., description="completed, failed or limit_exceeded")
+    error: Optional[str] = None
+    cursor: int = Field(..., description="Feed position after the last committed batch")
+    received: int
+    inserted: int
+    updated: int
+    rejected: int
+    batches: List[StreamIngestBatchAck]
+
 
 # ==================== BILLING MODELS ====================
 class CustomerCreate(BaseModel):
@@ -1,6 +1,7 @@
 from app.celery_app import celery_app
 from app.database import SessionLocal
 from app.utils.staging import stage_loans_ecl_orm, stage_loans_local_impairment_orm
+from app.utils.response_cache import invalidate_portfolio
 import logging
 import asyncio
 
@@ -20,6 +21,7 @@ def run_ecl_staging_task(self, portfolio_id: int, user_email: str, first_name: s
             result = loop.run_until_complete(
                 stage_loans_ecl_orm(portfolio_id, db, user_email, first_name)
             )
+            invalidate_portfolio(portfolio_id)
             return result
         except Exception as e:
             logger.error(f"ECL staging task failed: {e}")
@@ -41,6 +43,7 @@ def run_bog_staging_task(self, portfolio_id: int, user_email: str, first_name: s
             result = loop.run_until_complete(
                 stage_loans_local_impairment_orm(portfolio_id, db, user_email, first_name)
             )
+            invalidate_portfolio(portfolio_id)
             return result
         except Exception as e:
             logger.error(f"BOG staging task failed: {e}")
@@ -72,6 +75,7 @@ def run_ecl_calculation_task(self, portfolio_id: int, reporting_date_str: str, u
                     first_name=first_name
                 )
             )
+            invalidate_portfolio(portfolio_id)
             return result
         except Exception as e:
             logger.error(f"ECL calculation task failed: {e}")
@@ -103,6 +107,7 @@ def run_bog_calculation_task(self, portfolio_id: int, reporting_date_str: str, u
                     first_name=first_name
                 )
             )
+            invalidate_portfolio(portfolio_id)
             return result
         except Exception as e:
             logger.error(f"BOG calculation task failed: {e}")
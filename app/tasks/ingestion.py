@@ -2,89 +2,142 @@ from app.celery_app import celery_app
 from app.database import SessionLocal
 from app.utils.minio_reports_factory import s3_client
 from app.config import settings
-from app.utils.background_ingestion import process_portfolio_ingestion_sync
+from app.utils.background_ingestion import (
+    process_portfolio_ingestion_sync,
+    swap_portfolio_data,
+    finalize_portfolio_ingestion,
+    report_ingestion_outcome,
+)
+from app.utils.shadow_tables import create_shadow_tables
+from app.utils.response_cache import invalidate_portfolio
+from app.utils.ingest_formats import count_file_rows, file_suffix
+from app.utils.sync_processors import (
+    file_to_parquet_chunks,
+    process_loan_chunk_sync,
+    process_client_data_sync,
+)
+from celery import chord, group
 from io import BytesIO
 import pandas as pd
+import asyncio
 import logging
+import os
+import tempfile
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Celery file types -> argument names of process_portfolio_ingestion_sync
+FILE_ARGUMENTS = {
+    "loan_details": "loan_details_content",
+    "client_data": "client_data_content",
+    "loan_guarantee_data": "loan_guarantee_content",
+    "loan_collateral_data": "loan_collateral_data_content",
+}
+
+
+def _download_to_temp(file_type: str, file_key: str) -> str:
+    """Download a MinIO object to a local temp file (keeping its format extension) and return its path."""
+    fd, temp_path = tempfile.mkstemp(suffix=file_suffix(file_key), prefix=f"celery_{file_type}_")
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            s3_client.download_fileobj(settings.MINIO_BUCKET_NAME, file_key, tmp)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    logger.info(f"Downloaded {file_key} to {temp_path}")
+    return temp_path
+
+
+def _remove_temp_files(paths) -> None:
+    for tf in paths:
+        try:
+            if tf and os.path.exists(tf):
+                os.remove(tf)
+                logger.debug(f"Cleaned up Celery temp file: {tf}")
+        except OSError as e:
+            logger.warning(f"Failed to remove Celery temp file {tf}: {e}")
+
+
+def _run_coroutine(coro):
+    """Run an async processing utility to completion on a fresh event loop."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
 @celery_app.task(bind=True)
 def run_ingestion_task(self, portfolio_id: int, tenant_id: int, file_mappings: dict, user_email: str, first_name: str):
     """
     Celery task to handle portfolio ingestion.
     Downloads files from MinIO, processes them, and cleans up.
+
+    When ``INGESTION_CHUNKED_ENABLED`` is set and the loan details file has more
+    rows than ``INGESTION_CHUNK_ROWS`` (counted without converting it), the loan
+    file is split into Parquet row ranges, read with the tenant's ingestion
+    template, and fanned out to ``run_loan_chunk_task`` sub-tasks joined by a chord.
     """
     logger.info(f"Starting Celery ingestion task for portfolio {portfolio_id}")
-    
-    import os
-    import tempfile
-    
-    file_paths = {
-        "loan_details_content": None,
-        "client_data_content": None,
-        "loan_guarantee_content": None,
-        "loan_collateral_data_content": None
-    }
-    
+
+    file_paths = {argument: None for argument in FILE_ARGUMENTS.values()}
+
     uploaded_filenames = []
     temp_files = []
-    
+
     try:
         # 1. Download files from MinIO to local temp storage
         for file_type, file_key in file_mappings.items():
-            if not file_key:
+            if not file_key or file_type not in FILE_ARGUMENTS:
                 continue
-                
+
             try:
-                fd, temp_path = tempfile.mkstemp(suffix=".xlsx", prefix=f"celery_{file_type}_")
-                with os.fdopen(fd, 'wb') as tmp:
-                    s3_client.download_fileobj(settings.MINIO_BUCKET_NAME, file_key, tmp)
-                
+                temp_path = _download_to_temp(file_type, file_key)
                 temp_files.append(temp_path)
-                logger.info(f"Downloaded {file_key} to {temp_path}")
-                
+
                 # Map to correct argument name for the sync utility
-                if file_type == "loan_details":
-                    file_paths["loan_details_content"] = temp_path
-                    uploaded_filenames.append("loan_details")
-                elif file_type == "client_data":
-                    file_paths["client_data_content"] = temp_path
-                    uploaded_filenames.append("client_data")
-                elif file_type == "loan_guarantee_data":
-                    file_paths["loan_guarantee_content"] = temp_path
-                    uploaded_filenames.append("loan_guarantee_data")
-                elif file_type == "loan_collateral_data":
-                    file_paths["loan_collateral_data_content"] = temp_path
-                    uploaded_filenames.append("loan_collateral_data")
-                    
+                file_paths[FILE_ARGUMENTS[file_type]] = temp_path
+                uploaded_filenames.append(file_type)
+
             except Exception as e:
                 logger.error(f"Failed to download file {file_key}: {e}")
                 raise e
 
-        # 2. Run the processing utility (supports path inputs)
+        # 2. Large loan files: split into row ranges and fan out across workers
+        loan_details_path = file_paths["loan_details_content"]
+        if (settings.INGESTION_CHUNKED_ENABLED and loan_details_path
+                and count_file_rows(loan_details_path) > settings.INGESTION_CHUNK_ROWS):
+            with SessionLocal() as db:
+                chunks, date_formats = file_to_parquet_chunks(
+                    loan_details_path, settings.INGESTION_CHUNK_ROWS, tenant_id, db
+                )
+            try:
+                return _dispatch_chunked_ingestion(
+                    self, portfolio_id, tenant_id, file_mappings, chunks, date_formats,
+                    user_email, first_name, uploaded_filenames,
+                )
+            finally:
+                _remove_temp_files(path for path, _ in chunks)
+
+        # 3. Run the processing utility (supports path inputs)
         with SessionLocal() as db:
-             import asyncio
-             
-             loop = asyncio.new_event_loop()
-             asyncio.set_event_loop(loop)
-             
-             try:
-                 results = loop.run_until_complete(
-                     process_portfolio_ingestion_sync(
-                         task_id=self.request.id,
-                         portfolio_id=portfolio_id,
-                         tenant_id=tenant_id,
-                         db=db,
-                         user_email=user_email,
-                         first_name=first_name,
-                         uploaded_filenames=uploaded_filenames,
-                         **file_paths
-                     )
-                 )
-             finally:
-                 loop.close()
+            results = _run_coroutine(
+                process_portfolio_ingestion_sync(
+                    task_id=self.request.id,
+                    portfolio_id=portfolio_id,
+                    tenant_id=tenant_id,
+                    db=db,
+                    user_email=user_email,
+                    first_name=first_name,
+                    uploaded_filenames=uploaded_filenames,
+                    **file_paths
+                )
+            )
 
+        invalidate_portfolio(portfolio_id)
         return results
 
     except Exception as e:
@@ -92,9 +145,162 @@ def run_ingestion_task(self, portfolio_id: int, tenant_id: int, file_mappings: d
         raise e
     finally:
         # Cleanup local temp files
-        for tf in temp_files:
-            try:
-                if os.path.exists(tf):
-                    os.remove(tf)
-                    logger.debug(f"Cleaned up Celery temp file: {tf}")
-            except: pass
+        _remove_temp_files(temp_files)
+
+
+def _dispatch_chunked_ingestion(task, portfolio_id, tenant_id, file_mappings, chunks, date_formats,
+                                user_email, first_name, uploaded_filenames):
+    """
+    Create the portfolio's shadow tables, stage each Parquet chunk in MinIO and start the chord:
+    one ``run_loan_chunk_task`` per chunk plus ``run_client_data_task``, joined by
+    ``finalize_chunked_ingestion_task``.
+    """
+    results = {
+        "portfolio_id": portfolio_id,
+        "files_processed": 0,
+        "total_files": len(uploaded_filenames),
+        "details": {}
+    }
+    with SessionLocal() as db:
+        shadows = create_shadow_tables(portfolio_id, db)
+
+    prefix = f"ingestion/{portfolio_id}/{task.request.id}"
+    chunk_info = []
+    header = []
+    for index, (chunk_path, row_count) in enumerate(chunks):
+        chunk_key = f"{prefix}/loan_details_{index:04d}.parquet"
+        s3_client.upload_file(chunk_path, settings.MINIO_BUCKET_NAME, chunk_key)
+
+        chunk_task_id = str(uuid.uuid4())
+        header.append(
+            run_loan_chunk_task.s(
+                portfolio_id, tenant_id, chunk_key, index, len(chunks), shadows["loans"], date_formats
+            ).set(task_id=chunk_task_id)
+        )
+        chunk_info.append({"chunk": index, "rows": row_count, "task_id": chunk_task_id})
+
+    if file_mappings.get("client_data"):
+        header.append(run_client_data_task.s(portfolio_id, tenant_id, file_mappings["client_data"], shadows["clients"]))
+
+    callback = finalize_chunked_ingestion_task.s(
+        portfolio_id, tenant_id, file_mappings, results, user_email, first_name, uploaded_filenames
+    )
+    chord_result = chord(group(header))(callback)
+
+    progress = {
+        "status": "dispatched",
+        "mode": "chunked",
+        "portfolio_id": portfolio_id,
+        "total_rows": sum(row_count for _, row_count in chunks),
+        "chunks": chunk_info,
+        "finalize_task_id": chord_result.id,
+    }
+    task.update_state(state="PROGRESS", meta=progress)
+    logger.info(f"Dispatched {len(chunks)} loan chunks for portfolio {portfolio_id} (finalize task {chord_result.id})")
+    return progress
+
+
+@celery_app.task(bind=True)
+def run_loan_chunk_task(self, portfolio_id: int, tenant_id: int, chunk_key: str, chunk_index: int, total_chunks: int,
+                        table: str = "loans", date_formats: dict = None):
+    """
+    COPY one Parquet row range of a loan details file into ``table`` (the portfolio's loans shadow),
+    parsing dates with the ingestion template's ``date_formats`` when there is one.
+    Failures are returned rather than raised so the chord callback still runs and reports them.
+    """
+    self.update_state(state="PROGRESS", meta={"chunk": chunk_index, "total_chunks": total_chunks, "status": "running"})
+    temp_path = None
+    try:
+        temp_path = _download_to_temp("loan_details", chunk_key)
+        with SessionLocal() as db:
+            result = _run_coroutine(process_loan_chunk_sync(temp_path, portfolio_id, tenant_id, db, table, date_formats))
+        result.update({"file_type": "loan_details", "chunk": chunk_index})
+        return result
+    except Exception as e:
+        logger.error(f"Loan chunk {chunk_index + 1}/{total_chunks} failed for portfolio {portfolio_id}: {e}")
+        return {"file_type": "loan_details", "chunk": chunk_index, "error": str(e)}
+    finally:
+        _remove_temp_files([temp_path])
+        try:
+            s3_client.delete_object(Bucket=settings.MINIO_BUCKET_NAME, Key=chunk_key)
+        except Exception as e:
+            logger.warning(f"Failed to delete ingestion chunk {chunk_key}: {e}")
+
+
+@celery_app.task(bind=True)
+def run_client_data_task(self, portfolio_id: int, tenant_id: int, file_key: str, table: str = "clients"):
+    """COPY the client data file into ``table`` alongside the loan chunks of a chunked ingestion."""
+    temp_path = None
+    try:
+        temp_path = _download_to_temp("client_data", file_key)
+        with SessionLocal() as db:
+            result = _run_coroutine(process_client_data_sync(temp_path, portfolio_id, tenant_id, db, table))
+        result["file_type"] = "client_data"
+        return result
+    except Exception as e:
+        logger.error(f"Client data ingestion failed for portfolio {portfolio_id}: {e}")
+        return {"file_type": "client_data", "error": str(e)}
+    finally:
+        _remove_temp_files([temp_path])
+
+
+@celery_app.task(bind=True)
+def finalize_chunked_ingestion_task(self, chunk_results: list, portfolio_id: int, tenant_id: int, file_mappings: dict,
+                                    results: dict, user_email: str, first_name: str, uploaded_filenames: list):
+    """
+    Chord callback of a chunked ingestion: merge the per-chunk results, swap the
+    shadow tables in, then run guarantees, collateral, quality checks, staging,
+    usage and the outcome email.
+    """
+    loan_chunks = [r for r in chunk_results if r.get("file_type") == "loan_details"]
+    loan_errors = [f"Chunk {r['chunk']}: {r['error']}" for r in loan_chunks if r.get("error")]
+    results["details"]["loan_details"] = {
+        "processed": sum(r.get("processed", 0) for r in loan_chunks),
+        "chunks": len(loan_chunks),
+        "success": not loan_errors,
+    }
+    if loan_errors:
+        results["details"]["loan_details"]["errors"] = loan_errors
+        results.setdefault("errors", []).extend(f"Error processing loan details: {e}" for e in loan_errors)
+    else:
+        results["files_processed"] += 1
+
+    for client_result in (r for r in chunk_results if r.get("file_type") == "client_data"):
+        results["details"]["client_data"] = client_result
+        if client_result.get("error"):
+            results.setdefault("errors", []).append(f"Error processing client data: {client_result['error']}")
+        else:
+            results["files_processed"] += 1
+
+    with SessionLocal() as db:
+        if not swap_portfolio_data(portfolio_id, db, results):
+            return _run_coroutine(
+                report_ingestion_outcome(portfolio_id, results, first_name, user_email, uploaded_filenames)
+            )
+
+    temp_files = []
+    try:
+        extra_paths = {}
+        for file_type in ("loan_guarantee_data", "loan_collateral_data"):
+            file_key = file_mappings.get(file_type)
+            if file_key:
+                extra_paths[FILE_ARGUMENTS[file_type]] = _download_to_temp(file_type, file_key)
+                temp_files.append(extra_paths[FILE_ARGUMENTS[file_type]])
+
+        with SessionLocal() as db:
+            results = _run_coroutine(
+                finalize_portfolio_ingestion(
+                    portfolio_id=portfolio_id,
+                    db=db,
+                    results=results,
+                    first_name=first_name,
+                    user_email=user_email,
+                    uploaded_filenames=uploaded_filenames,
+                    **extra_paths
+                )
+            )
+        logger.info(f"Chunked portfolio ingestion completed with status: {results['status']}")
+        invalidate_portfolio(portfolio_id)
+        return results
+    finally:
+        _remove_temp_files(temp_files)
@@ -0,0 +1,218 @@
+from app.celery_app import celery_app
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Report
+from app.utils.minio_reports_factory import (
+    ReportUploadError,
+    run_and_save_loan_export_task,
+    run_and_save_report_pack_task,
+    run_and_save_report_task,
+)
+from app.utils.data_versions import bump_data_version
+from botocore.exceptions import BotoCoreError
+from datetime import datetime, timezone
+from sqlalchemy.exc import OperationalError
+from typing import List
+import logging
+import os
+import redis
+import shutil
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Failures worth another attempt: database disconnects, MinIO being unreachable and
+# failed uploads. Other HTTPExceptions from the builders (bad input, missing data) are final.
+TRANSIENT_ERRORS = (OperationalError, BotoCoreError, ConnectionError, ReportUploadError)
+
+_slots_client = None
+
+
+def _slots():
+    global _slots_client
+    if _slots_client is None:
+        _slots_client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    return _slots_client
+
+
+def _slot_key(tenant_id: int) -> str:
+    return f"report-slots:{tenant_id}"
+
+
+def acquire_tenant_slot(tenant_id: int, holder: str) -> bool:
+    """
+    Take one of the tenant's REPORT_TENANT_CONCURRENCY report slots. Slots are a
+    sorted set of holders scored by start time, so slots of workers that died
+    without releasing them expire after REPORT_SLOT_TIMEOUT.
+    """
+    key = _slot_key(tenant_id)
+    now = time.time()
+    pipe = _slots().pipeline()
+    pipe.zremrangebyscore(key, 0, now - settings.REPORT_SLOT_TIMEOUT)
+    pipe.zadd(key, {holder: now})
+    pipe.zrank(key, holder)
+    pipe.expire(key, settings.REPORT_SLOT_TIMEOUT)
+    rank = pipe.execute()[2]
+    if rank is not None and rank < settings.REPORT_TENANT_CONCURRENCY:
+        return True
+    _slots().zrem(key, holder)
+    return False
+
+
+def release_tenant_slot(tenant_id: int, holder: str) -> None:
+    _slots().zrem(_slot_key(tenant_id), holder)
+
+
+def _set_status(report_ids: List[int], portfolio_id: int, status: str) -> None:
+    with SessionLocal() as db:
+        values = {"status": status}
+        if status == "running":
+            values["started_at"] = datetime.now(timezone.utc)
+        db.query(Report).filter(Report.id.in_(report_ids)).update(values)
+        bump_data_version(portfolio_id, db, report_inputs=False)
+        db.commit()
+
+
+def _build_with_retries(task, report_ids: List[int], portfolio_id: int, build) -> None:
+    """
+    Run ``build`` with the reports marked running. Transient errors retry the task
+    with exponential backoff until max_retries; any other error marks them failed.
+    """
+    try:
+        _set_status(report_ids, portfolio_id, "running")
+        logger.info(f"Starting Celery report build for reports {report_ids} (attempt {task.request.retries + 1})")
+        build()
+    except TRANSIENT_ERRORS as e:
+        if task.request.retries < task.max_retries:
+            logger.warning(f"Reports {report_ids} failed with a transient error, retrying: {e}")
+            _set_status(report_ids, portfolio_id, "retrying")
+            raise task.retry(exc=e, countdown=settings.REPORT_RETRY_DELAY * 2 ** task.request.retries)
+        logger.error(f"Report task failed for report_ids={report_ids}: {e}")
+        _set_status(report_ids, portfolio_id, "failed")
+        raise
+    except Exception as e:
+        logger.error(f"Report task failed for report_ids={report_ids}: {e}")
+        _set_status(report_ids, portfolio_id, "failed")
+        raise
+
+
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=3)
+def run_report_task(self, report_id: int, report_type: str, portfolio_id: int, tenant_id: int):
+    """
+    Celery task building a report workbook and uploading it to MinIO. Runs on the
+    "reports" queue; progress is tracked on the Report row's status
+    (pending -> running -> success/failed, "retrying" between attempts).
+    """
+    with SessionLocal() as db:
+        report = db.query(Report).filter(Report.id == report_id).first()
+        if report is None:
+            logger.error(f"Report {report_id} not found.")
+            return {"report_id": report_id, "status": "missing"}
+        # Redelivered after the report was already built (e.g. the worker died before acking)
+        if report.status == "success":
+            return {"report_id": report_id, "status": "success"}
+        filename = report.report_name
+
+    holder = self.request.id or f"report-{report_id}"
+    if not acquire_tenant_slot(tenant_id, holder):
+        # Wait for one of the tenant's running reports without using up retries
+        logger.info(f"Report {report_id} waiting for a free slot of tenant {tenant_id}")
+        run_report_task.apply_async(
+            args=(report_id, report_type, portfolio_id, tenant_id),
+            queue="reports",
+            countdown=settings.REPORT_SLOT_WAIT,
+        )
+        return {"report_id": report_id, "status": "pending"}
+
+    # Each attempt writes its own local file; the MinIO object name stays the
+    # same, so a repeated attempt overwrites rather than duplicates the upload
+    file_path = os.path.join(tempfile.mkdtemp(prefix="report-"), filename)
+    try:
+        _build_with_retries(
+            self, [report_id], portfolio_id,
+            lambda: run_and_save_report_task(report_id, report_type, file_path, portfolio_id, raise_errors=True),
+        )
+        return {"report_id": report_id, "status": "success"}
+    finally:
+        release_tenant_slot(tenant_id, holder)
+        try:
+            os.rmdir(os.path.dirname(file_path))
+        except OSError:
+            pass
+
+
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=3)
+def run_report_pack_task(self, report_ids: List[int], portfolio_id: int, tenant_id: int):
+    """
+    Celery task building several reports of one portfolio from a single scan of
+    its loans (see run_and_save_report_pack_task). The pack takes one tenant slot
+    and its reports share a status.
+    """
+    with SessionLocal() as db:
+        # Reports a redelivered pack already finished are not built again
+        pending_ids = [
+            report_id for (report_id,) in
+            db.query(Report.id).filter(Report.id.in_(report_ids), Report.status != "success")
+        ]
+    if not pending_ids:
+        return {"report_ids": report_ids, "status": "success"}
+
+    holder = self.request.id or f"report-pack-{pending_ids[0]}"
+    if not acquire_tenant_slot(tenant_id, holder):
+        logger.info(f"Report pack {pending_ids} waiting for a free slot of tenant {tenant_id}")
+        run_report_pack_task.apply_async(
+            args=(report_ids, portfolio_id, tenant_id),
+            queue="reports",
+            countdown=settings.REPORT_SLOT_WAIT,
+        )
+        return {"report_ids": report_ids, "status": "pending"}
+
+    directory = tempfile.mkdtemp(prefix="report-pack-")
+    try:
+        _build_with_retries(
+            self, pending_ids, portfolio_id,
+            lambda: run_and_save_report_pack_task(pending_ids, portfolio_id, directory),
+        )
+        return {"report_ids": report_ids, "status": "success"}
+    finally:
+        release_tenant_slot(tenant_id, holder)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=3)
+def run_loan_export_task(self, report_id: int, portfolio_id: int, tenant_id: int):
+    """
+    Celery task writing a loan export Report as Parquet and uploading it to MinIO
+    (see run_and_save_loan_export_task). Shares the tenant's report slots and
+    statuses with report builds.
+    """
+    with SessionLocal() as db:
+        report = db.query(Report).filter(Report.id == report_id).first()
+        if report is None:
+            logger.error(f"Report {report_id} not found.")
+            return {"report_id": report_id, "status": "missing"}
+        if report.status == "success":
+            return {"report_id": report_id, "status": "success"}
+        filename = report.report_name
+
+    holder = self.request.id or f"loan-export-{report_id}"
+    if not acquire_tenant_slot(tenant_id, holder):
+        logger.info(f"Loan export {report_id} waiting for a free slot of tenant {tenant_id}")
+        run_loan_export_task.apply_async(
+            args=(report_id, portfolio_id, tenant_id),
+            queue="reports",
+            countdown=settings.REPORT_SLOT_WAIT,
+        )
+        return {"report_id": report_id, "status": "pending"}
+
+    directory = tempfile.mkdtemp(prefix="loan-export-")
+    try:
+        _build_with_retries(
+            self, [report_id], portfolio_id,
+            lambda: run_and_save_loan_export_task(report_id, os.path.join(directory, filename)),
+        )
+        return {"report_id": report_id, "status": "success"}
+    finally:
+        release_tenant_slot(tenant_id, holder)
+        shutil.rmtree(directory, ignore_errors=True)
@@ -29,6 +29,7 @@ from app.utils.process_email_notifyer import (
 )
 from app.calculators.ecl import calculate_probability_of_default
 from app.utils.staging import parse_days_range
+from app.utils.portfolio_stats import refresh_portfolio_stats
 from sqlalchemy import func
 from dateutil.relativedelta import relativedelta
 
@@ -383,6 +384,7 @@ async def process_ecl_calculation_sync(portfolio_id: int, reporting_date: str, d
             result_summary=result_summary,
         )
         db.add(calculation_result)
+        refresh_portfolio_stats(portfolio_id, db)
         db.commit()
 
         # Success email
@@ -606,6 +608,7 @@ async def process_bog_impairment_calculation_sync(
             result_summary=result_summary
         )
         db.add(calculation_result)
+        refresh_portfolio_stats(portfolio_id, db)
         db.commit()
 
         # -------------------------------------------------------
@@ -1302,6 +1305,10 @@ async def update_portfolio_ead_sync(portfolio_id: int, db: Session, reporting_da
             db.commit()
             offset += batch_size
             logger.info(f"Updated EAD for {total_updated} loans in portfolio {portfolio_id}")
+
+        # Loan values and stage exposures are EAD sums
+        refresh_portfolio_stats(portfolio_id, db)
+        db.commit()
             
         return {"status": "success", "total_updated": total_updated}
         
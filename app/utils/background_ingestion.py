@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import os
 from typing import Optional, Dict, Any, List
 from fastapi import UploadFile, HTTPException
 from sqlalchemy.orm import Session
@@ -39,6 +40,8 @@ from app.utils.sync_processors import (
     
 )
 
+from app.utils.ingest_formats import file_suffix
+from app.utils.shadow_tables import create_shadow_tables, drop_shadow_tables, swap_in_shadow_tables
 from app.utils.process_email_notifyer import send_ingestion_success_email, send_ingestion_failed_email, send_ingestion_began_email
 from app.utils.processors import process_loan_guarantees, process_collateral_data
 from app.utils.background_calculations import (
@@ -76,6 +79,179 @@ def get_model_columns(model):
 
 
 
+def swap_portfolio_data(portfolio_id: int, db: Session, results: Dict[str, Any]) -> bool:
+    """
+    Swap the loans and clients loaded into the portfolio's shadow tables in for the live rows.
+
+    If loading failed the shadows are dropped and the previous data is kept as-is.
+    Errors are recorded on ``results`` rather than raised; returns True when the swap happened.
+    """
+    if results.get("errors"):
+        logger.warning(f"Keeping previous data for portfolio {portfolio_id}: new files did not load cleanly")
+        drop_shadow_tables(portfolio_id, db)
+        return False
+
+    start = time.perf_counter()
+    try:
+        counts = swap_in_shadow_tables(portfolio_id, db)
+        logger.info(f"Swapped in new data for portfolio {portfolio_id}: {counts}")
+        return True
+    except Exception as e:
+        logger.error(f"Error swapping in new portfolio data: {str(e)}")
+        results.setdefault("errors", []).append(f"Error swapping in new portfolio data: {str(e)}")
+        return False
+    finally:
+        end = time.perf_counter()
+        logger.info(f"Data swap took {end - start:0.4f} seconds")
+
+
+def recalculate_subscription_loan_usage(portfolio_id: int, db: Session) -> None:
+    """Recount the loans held by the portfolio's subscription into its SubscriptionUsage row."""
+    try:
+        portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
+        if portfolio and portfolio.subscription_id:
+            subscription = (
+                db.query(TenantSubscription)
+                .filter(TenantSubscription.id == portfolio.subscription_id)
+                .first()
+            )
+            if subscription:
+                usage = (
+                    db.query(SubscriptionUsage)
+                    .filter(SubscriptionUsage.subscription_id == subscription.id)
+                    .with_for_update()
+                    .first()
+                )
+                if usage:
+                    # Authoritative loan count: all loans belonging to this subscription
+                    total_loans = (
+                        db.query(Loan)
+                        .filter(Loan.subscription_id == subscription.id)
+                        .count()
+                    )
+                    usage.current_loan_count = total_loans
+                    from datetime import datetime, timezone
+
+                    usage.last_calculated_at = datetime.now(timezone.utc)
+                    db.add(usage)
+                    db.commit()
+    except Exception as e:
+        logger.error(f"Failed to recalculate subscription usage after ingestion: {str(e)}")
+
+
+async def finalize_portfolio_ingestion(
+    portfolio_id: int,
+    db: Session,
+    results: Dict[str, Any],
+    loan_guarantee_content=None,
+    loan_collateral_data_content=None,
+    first_name: str = None,
+    user_email: str = None,
+    uploaded_filenames: str = None,
+) -> Dict[str, Any]:
+    """
+    Steps that run once loan and client rows are in place: guarantees, collateral,
+    quality checks, staging, subscription usage and the outcome email.
+
+    Shared by the single-worker ingestion and the chunked Celery chord callback.
+    Sets ``results["status"]`` and returns ``results``.
+    """
+    # ---------- Process loan guarantee data ----------
+    if loan_guarantee_content is not None:
+        start = time.perf_counter()
+        try:
+            logger.info(f"Processing loan guarantee data for portfolio {portfolio_id}")
+            guarantee_results = await process_loan_guarantees(loan_guarantee_content, portfolio_id, db)
+            results["details"]["loan_guarantee_data"] = guarantee_results
+            results["files_processed"] += 1
+            logger.info(f"Processed {guarantee_results.get('processed', 0)} guarantee records")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error processing loan guarantee data: {str(e)}")
+            results["details"]["loan_guarantee_data"] = {"error": str(e)}
+            results.setdefault("errors", []).append(f"Error processing loan guarantee data: {str(e)}")
+        end = time.perf_counter()
+        logger.info(f"Loan guarantee processing took {end - start:0.4f} seconds")
+
+    # ---------- Process loan collateral data ----------
+    if loan_collateral_data_content is not None:
+        start = time.perf_counter()
+        try:
+            logger.info(f"Processing loan collateral data for portfolio {portfolio_id}")
+            collateral_results = await process_collateral_data(loan_collateral_data_content, portfolio_id, db)
+            results["details"]["loan_collateral_data"] = collateral_results
+            results["files_processed"] += 1
+            logger.info(f"Processed {collateral_results.get('processed', 0)} collateral records")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error processing loan collateral data: {str(e)}")
+            results["details"]["loan_collateral_data"] = {"error": str(e)}
+            results.setdefault("errors", []).append(f"Error processing loan collateral data: {str(e)}")
+        end = time.perf_counter()
+        logger.info(f"Loan collateral processing took {end - start:0.4f} seconds")
+
+    # ---------- Quality checks ----------
+    start = time.perf_counter()
+    try:
+        logger.info(f"Performing quality checks for portfolio {portfolio_id}")
+        quality_results = run_quality_checks_sync(portfolio_id, db)
+        results["quality_checks"] = quality_results
+        logger.info(f"Found {quality_results.get('total_issues', 0)} quality issues")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error running quality checks: {str(e)}")
+        results["quality_checks"] = {"error": str(e)}
+        results.setdefault("errors", []).append(f"Error running quality checks: {str(e)}")
+    end = time.perf_counter()
+    logger.info(f"Quality checks took {end - start:0.4f} seconds")
+
+    # ---------- Loan staging ----------
+    start = time.perf_counter()
+    try:
+        logger.info(f"Starting loan staging for portfolio {portfolio_id}")
+        await stage_loans_ecl_orm(portfolio_id, db, user_email=user_email, first_name=first_name)
+        await stage_loans_local_impairment_orm(portfolio_id, db, user_email=user_email, first_name=first_name)
+        db.commit()
+        logger.info(f"Successfully completed staging for portfolio {portfolio_id}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error during loan staging: {str(e)}")
+        results["staging"] = {"error": str(e)}
+        results.setdefault("errors", []).append(f"Error during loan staging: {str(e)}")
+    end = time.perf_counter()
+
+    # ---------- Recalculate subscription loan usage ----------
+    recalculate_subscription_loan_usage(portfolio_id, db)
+
+    return await report_ingestion_outcome(portfolio_id, results, first_name, user_email, uploaded_filenames)
+
+
+async def report_ingestion_outcome(
+    portfolio_id: int,
+    results: Dict[str, Any],
+    first_name: str = None,
+    user_email: str = None,
+    uploaded_filenames: str = None,
+) -> Dict[str, Any]:
+    """Set ``results["status"]`` and send the success or failure email."""
+    if results.get("errors"):
+        results["status"] = "completed_with_errors"
+        try:
+            await send_ingestion_failed_email(user_email, first_name, portfolio_id, uploaded_filenames,
+                                              cc_emails=["support@service4gh.com"])
+        except:
+            logger.error("Failed to send ingestion failed email")
+    else:
+        results["status"] = "completed"
+        try:
+            await send_ingestion_success_email(user_email, first_name, portfolio_id, uploaded_filenames,
+                                               cc_emails=["support@service4gh.com"])
+        except:
+            logger.error("Failed to send ingestion success email")
+
+    return results
+
+
 async def process_portfolio_ingestion_sync(
     task_id: str,
     portfolio_id: int,
@@ -118,47 +294,8 @@ async def process_portfolio_ingestion_sync(
         if client_data_path: temp_files.append(client_data_path)
         if loan_guarantee_path: temp_files.append(loan_guarantee_path)
         if loan_collateral_path: temp_files.append(loan_collateral_path)
-        # ---------- Clear existing portfolio data ----------
-        try:
-            start = time.perf_counter()
-            logger.info(f"Checking for existing data in portfolio {portfolio_id}")
-
-            calculation_count = db.query(CalculationResult).filter(
-                CalculationResult.portfolio_id == portfolio_id
-            ).delete()
-            quality_count = db.query(QualityIssue).filter(
-                QualityIssue.portfolio_id == portfolio_id
-            ).delete()
-            # Track how many loans currently exist for this portfolio
-            existing_loans_for_portfolio = db.query(Loan).filter(
-                Loan.portfolio_id == portfolio_id
-            ).count()
-
-            loan_count = db.query(Loan).filter(
-                Loan.portfolio_id == portfolio_id
-            ).delete()
-            guarantee_count = db.query(Guarantee).filter(
-                Guarantee.portfolio_id == portfolio_id
-            ).delete()
-            client_count = db.query(Client).filter(
-                Client.portfolio_id == portfolio_id
-            ).delete()
-            report_count = db.query(Report).filter(
-                Report.portfolio_id == portfolio_id
-            ).delete()
-
-            db.commit()
-
-            logger.info(
-                f"Cleared existing data: Loans:{loan_count}, Clients:{client_count}, "
-                f"Guarantees:{guarantee_count}, Quality Issues:{quality_count}, "
-                f"Calculation Results:{calculation_count}, Reports:{report_count}"
-            )
-        except Exception as e:
-            logger.error(f"Error clearing existing data: {str(e)}")
-            results.setdefault("errors", []).append(f"Error clearing existing data: {str(e)}")
-        end = time.perf_counter()
-        logger.info(f"Data clearing took {end - start:0.4f} seconds")
+        # ---------- Load into shadow tables; the live data stays readable ----------
+        shadows = create_shadow_tables(portfolio_id, db)
 
         # ---------- Count files ----------
         files_to_process = sum(
@@ -175,7 +312,7 @@ async def process_portfolio_ingestion_sync(
             start = time.perf_counter()
             try:
                 logger.info(f"Processing loan details for portfolio {portfolio_id} (batch mode)")
-                loan_results = await process_loan_details_sync(loan_details_path, portfolio_id, tenant_id, db)
+                loan_results = await process_loan_details_sync(loan_details_path, portfolio_id, tenant_id, db, shadows["loans"])
                 results["details"]["loan_details"] = loan_results
                 results["files_processed"] += 1
                 logger.info(f"Processed {loan_results.get('processed', 0)} loan records")
@@ -192,7 +329,7 @@ async def process_portfolio_ingestion_sync(
             start = time.perf_counter()
             try:
                 logger.info(f"Processing client data for portfolio {portfolio_id} (batch mode)")
-                client_results = await process_client_data_sync(client_data_path, portfolio_id, tenant_id, db)
+                client_results = await process_client_data_sync(client_data_path, portfolio_id, tenant_id, db, shadows["clients"])
                 results["details"]["client_data"] = client_results
                 results["files_processed"] += 1
                 logger.info(f"Processed {client_results.get('processed', 0)} client records")
@@ -204,117 +341,21 @@ async def process_portfolio_ingestion_sync(
             end = time.perf_counter()
             logger.info(f"Client data processing took {end - start:0.4f} seconds")
 
-        # ---------- Process loan guarantee data ----------
-        if loan_guarantee_content is not None:
-            start = time.perf_counter()
-            try:
-                logger.info(f"Processing loan guarantee data for portfolio {portfolio_id}")
-                guarantee_results = await process_loan_guarantees(loan_guarantee_content, portfolio_id, db)
-                results["details"]["loan_guarantee_data"] = guarantee_results
-                results["files_processed"] += 1
-                logger.info(f"Processed {guarantee_results.get('processed', 0)} guarantee records")
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error processing loan guarantee data: {str(e)}")
-                results["details"]["loan_guarantee_data"] = {"error": str(e)}
-                results.setdefault("errors", []).append(f"Error processing loan guarantee data: {str(e)}")
-            end = time.perf_counter()
-            logger.info(f"Loan guarantee processing took {end - start:0.4f} seconds")
-
-        # ---------- Process loan collateral data ----------
-        if loan_collateral_data_content is not None:
-            start = time.perf_counter()
-            try:
-                logger.info(f"Processing loan collateral data for portfolio {portfolio_id}")
-                collateral_results = await process_collateral_data(loan_collateral_data_content, portfolio_id, db)
-                results["details"]["loan_collateral_data"] = collateral_results
-                results["files_processed"] += 1
-                logger.info(f"Processed {collateral_results.get('processed', 0)} collateral records")
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error processing loan collateral data: {str(e)}")
-                results["details"]["loan_collateral_data"] = {"error": str(e)}
-                results.setdefault("errors", []).append(f"Error processing loan collateral data: {str(e)}")
-            end = time.perf_counter()
-            logger.info(f"Loan collateral processing took {end - start:0.4f} seconds")
-
-        # ---------- Quality checks ----------
-        start = time.perf_counter()
-        try:
-            logger.info(f"Performing quality checks for portfolio {portfolio_id}")
-            quality_results = run_quality_checks_sync(portfolio_id, db)
-            results["quality_checks"] = quality_results
-            logger.info(f"Found {quality_results.get('total_issues', 0)} quality issues")
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error running quality checks: {str(e)}")
-            results["quality_checks"] = {"error": str(e)}
-            results.setdefault("errors", []).append(f"Error running quality checks: {str(e)}")
-        end = time.perf_counter()
-        logger.info(f"Quality checks took {end - start:0.4f} seconds")
-
-        # ---------- Loan staging ----------
-        start = time.perf_counter()
-        try:
-            logger.info(f"Starting loan staging for portfolio {portfolio_id}")
-            await stage_loans_ecl_orm(portfolio_id, db, user_email=user_email, first_name=first_name)
-            await stage_loans_local_impairment_orm(portfolio_id, db, user_email=user_email, first_name=first_name)
-            db.commit()
-            logger.info(f"Successfully completed staging for portfolio {portfolio_id}")
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error during loan staging: {str(e)}")
-            results["staging"] = {"error": str(e)}
-            results.setdefault("errors", []).append(f"Error during loan staging: {str(e)}")
-        end = time.perf_counter()
-
-        # ---------- Recalculate subscription loan usage ----------
-        try:
-            portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-            if portfolio and portfolio.subscription_id:
-                subscription = (
-                    db.query(TenantSubscription)
-                    .filter(TenantSubscription.id == portfolio.subscription_id)
-                    .first()
-                )
-                if subscription:
-                    usage = (
-                        db.query(SubscriptionUsage)
-                        .filter(SubscriptionUsage.subscription_id == subscription.id)
-                        .with_for_update()
-                        .first()
-                    )
-                    if usage:
-                        # Authoritative loan count: all loans belonging to this subscription
-                        total_loans = (
-                            db.query(Loan)
-                            .filter(Loan.subscription_id == subscription.id)
-                            .count()
-                        )
-                        usage.current_loan_count = total_loans
-                        from datetime import datetime, timezone
-
-                        usage.last_calculated_at = datetime.now(timezone.utc)
-                        db.add(usage)
-                        db.commit()
-        except Exception as e:
-            logger.error(f"Failed to recalculate subscription usage after ingestion: {str(e)}")
-
-        # ---------- Final status & emails ----------
-        if results.get("errors"):
-            results["status"] = "completed_with_errors"
-            try:
-                await send_ingestion_failed_email(user_email, first_name, portfolio_id, uploaded_filenames,
-                                                  cc_emails=["support@service4gh.com"])
-            except:
-                logger.error("Failed to send ingestion failed email")
+        # ---------- Swap in the new loans & clients in one transaction ----------
+        if swap_portfolio_data(portfolio_id, db, results):
+            # ---------- Guarantees, collateral, quality checks, staging, usage & emails ----------
+            await finalize_portfolio_ingestion(
+                portfolio_id=portfolio_id,
+                db=db,
+                results=results,
+                loan_guarantee_content=loan_guarantee_content,
+                loan_collateral_data_content=loan_collateral_data_content,
+                first_name=first_name,
+                user_email=user_email,
+                uploaded_filenames=uploaded_filenames,
+            )
         else:
-            results["status"] = "completed"
-            try:
-                await send_ingestion_success_email(user_email, first_name, portfolio_id, uploaded_filenames,
-                                                   cc_emails=["support@service4gh.com"])
-            except:
-                logger.error("Failed to send ingestion success email")
+            await report_ingestion_outcome(portfolio_id, results, first_name, user_email, uploaded_filenames)
 
         logger.info(f"Portfolio ingestion completed with status: {results['status']}")
         
@@ -475,7 +516,7 @@ async def fetch_excel_from_minio(payload: IngestPayload, db: Session, user_email
         # --------- Download directly to temp file ----------
         try:
             # Create a dedicated temp file for this upload
-            fd, temp_path = tempfile.mkstemp(suffix=".xlsx", prefix=f"ingest_{file_type}_")
+            fd, temp_path = tempfile.mkstemp(suffix=file_suffix(file_key), prefix=f"ingest_{file_type}_")
             with os.fdopen(fd, 'wb') as tmp:
                 s3_client.download_fileobj(BUCKET_NAME, file_key, tmp)
             
@@ -0,0 +1,84 @@
+"""
+Per-portfolio data versions and the ETags derived from them.
+
+``portfolios.data_version`` only ever increases. Every write that changes what a
+portfolio's read endpoints return (ingestion, staging, calculation, quality-issue
+edits, report generation) bumps it in the same transaction, usually via
+``refresh_portfolio_stats``. Read endpoints then build an ETag from the version
+alone and answer a matching ``If-None-Match`` with 304 before running their
+queries.
+
+``portfolios.report_version`` moves with it except on report bookkeeping (a
+report being requested or changing status), which passes ``report_inputs=False``.
+It only changes when what reports are built from changes, so it can key
+finished report workbooks for reuse.
+"""
+import hashlib
+from typing import Iterable, Optional, Tuple
+
+from fastapi import Request, Response, status
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models import Portfolio
+
+
+def data_version_bump(portfolio_id: int, report_inputs: bool = True):
+    """
+    UPDATE statement bumping the portfolio's data_version, and its report_version
+    unless ``report_inputs`` is False; execute it on a sync or async session.
+    """
+    values = {"data_version": Portfolio.data_version + 1}
+    if report_inputs:
+        values["report_version"] = Portfolio.report_version + 1
+    return (
+        update(Portfolio)
+        .where(Portfolio.id == portfolio_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_data_version(portfolio_id: int, db: Session, report_inputs: bool = True) -> None:
+    """Bump the portfolio's data_version (and report_version) in the caller's transaction."""
+    db.execute(data_version_bump(portfolio_id, report_inputs))
+
+
+def data_etag(request: Request, user, versions: Iterable[Tuple[int, int]]) -> str:
+    """
+    Weak ETag for a response built from the given ``(portfolio_id, data_version)`` pairs.
+    Tenant and user are part of it because responses are filtered per user, and the
+    query string because filters and pagination change the body.
+    """
+    parts = [request.url.path, request.url.query, user.tenant_id, user.id, *sorted(versions)]
+    return f'W/"{hashlib.sha256(repr(parts).encode()).hexdigest()[:32]}"'
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match header covers ``etag`` (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def conditional_response(request: Request, response: Response, user,
+                         versions: Iterable[Tuple[int, int]]) -> Optional[Response]:
+    """
+    Set the ETag for ``versions`` on ``response``; return a 304 response to send instead
+    when the client already has it, otherwise None.
+    """
+    etag = data_etag(request, user, versions)
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    # Let browsers keep the body but always revalidate
+    response.headers["Cache-Control"] = "private, no-cache"
+    return None
@@ -1,5 +1,5 @@
 from datetime import date
-from typing import Dict, Any, List, Iterable, Optional
+from typing import Dict, Any, List, Iterable, Optional, Sequence
 from io import BytesIO
 import pandas as pd
 from openpyxl import Workbook, load_workbook
@@ -10,6 +10,8 @@ import os
 from datetime import datetime
 import traceback
 
+from app.utils.xlsx_reports import open_report_workbook, write_rows
+
 
 ECL_NARRATIVE = "The latest ECL calculation and the related report below covers only assets with  open balances"
 
@@ -400,161 +402,87 @@ def create_report_excel(
     
 #     return buffer
 
-def populate_ecl_detailed_report(
-    wb: Workbook,
+def _detailed_report_sheet(file_path: str, title: str, column_widths: Dict[str, float],
+                           currency_columns: List[str], percentage_columns: List[str]):
+    """
+    Open a constant-memory workbook with the heading cells shared by the detailed
+    report templates. Loan rows take their number format from the column, so they
+    can be written as plain value tuples.
+    """
+    wb = open_report_workbook(file_path)
+    ws = wb.add_worksheet("Sheet1")
+    formats = {
+        "bold": wb.add_format({"bold": True, "font_size": 10}),
+        "narrative": wb.add_format({"italic": True}),
+        "date": wb.add_format({"num_format": "yyyy-mm-dd"}),
+        "currency": wb.add_format({"num_format": "#,##0.00"}),
+        "percentage": wb.add_format({"num_format": "0.00%"}),
+    }
+    for column in sorted(set(column_widths) | set(currency_columns) | set(percentage_columns)):
+        column_format = (formats["currency"] if column in currency_columns
+                         else formats["percentage"] if column in percentage_columns else None)
+        ws.set_column(f"{column}:{column}", column_widths.get(column), column_format)
+
+    ws.write("A1", ECL_NARRATIVE, formats["narrative"])
+    ws.write("A2", title, formats["bold"])
+    ws.write("A3", "Report date", formats["bold"])
+    ws.write("A4", "Report run date", formats["bold"])
+    ws.write("A6", "Report description", formats["bold"])
+    return wb, ws, formats
+
+
+def write_ecl_detailed_report(
+    file_path: str,
     portfolio_name: str,
     report_date: date,
-    report_data: Dict[str, Any], # Contains summary info like totals, run date
-    loans_iterator: Iterable[Dict[str, Any]], # <-- NEW: Accepts an iterator
-    temp_file_path: Optional[str] = None # <-- NEW: Path for cleanup
-) -> BytesIO:
+    report_data: Dict[str, Any],
+    loan_rows: Iterable[Sequence[Any]],
+) -> int:
     """
-    Populate the ECL detailed report template with data using an iterator.
+    Write the ECL detailed report, laid out like its template, to an xlsx file.
 
     Args:
-        wb: Excel workbook (template)
+        file_path: Path of the xlsx file to write
         portfolio_name: Name of the portfolio
         report_date: Date of the report
         report_data: Summary data for the report header/totals
-        loans_iterator: An iterator yielding loan detail dictionaries
-        temp_file_path: The path to the temporary JSON file for cleanup
+        loan_rows: One tuple of cell values per loan, in column order
 
     Returns:
-        BytesIO: Excel file as bytes buffer
+        int: Number of loan rows written
     """
-    print("Starting Excel population for ECL Detailed Report using iterator...")
-    ws = wb.active
-    currency_format = '#,##0.00'
-    percentage_format = '0.00%'
-
-    ws['A1'] = ECL_NARRATIVE
-    ws['A1'].font = Font(name='Calibri', size=11, italic=True)
-
-    # Populate header information from report_data
-    ws['B3'] = report_date
-    ws['B4'] = report_data.get('report_run_date', datetime.now().strftime("%Y-%m-%d"))
-    ws['B6'] = report_data.get('description', f"ECL Detailed Report for {portfolio_name}")
-
-    # Populate summary values from report_data
-    ws['B9'] = report_data.get('total_ead', 0)
-    ws['B9'].number_format = currency_format
-
-    # Note: total_lgd in summary might represent sum(lgd * balance),
-    # not just sum(lgd). Ensure report_data provides the correct summary value.
-    ws['B10'] = report_data.get('total_lgd', 0)
-    ws['B10'].number_format = currency_format
-
-    ws['B12'] = report_data.get('total_ecl', 0)
-    ws['B12'].number_format = currency_format
-
-
-    # Populate loan details starting from row 15
-    start_row = 15
-    loan_count = 0
-    print(f"Processing loans for Excel sheet...")
-
-    # Iterate directly over the loan data stream
-    for i, loan in enumerate(loans_iterator): # <--- CHANGE: Use the iterator directly
-        row = start_row + i
-        loan_count += 1
-
-        if loan_count % 1000 == 0:
-            print(f"Processed {loan_count} loans into Excel...")
-
-        try:
-            # Map loan data to columns, converting strings from JSON back to numbers
-            ws.cell(row=row, column=1, value=loan.get('loan_id', ''))
-            ws.cell(row=row, column=2, value=loan.get('employee_id', ''))
-            ws.cell(row=row, column=3, value=loan.get('employee_name', ''))
-
-            # Loan value
-            loan_value = float(loan.get('loan_value', '0'))
-            ws.cell(row=row, column=4, value=loan_value).number_format = currency_format
-
-            # Outstanding loan balance
-            outstanding_balance = float(loan.get('outstanding_loan_balance', '0'))
-            ws.cell(row=row, column=5, value=outstanding_balance).number_format = currency_format
-
-            # Accumulated arrears
-            accumulated_arrears = float(loan.get('accumulated_arrears', '0'))
-            ws.cell(row=row, column=6, value=accumulated_arrears).number_format = currency_format
-
-            # NDIA
-            ndia = float(loan.get('ndia', '0'))
-            ws.cell(row=row, column=7, value=ndia).number_format = currency_format # Or '#,##0' if it's always integer days
-
-            # Stage
-            ws.cell(row=row, column=8, value=loan.get('stage', ''))
-
-            # EAD
-            ead = float(loan.get('ead', '0'))
-            ws.cell(row=row, column=9, value=ead).number_format = currency_format
-
-            # LGD (Stored as 'percentage value' string like '45.6')
-            lgd_str = loan.get('lgd', '0')
-            lgd = float(lgd_str) / 100.0 # Convert to decimal for percentage format
-            ws.cell(row=row, column=10, value=lgd).number_format = percentage_format
-
-            # EIR (Stored as 'percentage value' string)
-            eir_str = loan.get('eir', '0')
-            eir = float(eir_str) / 100.0
-            ws.cell(row=row, column=11, value=eir).number_format = percentage_format
-
-            # PD (Stored as 'percentage value' string)
-            pd_str = loan.get('pd', '0')
-            pd_value = float(pd_str) / 100.0
-            ws.cell(row=row, column=12, value=pd_value).number_format = percentage_format
-
-            # ECL
-            ecl = float(loan.get('ecl', '0'))
-            ws.cell(row=row, column=13, value=ecl).number_format = currency_format
-
-            # Outstanding balance (difference)
-            balance_diff = float(loan.get('balance_difference', '0'))
-            ws.cell(row=row, column=14, value=balance_diff).number_format = currency_format
-            if row == 15: # Add header if it's the first row
-                ws.cell(row=14, column=14, value="Outstanding Balance Difference")
-
-        except (ValueError, TypeError) as e:
-             print(f"Warning: Could not parse data for row {row}, loan_id {loan.get('loan_id', 'N/A')}. Error: {e}")
-             # Optionally fill cells with error indicators or skip row
-             ws.cell(row=row, column=1, value=loan.get('loan_id', 'N/A'))
-             ws.cell(row=row, column=2, value="PARSE ERROR")
-             # ... fill other known columns if possible ...
-        except Exception as e:
-            print(f"Unexpected error processing row {row}, loan_id {loan.get('loan_id', 'N/A')}: {e}")
-            traceback.print_exc() # Print full traceback for debugging
-            ws.cell(row=row, column=1, value=loan.get('loan_id', 'N/A'))
-            ws.cell(row=row, column=2, value="PROCESSING ERROR")
-
-
-    print(f"Completed processing {loan_count} loans for Excel sheet.")
-
-    # Save to BytesIO
-    buffer = BytesIO()
-    try:
-        print("Saving workbook to buffer...")
-        wb.save(buffer)
-        buffer.seek(0)
-        print("Workbook saved.")
-    except Exception as e:
-        print(f"Error saving workbook: {e}")
-        raise # Re-raise the exception
-
-    finally:
-        # Clean up temporary file INSIDE the excel generator
-        # This ensures cleanup even if workbook saving fails (partially)
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                print(f"Cleaned up temporary file: {temp_file_path}")
-            except Exception as e:
-                print(f"Error cleaning up temporary file '{temp_file_path}': {e}")
-        else:
-            if temp_file_path:
-                 print(f"Temporary file path provided but file not found for cleanup: {temp_file_path}")
-
-    return buffer
+    wb, ws, formats = _detailed_report_sheet(
+        file_path,
+        "ECL Detailed report",
+        {"A": 27.54, "B": 37.28, "C": 20.03, "D": 11.53, "E": 25.32, "F": 19.33, "G": 11.53},
+        currency_columns=["D", "E", "F", "G", "I", "M", "N"],
+        percentage_columns=["J", "K", "L"],
+    )
+    ws.write_datetime("B3", report_date, formats["date"])
+    ws.write("B4", report_data.get('report_run_date', datetime.now().strftime("%Y-%m-%d")))
+    ws.write("B6", report_data.get('description', f"ECL Detailed Report for {portfolio_name}"))
+
+    # total_lgd is the EAD-weighted sum(lgd * ead), not a plain sum of LGDs
+    ws.write("A9", "Total exposure at default:", formats["bold"])
+    ws.write_number("B9", report_data.get('total_ead', 0), formats["currency"])
+    ws.write("A10", "Total loss given default:", formats["bold"])
+    ws.write_number("B10", report_data.get('total_lgd', 0), formats["currency"])
+    ws.write("A11", "Effective interest rate:", formats["bold"])
+    ws.write("B11", "Computed separately for each individual loan")
+    ws.write("A12", "Total ECL:", formats["bold"])
+    ws.write_number("B12", report_data.get('total_ecl', 0), formats["currency"])
+
+    ws.write_row("A14", [
+        "Loan ID", "Employee ID", "Employee name", "Loan value", "Outstanding loan balance",
+        "Accumulated Arrears", "NDIA", "Stage", "EAD", "LGD", "EIR", "PD", "ECL",
+        "Outstanding Balance Difference",
+    ], formats["bold"])
+
+    start_row = 14
+    loan_count = write_rows(ws, loan_rows, start_row) - start_row
+    wb.close()
+    print(f"Completed writing {loan_count} loans to the ECL detailed report.")
+    return loan_count
 
 
 def populate_ecl_report_summarised(
@@ -631,140 +559,56 @@ def populate_ecl_report_summarised(
     return buffer
 
 
-def populate_local_impairment_details_report(
-    wb: Workbook,
+def write_local_impairment_details_report(
+    file_path: str,
     portfolio_name: str,
     report_date: date,
-    report_data: Dict[str, Any], # Contains summary info like totals, run date
-    loans_iterator: Iterable[Dict[str, Any]], # <-- NEW: Accepts an iterator
-    temp_file_path: Optional[str] = None # <-- NEW: Path for cleanup
-) -> BytesIO:
+    report_data: Dict[str, Any],
+    loan_rows: Iterable[Sequence[Any]],
+) -> int:
     """
-    Populate the local impairment detailed report template using an iterator.
+    Write the local impairment detailed report, laid out like its template, to an xlsx file.
 
     Args:
-        wb: Excel workbook (template)
+        file_path: Path of the xlsx file to write
         portfolio_name: Name of the portfolio
         report_date: Date of the report
         report_data: Summary data for the report header/totals
-        loans_iterator: An iterator yielding loan detail dictionaries
-        temp_file_path: The path to the temporary JSON file for cleanup
+        loan_rows: One tuple of cell values per loan, in column order
 
     Returns:
-        BytesIO: Excel file as bytes buffer
+        int: Number of loan rows written
     """
-    print("Starting Excel population for Local Impairment Detailed Report using iterator...")
-    ws = wb.active
-    currency_format = '#,##0.00'
-    percentage_format = '0.00%'
-
-    ws['A1'] = ECL_NARRATIVE
-    ws['A1'].font = Font(name='Calibri', size=11, italic=True)
-
-    # Populate header information from report_data
-    ws['B3'] = report_date
-    ws['B4'] = report_data.get('report_run_date', datetime.now().strftime("%Y-%m-%d"))
-    ws['B6'] = report_data.get('description', f"Local Impairment Details Report for {portfolio_name}")
-
-    # Populate total provision from report_data
-    ws['B12'] = report_data.get('total_provision', 0)
-    ws['B12'].number_format = currency_format
-
-    # Use total_loan_count from report_data if available
-    if 'total_loan_count' in report_data:
-        ws['B14'] = f"Total Loans: {report_data['total_loan_count']}"
-    else:
-         ws['B14'] = "Total Loans: N/A"
-
-    # Populate loan details starting from row 15
-    start_row = 15
-    loan_count = 0
-    print(f"Processing loans for Excel sheet...")
+    wb, ws, formats = _detailed_report_sheet(
+        file_path,
+        "Local Impairment Detailed report",
+        {"A": 27.54, "B": 12.94, "C": 18.08, "D": 19.2, "E": 34.92, "F": 19.33, "G": 11.53, "I": 17.39,
+         "J": 11.53},
+        currency_columns=["D", "E", "F", "G", "J", "K"],
+        percentage_columns=["I"],
+    )
+    ws.write_datetime("B3", report_date, formats["date"])
+    ws.write("B4", report_data.get('report_run_date', datetime.now().strftime("%Y-%m-%d")))
+    ws.write("B6", report_data.get('description', f"Local Impairment Details Report for {portfolio_name}"))
 
-    # Iterate directly over the loan data stream
-    for i, loan in enumerate(loans_iterator): # <--- CHANGE: Use the iterator directly
-        row = start_row + i
-        loan_count += 1
+    ws.write("A12", "Total Provision:", formats["bold"])
+    ws.write_number("B12", report_data.get('total_provision', 0), formats["currency"])
 
-        if loan_count % 1000 == 0:
-            print(f"Processed {loan_count} loans into Excel...")
+    ws.write("A13", "Total Loans:", formats["bold"])
+    ws.write("B13", report_data.get('total_loan_count', 'N/A'))
 
-        try:
-            # Map loan data to columns, converting strings from JSON back to numbers
-            ws.cell(row=row, column=1, value=loan.get('loan_id', ''))
-            ws.cell(row=row, column=2, value=loan.get('employee_id', ''))
-            ws.cell(row=row, column=3, value=loan.get('employee_name', ''))
-
-            # Loan value
-            loan_value = float(loan.get('loan_value', '0'))
-            ws.cell(row=row, column=4, value=loan_value).number_format = currency_format
-
-            # Outstanding loan balance
-            outstanding_balance = float(loan.get('outstanding_balance', '0'))
-            ws.cell(row=row, column=5, value=outstanding_balance).number_format = currency_format
-
-            # Accumulated arrears
-            accumulated_arrears = float(loan.get('accumulated_arrears', '0'))
-            ws.cell(row=row, column=6, value=accumulated_arrears).number_format = currency_format
-
-            # NDIA
-            ndia = float(loan.get('ndia', '0'))
-            ws.cell(row=row, column=7, value=ndia).number_format = currency_format # Or '#,##0'
-
-            # Impairment category
-            ws.cell(row=row, column=8, value=loan.get('impairment_category', ''))
-
-            # Provision rate (Stored as 'rate value' string like '0.25')
-            provision_rate_str = loan.get('provision_rate', '0')
-            provision_rate = float(provision_rate_str) # Already a rate, format as percentage
-            ws.cell(row=row, column=9, value=provision_rate).number_format = percentage_format
-
-            # Provision amount
-            provision_amount = float(loan.get('provision_amount', '0'))
-            ws.cell(row=row, column=10, value=provision_amount).number_format = currency_format
-
-            # Outstanding balance (difference)
-            balance_diff = float(loan.get('balance_difference', '0'))
-            ws.cell(row=row, column=11, value=balance_diff).number_format = currency_format
-            if row == 15: # Add header if it's the first row
-                ws.cell(row=14, column=11, value="Outstanding Balance Difference")
-
-        except (ValueError, TypeError) as e:
-             print(f"Warning: Could not parse data for row {row}, loan_id {loan.get('loan_id', 'N/A')}. Error: {e}")
-             ws.cell(row=row, column=1, value=loan.get('loan_id', 'N/A'))
-             ws.cell(row=row, column=2, value="PARSE ERROR")
-        except Exception as e:
-            print(f"Unexpected error processing row {row}, loan_id {loan.get('loan_id', 'N/A')}: {e}")
-            traceback.print_exc()
-            ws.cell(row=row, column=1, value=loan.get('loan_id', 'N/A'))
-            ws.cell(row=row, column=2, value="PROCESSING ERROR")
-
-
-    print(f"Completed processing {loan_count} loans for Excel sheet.")
+    ws.write_row("A14", [
+        "Loan ID", "Employee ID", "Employee name", "Loan value", "Outstanding loan balance",
+        "Accumulated Arrears", "NDIA", "Stage", "Provision rate", "Provision",
+        "Outstanding Balance Difference",
+    ], formats["bold"])
 
-    # Save to BytesIO
-    buffer = BytesIO()
-    try:
-        print("Saving workbook to buffer...")
-        wb.save(buffer)
-        buffer.seek(0)
-        print("Workbook saved.")
-    except Exception as e:
-        print(f"Error saving workbook: {e}")
-        raise
-    finally:
-        # Clean up temporary file INSIDE the excel generator
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                print(f"Cleaned up temporary file: {temp_file_path}")
-            except Exception as e:
-                print(f"Error cleaning up temporary file '{temp_file_path}': {e}")
-        else:
-             if temp_file_path:
-                 print(f"Temporary file path provided but file not found for cleanup: {temp_file_path}")
+    start_row = 14
+    loan_count = write_rows(ws, loan_rows, start_row) - start_row
+    wb.close()
+    print(f"Completed writing {loan_count} loans to the local impairment detailed report.")
+    return loan_count
 
-    return buffer
 
 def populate_local_impairment_report_summarised(
     wb: Workbook, 
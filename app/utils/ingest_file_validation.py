@@ -3,6 +3,7 @@ from fastapi import HTTPException, status, UploadFile
 from sqlalchemy.inspection import inspect
 
 from app.models import Loan, Client
+from app.utils.ingest_formats import ALLOWED_EXTENSIONS, detect_file_format, read_headers
 
 # Map file types to model classes
 MODEL_MAP = {
@@ -12,8 +13,6 @@ MODEL_MAP = {
     #"loan_collateral_data": LoanCollateral,
 }
 
-ALLOWED_EXTENSIONS = {".xlsx", ".xls"}
-
 def get_model_columns(model):
     """Return a list of column names from a SQLAlchemy model."""
     mapper = inspect(model)
@@ -21,27 +20,31 @@ def get_model_columns(model):
 
 async def validate_uploaded_file(file: UploadFile, file_type: str):
     """
-    Validates that an uploaded file is an Excel file and contains the required columns
-    based on the SQLAlchemy model schema.
+    Validates that an uploaded file is a supported format (Excel, CSV, CSV.gz or Parquet)
+    and contains the required columns based on the SQLAlchemy model schema.
     """
     if file is None:
         return  # skip optional files
 
     # --- Check file extension ---
     filename = file.filename.lower()
-    if not any(filename.endswith(ext) for ext in ALLOWED_EXTENSIONS):
+    file_format = detect_file_format(filename)
+    if file_format is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"{file_type} must be an Excel file (.xlsx or .xls). Provided: {filename}",
+            detail=(
+                f"{file_type} must be one of {', '.join(sorted(ALLOWED_EXTENSIONS))}. "
+                f"Provided: {filename}"
+            ),
         )
 
-    # --- Try to read the Excel file ---
+    # --- Read only the header row ---
     try:
-        df = pd.read_excel(file.file, nrows=5)  # only read a few rows to get headers
+        columns = read_headers(file.file, file_format)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Failed to read {file_type} as an Excel file. Error: {str(e)}",
+            detail=f"Failed to read {file_type} as a {file_format} file. Error: {str(e)}",
         )
 
     # --- Get required model columns ---
@@ -59,7 +62,7 @@ async def validate_uploaded_file(file: UploadFile, file_type: str):
     required_columns = [col for col in model_columns if col not in excluded]
 
     # --- Check if all required columns are present ---
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    missing_columns = [col for col in required_columns if col not in columns]
 
     if missing_columns:
         raise HTTPException(
@@ -76,7 +79,7 @@ async def validate_all_uploaded_files(
     #loan_guarantee_data: UploadFile = None,
     #loan_collateral_data: UploadFile = None,
 ):
-    """Validates all uploaded Excel files for required columns."""
+    """Validates all uploaded ingestion files for required columns."""
     await validate_uploaded_file(loan_details, "loan_details")
     await validate_uploaded_file(client_data, "client_data")
     '''
@@ -0,0 +1,218 @@
+"""
+File format helpers for the ingestion pipeline.
+
+Uploads may be Excel workbooks, plain CSV, gzip-compressed CSV or Parquet.
+Excel and CSV.gz are turned into a temporary CSV so Polars can stream them in
+batches; CSV is read in place; Parquet is read directly through pyarrow with
+column projection, so no text parsing happens at all.
+"""
+import csv
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import openpyxl
+import pandas as pd
+import polars as pl
+import pyarrow.parquet as pq
+from xlsx2csv import Xlsx2csv
+
+logger = logging.getLogger(__name__)
+
+# Longest suffix first so ".csv.gz" wins over ".csv"
+FORMAT_EXTENSIONS = {
+    ".csv.gz": "csv.gz",
+    ".parquet": "parquet",
+    ".xlsx": "excel",
+    ".xls": "excel",
+    ".csv": "csv",
+}
+
+ALLOWED_EXTENSIONS = set(FORMAT_EXTENSIONS)
+
+CSV_BATCH_SIZE = 50_000
+PARQUET_BATCH_SIZE = 50_000
+
+
+def detect_file_format(filename: str) -> Optional[str]:
+    """Return "excel", "csv", "csv.gz" or "parquet" for a filename/object key, or None if unsupported."""
+    name = (filename or "").lower()
+    for ext, file_format in FORMAT_EXTENSIONS.items():
+        if name.endswith(ext):
+            return file_format
+    return None
+
+
+def file_suffix(filename: str) -> str:
+    """Extension to keep on temp copies of an upload so its format can be detected again."""
+    name = (filename or "").lower()
+    for ext in FORMAT_EXTENSIONS:
+        if name.endswith(ext):
+            return ext
+    return ".xlsx"
+
+
+def normalize_column_name(name) -> str:
+    """Lower-case a header and replace spaces/dots so it lines up with model column names."""
+    return str(name).strip().lower().replace(".", "").replace(" ", "_")
+
+
+def read_headers(source, file_format: str) -> List[str]:
+    """
+    Read only the header row of a file.
+
+    ``source`` may be a path or a binary file object (e.g. ``UploadFile.file``).
+    """
+    if file_format == "parquet":
+        return list(pq.ParquetFile(source).schema_arrow.names)
+    if file_format == "csv":
+        return pl.read_csv(source, n_rows=0).columns
+    if file_format == "csv.gz":
+        with gzip.open(source, "rb") as f:
+            return pl.read_csv(f.readline()).columns
+    return pd.read_excel(source, nrows=5).columns.tolist()
+
+
+def count_file_rows(path: str) -> int:
+    """
+    Data rows in an upload without converting it: Parquet metadata, the first
+    worksheet's recorded dimension (blank rows included), or one pass over the
+    CSV text.
+    """
+    file_format = detect_file_format(path)
+    if file_format == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    if file_format == "csv":
+        return pl.scan_csv(path, infer_schema_length=0).select(pl.len()).collect().item()
+    if file_format == "csv.gz":
+        with gzip.open(path, "rt", newline="") as f:
+            return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+    if path.lower().endswith(".xls"):
+        return len(pd.read_excel(path).index)
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        if sheet.max_row is None:
+            # No dimension recorded: count the rows instead
+            return max(sum(1 for _ in sheet.iter_rows(values_only=True)) - 1, 0)
+        return max(sheet.max_row - 1, 0)
+    finally:
+        workbook.close()
+
+
+def convert_to_csv(path: str) -> Optional[str]:
+    """
+    Produce a temporary CSV for Excel and CSV.gz files.
+    Returns None when the file can be read as-is (CSV or Parquet); the caller owns the temp file.
+    """
+    file_format = detect_file_format(path)
+    if file_format in ("csv", "parquet"):
+        return None
+
+    fd, csv_path = tempfile.mkstemp(suffix=".csv", prefix="ingest_conv_")
+    os.close(fd)  # Close file descriptor, the converters open it themselves
+    try:
+        if file_format == "csv.gz":
+            with gzip.open(path, "rb") as src, open(csv_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            Xlsx2csv(path, skip_empty_lines=True).convert(csv_path)
+        return csv_path
+    except Exception:
+        if os.path.exists(csv_path): os.remove(csv_path)
+        raise
+
+
+def describe_file(path: str) -> Tuple[List[str], int]:
+    """Return (headers, data row count) for an upload saved at ``path``."""
+    file_format = detect_file_format(path)
+    if file_format == "parquet":
+        parquet_file = pq.ParquetFile(path)
+        return list(parquet_file.schema_arrow.names), parquet_file.metadata.num_rows
+    if file_format == "excel":
+        df = pd.read_excel(path)
+        return df.columns.tolist(), len(df.index)
+
+    csv_path = convert_to_csv(path)
+    try:
+        source = csv_path or path
+        headers = pl.read_csv(source, n_rows=0).columns
+        row_count = pl.scan_csv(source, infer_schema_length=0).select(pl.len()).collect().item()
+        return headers, row_count
+    finally:
+        if csv_path and os.path.exists(csv_path): os.remove(csv_path)
+
+
+def _project(headers: Iterable[str], columns: Optional[Iterable[str]]) -> Optional[List[str]]:
+    """Raw header names whose normalized form is in ``columns`` (None keeps everything)."""
+    if columns is None:
+        return None
+    wanted = set(columns)
+    return [h for h in headers if normalize_column_name(h) in wanted]
+
+
+def iter_batches(path: str, columns: Optional[Iterable[str]] = None,
+                 infer_schema_length: int = 10000,
+                 schema_overrides: Optional[Dict[str, pl.PolarsDataType]] = None,
+                 skip_rows: int = 0) -> Iterator[pl.DataFrame]:
+    """
+    Stream a file as Polars DataFrame batches.
+
+    ``columns`` lists normalized column names to read; anything else is skipped
+    at the reader (Parquet column projection / CSV ``columns=``).
+    ``schema_overrides`` (every raw CSV header -> dtype) replaces schema inference
+    and makes values that do not fit raise instead of being nulled.
+    ``skip_rows`` skips data rows of a CSV, e.g. to resume after a failed read.
+    """
+    if detect_file_format(path) == "parquet":
+        parquet_file = pq.ParquetFile(path)
+        projected = _project(parquet_file.schema_arrow.names, columns)
+        for record_batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_SIZE, columns=projected or None):
+            yield pl.from_arrow(record_batch)
+        return
+
+    csv_path = convert_to_csv(path)
+    try:
+        source = csv_path or path
+        projected = _project(pl.read_csv(source, n_rows=0).columns, columns)
+        if schema_overrides:
+            reader = pl.read_csv_batched(
+                source,
+                columns=projected or None,
+                schema_overrides=schema_overrides,
+                infer_schema_length=0,
+                skip_rows_after_header=skip_rows,
+                batch_size=CSV_BATCH_SIZE,
+            )
+        else:
+            reader = pl.read_csv_batched(
+                source,
+                columns=projected or None,
+                infer_schema_length=infer_schema_length,
+                ignore_errors=True,
+                skip_rows_after_header=skip_rows,
+                batch_size=CSV_BATCH_SIZE,
+            )
+        while (batches := reader.next_batches(1)):
+            yield batches[0]
+    finally:
+        if csv_path and os.path.exists(csv_path): os.remove(csv_path)
+
+
+def read_frame(path: str, columns: Optional[Iterable[str]] = None,
+               infer_schema_length: int = 5000) -> pl.DataFrame:
+    """Read a whole (small) file such as guarantees or collateral into one DataFrame."""
+    if detect_file_format(path) == "parquet":
+        projected = _project(pq.ParquetFile(path).schema_arrow.names, columns)
+        return pl.read_parquet(path, columns=projected or None)
+
+    csv_path = convert_to_csv(path)
+    try:
+        source = csv_path or path
+        projected = _project(pl.read_csv(source, n_rows=0).columns, columns)
+        return pl.read_csv(source, columns=projected or None, infer_schema_length=infer_schema_length, ignore_errors=True)
+    finally:
+        if csv_path and os.path.exists(csv_path): os.remove(csv_path)
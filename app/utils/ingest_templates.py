@@ -0,0 +1,178 @@
+"""
+Per-tenant registry of ingestion file layouts.
+
+Monthly loan and client files keep the same header layout, so the column
+mapping, Polars read schema and date formats resolved on the first upload are
+stored in ``ingestion_templates`` keyed by tenant, file type and a fingerprint
+of the headers. Later uploads with the same fingerprint skip schema inference,
+read with an explicit schema (no ``ignore_errors``) and parse dates with the
+known format instead of row-by-row ``dateutil`` calls.
+"""
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import polars as pl
+import pyarrow.parquet as pq
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import IngestionTemplate
+from app.utils.ingest_formats import detect_file_format, normalize_column_name
+
+logger = logging.getLogger(__name__)
+
+# Rows sampled when a layout is seen for the first time
+TEMPLATE_INFER_ROWS = 10000
+
+# Distinct values checked when detecting a date format
+DATE_SAMPLE_SIZE = 500
+
+# Tried in order; month-first before day-first to match dateutil's default
+DATE_FORMAT_CANDIDATES = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%m-%d-%Y",
+    "%d-%m-%Y",
+    "%Y/%m/%d",
+    "%d-%b-%Y",
+    "%d %b %Y",
+    "%d-%b-%y",
+]
+
+# Identifier columns are always read as text, whatever the sample looked like
+TEXT_COLUMNS = {"loan_no", "employee_id", "phone_number", "previous_employee_no",
+                "social_security_no", "voters_id_no"}
+
+POLARS_DTYPES = {"Utf8": pl.Utf8, "Float64": pl.Float64}
+
+
+def header_fingerprint(file_type: str, headers: Iterable[str]) -> str:
+    """Stable hash of a file type and its raw headers in order."""
+    payload = "\x1f".join([file_type, *[str(h) for h in headers]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def detect_date_format(values: pl.Series) -> Optional[str]:
+    """First candidate format that parses every sampled non-empty value, or None."""
+    sample = values.drop_nulls().cast(pl.Utf8).str.strip_chars()
+    sample = sample.filter(sample != "").unique().head(DATE_SAMPLE_SIZE)
+    if sample.len() == 0:
+        return None
+    for fmt in DATE_FORMAT_CANDIDATES:
+        if sample.str.strptime(pl.Datetime, fmt, strict=False).null_count() == 0:
+            return fmt
+    return None
+
+
+def schema_overrides(template: Optional[IngestionTemplate]) -> Optional[Dict[str, pl.PolarsDataType]]:
+    """Polars read schema stored on a template (None when there is nothing to enforce)."""
+    if template is None or not template.dtypes:
+        return None
+    return {header: POLARS_DTYPES.get(name, pl.Utf8) for header, name in template.dtypes.items()}
+
+
+def _infer_template_fields(source: str, target_columns: Iterable[str], date_columns: Iterable[str]) -> Dict:
+    """Resolve headers, mapping, dtypes and date formats from a sample of ``source``."""
+    targets = set(target_columns)
+    if detect_file_format(source) == "parquet":
+        sample = pl.read_parquet(source, n_rows=TEMPLATE_INFER_ROWS)
+        typed = True
+    else:
+        sample = pl.read_csv(source, n_rows=TEMPLATE_INFER_ROWS, infer_schema_length=TEMPLATE_INFER_ROWS,
+                             ignore_errors=True)
+        typed = False
+
+    headers = list(sample.columns)
+    mapping = {h: normalize_column_name(h) for h in headers if normalize_column_name(h) in targets}
+
+    # Parquet carries its own types; CSV gets numbers as Float64 and everything else as text
+    dtypes = {}
+    if not typed:
+        for header in headers:
+            column = mapping.get(header)
+            numeric = sample[header].dtype.is_numeric()
+            dtypes[header] = "Float64" if column and numeric and column not in TEXT_COLUMNS else "Utf8"
+
+    date_formats = {}
+    for header, column in mapping.items():
+        if column in date_columns and sample[header].dtype == pl.Utf8:
+            fmt = detect_date_format(sample[header])
+            if fmt:
+                date_formats[column] = fmt
+
+    return {"headers": headers, "column_mapping": mapping, "dtypes": dtypes, "date_formats": date_formats}
+
+
+def resolve_ingest_template(
+    db: Session,
+    tenant_id: int,
+    file_type: str,
+    source: str,
+    target_columns: Iterable[str],
+    date_columns: Iterable[str] = (),
+) -> Optional[IngestionTemplate]:
+    """
+    Return the template for ``source``'s layout, creating it from a sample on first sight.
+
+    ``source`` must be a CSV or Parquet path (convert Excel/CSV.gz first).
+    Returns None if the registry cannot be used; callers then fall back to inference.
+    """
+    try:
+        if detect_file_format(source) == "parquet":
+            headers = list(pq.ParquetFile(source).schema_arrow.names)
+        else:
+            headers = pl.read_csv(source, n_rows=0).columns
+        fingerprint = header_fingerprint(file_type, headers)
+
+        template = (
+            db.query(IngestionTemplate)
+            .filter(
+                IngestionTemplate.tenant_id == tenant_id,
+                IngestionTemplate.file_type == file_type,
+                IngestionTemplate.header_fingerprint == fingerprint,
+            )
+            .first()
+        )
+        if template:
+            template.use_count = (template.use_count or 0) + 1
+            template.last_used_at = datetime.now(timezone.utc)
+            db.commit()
+            logger.info(f"Reusing ingestion template {template.id} for {file_type} (tenant {tenant_id})")
+            return template
+
+        template = IngestionTemplate(
+            tenant_id=tenant_id,
+            file_type=file_type,
+            header_fingerprint=fingerprint,
+            **_infer_template_fields(source, target_columns, list(date_columns)),
+        )
+        db.add(template)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker registered the same layout first
+            db.rollback()
+            return resolve_ingest_template(db, tenant_id, file_type, source, target_columns, date_columns)
+        logger.info(f"Registered ingestion template {template.id} for {file_type} (tenant {tenant_id})")
+        return template
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Ingestion template lookup failed for {file_type}, inferring schema instead: {e}")
+        return None
+
+
+def forget_ingest_template(db: Session, template: Optional[IngestionTemplate]) -> None:
+    """Delete a template whose schema no longer fits its files so the next upload re-infers it."""
+    if template is None:
+        return
+    try:
+        db.delete(template)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to delete ingestion template {template.id}: {e}")
+
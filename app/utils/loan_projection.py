@@ -0,0 +1,46 @@
+"""
+Column projections over ``loans``.
+
+Most scans use a handful of a loan's 60+ columns, so instead of loading whole
+``Loan`` objects they select one or more named bundles from
+``LOAN_COLUMN_BUNDLES`` (``identity``, ``ecl_inputs``, ``ecl_outputs``,
+``bog_outputs``, ``repayment``):
+
+* ``loan_rows`` returns lightweight row tuples with attribute access
+  (``row.loan_amount``), which is all read-only reports need;
+* ``load_loan_bundles`` is a ``load_only`` option for loops that still modify
+  ``Loan`` objects.
+"""
+from typing import Iterable, List
+
+from sqlalchemy.orm import Query, Session, load_only
+
+from app.models import LOAN_COLUMN_BUNDLES, Loan
+
+
+def loan_columns(*bundles: str) -> List:
+    """Loan column attributes for ``bundles``, ``id`` first and without duplicates."""
+    names = ["id"]
+    for bundle in bundles:
+        if bundle not in LOAN_COLUMN_BUNDLES:
+            raise ValueError(f"Unknown loan column bundle '{bundle}'")
+        names.extend(n for n in LOAN_COLUMN_BUNDLES[bundle] if n not in names)
+    return [getattr(Loan, name) for name in names]
+
+
+def load_loan_bundles(*bundles: str):
+    """``load_only`` option restricting ``Loan`` entities to ``bundles``."""
+    return load_only(*loan_columns(*bundles))
+
+
+def loan_rows(db: Session, portfolio_id: int, *bundles: str, filters: Iterable = ()) -> Query:
+    """
+    Query of the portfolio's loans as row tuples holding only ``bundles``, ordered by id.
+    Iterate it, call ``.all()``, or add ``.yield_per(n)`` for large portfolios.
+    """
+    return (
+        db.query(*loan_columns(*bundles))
+        .filter(Loan.portfolio_id == portfolio_id, *filters)
+        .order_by(Loan.id)
+    )
+
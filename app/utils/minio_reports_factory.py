@@ -1,7 +1,9 @@
 import boto3
 from botocore.client import Config
 from botocore.exceptions import ClientError
+import re
 import time
+from email.utils import format_datetime, parsedate_to_datetime
 from datetime import datetime, timedelta, date
 from app.config import settings
 import io
@@ -9,16 +11,29 @@ import uuid
 import pandas as pd
 import logging
 from io import BytesIO
-from sqlalchemy import text, func, case, cast, String, and_, select, Numeric, literal_column, union_all
-from app.database import SessionLocal
-from app.models import Loan, User, Report, Portfolio, Client
+from sqlalchemy import text, func, case, cast, String, and_, select
+from app.database import ReadSessionLocal, SessionLocal
+from app.models import Loan, User, Report, Portfolio
 from app.schemas import LoanGuaranteeColumns, CollateralColumns
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, UploadFile
 import os
 import shutil
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from app.utils.mapping_utils import get_model_columns
+from app.utils.ingest_formats import describe_file
+from app.utils.xlsx_reports import (
+    journal_entries,
+    open_report_workbook,
+    start_report_sheet,
+    write_detailed_rows,
+    write_rows,
+    write_stage_summary,
+)
+from app.utils.data_versions import bump_data_version
+from app.utils.portfolio_stats import portfolio_stats_for
+from app.utils.report_pack import write_report_pack
+from app.utils.loan_export import iter_record_batches, loan_export_query, write_loan_parquet
 
 
 
@@ -46,9 +61,17 @@ public_s3_client = boto3.client(
 )
 
 
+class ReportUploadError(HTTPException):
+    """A file could not be uploaded to MinIO; report tasks retry it."""
+
+    def __init__(self):
+        super().__init__(status_code=500, detail="File upload failed")
+
+
 def upload_file_to_minio(file_path: str, object_name: str) -> str:
     """
     Upload a local file to MinIO and return its accessible URL.
+    Raises ``ReportUploadError`` (a 500 HTTPException) when the upload fails.
     """
     bucket_name = settings.MINIO_BUCKET_NAME
 
@@ -63,12 +86,43 @@ def upload_file_to_minio(file_path: str, object_name: str) -> str:
         s3_client.upload_file(file_path, bucket_name, object_name)
     except boto3.exceptions.S3UploadFailedError as e:
         logger.error(f"Upload failed: {e}")
-        raise HTTPException(status_code=500, detail="File upload failed")
+        raise ReportUploadError() from e
 
     # Return URL to access file
     file_url = f"{MINIO_PUBLIC_ENDPOINT}/{bucket_name}/{object_name}"
     return file_url
 
+
+REPORT_RETENTION_RULE_ID = "report-retention"
+
+
+def apply_report_retention(days: int = settings.REPORT_RETENTION_DAYS) -> None:
+    """
+    Expire report workbooks (objects under ``reports/``) after ``days`` with a bucket
+    lifecycle rule, keeping any other rules on the bucket; ``days=0`` removes it.
+    """
+    bucket_name = settings.MINIO_BUCKET_NAME
+    try:
+        rules = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name)["Rules"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "NoSuchLifecycleConfiguration":
+            raise
+        rules = []
+
+    rules = [rule for rule in rules if rule.get("ID") != REPORT_RETENTION_RULE_ID]
+    if days:
+        rules.append({
+            "ID": REPORT_RETENTION_RULE_ID,
+            "Status": "Enabled",
+            "Filter": {"Prefix": "reports/"},
+            "Expiration": {"Days": days},
+        })
+    if rules:
+        s3_client.put_bucket_lifecycle_configuration(Bucket=bucket_name, LifecycleConfiguration={"Rules": rules})
+    else:
+        s3_client.delete_bucket_lifecycle(Bucket=bucket_name)
+    logger.info(f"Report retention on bucket {bucket_name}: {days or 'disabled'} days")
+
 def upload_and_extract_columns(
     portfolio_id: int,
     uploadfile: UploadFile,
@@ -76,7 +130,7 @@ def upload_and_extract_columns(
     expected_columns: list[str],
 ) -> dict:
     """
-    Uploads file to MinIO, extracts Excel column headers,
+    Uploads file to MinIO, extracts column headers (Excel, CSV, CSV.gz or Parquet),
     and returns metadata including file_id and expected columns.
     """
 
@@ -95,16 +149,14 @@ def upload_and_extract_columns(
     # Upload to MinIO
     file_url = upload_file_to_minio(tmp_path, object_name)
 
-    # Extract Excel metadata
+    # Extract header metadata (the file extension decides how it is read)
     try:
-        df = pd.read_excel(tmp_path)
-        excel_columns = df.columns.tolist()
-        row_count = len(df.index)
+        excel_columns, row_count = describe_file(tmp_path)
     except Exception as e:
         os.remove(tmp_path)
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid Excel file for '{key}': {e}",
+            detail=f"Invalid file for '{key}': {e}",
         )
 
     os.remove(tmp_path)
@@ -198,73 +250,110 @@ def upload_multiple_files_to_minio(
 
 
 
-def generate_presigned_url(object_name: str, expiry_minutes: int = 10):
+def generate_presigned_url(object_name: str, expiry_minutes: int = 10, file_name: Optional[str] = None,
+                           content_type: Optional[str] = None):
     print("DEBUG PRESIGNED USING:", public_s3_client.meta.endpoint_url)
     print("DEBUG INTERNAL:", s3_client.meta.endpoint_url)
     bucket = settings.MINIO_BUCKET_NAME
+    params = {"Bucket": bucket, "Key": object_name}
+    if file_name:
+        # MinIO answers the signed GET with this header, so the browser saves the file under its name
+        params["ResponseContentDisposition"] = f'attachment; filename="{file_name}"'
+    if content_type:
+        params["ResponseContentType"] = content_type
     url = public_s3_client.generate_presigned_url(
         "get_object",
-        Params={"Bucket": bucket, "Key": object_name},
+        Params=params,
         ExpiresIn=expiry_minutes * 60,
     )
     return url
 
 
-def download_report(bucket_name: str, object_name: str) -> BytesIO:
+# Bytes read from MinIO per chunk of a streamed report download
+REPORT_DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _single_byte_range(range_header: Optional[str]) -> Optional[str]:
+    """The ``Range`` header if it asks for one byte range; multiple or malformed ranges are ignored."""
+    match = _BYTE_RANGE.match((range_header or "").replace(" ", ""))
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    if match.group(1) and match.group(2) and int(match.group(2)) < int(match.group(1)):
+        return None
+    return match.group(0)
+
+
+def open_report_object(object_name: str, range_header: Optional[str] = None,
+                       if_range: Optional[str] = None) -> Dict:
     """
-    Download a file from a MinIO bucket using boto3 and return it as BytesIO.
-    Raises an exception if bucket or object not found.
+    Start a GET of a report object for streaming to a client, honouring a single
+    byte ``Range`` and ``If-Range``. Returns the HTTP ``status`` (200, 206 or 416),
+    the ``headers`` to pass on (length, range, ETag, Last-Modified) and the unread
+    S3 ``body`` (None for 416). Raises FileNotFoundError if the object is missing.
     """
-    try:
-        # Check bucket existence
-        s3_client.head_bucket(Bucket=bucket_name)
-    except Exception:
-        raise FileNotFoundError(f"Bucket '{bucket_name}' not found")
-
-    start_time = time.time()
-    last_error = None
+    bucket_name = settings.MINIO_BUCKET_NAME
+    params = {"Bucket": bucket_name, "Key": object_name}
+    byte_range = _single_byte_range(range_header)
+    if byte_range and if_range:
+        # If-Range: send the range only if the object is unchanged, else all of it.
+        # S3 has no If-Range, so ask for the range on condition and retry without it.
+        if if_range.startswith('"'):
+            params["IfMatch"] = if_range
+        else:
+            try:
+                params["IfUnmodifiedSince"] = parsedate_to_datetime(if_range)
+            except (TypeError, ValueError):
+                # Weak ETags and unreadable dates never match
+                byte_range = None
+    if byte_range:
+        params["Range"] = byte_range
 
-    # Retry for up to 10 seconds
-    while time.time() - start_time < 10:
-        try:
-            file_obj = BytesIO()
-            s3_client.download_fileobj(bucket_name, object_name, file_obj)
-            file_obj.seek(0)
-            return file_obj
-        except s3_client.exceptions.NoSuchKey:
-            last_error = FileNotFoundError(f"Object '{object_name}' not found in bucket '{bucket_name}'")
-            time.sleep(1)
-        except ClientError as e:
-            error_code = e.response.get("Error", {}).get("Code")
-            if error_code == "404" or error_code == "NotFound":
-                 last_error = FileNotFoundError(f"Object '{object_name}' not found in bucket '{bucket_name}' - {str(e)}")
-                 time.sleep(1)
-            else:
-                 # If it's another client error, raise immediately
-                 raise RuntimeError(f"Error downloading '{object_name}' from '{bucket_name}': {str(e)}")
-        except Exception as e:
-            # If it's a different kind of error, we might want to retry or fail.
-            # For network blips, retrying might be good.
-            last_error = RuntimeError(f"Error downloading '{object_name}' from '{bucket_name}': {str(e)}")
-            time.sleep(1)
-            
-    # If we fall through here, we ran out of time
-    if last_error:
-        raise last_error
-    else:
-        # Should not happen if loop logic is correct
-        raise TimeoutError(f"Timed out trying to download '{object_name}'")
+    try:
+        response = s3_client.get_object(**params)
+    except ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code")
+        if error_code in ("NoSuchKey", "404", "NotFound"):
+            raise FileNotFoundError(f"Object '{object_name}' not found in bucket '{bucket_name}'")
+        if error_code in ("PreconditionFailed", "412"):
+            return open_report_object(object_name)
+        if error_code in ("InvalidRange", "416"):
+            size = s3_client.head_object(Bucket=bucket_name, Key=object_name)["ContentLength"]
+            return {"status": 416, "headers": {"Content-Range": f"bytes */{size}"}, "body": None}
+        raise RuntimeError(f"Error downloading '{object_name}' from '{bucket_name}': {str(e)}")
+
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(response["ContentLength"])}
+    if response.get("ETag"):
+        headers["ETag"] = response["ETag"]
+    if response.get("LastModified"):
+        headers["Last-Modified"] = format_datetime(response["LastModified"], usegmt=True)
+    if response.get("ContentRange"):
+        headers["Content-Range"] = response["ContentRange"]
+    return {"status": 206 if "Content-Range" in headers else 200, "headers": headers, "body": response["Body"]}
+
+
+def iter_object_chunks(body, chunk_size: int = REPORT_DOWNLOAD_CHUNK_BYTES):
+    """Read an S3 body ``chunk_size`` bytes at a time, closing it when done or abandoned."""
+    try:
+        while chunk := body.read(chunk_size):
+            yield chunk
+    finally:
+        body.close()
     
 
-def run_and_save_report_task(report_id: int, report_type: str, file_path: str, portfolio_id: int):
+def run_and_save_report_task(report_id: int, report_type: str, file_path: str, portfolio_id: int,
+                             raise_errors: bool = False):
     """
     Background task to generate Excel reports and upload to MinIO.
     Mirrors run_and_save_report_task from reports_factory.py but uses MinIO instead of Azure.
+    The report row is tracked on the primary; the portfolio scans run on the read replica.
+    With ``raise_errors`` a failure is re-raised instead of marking the report failed,
+    leaving retries and the final status to the caller (the Celery report task).
     """
     db = SessionLocal()
+    read_db = ReadSessionLocal()
     try:
-        import xlsxwriter
-
         logger.info(f"[TASK START] Running report task: report_id={report_id}, report_type={report_type}")
 
         report = db.query(Report).filter(Report.id == report_id).first()
@@ -275,228 +364,38 @@ def run_and_save_report_task(report_id: int, report_type: str, file_path: str, p
         portfolio_id = report.portfolio_id
         relevant_portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
 
-        # Build client map for name fallback
-        client_map = {}
-        clients = db.query(Client).filter(Client.portfolio_id == portfolio_id).all()
-        for c in clients:
-            if c.employee_id:
-                client_map[c.employee_id] = f"{c.last_name or ''} {c.other_names or ''}".strip() or "Unknown"
-
-        workbook = xlsxwriter.Workbook(file_path)
+        # constant_memory: rows go to disk as they are written, top to bottom
+        workbook = open_report_workbook(file_path)
         worksheet = workbook.add_worksheet(report_type)
+        row_idx = start_report_sheet(workbook, worksheet, report_type, relevant_portfolio.name)
 
         match report_type:
-            case "ecl_detailed_report":
-                bold_format = workbook.add_format({'bold': True})
-                left_format = workbook.add_format({'align': 'left'})
-                bold_left_format = workbook.add_format({'bold': True, 'align': 'left'})
-                italic_format = workbook.add_format({'italic': True})
-                worksheet.write('A1', f"Dalex Finance", bold_format)
-                worksheet.write('A2', f"Detailed IFRS9 ECL report", bold_format)
-                worksheet.write('A3', f"Portfolio: {relevant_portfolio.name}", bold_format)
-                worksheet.write('A4', f"Report date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-                worksheet.write('A5', f"Report extraction date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-
-                worksheet.write('A7', f"Note that ECL calculation results are as at the report run date. ECLs are discounted at the effective interest rate to the calculation run date", italic_format)
-
-                headers = [
-                    "Loan No", "Loan Issue Date", "Deduction Start Period", "Submission Period", "Maturity Period", "Outsanding Loan Balance","Deduction Status", "Employee ID", "Employee Name", "Loan Amount", "Theoretical Balance",
-                    "Oustanding balance", "Accumulated Arrears", "NDIA", "Stage", "EAD", "LGD", "EIR", "PD", "ECL"
-                ]
-                start_row=8
-                for col, h in enumerate(headers):
-                    worksheet.write(8, col, h, workbook.add_format({'bold': True, 'align': 'left'}))
-
-                query = db.query(Loan).filter(Loan.portfolio_id == portfolio_id).yield_per(1000)
-                row_idx = start_row+1
-
-                for row in query:
-                    worksheet.write(row_idx, 0, row.loan_no)
-                    worksheet.write(row_idx, 1, str(row.loan_issue_date))
-                    worksheet.write(row_idx, 2, str(row.deduction_start_period))
-                    worksheet.write(row_idx, 3, str(row.submission_period))
-                    worksheet.write(row_idx, 4, str(row.maturity_period))
-                    worksheet.write(row_idx, 5, float(row.outstanding_loan_balance or 0))
-                    worksheet.write(row_idx, 6, str(row.deduction_status))
-                    worksheet.write(row_idx, 7, row.employee_id)
-                    client_name = row.employee_name or client_map.get(row.employee_id, "Unknown")
-                    worksheet.write(row_idx, 8, client_name)
-                    worksheet.write(row_idx, 9, float(row.loan_amount or 0))
-                    worksheet.write(row_idx, 10, float(row.theoretical_balance or 0))
-                    worksheet.write(row_idx, 11, float(row.balance_difference or 0))
-                    worksheet.write(row_idx, 12, float(row.accumulated_arrears or 0))
-                    worksheet.write(row_idx, 13, str(row.ndia))
-                    worksheet.write(row_idx, 14, str(row.ifrs9_stage))
-                    worksheet.write(row_idx, 15, float(row.ead or 0))
-                    worksheet.write(row_idx, 16, float(row.lgd or 0))
-                    worksheet.write(row_idx, 17, float(row.eir or 0))
-                    worksheet.write(row_idx, 18, float(row.pd or 0))
-                    worksheet.write(row_idx, 19, float(row.final_ecl or 0))
-                    row_idx += 1
-
-            case "BOG_impairment_detailed_report":
-                bold_format = workbook.add_format({'bold': True})
-                left_format = workbook.add_format({'align': 'left'})
-                bold_left_format = workbook.add_format({'bold': True, 'align': 'left'})
-                worksheet.write('A1', f"Dalex Finance", bold_format)
-                worksheet.write('A2', f"Detailed BOG impairment report", bold_format)
-                worksheet.write('A3', f"Portfolio: {relevant_portfolio.name}", bold_format)
-                worksheet.write('A4', f"Report date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-                worksheet.write('A5', f"Report extraction date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-
-                headers = [
-                    "Loan No", "Employee ID", "Employee Name", "Loan Amount", "Theoretical Balance", "Oustanding balance",
-                    "Accumulated Arrears", "NDIA", "Stage", "Provision rate %", "Provision"
-                ]
-                start_row=7
-                for col, h in enumerate(headers):
-                    worksheet.write(start_row, col, h, workbook.add_format({'bold': True, 'align': 'center'}))
-
-                query = db.query(Loan).filter(Loan.portfolio_id == portfolio_id).yield_per(1000)
-                row_idx = start_row+1
-
-                for row in query:
-                    worksheet.write(row_idx, 0, row.loan_no)
-                    worksheet.write(row_idx, 1, row.employee_id)
-                    client_name = row.employee_name or client_map.get(row.employee_id, "Unknown")
-                    worksheet.write(row_idx, 2, client_name)
-                    worksheet.write(row_idx, 3, float(row.loan_amount or 0))
-                    worksheet.write(row_idx, 4, float(row.theoretical_balance or 0))
-                    worksheet.write(row_idx, 5, float(row.balance_difference or 0))
-                    worksheet.write(row_idx, 6, float(row.accumulated_arrears or 0))
-                    worksheet.write(row_idx, 7, str(row.ndia))
-                    worksheet.write(row_idx, 8, str(row.bog_stage))
-                    worksheet.write(row_idx, 9, float(row.bog_prov_rate or 0))
-                    worksheet.write(row_idx, 10, float(row.bog_provision or 0))
-                    row_idx += 1
+            case "ecl_detailed_report" | "BOG_impairment_detailed_report":
+                row_idx = write_detailed_rows(worksheet, read_db, report_type, portfolio_id, row_idx)
 
             case "ecl_report_summarised_by_stages":
-                bold_format = workbook.add_format({'bold': True})
-                left_format = workbook.add_format({'align': 'left'})
-                bold_left_format = workbook.add_format({'bold': True, 'align': 'left'})
-                worksheet.write('A1', f"Dalex Finance", bold_format)
-                worksheet.write('A2', f"Summary IFRS 9 ECL report", bold_format)
-                worksheet.write('A3', f"Portfolio: {relevant_portfolio.name}", bold_format)
-                worksheet.write('A4', f"Report date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-                worksheet.write('A5', f"Report extraction date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-
-                headers = [
-                    "Stages", "Loan value", "Outstanding loan balance", "Oustanding balance", "ECL", "Recovery rate %"
-                ]
-                start_row=7
-                for col, h in enumerate(headers):
-                    worksheet.write(start_row, col, h, workbook.add_format({'bold': True, 'align': 'center'}))
-
-                query = db.query( Loan.ifrs9_stage.label("stage"), func.sum(Loan.loan_amount).label("loan_value"), func.sum(Loan.ead).label("outstanding_loan_balance"), func.sum(Loan.balance_difference).label("balance_difference"), func.sum(Loan.final_ecl).label("ecl"), cast(0.20, Numeric(5, 2)).label("recovery_rate")
-                 ) .filter(Loan.portfolio_id == portfolio_id) .group_by(Loan.ifrs9_stage) .order_by(Loan.ifrs9_stage) .all() 
-                row_idx = start_row+1
-
-                for row in query:
-                    worksheet.write(row_idx, 0, row.stage)
-                    worksheet.write(row_idx, 1, round(float(row.loan_value),2))
-                    worksheet.write(row_idx, 2, round(float(row.outstanding_loan_balance),2))
-                    worksheet.write(row_idx, 3, round(float(row.balance_difference or 0),2))
-                    worksheet.write(row_idx, 4, round(float(row.ecl),2))
-                    worksheet.write(row_idx, 5, round(float(row.outstanding_loan_balance)/float(row.loan_value) * 100,2))
-                    row_idx+= 1
+                stages = read_db.query(
+                    Loan.ifrs9_stage, func.sum(Loan.loan_amount), func.sum(Loan.ead),
+                    func.sum(Loan.balance_difference), func.sum(Loan.final_ecl)
+                ).filter(Loan.portfolio_id == portfolio_id).group_by(Loan.ifrs9_stage).order_by(Loan.ifrs9_stage).all()
+                row_idx = write_stage_summary(worksheet, stages, row_idx)
 
             case "BOG_impairmnt_summary_by_stages":
-                bold_format = workbook.add_format({'bold': True})
-                left_format = workbook.add_format({'align': 'left'})
-                bold_left_format = workbook.add_format({'bold': True, 'align': 'left'})
-                worksheet.write('A1', f"Dalex Finance", bold_format)
-                worksheet.write('A2', f"Summary BOG impairment report ", bold_format)
-                worksheet.write('A3', f"Portfolio: {relevant_portfolio.name}", bold_format)
-                worksheet.write('A4', f"Report date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-                worksheet.write('A5', f"Report extraction date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-
-                headers = [
-                    "Stages", "Loan value", "Outstanding loan balance", "Oustanding balance", "Provision", "Recovery rate %"
-                ]
-                start_row = 7
-                for col, h in enumerate(headers):
-                    worksheet.write(start_row, col, h, workbook.add_format({'bold': True}))
-
-                query = db.query(Loan.bog_stage.label("stage"), func.sum(Loan.loan_amount).label("loan_value"), func.sum(Loan.ead).label("outstanding_loan_balance"), func.sum(Loan.balance_difference).label("balance_difference"), func.sum(Loan.bog_provision).label("provision"), cast(0.20, Numeric(5, 2)).label("recovery_rate")
-                 ) .filter(Loan.portfolio_id == portfolio_id) .group_by(Loan.bog_stage) .order_by(Loan.bog_stage) .all() 
-                row_idx = start_row+1
-
-                for row in query:
-                    worksheet.write(row_idx, 0, row.stage)
-                    worksheet.write(row_idx, 1, round(float(row.loan_value),2))
-                    worksheet.write(row_idx, 2, round(float(row.outstanding_loan_balance),2))
-                    worksheet.write(row_idx, 3, round(float(row.balance_difference or 0),2))
-                    worksheet.write(row_idx, 4, round(float(row.provision),2))
-                    worksheet.write(row_idx, 5, round(float(row.outstanding_loan_balance)/float(row.loan_value) * 100,2))
-                    row_idx+= 1
+                stages = read_db.query(
+                    Loan.bog_stage, func.sum(Loan.loan_amount), func.sum(Loan.ead),
+                    func.sum(Loan.balance_difference), func.sum(Loan.bog_provision)
+                ).filter(Loan.portfolio_id == portfolio_id).group_by(Loan.bog_stage).order_by(Loan.bog_stage).all()
+                row_idx = write_stage_summary(worksheet, stages, row_idx)
 
             case "journals_report":
-                bold_format = workbook.add_format({'bold': True})
-                left_format = workbook.add_format({'align': 'left'})
-                bold_left_format = workbook.add_format({'bold': True, 'align': 'left'})
-                worksheet.write('A1', f"Dalex Finance", bold_format)
-                worksheet.write('A2', f"Journals report", bold_format)
-                worksheet.write('A3', f"Portfolio: {relevant_portfolio.name}", bold_format)
-                worksheet.write('A4', f"Report date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-                worksheet.write('A5', f"Report extraction date: {date.today().strftime('%Y-%m-%d')}", bold_format)
-
-                headers = [
-                    "GL Account code", "Journal description", "Journal amount"
-                ]
-                start_row = 7
-                for col, h in enumerate(headers):
-                    worksheet.write(start_row, col, h, bold_left_format)
-                    col_width = max(len(h), 30)
-                    worksheet.set_column(col, col, col_width, left_format)
-
-                # Step 1: Get Portfolio object and values
-                portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-                if not portfolio:
-                    raise HTTPException(status_code=404, detail="Portfolio not found")
-
-                # Step 2: Calculate monetary values
-                ecl_total = db.query(func.sum(Loan.final_ecl)).filter(Loan.portfolio_id == portfolio_id).scalar() or 0
-                bog_total = db.query(func.sum(Loan.bog_provision)).filter(Loan.portfolio_id == portfolio_id).scalar() or 0
-                bog_topup = float(bog_total) - float(ecl_total)
-
-                # Step 3: Compose individual selects using dynamic Portfolio values
-                stmt1 = select(
-                    literal_column(f"'{portfolio.ecl_impairment_account}'").label("account_code"),
-                    literal_column("'IFRS9 Impairment - P&L charge'").label("description"),
-                    literal_column(f"{ecl_total}").label("ghs")
+                # The maintained portfolio totals, refreshed by the ECL and BOG calculations
+                stats = portfolio_stats_for(read_db, [portfolio_id])[portfolio_id]
+                row_idx = write_rows(
+                    worksheet,
+                    journal_entries(relevant_portfolio, stats.total_final_ecl, stats.total_bog_provision),
+                    row_idx,
                 )
 
-                stmt2 = select(
-                    literal_column(f"'{portfolio.loan_assets}'").label("account_code"),
-                    literal_column("'IFRS9 Impairment - impact on loans'").label("description"),
-                    literal_column(f"{-ecl_total}").label("ghs")
-                )
-
-                stmt3 = select(
-                    literal_column(f"'{portfolio.ecl_impairment_account}'").label("account_code"),
-                    literal_column("'Top up for BOG Impairment - P&L charge'").label("description"),
-                    literal_column(f"{bog_topup}").label("ghs")
-                )
-
-                stmt4 = select(
-                    literal_column(f"'{portfolio.credit_risk_reserve}'").label("account_code"),
-                    literal_column("'Credit risk reserve'").label("description"),
-                    literal_column(f"{-bog_topup}").label("ghs")
-                )
-
-                # Step 4: Combine all queries
-                query = union_all(stmt1, stmt2, stmt3, stmt4)
-
-                # Step 5: Execute
-                results = db.execute(query).fetchall()               
-
-                row_idx =start_row + 1
-                for row in results:
-                    worksheet.write(row_idx, 0, row.account_code)
-                    worksheet.write(row_idx, 1, row.description)
-                    worksheet.write(row_idx, 2, row.ghs)
-                    row_idx+= 1
-
         workbook.close()
         logger.info(f"[TASK] Excel workbook completed for report_id={report_id}, rows={row_idx}")
 
@@ -509,6 +408,7 @@ def run_and_save_report_task(report_id: int, report_type: str, file_path: str, p
             "status": "success",
             "file_path": minio_url
         })
+        bump_data_version(portfolio_id, db, report_inputs=False)
         db.commit()
         logger.info(f"[TASK COMPLETE] Report {report_id} successfully uploaded to MinIO and status updated.")
         
@@ -521,8 +421,10 @@ def run_and_save_report_task(report_id: int, report_type: str, file_path: str, p
 
     except Exception as e:
         logger.error(f"[TASK ERROR] Report task failed for report_id={report_id}: {e}", exc_info=True)
-        db.query(Report).filter(Report.id == report_id).update({"status": "failed"})
-        db.commit()
+        if not raise_errors:
+            db.query(Report).filter(Report.id == report_id).update({"status": "failed"})
+            bump_data_version(portfolio_id, db, report_inputs=False)
+            db.commit()
         
         # Clean up local file if it exists
         try:
@@ -531,10 +433,80 @@ def run_and_save_report_task(report_id: int, report_type: str, file_path: str, p
                 logger.info(f"[CLEANUP] Local file {file_path} removed after error.")
         except Exception as cleanup_error:
             logger.warning(f"[CLEANUP] Failed to remove local file {file_path}: {cleanup_error}")
+        if raise_errors:
+            raise
+
+    finally:
+        read_db.close()
+        db.close()
+
+
+
+def run_and_save_report_pack_task(report_ids: List[int], portfolio_id: int, directory: str):
+    """
+    Build several reports of one portfolio from a single scan of its loans
+    (app.utils.report_pack), upload every workbook, then mark all of the Report
+    rows done in one commit. Errors are raised to the caller (the Celery report
+    pack task), which handles retries and the failed status.
+    """
+    db = SessionLocal()
+    read_db = ReadSessionLocal()
+    try:
+        logger.info(f"[TASK START] Running report pack: report_ids={report_ids}, portfolio_id={portfolio_id}")
+        reports = db.query(Report).filter(Report.id.in_(report_ids)).all()
+        portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
+        if portfolio is None:
+            raise ValueError(f"Portfolio {portfolio_id} not found")
+
+        report_files = {report.report_type: os.path.join(directory, report.report_name) for report in reports}
+        rows = write_report_pack(read_db, portfolio, report_files)
+        logger.info(f"[TASK] Report pack workbooks completed for portfolio_id={portfolio_id}, rows={rows}")
+
+        # Same object names as single reports, so a repeated attempt overwrites its uploads
+        file_urls = {
+            report.id: upload_file_to_minio(report_files[report.report_type], f"reports/{report.report_name}")
+            for report in reports
+        }
+        for report_id, minio_url in file_urls.items():
+            db.query(Report).filter(Report.id == report_id).update({"status": "success", "file_path": minio_url})
+        bump_data_version(portfolio_id, db, report_inputs=False)
+        db.commit()
+        logger.info(f"[TASK COMPLETE] Report pack {report_ids} uploaded to MinIO and statuses updated.")
 
     finally:
+        read_db.close()
         db.close()
 
+def run_and_save_loan_export_task(report_id: int, file_path: str):
+    """
+    Write a loan export Report (app.utils.loan_export) as Parquet from the read
+    replica, upload it to ``reports/{report_name}`` and mark the report done with
+    its row count. Errors are raised to the caller (the Celery export task).
+    """
+    db = SessionLocal()
+    read_db = ReadSessionLocal()
+    try:
+        report = db.query(Report).filter(Report.id == report_id).first()
+        if report is None:
+            raise ValueError(f"Report {report_id} not found")
+        logger.info(f"[TASK START] Running loan export: report_id={report_id}, portfolio_id={report.portfolio_id}")
+
+        query, schema = loan_export_query(report.portfolio_id, report.tenant_id, **report.report_data["filters"])
+        rows = write_loan_parquet(iter_record_batches(read_db, query, schema), schema, file_path)
+        minio_url = upload_file_to_minio(file_path, f"reports/{report.report_name}")
+
+        db.query(Report).filter(Report.id == report_id).update({
+            "status": "success",
+            "file_path": minio_url,
+            "report_data": {**report.report_data, "rows": rows, "columns": schema.names},
+        })
+        bump_data_version(report.portfolio_id, db, report_inputs=False)
+        db.commit()
+        logger.info(f"[TASK COMPLETE] Loan export {report_id} uploaded to MinIO, rows={rows}")
+
+    finally:
+        read_db.close()
+        db.close()
 
 async def generate_presigned_url_for_download(file_url: str, expiry_minutes: int = 10) -> str:
     """
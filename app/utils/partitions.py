@@ -0,0 +1,141 @@
+"""
+Per-portfolio list partitions of ``loans`` and ``clients``.
+
+On Postgres both tables are partitioned by LIST (portfolio_id) with one
+partition per portfolio (``loans_p<id>``, ``clients_p<id>``) and a DEFAULT
+partition catching rows of portfolios created before their partitions were.
+Replacing or dropping a portfolio's data then touches only its own partition.
+
+Every helper is a no-op when the tables are not partitioned (e.g. SQLite in tests).
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("loans", "clients")
+
+
+def partition_name(table: str, portfolio_id: int) -> str:
+    """Name of the partition holding ``portfolio_id``'s rows of ``table``."""
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"'{table}' is not partitioned by portfolio")
+    return f"{table}_p{int(portfolio_id)}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def is_partitioned(table: str, db: Session) -> bool:
+    """True when ``table`` is a partitioned Postgres table."""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": table},
+    ).first() is not None
+
+
+def partition_exists(table: str, portfolio_id: int, db: Session) -> bool:
+    return db.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"),
+        {"name": partition_name(table, portfolio_id)},
+    ).scalar()
+
+
+def ensure_portfolio_partitions(portfolio_id: int, db: Session) -> None:
+    """
+    Create the portfolio's partitions if missing and commit.
+    Rows already sitting in the DEFAULT partition for this portfolio are moved in.
+    """
+    created = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table, db) or partition_exists(table, portfolio_id, db):
+            continue
+        partition = partition_name(table, portfolio_id)
+        default = default_partition_name(table)
+        params = {"portfolio_id": portfolio_id}
+        # A new partition may not overlap rows left in DEFAULT, so move them across
+        db.execute(text(
+            f"CREATE TEMP TABLE moved_{partition} ON COMMIT DROP AS "
+            f"SELECT * FROM {default} WHERE portfolio_id = :portfolio_id"
+        ), params)
+        db.execute(text(f"DELETE FROM {default} WHERE portfolio_id = :portfolio_id"), params)
+        db.execute(text(f"CREATE TABLE {partition} PARTITION OF {table} FOR VALUES IN ({int(portfolio_id)})"))
+        db.execute(text(f"INSERT INTO {table} SELECT * FROM moved_{partition}"))
+        created.append(partition)
+    if created:
+        db.commit()
+        logger.info(f"Created partitions for portfolio {portfolio_id}: {created}")
+
+
+def drop_portfolio_partitions(portfolio_id: int, db: Session) -> None:
+    """Drop the portfolio's (emptied) partitions after the portfolio itself is deleted, and commit."""
+    dropped = []
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(table, db) and partition_exists(table, portfolio_id, db):
+            db.execute(text(f"DROP TABLE {partition_name(table, portfolio_id)}"))
+            dropped.append(partition_name(table, portfolio_id))
+    if dropped:
+        db.commit()
+        logger.info(f"Dropped partitions for portfolio {portfolio_id}: {dropped}")
+
+
+def _portfolio_check_name(replacement: str) -> str:
+    return f"{replacement}_portfolio_check"
+
+
+def prepare_partition_replacement(table: str, portfolio_id: int, replacement: str, db: Session) -> None:
+    """
+    Ready ``replacement`` (a plain table holding only this portfolio's rows) to be swapped
+    in by ``exchange_portfolio_partition``: prove the partition bound with a CHECK
+    constraint and build the parent's primary key and indexes on it. ATTACH PARTITION
+    then adopts them instead of validating rows and building indexes under the lock
+    taken by DETACH. Index names are left to Postgres, so they never clash with the
+    partition being replaced. Runs in the caller's transaction; no live table is locked.
+    """
+    pid = int(portfolio_id)
+    db.execute(text(
+        f"ALTER TABLE {replacement} ADD CONSTRAINT {_portfolio_check_name(replacement)} "
+        f"CHECK (portfolio_id IS NOT NULL AND portfolio_id = {pid})"
+    ))
+    parent_indexes = db.execute(text("""
+        SELECT con.contype, pg_get_constraintdef(con.oid) AS constraint_def, x.indisunique,
+               substring(pg_get_indexdef(x.indexrelid) from ' USING .*$') AS index_def
+        FROM pg_index x
+        LEFT JOIN pg_constraint con ON con.conindid = x.indexrelid AND con.conrelid = x.indrelid
+        WHERE x.indrelid = to_regclass(:table)
+    """), {"table": table}).mappings().all()
+    for index in parent_indexes:
+        if index["contype"] in ("p", "u"):
+            db.execute(text(f"ALTER TABLE {replacement} ADD {index['constraint_def']}"))
+        else:
+            unique = "UNIQUE " if index["indisunique"] else ""
+            db.execute(text(f"CREATE {unique}INDEX ON {replacement}{index['index_def']}"))
+
+
+def exchange_portfolio_partition(table: str, portfolio_id: int, replacement: str, db: Session) -> None:
+    """
+    Swap ``replacement`` in as the portfolio's partition of ``table``: detach and drop the
+    current partition, then attach the replacement under the partition's name. The
+    replacement must have been through ``prepare_partition_replacement`` so the swap only
+    holds the parent's lock for metadata changes. Runs in the caller's transaction.
+
+    DETACH ... CONCURRENTLY is not an option: it cannot run in a transaction block, and
+    Postgres refuses it while the table has a DEFAULT partition.
+    """
+    partition = partition_name(table, portfolio_id)
+    pid = int(portfolio_id)
+
+    if partition_exists(table, portfolio_id, db):
+        db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+        db.execute(text(f"DROP TABLE {partition}"))
+    else:
+        db.execute(text(f"DELETE FROM {default_partition_name(table)} WHERE portfolio_id = :portfolio_id"),
+                   {"portfolio_id": pid})
+    db.execute(text(f"ALTER TABLE {replacement} RENAME TO {partition}"))
+    db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN ({pid})"))
+    db.execute(text(f"ALTER TABLE {partition} DROP CONSTRAINT {_portfolio_check_name(replacement)}"))
@@ -0,0 +1,148 @@
+"""
+Maintained per-portfolio aggregates (``portfolio_stats``).
+
+Steps that change a portfolio's loans, clients or quality issues (ingestion,
+staging, ECL/BOG calculation, EAD updates, quality checks and issue status
+changes) call ``refresh_portfolio_stats`` before committing, so the row commits
+together with the data it describes. The portfolio list, portfolio detail and
+dashboard read it through ``portfolio_stats_for`` instead of aggregating loans.
+"""
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import Client, Loan, PortfolioStats, QualityIssue
+from app.utils.data_versions import bump_data_version
+
+
+def _stage_totals(db: Session, portfolio_id: int, stage_column, provision_column) -> Dict[str, Dict[str, Any]]:
+    rows = (
+        db.query(
+            stage_column.label("stage"),
+            func.count(Loan.id).label("num_loans"),
+            func.sum(Loan.ead).label("total_exposure"),
+            func.sum(provision_column).label("provision_amount"),
+        )
+        .filter(Loan.portfolio_id == portfolio_id, stage_column.isnot(None))
+        .group_by(stage_column)
+        .all()
+    )
+    return {
+        row.stage: {
+            "num_loans": int(row.num_loans or 0),
+            "total_exposure": float(row.total_exposure or 0),
+            "provision_amount": float(row.provision_amount or 0),
+        }
+        for row in rows
+    }
+
+
+def compute_issue_flags(portfolio_id: int, db: Session) -> Dict[str, bool]:
+    has_issues = db.query(
+        db.query(QualityIssue.id).filter(QualityIssue.portfolio_id == portfolio_id).exists()
+    ).scalar()
+    has_open_issues = db.query(
+        db.query(QualityIssue.id)
+        .filter(QualityIssue.portfolio_id == portfolio_id, QualityIssue.status != "approved")
+        .exists()
+    ).scalar()
+    return {"has_quality_issues": bool(has_issues), "has_open_quality_issues": bool(has_open_issues)}
+
+
+def compute_portfolio_stats(portfolio_id: int, db: Session) -> Dict[str, Any]:
+    """Aggregate the portfolio's loans, clients and quality issues into ``PortfolioStats`` values."""
+    loans = db.query(
+        func.count(Loan.id).label("total_loans"),
+        func.sum(Loan.ead).label("total_loan_value"),
+        func.avg(Loan.ead).label("average_loan_amount"),
+        func.sum(Loan.outstanding_loan_balance).label("total_outstanding_balance"),
+        func.sum(Loan.final_ecl).label("total_final_ecl"),
+        func.sum(Loan.bog_provision).label("total_bog_provision"),
+    ).filter(Loan.portfolio_id == portfolio_id).one()
+
+    client_types = (
+        db.query(Client.client_type, func.count(Client.id))
+        .filter(Client.portfolio_id == portfolio_id)
+        .group_by(Client.client_type)
+        .all()
+    )
+
+    unpaid_borrowers = (
+        select(Loan.employee_id)
+        .where(Loan.portfolio_id == portfolio_id, Loan.paid == False)
+        .distinct()
+    )
+    active_customers = db.query(func.count(Client.id)).filter(
+        Client.portfolio_id == portfolio_id,
+        Client.employee_id.in_(unpaid_borrowers),
+    ).scalar()
+
+    return {
+        "total_loans": loans.total_loans or 0,
+        "total_loan_value": loans.total_loan_value or 0,
+        "average_loan_amount": loans.average_loan_amount or 0,
+        "total_outstanding_balance": loans.total_outstanding_balance or 0,
+        "total_final_ecl": loans.total_final_ecl or 0,
+        "total_bog_provision": loans.total_bog_provision or 0,
+        "ifrs9_stages": _stage_totals(db, portfolio_id, Loan.ifrs9_stage, Loan.final_ecl),
+        "bog_stages": _stage_totals(db, portfolio_id, Loan.bog_stage, Loan.bog_provision),
+        "total_customers": sum(count for _, count in client_types),
+        "client_types": {client_type: count for client_type, count in client_types if client_type is not None},
+        "active_customers": active_customers or 0,
+        **compute_issue_flags(portfolio_id, db),
+    }
+
+
+def refresh_portfolio_stats(portfolio_id: int, db: Session, issues_only: bool = False) -> PortfolioStats:
+    """
+    Recompute the portfolio's ``portfolio_stats`` row and bump its data_version in the
+    caller's transaction (flushed, not committed). ``issues_only`` limits an existing
+    row's refresh to the quality-issue flags.
+    """
+    # Pending changes (e.g. an issue's new status) must be visible to the aggregates
+    db.flush()
+    stats = db.get(PortfolioStats, portfolio_id, with_for_update=True)
+    if stats is None:
+        stats = PortfolioStats(portfolio_id=portfolio_id)
+        db.add(stats)
+        issues_only = False
+
+    values = compute_issue_flags(portfolio_id, db) if issues_only else compute_portfolio_stats(portfolio_id, db)
+    for name, value in values.items():
+        setattr(stats, name, value)
+    bump_data_version(portfolio_id, db, report_inputs=not issues_only)
+    db.flush()
+    return stats
+
+
+def portfolio_stats_for(db: Session, portfolio_ids: Iterable[int]) -> Dict[int, PortfolioStats]:
+    """
+    ``PortfolioStats`` by portfolio id. Portfolios without a row yet (nothing has
+    refreshed them since they were created) get unsaved stats computed on the spot,
+    so this also works on read-only sessions.
+    """
+    portfolio_ids = list(portfolio_ids)
+    if not portfolio_ids:
+        return {}
+    stats = {
+        row.portfolio_id: row
+        for row in db.query(PortfolioStats).filter(PortfolioStats.portfolio_id.in_(portfolio_ids))
+    }
+    for portfolio_id in portfolio_ids:
+        if portfolio_id not in stats:
+            stats[portfolio_id] = PortfolioStats(portfolio_id=portfolio_id, **compute_portfolio_stats(portfolio_id, db))
+    return stats
+
+
+def portfolio_flags(stats: PortfolioStats) -> Dict[str, Optional[bool]]:
+    """The ``has_*`` flags shared by the portfolio list and detail responses."""
+    return {
+        "has_ingested_data": (stats.total_loans or 0) > 0,
+        "has_calculated_ecl": (stats.total_final_ecl or 0) > 0,
+        "has_calculated_local_impairment": (stats.total_bog_provision or 0) > 0,
+        # None when there is nothing to approve
+        "has_all_issues_approved": (
+            not stats.has_open_quality_issues if stats.has_quality_issues else None
+        ),
+    }
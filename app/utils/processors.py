@@ -4,7 +4,6 @@ import polars as pl
 import numpy as np
 import os
 import tempfile
-from xlsx2csv import Xlsx2csv
 from datetime import datetime  # Import datetime for type checking
 import concurrent.futures
 from sqlalchemy import text
@@ -13,17 +12,7 @@ from app.models import (
     Portfolio,
     Client
 )
-
-def excel_to_csv_helper(excel_path: str) -> str:
-    """Helper to convert Excel file to CSV for memory-efficient streaming."""
-    fd, csv_path = tempfile.mkstemp(suffix=".csv", prefix="proc_conv_")
-    os.close(fd)
-    try:
-        Xlsx2csv(excel_path, skip_empty_lines=True).convert(csv_path)
-        return csv_path
-    except Exception as e:
-        if os.path.exists(csv_path): os.remove(csv_path)
-        raise e
+from app.utils.ingest_formats import read_frame, normalize_column_name
 
 async def process_loan_details(loan_details, portfolio_id, db):
     """Function to process loan details with high-performance optimizations for large datasets using Polars."""
@@ -499,96 +488,89 @@ async def process_loan_guarantees(file_path, portfolio_id, db):
     if not isinstance(file_path, str) or not os.path.exists(file_path):
         return {"processed": 0, "success": True}
 
-    csv_path = None
-    try:
-        csv_path = excel_to_csv_helper(file_path)
-        df = pl.read_csv(csv_path, infer_schema_length=5000, ignore_errors=True)
-        
-        if df.height == 0: return {"processed": 0, "success": True}
+    # Excel, CSV, CSV.gz or Parquet
+    df = read_frame(file_path)
 
-        # Normalize columns
-        df.columns = [c.strip().lower().replace(".", "").replace(" ", "_") for c in df.columns]
-        
-        # Mapping
-        target_columns = {
-            "loan_no": "loan_no", "guarantor_name": "guarantor_name", "guarantee_amount": "guarantee_amount"
-        }
-        rename_map = {k: v for k, v in target_columns.items() if k in df.columns}
-        if rename_map: df = df.rename(rename_map)
+    if df.height == 0: return {"processed": 0, "success": True}
 
-        # Insert using COPY
-        connection = db.connection().connection
-        cursor = connection.cursor()
-        
-        copy_cols = ["loan_no", "guarantor_name", "guarantee_amount"]
-        copy_cols = [c for c in copy_cols if c in df.columns]
-        
-        rows_data = []
-        for row in df.select(copy_cols).to_dicts():
-            line = "\t".join(str(row.get(c, "")) for c in copy_cols)
-            rows_data.append(line)
-        
-        if rows_data:
-            batch_buffer = io.StringIO("\n".join(rows_data) + "\n")
-            cursor.copy_from(batch_buffer, "guarantees", columns=copy_cols, sep="\t", null="")
-            connection.commit()
+    # Normalize columns
+    df.columns = [normalize_column_name(c) for c in df.columns]
+
+    # Mapping
+    target_columns = {
+        "loan_no": "loan_no", "guarantor_name": "guarantor_name", "guarantee_amount": "guarantee_amount"
+    }
+    rename_map = {k: v for k, v in target_columns.items() if k in df.columns}
+    if rename_map: df = df.rename(rename_map)
 
-        return {"processed": len(rows_data), "success": True}
+    # Insert using COPY
+    connection = db.connection().connection
+    cursor = connection.cursor()
+    
+    copy_cols = ["loan_no", "guarantor_name", "guarantee_amount"]
+    copy_cols = [c for c in copy_cols if c in df.columns]
+    
+    rows_data = []
+    for row in df.select(copy_cols).to_dicts():
+        line = "\t".join(str(row.get(c, "")) for c in copy_cols)
+        rows_data.append(line)
+    
+    if rows_data:
+        batch_buffer = io.StringIO("\n".join(rows_data) + "\n")
+        cursor.copy_from(batch_buffer, "guarantees", columns=copy_cols, sep="\t", null="")
+        db.commit()
+
+    return {"processed": len(rows_data), "success": True}
 
-    finally:
-        if csv_path and os.path.exists(csv_path): os.remove(csv_path)
 
 async def process_collateral_data(file_path, portfolio_id, db):
     """Chunked processing for loan collateral (securities)."""
     if not isinstance(file_path, str) or not os.path.exists(file_path):
         return {"processed": 0, "success": True}
 
-    csv_path = None
-    try:
-        csv_path = excel_to_csv_helper(file_path)
-        # Using a small batch or just one-shot if collateral is small, but reader is safer
-        df = pl.read_csv(csv_path, infer_schema_length=5000, ignore_errors=True)
-        
-        if df.height == 0: return {"processed": 0, "success": True}
+    # Excel, CSV, CSV.gz or Parquet; collateral files are small enough to read one-shot
+    df = read_frame(file_path)
 
-        # Normalize columns
-        df.columns = [c.strip().lower().replace(".", "").replace(" ", "_") for c in df.columns]
-        
-        # Get client mapping: employee_id -> client_id
-        clients_query = text("SELECT employee_id, id FROM clients WHERE portfolio_id = :portfolio_id")
-        clients_result = db.execute(clients_query, {"portfolio_id": portfolio_id})
-        client_map = {str(emp_id): c_id for emp_id, c_id in clients_result if emp_id}
+    if df.height == 0: return {"processed": 0, "success": True}
 
-        # Mapping
-        target_columns = {
-            "loan_no": "loan_no", "collateral_description": "collateral_description", "collateral_value": "collateral_value"
-        }
-        rename_map = {k: v for k, v in target_columns.items() if k in df.columns}
-        if rename_map: df = df.rename(rename_map)
+    # Normalize columns
+    df.columns = [normalize_column_name(c) for c in df.columns]
 
-        # Inject using COPY
-        connection = db.connection().connection
-        cursor = connection.cursor()
-        
-        rows_data = []
-        for row in df.to_dicts():
-            loan_no = str(row.get("loan_no", ""))
-            client_id = client_map.get(loan_no)
-            if client_id:
-                processed_row = {
-                    "client_id": str(client_id),
-                    "collateral_description": str(row.get("collateral_description", "")),
-                    "collateral_value": str(row.get("collateral_value", 0))
-                }
-                line = "\t".join(processed_row.values())
-                rows_data.append(line)
-        
-        if rows_data:
-            batch_buffer = io.StringIO("\n".join(rows_data) + "\n")
-            cursor.copy_from(batch_buffer, "securities", columns=["client_id", "collateral_description", "collateral_value"], sep="\t", null="")
-            connection.commit()
+    # Get client mapping: loan_no -> client_id (materialized on loans at ingestion)
+    clients_query = text(
+        "SELECT loan_no, client_id FROM loans WHERE portfolio_id = :portfolio_id AND client_id IS NOT NULL"
+    )
+    clients_result = db.execute(clients_query, {"portfolio_id": portfolio_id})
+    client_map = {str(loan_no): c_id for loan_no, c_id in clients_result if loan_no}
+
+    # Mapping
+    target_columns = {
+        "loan_no": "loan_no", "collateral_description": "collateral_description", "collateral_value": "collateral_value"
+    }
+    rename_map = {k: v for k, v in target_columns.items() if k in df.columns}
+    if rename_map: df = df.rename(rename_map)
+
+    # Inject using COPY
+    connection = db.connection().connection
+    cursor = connection.cursor()
+    
+    rows_data = []
+    for row in df.to_dicts():
+        loan_no = str(row.get("loan_no", ""))
+        client_id = client_map.get(loan_no)
+        if client_id:
+            processed_row = {
+                "client_id": str(client_id),
+                "collateral_description": str(row.get("collateral_description", "")),
+                "collateral_value": str(row.get("collateral_value", 0))
+            }
+            line = "\t".join(processed_row.values())
+            rows_data.append(line)
+    
+    if rows_data:
+        batch_buffer = io.StringIO("\n".join(rows_data) + "\n")
+        cursor.copy_from(batch_buffer, "securities", columns=["client_id", "collateral_description", "collateral_value"], sep="\t", null="")
+        db.commit()
 
-        return {"processed": len(rows_data), "success": True}
+    return {"processed": len(rows_data), "success": True}
 
-    finally:
-        if csv_path and os.path.exists(csv_path): os.remove(csv_path)
@@ -2,6 +2,7 @@ from collections import defaultdict
 from typing import List, Dict, Any
 from sqlalchemy.orm import Session
 from app.models import Client, Loan, QualityIssue, Portfolio
+from app.utils.portfolio_stats import refresh_portfolio_stats
 import time
 
 
@@ -384,7 +385,8 @@ def create_and_save_quality_issues(db: Session, portfolio_id: int, task_id: str
         if task_id:
             get_task_manager().update_task(task_id, status_message=f"Saving {len(issues_to_create)} quality issues")
         db.bulk_save_objects(issues_to_create)
-        db.commit()
+    refresh_portfolio_stats(portfolio_id, db, issues_only=True)
+    db.commit()
 
     # Build response summary
     summary = {
@@ -0,0 +1,135 @@
+"""
+SQL aggregation helpers for the analytical reports.
+
+The collateral, guarantee, interest rate, repayment, assumptions, amortisation,
+PD, EAD and LGD reports only need totals, distributions and a few top-N lists,
+so they are computed by the database instead of loading every loan:
+
+* ``totals`` runs one SELECT of aggregate expressions (SUM, COUNT, ...);
+* ``value_stats`` gives count/total/average/min/max of a value plus its median
+  (the value at ``count // 2`` in ascending order, as ``sorted(values)[n // 2]``);
+* ``bucket_counts`` counts rows per range with a CASE ... GROUP BY, the portable
+  form of ``width_bucket`` for uneven ranges;
+* ``category_counts`` / ``category_averages`` GROUP BY a column;
+* ``top_rows`` is ORDER BY ... LIMIT.
+
+Each helper takes the FROM clause and WHERE conditions, so a report is a handful
+of queries whatever the size of the portfolio.
+"""
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, Row, case, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.models import Client, Loan, Security
+
+
+def as_decimal(value) -> Decimal:
+    """Aggregate result as a Decimal, NULL (e.g. SUM of no rows) as 0."""
+    if value is None:
+        return Decimal(0)
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def ratio(numerator, denominator):
+    """``numerator / denominator`` as a float, 0 when the denominator is not positive."""
+    # Float first: SQLite divides integer-valued NUMERICs as integers
+    return case((denominator > 0, cast(numerator, Float) / denominator), else_=0.0)
+
+
+def range_buckets(value, bounds: Sequence[Tuple[str, Optional[Any]]], inclusive: bool = True):
+    """
+    ``(label, condition)`` pairs for consecutive ranges of ``value``: each bound is
+    the range's upper limit (``<=``, or ``<`` when not ``inclusive``), ``None`` for
+    the open-ended last range.
+    """
+    return [
+        (label, None if upper is None else (value <= upper if inclusive else value < upper))
+        for label, upper in bounds
+    ]
+
+
+def totals(db: Session, *columns, select_from=Loan, where: Sequence = ()) -> Row:
+    """One row of aggregate ``columns`` over ``select_from`` filtered by ``where``."""
+    return db.execute(select(*columns).select_from(select_from).where(*where)).one()
+
+
+def value_stats(db: Session, value, select_from=Loan, where: Sequence = ()) -> Dict[str, Any]:
+    """Count, total, average, minimum, maximum and median of ``value`` over the matching rows."""
+    count, total, minimum, maximum = totals(
+        db, func.count(), func.sum(value), func.min(value), func.max(value), select_from=select_from, where=where
+    )
+    median = None
+    if count:
+        median = db.execute(
+            select(value).select_from(select_from).where(*where).order_by(value).offset(count // 2).limit(1)
+        ).scalar()
+    total = as_decimal(total)
+    return {
+        "count": count,
+        "total": total,
+        "average": total / count if count else Decimal(0),
+        "min": as_decimal(minimum),
+        "max": as_decimal(maximum),
+        "median": as_decimal(median),
+    }
+
+
+def bucket_counts(db: Session, buckets: Sequence[Tuple[str, Any]], select_from=Loan,
+                  where: Sequence = ()) -> Dict[str, Decimal]:
+    """
+    Rows per bucket, for ``(label, condition)`` buckets checked in order; a
+    ``None`` condition (the last bucket) takes every remaining row. Every label is
+    returned, in order, empty buckets with 0.
+    """
+    whens = [(condition, label) for label, condition in buckets if condition is not None]
+    default = next((label for label, condition in buckets if condition is None), None)
+    bucket = case(*whens, else_=default).label("bucket")
+    counts = {label: Decimal(0) for label, _ in buckets}
+    rows = db.execute(select(bucket, func.count()).select_from(select_from).where(*where).group_by(bucket))
+    for label, count in rows:
+        if label is not None:
+            counts[label] = Decimal(count)
+    return counts
+
+
+def category_counts(db: Session, column, select_from=Loan, where: Sequence = ()) -> Dict[Any, Decimal]:
+    """Rows per non-empty value of ``column``."""
+    rows = db.execute(
+        select(column, func.count()).select_from(select_from)
+        .where(*where, column.is_not(None), column != "").group_by(column).order_by(column)
+    )
+    return {category: Decimal(count) for category, count in rows}
+
+
+def category_averages(db: Session, column, value, select_from=Loan, where: Sequence = ()) -> Dict[Any, Decimal]:
+    """Average of ``value`` per non-empty value of ``column``."""
+    rows = db.execute(
+        select(column, func.sum(value), func.count()).select_from(select_from)
+        .where(*where, column.is_not(None), column != "").group_by(column).order_by(column)
+    )
+    return {category: as_decimal(total) / count for category, total, count in rows}
+
+
+def top_rows(db: Session, columns: Sequence, order_by: Sequence, limit: int, select_from=Loan,
+             where: Sequence = ()) -> List[Row]:
+    """The first ``limit`` matching rows in ``order_by`` order."""
+    query = select(*columns).select_from(select_from).where(*where).order_by(*order_by).limit(limit)
+    return list(db.execute(query))
+
+
+def portfolio_clients(portfolio_id: int):
+    """Condition on ``Client``: in the portfolio and borrower of one of its loans."""
+    loan_client_ids = select(Loan.client_id).where(Loan.portfolio_id == portfolio_id, Loan.client_id.is_not(None))
+    return (Client.portfolio_id == portfolio_id) & Client.id.in_(loan_client_ids)
+
+
+def security_value_by_client(portfolio_id: int):
+    """Subquery of ``(client_id, security_value)``: the collateral value pledged by each of the portfolio's clients."""
+    return (
+        select(Security.client_id.label("client_id"), func.sum(Security.collateral_value).label("security_value"))
+        .where(Security.client_id.in_(select(Client.id).where(Client.portfolio_id == portfolio_id)))
+        .group_by(Security.client_id)
+        .subquery()
+    )
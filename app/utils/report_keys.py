@@ -0,0 +1,68 @@
+"""
+Content keys for report workbooks.
+
+A report's workbook depends only on the portfolio's loans and settings
+(``portfolios.report_version``), the report type and date, and the code laying it
+out (``REPORT_GENERATOR_VERSION``). Requests with the same key share one Report
+row: a finished report is handed back as it is, and one still being built is
+attached to rather than queued again. The index ``uq_reports_content_key_live``
+keeps concurrent requests from creating a second live row for a key.
+
+Report workbooks expire from MinIO after ``REPORT_RETENTION_DAYS`` (see
+``apply_report_retention``), so older reports give up their key and are rebuilt
+on the next request. So do builds running for longer than ``REPORT_SLOT_TIMEOUT``
+(the worker most likely died) and reports still queued after
+``REPORT_QUEUE_TIMEOUT``; a report merely waiting for one of its tenant's slots
+keeps its key.
+"""
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Report
+
+# Bump when a report's layout or contents change, so older workbooks stop being reused
+REPORT_GENERATOR_VERSION = 1
+
+
+def report_content_key(portfolio_id: int, report_type: str, report_date: date, report_version: int) -> str:
+    parts = [portfolio_id, report_type, report_date.isoformat(), report_version, REPORT_GENERATOR_VERSION]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _stale_report():
+    """Reports whose workbook has expired, or whose build has been running or queued too long to trust."""
+    now = datetime.now(timezone.utc)
+    stale = or_(
+        and_(Report.status.in_(("running", "retrying")),
+             Report.started_at < now - timedelta(seconds=settings.REPORT_SLOT_TIMEOUT)),
+        and_(Report.status == "pending",
+             Report.created_at < now - timedelta(seconds=settings.REPORT_QUEUE_TIMEOUT)),
+    )
+    if settings.REPORT_RETENTION_DAYS:
+        # A day's margin so a reused link does not expire as soon as it is handed out
+        return or_(stale, Report.created_at < now - timedelta(days=settings.REPORT_RETENTION_DAYS - 1))
+    return stale
+
+
+async def reusable_reports(db: AsyncSession, portfolio_id: int, content_keys: Iterable[str]) -> Dict[str, Report]:
+    """Live (not failed) reports of the portfolio with one of the keys, by key; stale ones give their key up."""
+    content_keys = list(content_keys)
+    await db.execute(
+        update(Report)
+        .where(Report.portfolio_id == portfolio_id, Report.content_key.in_(content_keys), _stale_report())
+        .values(content_key=None)
+        .execution_options(synchronize_session=False)
+    )
+    reports = await db.scalars(
+        select(Report).where(
+            Report.portfolio_id == portfolio_id,
+            Report.content_key.in_(content_keys),
+            Report.status != "failed",
+        )
+    )
+    return {report.content_key: report for report in reports}
@@ -0,0 +1,127 @@
+"""
+Report packs: several reports of one portfolio built from a single scan of its loans.
+
+Building the ECL/BOG detailed and summary reports and the journals report one by
+one reads the portfolio's loans five times. ``write_report_pack`` selects, in one
+query over a server-side cursor, the detailed reports' cell values plus the raw
+stage and amount columns. Each row is written to every detailed workbook in the
+pack and added to running per-stage totals, from which the summary and journals
+workbooks are written once the scan ends.
+"""
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import Loan, Portfolio
+from app.utils.xlsx_reports import (
+    DETAILED_REPORT_COLUMNS,
+    journal_entries,
+    open_report_workbook,
+    start_report_sheet,
+    stream_rows,
+    write_rows,
+    write_stage_summary,
+)
+
+PACK_REPORT_TYPES = (
+    "ecl_detailed_report",
+    "ecl_report_summarised_by_stages",
+    "BOG_impairment_detailed_report",
+    "BOG_impairmnt_summary_by_stages",
+    "journals_report",
+)
+
+# Raw values the summaries and journals add up, selected after the detailed cells
+_TOTALS_COLUMNS = (
+    Loan.ifrs9_stage,
+    Loan.bog_stage,
+    Loan.loan_amount,
+    Loan.ead,
+    Loan.balance_difference,
+    Loan.final_ecl,
+    Loan.bog_provision,
+)
+
+
+class StageTotals:
+    """Running per-stage sums; the in-flight equivalent of a summary report's GROUP BY."""
+
+    def __init__(self):
+        self.stages: Dict[str, List] = {}
+
+    def add(self, stage, loan_value, outstanding_balance, balance_difference, amount):
+        totals = self.stages.setdefault(stage, [0, 0, 0, 0])
+        # SUM() skips NULLs
+        totals[0] += loan_value or 0
+        totals[1] += outstanding_balance or 0
+        totals[2] += balance_difference or 0
+        totals[3] += amount or 0
+
+    def rows(self):
+        # ORDER BY stage, with the NULL stage last as PostgreSQL sorts it
+        for stage in sorted(self.stages, key=lambda stage: (stage is None, stage or "")):
+            yield (stage, *self.stages[stage])
+
+
+def write_report_pack(db: Session, portfolio: Portfolio, report_files: Dict[str, str]) -> Dict[str, int]:
+    """
+    Write each requested report type to its xlsx path in ``report_files`` from a
+    single scan of the portfolio's loans. Returns the rows written per report type.
+    """
+    unknown = set(report_files) - set(PACK_REPORT_TYPES)
+    if unknown:
+        raise ValueError(f"Report types cannot be built in a pack: {sorted(unknown)}")
+
+    workbooks, worksheets, next_rows = {}, {}, {}
+    for report_type, file_path in report_files.items():
+        workbooks[report_type] = open_report_workbook(file_path)
+        worksheets[report_type] = workbooks[report_type].add_worksheet(report_type)
+        next_rows[report_type] = start_report_sheet(
+            workbooks[report_type], worksheets[report_type], report_type, portfolio.name
+        )
+    first_rows = dict(next_rows)
+
+    # Each detailed report reads its own slice of the selected columns
+    expressions, slices = [], {}
+    detailed = [report_type for report_type in report_files if report_type in DETAILED_REPORT_COLUMNS]
+    for report_type in detailed:
+        columns = [expression for _, expression in DETAILED_REPORT_COLUMNS[report_type]]
+        slices[report_type] = slice(len(expressions), len(expressions) + len(columns))
+        expressions += columns
+    totals_start = len(expressions)
+
+    # Labelled by position: SELECT would otherwise merge the columns both detailed reports share
+    expressions += _TOTALS_COLUMNS
+    query = (
+        select(*(expression.label(f"c{position}") for position, expression in enumerate(expressions)))
+        .select_from(Loan)
+        .outerjoin(Loan.client)
+        .where(Loan.portfolio_id == portfolio.id)
+        .order_by(Loan.id)
+    )
+
+    ecl_stages, bog_stages = StageTotals(), StageTotals()
+    ecl_total = bog_total = 0
+    for row in stream_rows(db, query):
+        for report_type in detailed:
+            worksheets[report_type].write_row(next_rows[report_type], 0, row[slices[report_type]])
+            next_rows[report_type] += 1
+        ifrs9_stage, bog_stage, loan_amount, ead, balance_difference, final_ecl, bog_provision = row[totals_start:]
+        ecl_stages.add(ifrs9_stage, loan_amount, ead, balance_difference, final_ecl)
+        bog_stages.add(bog_stage, loan_amount, ead, balance_difference, bog_provision)
+        ecl_total += final_ecl or 0
+        bog_total += bog_provision or 0
+
+    for report_type, stages in (("ecl_report_summarised_by_stages", ecl_stages),
+                                ("BOG_impairmnt_summary_by_stages", bog_stages)):
+        if report_type in report_files:
+            next_rows[report_type] = write_stage_summary(worksheets[report_type], stages.rows(), next_rows[report_type])
+    if "journals_report" in report_files:
+        next_rows["journals_report"] = write_rows(
+            worksheets["journals_report"], journal_entries(portfolio, ecl_total, bog_total), next_rows["journals_report"]
+        )
+
+    for workbook in workbooks.values():
+        workbook.close()
+    return {report_type: next_rows[report_type] - first_rows[report_type] for report_type in report_files}
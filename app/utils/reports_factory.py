@@ -15,6 +15,7 @@ from azure.storage.blob import generate_blob_sas, BlobSasPermissions
 from datetime import datetime, timedelta, date
 import urllib.parse as parse
 from sqlalchemy.orm import Session
+from app.utils.loan_projection import loan_rows
 
 
 
@@ -72,7 +73,7 @@ def run_and_save_report_task(report_id: int, report_type: str, file_path: str, p
                 for col, h in enumerate(headers):
                     worksheet.write(8, col, h, workbook.add_format({'bold': True, 'align': 'left'}))
 
-                query = db.query(Loan).filter(Loan.portfolio_id == portfolio_id).yield_per(1000)
+                query = loan_rows(db, portfolio_id, "identity", "ecl_inputs", "ecl_outputs", "repayment").yield_per(1000)
                 row_idx = start_row+1
 
                 for row in query:
@@ -115,7 +116,7 @@ def run_and_save_report_task(report_id: int, report_type: str, file_path: str, p
                 for col, h in enumerate(headers):
                     worksheet.write(start_row, col, h, workbook.add_format({'bold': True, 'align': 'center'}))
 
-                query = db.query(Loan).filter(Loan.portfolio_id == portfolio_id).yield_per(1000)
+                query = loan_rows(db, portfolio_id, "identity", "ecl_inputs", "bog_outputs").yield_per(1000)
                 row_idx = start_row+1
 
                 for row in query:
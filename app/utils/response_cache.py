@@ -0,0 +1,258 @@
+"""
+Redis-backed response cache for tenant read endpoints.
+
+``@cached_response`` stores a route's serialised body under a key made of the
+tenant, the request path and query, and the ``data_version`` of every portfolio
+the response is built from. Writes bump data_version (see ``data_versions``), so
+an entry is never served after the data behind it changed; ingestion and
+calculation tasks additionally call ``invalidate_portfolio`` to free entries of
+old versions before their TTL runs out.
+
+Entries are shared by every user of a tenant. Per-user checks (portfolio
+ownership, 404s) belong in the route's ``versions`` function, which runs on
+every request before the cache is consulted; per-user fields are added back by
+a ``personalize`` function.
+
+Concurrent misses for the same key are collapsed: one request computes the
+body while the others wait for it to appear (single flight). Redis errors never
+fail a request; the cache is bypassed for a short while instead.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis
+from fastapi import HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Portfolio
+from app.utils.data_versions import conditional_response
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "rc"
+# Seconds to bypass the cache after a Redis error
+RETRY_AFTER = 30
+# How often requests waiting on another request's computation poll for the result
+WAIT_INTERVAL = 0.05
+
+_client: Optional[redis.Redis] = None
+_unavailable_until = 0.0
+
+
+def get_cache_client() -> Optional[redis.Redis]:
+    """The shared Redis client, or None while caching is disabled or Redis is unreachable."""
+    global _client
+    if not settings.RESPONSE_CACHE_ENABLED or time.monotonic() < _unavailable_until:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.RESPONSE_CACHE_URL,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+        )
+    return _client
+
+
+def _cache_failed(error: Exception) -> None:
+    global _unavailable_until
+    logger.warning(f"Response cache unavailable, bypassing it for {RETRY_AFTER}s: {error}")
+    _unavailable_until = time.monotonic() + RETRY_AFTER
+
+
+def _portfolio_index(portfolio_id: int) -> str:
+    return f"{KEY_PREFIX}:index:portfolio:{portfolio_id}"
+
+
+def cache_key(namespace: str, request, tenant_id: Optional[int], versions: Iterable[Tuple[int, int]]) -> str:
+    params = [request.url.path, sorted(request.query_params.multi_items()), sorted(versions)]
+    digest = hashlib.sha256(repr(params).encode()).hexdigest()[:32]
+    return f"{KEY_PREFIX}:{namespace}:{tenant_id}:{digest}"
+
+
+def cache_get(key: str) -> Optional[bytes]:
+    client = get_cache_client()
+    if client is None:
+        return None
+    try:
+        return client.get(key)
+    except redis.RedisError as e:
+        _cache_failed(e)
+        return None
+
+
+def cache_set(key: str, body: bytes, ttl: int, portfolio_ids: Iterable[int]) -> None:
+    """Store ``body`` and index it under each portfolio for ``invalidate_portfolio``."""
+    client = get_cache_client()
+    if client is None:
+        return
+    if len(body) > settings.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+        logger.debug(f"Not caching {key}: {len(body)} bytes exceeds RESPONSE_CACHE_MAX_ENTRY_BYTES")
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.set(key, body, ex=ttl)
+        for portfolio_id in portfolio_ids:
+            pipe.sadd(_portfolio_index(portfolio_id), key)
+            pipe.expire(_portfolio_index(portfolio_id), ttl)
+        pipe.execute()
+    except redis.RedisError as e:
+        _cache_failed(e)
+
+
+def acquire_fill_lock(key: str) -> bool:
+    """
+    Claim the right to compute ``key``. True when this request should compute it
+    (including whenever the cache is unavailable), False when another request is.
+    """
+    client = get_cache_client()
+    if client is None:
+        return True
+    try:
+        return bool(client.set(f"{key}:lock", 1, nx=True, px=int(settings.RESPONSE_CACHE_LOCK_TIMEOUT * 1000)))
+    except redis.RedisError as e:
+        _cache_failed(e)
+        return True
+
+
+def release_fill_lock(key: str) -> None:
+    client = get_cache_client()
+    if client is None:
+        return
+    try:
+        client.delete(f"{key}:lock")
+    except redis.RedisError as e:
+        _cache_failed(e)
+
+
+def invalidate_portfolio(portfolio_id: int) -> None:
+    """Drop every cached response built from the portfolio's data."""
+    client = get_cache_client()
+    if client is None:
+        return
+    index = _portfolio_index(portfolio_id)
+    try:
+        keys = client.smembers(index)
+        client.delete(index, *keys)
+    except redis.RedisError as e:
+        _cache_failed(e)
+
+
+async def portfolio_versions(portfolio_id: int, db: AsyncSession, **_) -> List[Tuple[int, int]]:
+    """``versions`` function of async routes serving a single portfolio; 404 when it does not exist."""
+    data_version = await db.scalar(select(Portfolio.data_version).where(Portfolio.id == portfolio_id))
+    if data_version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
+    return [(portfolio_id, data_version)]
+
+
+def _serialize(result: Any, response_model: Any) -> bytes:
+    if response_model is not None:
+        adapter = TypeAdapter(response_model)
+        # by_alias like FastAPI, e.g. for the "Stage 1" keys of the portfolio summary
+        return adapter.dump_json(adapter.validate_python(result, from_attributes=True), by_alias=True)
+    return json.dumps(jsonable_encoder(result)).encode()
+
+
+def _respond(body: bytes, response: Response, personalize: Optional[Callable], user) -> Response:
+    if personalize is not None:
+        body = json.dumps(personalize(json.loads(body), user)).encode()
+    headers = {name: response.headers[name] for name in ("ETag", "Cache-Control") if name in response.headers}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached_response(
+    namespace: str,
+    versions: Callable[..., Any],
+    response_model: Any = None,
+    ttl: Optional[int] = None,
+    personalize: Optional[Callable[[Dict[str, Any], Any], Dict[str, Any]]] = None,
+):
+    """
+    Cache a tenant read route's response. Apply below the ``@router.get`` decorator
+    of a route taking ``request``, ``response``, ``db`` and ``current_user``.
+
+    ``versions`` receives the route's arguments and returns the
+    ``(portfolio_id, data_version)`` pairs the response is built from (a coroutine
+    function for async routes). It also answers If-None-Match with 304, replacing
+    ``conditional_response`` in the route itself.
+    """
+    ttl = ttl or settings.RESPONSE_CACHE_TTL
+
+    def prepare(kwargs, version_pairs: List[Tuple[int, int]]):
+        request, response, user = kwargs["request"], kwargs["response"], kwargs["current_user"]
+        not_modified = conditional_response(request, response, user, version_pairs)
+        return not_modified, cache_key(namespace, request, user.tenant_id, version_pairs)
+
+    def decorator(route):
+        if inspect.iscoroutinefunction(route):
+            @functools.wraps(route)
+            async def async_wrapper(**kwargs):
+                version_pairs = [tuple(v) for v in await versions(**kwargs)]
+                not_modified, key = prepare(kwargs, version_pairs)
+                if not_modified:
+                    return not_modified
+
+                body = await run_in_threadpool(cache_get, key)
+                if body is None:
+                    if await run_in_threadpool(acquire_fill_lock, key):
+                        try:
+                            result = await route(**kwargs)
+                            if isinstance(result, Response):
+                                return result
+                            body = _serialize(result, response_model)
+                            await run_in_threadpool(cache_set, key, body, ttl, [pid for pid, _ in version_pairs])
+                        finally:
+                            await run_in_threadpool(release_fill_lock, key)
+                    else:
+                        deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+                        while body is None and time.monotonic() < deadline:
+                            await asyncio.sleep(WAIT_INTERVAL)
+                            body = await run_in_threadpool(cache_get, key)
+                        if body is None:
+                            # The other request failed or is slow; don't wait any longer
+                            body = _serialize(await route(**kwargs), response_model)
+                return _respond(body, kwargs["response"], personalize, kwargs["current_user"])
+
+            return async_wrapper
+
+        @functools.wraps(route)
+        def wrapper(**kwargs):
+            version_pairs = [tuple(v) for v in versions(**kwargs)]
+            not_modified, key = prepare(kwargs, version_pairs)
+            if not_modified:
+                return not_modified
+
+            body = cache_get(key)
+            if body is None:
+                if acquire_fill_lock(key):
+                    try:
+                        result = route(**kwargs)
+                        if isinstance(result, Response):
+                            return result
+                        body = _serialize(result, response_model)
+                        cache_set(key, body, ttl, [pid for pid, _ in version_pairs])
+                    finally:
+                        release_fill_lock(key)
+                else:
+                    deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+                    while body is None and time.monotonic() < deadline:
+                        time.sleep(WAIT_INTERVAL)
+                        body = cache_get(key)
+                    if body is None:
+                        body = _serialize(route(**kwargs), response_model)
+            return _respond(body, kwargs["response"], personalize, kwargs["current_user"])
+
+        return wrapper
+
+    return decorator
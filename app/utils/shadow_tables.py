@@ -0,0 +1,131 @@
+"""
+Shadow tables for portfolio re-ingestion.
+
+New loan and client rows are COPYed into per-portfolio shadow tables
+(``loans_shadow_<portfolio_id>``, ``clients_shadow_<portfolio_id>``) while the
+live rows stay readable. ``swap_in_shadow_tables`` then replaces the portfolio's
+rows in a single transaction, so readers see either the old data or the new
+data, never an empty or half-loaded portfolio.
+
+When the tables are partitioned by portfolio the swap is a partition exchange
+(detach + drop the old partition, attach the shadow), so no rows are deleted;
+otherwise the old rows are deleted and the shadow rows inserted. Before the swap,
+in its own transaction, loans are linked to their clients (``loans.client_id``)
+between the shadows and shadows to be attached get the partition's indexes.
+"""
+import logging
+import time
+from typing import Any, Dict
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models import Client, Loan
+from app.utils.partitions import exchange_portfolio_partition, is_partitioned, prepare_partition_replacement
+from app.utils.portfolio_stats import refresh_portfolio_stats
+from app.utils.sync_processors import link_loans_to_clients
+
+logger = logging.getLogger(__name__)
+
+# Live table -> model whose columns are carried across on swap
+SHADOW_TABLES = {
+    "loans": Loan,
+    "clients": Client,
+}
+
+# Derived rows that belong to the data being replaced
+DERIVED_CLEANUP = [
+    ("calculation_results", "DELETE FROM calculation_results WHERE portfolio_id = :portfolio_id"),
+    ("quality_issues", "DELETE FROM quality_issues WHERE portfolio_id = :portfolio_id"),
+    ("reports", "DELETE FROM reports WHERE portfolio_id = :portfolio_id"),
+    ("guarantees", "DELETE FROM guarantees WHERE portfolio_id = :portfolio_id"),
+    ("securities", "DELETE FROM securities WHERE client_id IN (SELECT id FROM clients WHERE portfolio_id = :portfolio_id)"),
+]
+
+
+def shadow_table_name(table: str, portfolio_id: int) -> str:
+    """Name of the shadow copy of ``table`` used while re-ingesting ``portfolio_id``."""
+    if table not in SHADOW_TABLES:
+        raise ValueError(f"No shadow table for '{table}'")
+    return f"{table}_shadow_{int(portfolio_id)}"
+
+
+def create_shadow_tables(portfolio_id: int, db: Session) -> Dict[str, str]:
+    """
+    (Re)create empty shadow tables for the portfolio and commit.
+    Ids still come from the live tables' sequences, so rows keep them after the swap.
+    Shadows are unlogged unless they will be attached as partitions.
+    Returns a mapping of live table -> shadow table.
+    """
+    shadows = {}
+    for table in SHADOW_TABLES:
+        shadow = shadow_table_name(table, portfolio_id)
+        persistence = "" if is_partitioned(table, db) else "UNLOGGED "
+        db.execute(text(f"DROP TABLE IF EXISTS {shadow}"))
+        db.execute(text(f"CREATE {persistence}TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS)"))
+        shadows[table] = shadow
+    db.commit()
+    logger.info(f"Created shadow tables for portfolio {portfolio_id}: {list(shadows.values())}")
+    return shadows
+
+
+def drop_shadow_tables(portfolio_id: int, db: Session) -> None:
+    """Drop the portfolio's shadow tables, e.g. after a failed load."""
+    try:
+        for table in SHADOW_TABLES:
+            db.execute(text(f"DROP TABLE IF EXISTS {shadow_table_name(table, portfolio_id)}"))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to drop shadow tables for portfolio {portfolio_id}: {e}")
+
+
+def swap_in_shadow_tables(portfolio_id: int, db: Session) -> Dict[str, Any]:
+    """
+    Link the shadow loans to the shadow clients and index the shadows, then replace the
+    portfolio's loans and clients (and the results derived from them) with the shadows
+    in one transaction. Raises on failure after rolling back, leaving the previous data in place.
+    """
+    start = time.perf_counter()
+    params = {"portfolio_id": portfolio_id}
+    counts = {}
+    partitioned = {table: is_partitioned(table, db) for table in SHADOW_TABLES}
+    try:
+        # Shadow-only work is committed first so the swap transaction stays short
+        counts["linked_loans"] = link_loans_to_clients(
+            portfolio_id, db,
+            loans_table=shadow_table_name("loans", portfolio_id),
+            clients_table=shadow_table_name("clients", portfolio_id),
+        )
+        for table in SHADOW_TABLES:
+            if partitioned[table]:
+                prepare_partition_replacement(table, portfolio_id, shadow_table_name(table, portfolio_id), db)
+        db.commit()
+
+        for name, sql in DERIVED_CLEANUP:
+            counts[name] = db.execute(text(sql), params).rowcount
+
+        for table, model in SHADOW_TABLES.items():
+            shadow = shadow_table_name(table, portfolio_id)
+            if partitioned[table]:
+                counts[table] = db.execute(text(f"SELECT count(*) FROM {shadow}")).scalar()
+                exchange_portfolio_partition(table, portfolio_id, shadow, db)
+                continue
+            columns = ", ".join(c.name for c in model.__table__.columns)
+            db.execute(text(f"DELETE FROM {table} WHERE portfolio_id = :portfolio_id"), params)
+            counts[table] = db.execute(
+                text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {shadow}")
+            ).rowcount
+            db.execute(text(f"DROP TABLE {shadow}"))
+
+        # Aggregates commit with the data they describe
+        refresh_portfolio_stats(portfolio_id, db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        drop_shadow_tables(portfolio_id, db)
+        raise
+
+    end = time.perf_counter()
+    logger.info(f"Swapped in shadow tables for portfolio {portfolio_id} in {end - start:0.4f} seconds: {counts}")
+    return counts
@@ -12,6 +12,8 @@ from typing import Optional
 from decimal import Decimal
 
 from app.models import Portfolio, Loan
+from app.utils.loan_projection import load_loan_bundles
+from app.utils.portfolio_stats import refresh_portfolio_stats
 from app.schemas import ECLStagingConfig, LocalImpairmentConfig
 from app.utils.validate_bog import validate_and_fix_bog_config
 from app.utils.process_email_notifyer import (
@@ -98,6 +100,7 @@ async def stage_loans_ecl_orm(portfolio_id: int, db: Session, user_email, first_
 
             loan_batch = (
                 db.query(Loan)
+                .options(load_loan_bundles("ecl_inputs"))
                 .filter(
                     Loan.portfolio_id == portfolio_id,
                     Loan.outstanding_loan_balance > 0
@@ -139,6 +142,9 @@ async def stage_loans_ecl_orm(portfolio_id: int, db: Session, user_email, first_
 
             logger.info(f"Processed {offset} loans for ECL staging.")
 
+        refresh_portfolio_stats(portfolio_id, db)
+        db.commit()
+
         # ------------------------------------
         # SEND SUCCESS EMAIL (ONLY IF NO ERROR)
         # ------------------------------------
@@ -246,6 +252,7 @@ async def stage_loans_local_impairment_orm(
         while True:
             loan_batch = (
                 db.query(Loan)
+                .options(load_loan_bundles("ecl_inputs"))
                 .filter(
                     Loan.portfolio_id == portfolio_id,
                     Loan.outstanding_loan_balance > 0
@@ -295,6 +302,9 @@ async def stage_loans_local_impairment_orm(
 
             logger.info(f"Processed {offset} loans for BOG staging")
 
+        refresh_portfolio_stats(portfolio_id, db)
+        db.commit()
+
         # ----------------------------
         # SEND SUCCESS EMAIL (ONLY IF NO ERROR)
         # ----------------------------
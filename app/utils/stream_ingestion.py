@@ -0,0 +1,369 @@
+"""
+Streaming bulk ingestion for portfolios fed by an external application.
+
+Loan or client records arrive in the request body as NDJSON (one JSON object
+per line) or as an Arrow IPC stream. They are validated and coerced in batches
+and merged into the portfolio with COPY: rows whose key (``loan_no`` for loans,
+``employee_id`` for clients) already exists are updated, the rest are inserted.
+Merging makes a replayed batch harmless, so a client that lost its connection
+can resend from the last acknowledged cursor.
+
+The body is only read as fast as batches are written, which gives the sender
+natural backpressure.
+"""
+import io
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import anyio.from_thread
+import polars as pl
+import pyarrow as pa
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Loan
+
+from app.utils.ingest_formats import normalize_column_name
+from app.utils.portfolio_stats import refresh_portfolio_stats
+from app.utils.sync_processors import (
+    CLIENT_COPY_COLUMNS,
+    LOAN_COPY_COLUMNS,
+    client_copy_row,
+    get_portfolio_subscription_id,
+    link_loans_to_clients,
+    transform_loan_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/json")
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Record type -> (table, merge key)
+STREAM_RECORD_TYPES = {
+    "loans": ("loans", "loan_no"),
+    "clients": ("clients", "employee_id"),
+}
+
+# Derived loan column -> the fields it is computed from. A batch only rewrites a
+# derived column when it carries all of its inputs, so a delta that omits them
+# leaves the stored value alone.
+DERIVED_LOAN_INPUTS = {
+    "ndia": ("monthly_installment", "accumulated_arrears"),
+    "balance_difference": ("outstanding_loan_balance", "theoretical_balance", "accumulated_arrears"),
+}
+
+# Rejected records reported back per batch (the count is always complete)
+MAX_REPORTED_REJECTIONS = 20
+
+
+async def iter_ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Optional[dict], Optional[str]]]:
+    """Yield ``(record, None)`` per NDJSON line, or ``(None, error)`` for a line that is not a JSON object."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_ndjson_line(line)
+    if buffer.strip():
+        yield _parse_ndjson_line(buffer)
+
+
+def _parse_ndjson_line(line: bytes) -> Tuple[Optional[dict], Optional[str]]:
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, f"invalid JSON: {e}"
+    if not isinstance(record, dict):
+        return None, "record is not a JSON object"
+    return record, None
+
+
+class _BodyReader(io.RawIOBase):
+    """
+    Blocking file-like view of an async request body for readers running in a worker
+    thread: each read pulls the next chunk from the event loop, so the body is only
+    received as fast as it is parsed.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = anyio.from_thread.run(self._next_chunk)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    async def _next_chunk(self) -> Optional[bytes]:
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+
+def _read_next_batch(reader: pa.ipc.RecordBatchStreamReader) -> Optional[pa.RecordBatch]:
+    try:
+        return reader.read_next_batch()
+    except StopIteration:
+        return None
+
+
+async def iter_arrow_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Optional[dict], Optional[str]]]:
+    """Yield ``(record, None)`` per row of an Arrow IPC stream body, reading one record batch at a time."""
+    reader = await run_in_threadpool(pa.ipc.open_stream, io.BufferedReader(_BodyReader(chunks)))
+    while True:
+        record_batch = await run_in_threadpool(_read_next_batch, reader)
+        if record_batch is None:
+            break
+        for record in record_batch.to_pylist():
+            yield record, None
+
+
+def coerce_record(record: dict, key: str) -> Tuple[Optional[dict], Optional[str]]:
+    """Normalize field names and turn values into text for the batch transforms; reject records without a key."""
+    row = {}
+    for name, value in record.items():
+        if value is None:
+            continue
+        if isinstance(value, (dict, list)):
+            return None, f"field '{name}' must be a scalar"
+        row[normalize_column_name(name)] = str(value)
+    if not row.get(key):
+        return None, f"missing '{key}'"
+    return row, None
+
+
+def _loan_copy_lines(rows: List[dict], portfolio_id: int, tenant_id: int, sub_id: int) -> Tuple[List[str], List[str]]:
+    columns = sorted({name for row in rows for name in row})
+    df = pl.DataFrame(
+        [{c: row.get(c) for c in columns} for row in rows],
+        schema={c: pl.Utf8 for c in columns},
+    )
+    df = transform_loan_batch(df, portfolio_id, tenant_id, sub_id)
+    # The transform fills in derived columns whatever the batch carries
+    stale = {
+        derived for derived, inputs in DERIVED_LOAN_INPUTS.items()
+        if not all(column in df.columns for column in inputs)
+    }
+    copy_cols = [c for c in LOAN_COPY_COLUMNS if c in df.columns and c not in stale]
+    lines = [
+        "\t".join("" if row[c] is None else str(row[c]) for c in copy_cols)
+        for row in df.select(copy_cols).to_dicts()
+    ]
+    return copy_cols, lines
+
+
+def _client_copy_lines(rows: List[dict], portfolio_id: int, tenant_id: int) -> Tuple[List[str], List[str]]:
+    lines = ["\t".join(client_copy_row(row, portfolio_id, tenant_id).values()) for row in rows]
+    return CLIENT_COPY_COLUMNS, lines
+
+
+def merge_copy_batch(db: Session, table: str, key: str, columns: List[str], lines: List[str],
+                     portfolio_id: int) -> Dict[str, int]:
+    """
+    COPY a batch into a temporary table and merge it into ``table`` on (portfolio_id, key)
+    in one transaction. Returns the number of rows updated and inserted.
+
+    No unique constraint backs the key (file uploads are not deduplicated on it), so
+    merges into the same portfolio take a transaction-scoped advisory lock; otherwise
+    two concurrent streams could both insert a key the other has not committed yet.
+    """
+    connection = db.connection().connection
+    cursor = connection.cursor()
+    staging = f"stream_{table}"
+    try:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s), %s)", (table, portfolio_id))
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        cursor.copy_from(io.StringIO("\n".join(lines) + "\n"), staging, columns=columns, sep="\t", null="")
+
+        column_list = ", ".join(columns)
+        assignments = ", ".join(f"{c} = s.{c}" for c in columns if c not in (key, "portfolio_id"))
+        cursor.execute(
+            f"UPDATE {table} t SET {assignments}, updated_at = now() FROM {staging} s "
+            f"WHERE t.portfolio_id = %s AND t.{key} = s.{key}",
+            (portfolio_id,),
+        )
+        updated = cursor.rowcount
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.portfolio_id = %s AND t.{key} = s.{key})",
+            (portfolio_id,),
+        )
+        inserted = cursor.rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"updated": updated, "inserted": inserted}
+
+
+def count_new_loans(rows: List[dict], portfolio_id: int, db: Session) -> int:
+    """Number of distinct loan numbers in ``rows`` that the portfolio does not hold yet."""
+    loan_nos = {row["loan_no"] for row in rows}
+    existing = (
+        db.query(func.count(func.distinct(Loan.loan_no)))
+        .filter(Loan.portfolio_id == portfolio_id, Loan.loan_no.in_(loan_nos))
+        .scalar()
+    )
+    return len(loan_nos) - existing
+
+
+def write_stream_batch(rows: List[dict], record_type: str, portfolio_id: int, tenant_id: int,
+                       db: Session, sub_id: int = 0) -> Dict[str, int]:
+    """Transform one batch of coerced records and merge it into the portfolio."""
+    table, key = STREAM_RECORD_TYPES[record_type]
+
+    # Last occurrence of a key in the batch wins
+    rows = list({row[key]: row for row in rows}.values())
+
+    if record_type == "loans":
+        columns, lines = _loan_copy_lines(rows, portfolio_id, tenant_id, sub_id)
+    else:
+        columns, lines = _client_copy_lines(rows, portfolio_id, tenant_id)
+    return merge_copy_batch(db, table, key, columns, lines, portfolio_id)
+
+
+def relink_portfolio_loans(portfolio_id: int, db: Session) -> None:
+    """
+    Bring ``loans.client_id`` and the portfolio's ``portfolio_stats`` up to date after
+    merging streamed loans or clients, and commit.
+    """
+    try:
+        linked = link_loans_to_clients(portfolio_id, db, clear_stale=True)
+        refresh_portfolio_stats(portfolio_id, db)
+        db.commit()
+        logger.info(f"Linked {linked} streamed loans to clients for portfolio {portfolio_id}")
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to link loans to clients for portfolio {portfolio_id}: {e}")
+
+
+async def stream_ingest_records(
+    records: AsyncIterator[Tuple[Optional[dict], Optional[str]]],
+    record_type: str,
+    portfolio_id: int,
+    tenant_id: int,
+    db: Session,
+    cursor: int = 0,
+    batch_rows: int = 5000,
+    loan_allowance: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Consume ``records`` in batches of ``batch_rows``, writing each batch before reading on.
+
+    ``cursor`` is the position of the first record of this body within the sender's
+    feed; every acknowledgement carries the cursor to resume from once it is committed.
+    A failing batch stops the stream and is reported with the last committed cursor.
+
+    ``loan_allowance`` is how many new loans the subscription plan still allows; a batch
+    that would go past it is not written and the stream stops with ``limit_exceeded``.
+    """
+    table, key = STREAM_RECORD_TYPES[record_type]
+    sub_id = get_portfolio_subscription_id(portfolio_id, db) if record_type == "loans" else 0
+
+    acknowledgements = []
+    totals = {"received": 0, "inserted": 0, "updated": 0, "rejected": 0}
+    committed_cursor = cursor
+    batch: List[dict] = []
+    rejections: List[Dict[str, Any]] = []
+    rejected = 0
+    position = cursor
+
+    async def flush() -> Optional[Dict[str, Any]]:
+        nonlocal batch, rejections, rejected, committed_cursor
+        ack = {
+            "batch": len(acknowledgements),
+            "records": len(batch) + rejected,
+            "rejected": rejected,
+            "rejections": rejections,
+        }
+        if loan_allowance is not None and batch:
+            new_loans = await run_in_threadpool(count_new_loans, batch, portfolio_id, db)
+            if totals["inserted"] + new_loans > loan_allowance:
+                ack.update({
+                    "status": "limit_exceeded",
+                    "cursor": committed_cursor,
+                    "error": (
+                        f"Loan data limit exceeded: this batch adds {new_loans} loans but your plan "
+                        f"allows {max(loan_allowance - totals['inserted'], 0)} more."
+                    ),
+                })
+                acknowledgements.append(ack)
+                return ack
+
+        try:
+            written = await run_in_threadpool(write_stream_batch, batch, record_type, portfolio_id, tenant_id, db, sub_id) \
+                if batch else {"inserted": 0, "updated": 0}
+        except Exception as e:
+            logger.error(f"Stream ingest batch {ack['batch']} failed for portfolio {portfolio_id}: {e}")
+            ack.update({"status": "failed", "error": str(e), "cursor": committed_cursor})
+            acknowledgements.append(ack)
+            return ack
+
+        committed_cursor = position
+        totals["inserted"] += written["inserted"]
+        totals["updated"] += written["updated"]
+        totals["rejected"] += rejected
+        ack.update(written)
+        ack.update({"status": "committed", "cursor": committed_cursor})
+        acknowledgements.append(ack)
+        logger.info(f"Stream ingest {table} batch {ack['batch']} for portfolio {portfolio_id}: {written}, cursor {committed_cursor}")
+        batch, rejections, rejected = [], [], 0
+        return None
+
+    async def finish(failed: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # One set-based link per request rather than per batch
+        if totals["inserted"] or totals["updated"]:
+            await run_in_threadpool(relink_portfolio_loans, portfolio_id, db)
+        return _stream_result(record_type, portfolio_id, totals, acknowledgements, committed_cursor, failed)
+
+    async for record, error in records:
+        totals["received"] += 1
+        position += 1
+        if error is None:
+            record, error = coerce_record(record, key)
+        if error is None:
+            batch.append(record)
+        else:
+            rejected += 1
+            if len(rejections) < MAX_REPORTED_REJECTIONS:
+                rejections.append({"position": position - 1, "error": error})
+
+        if len(batch) + rejected >= batch_rows:
+            failed = await flush()
+            if failed:
+                return await finish(failed)
+
+    if batch or rejected:
+        failed = await flush()
+        if failed:
+            return await finish(failed)
+
+    return await finish()
+
+
+def _stream_result(record_type, portfolio_id, totals, acknowledgements, cursor, failed=None) -> Dict[str, Any]:
+    return {
+        "portfolio_id": portfolio_id,
+        "record_type": record_type,
+        "status": failed["status"] if failed else "completed",
+        "error": failed["error"] if failed else None,
+        "cursor": cursor,
+        **totals,
+        "batches": acknowledgements,
+    }
@@ -0,0 +1,297 @@
+"""
+Streaming CSV and xlsx downloads.
+
+``export_response`` turns one or more ``ExportSheet`` into a ``StreamingResponse``
+whose body is produced while the rows are read, so a download holds one batch of
+rows in memory and its first bytes go out before the last row is fetched:
+
+* ``csv_chunks`` writes a single sheet as CSV, flushed every ``EXPORT_CHUNK_BYTES``;
+* ``xlsx_chunks`` writes the sheets as an xlsx package straight into a zip stream.
+  Each worksheet part is deflated row by row and drained as it grows; the
+  workbook, styles and content-type parts (which only list the sheets) follow
+  the worksheets, so a sheet with no rows and no headers can be left out.
+
+Cell values are written as inline strings, numbers, booleans or dates (dicts and
+lists as their text), so no shared-string table has to be kept in memory.
+
+The body runs after the request's own session is closed, so it reads on its own
+replica session: ``ExportSheet.rows`` is called with that session, and row
+queries must filter by tenant explicitly (use ``query_rows`` for a SELECT).
+"""
+import csv
+import io
+import logging
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.database import ReadSessionLocal
+from app.utils.xlsx_reports import stream_rows
+
+logger = logging.getLogger(__name__)
+
+CSV_MEDIA_TYPE = "text/csv"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Rows fetched per round trip of the server-side cursor
+EXPORT_BATCH_ROWS = 1000
+
+# Bytes buffered before a chunk is sent
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+class ExportSheet(NamedTuple):
+    """
+    A sheet of a download: its name, its header row and a function returning its
+    rows from the download's session. With ``headers=None`` the rows are dicts
+    and the keys of the first one are the headers.
+    """
+    name: str
+    headers: Optional[Sequence[str]]
+    rows: Callable[[Session], Iterable]
+
+
+def query_rows(query, batch_size: int = EXPORT_BATCH_ROWS) -> Callable[[Session], Iterator]:
+    """``ExportSheet.rows`` streaming a SELECT from a server-side cursor."""
+    return lambda db: stream_rows(db, query, batch_size)
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file collecting what a writer produces until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+
+def _with_headers(headers: Optional[Sequence[str]], rows: Iterable) -> Tuple[Optional[List[str]], Iterator]:
+    """The header row and the rows as value sequences; dict rows are aligned on the headers."""
+    rows = iter(rows)
+    if headers is not None:
+        return list(headers), rows
+    first = next(rows, None)
+    if first is None:
+        return None, iter(())
+    keys = list(first.keys())
+
+    def values():
+        yield [first.get(key) for key in keys]
+        for row in rows:
+            yield [row.get(key) for key in keys]
+
+    return keys, values()
+
+
+def csv_chunks(headers: Optional[Sequence[str]], rows: Iterable,
+               chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """The rows as UTF-8 CSV, the header row first, in chunks of about ``chunk_bytes``."""
+    headers, rows = _with_headers(headers, rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if headers is not None:
+        writer.writerow(headers)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+# --- xlsx parts
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Cell style indexes in _STYLES
+_DATETIME_STYLE = 1
+_DATE_STYLE = 2
+
+_STYLES = (
+    f'{_XML_DECLARATION}<styleSheet xmlns="{_MAIN_NS}">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+# Characters XML 1.0 does not allow
+_ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell(ref: str, value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, Decimal)) or (isinstance(value, float) and math.isfinite(value)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        # openpyxl's rule too: Excel has no time zones, so the wall-clock time is kept
+        serial = (value.replace(tzinfo=None) - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}" s="{_DATETIME_STYLE}"><v>{serial}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="{_DATE_STYLE}"><v>{(value - _EXCEL_EPOCH.date()).days}</v></c>'
+    text = _ILLEGAL_XML_CHARS.sub("", str(value))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _row(number: int, values: Sequence, columns: List[str]) -> str:
+    while len(columns) < len(values):
+        columns.append(_column_letter(len(columns)))
+    cells = "".join(_cell(f"{columns[i]}{number}", value) for i, value in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def _package_parts(names: List[str]) -> Dict[str, str]:
+    """Every part of the package but the worksheets, for sheets ``names`` (sheet1.xml, ...)."""
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for n in range(1, len(names) + 1)
+    )
+    sheets = "".join(
+        f'<sheet name={quoteattr(name[:31])} sheetId="{n}" r:id="rId{n}"/>' for n, name in enumerate(names, 1)
+    )
+    sheet_rels = "".join(
+        f'<Relationship Id="rId{n}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{n}.xml"/>'
+        for n in range(1, len(names) + 1)
+    )
+    return {
+        "xl/workbook.xml": (
+            f'{_XML_DECLARATION}<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>{sheets}</sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            f'{_XML_DECLARATION}<Relationships xmlns="{_PACKAGE_REL_NS}">{sheet_rels}'
+            f'<Relationship Id="rId{len(names) + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/></Relationships>'
+        ),
+        "xl/styles.xml": _STYLES,
+        "_rels/.rels": (
+            f'{_XML_DECLARATION}<Relationships xmlns="{_PACKAGE_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+        ),
+        "[Content_Types].xml": (
+            f'{_XML_DECLARATION}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{overrides}</Types>'
+        ),
+    }
+
+
+def xlsx_chunks(sheets: Iterable[Tuple[str, Optional[Sequence[str]], Iterable]],
+                chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    An xlsx workbook of ``(name, headers, rows)`` sheets, in chunks of about
+    ``chunk_bytes``. Sheets are read one after the other; a sheet without headers
+    (dict rows, none of them) is left out. A workbook always has a sheet, so an
+    empty one is written if every sheet is left out.
+    """
+    sink = ChunkSink()
+    names = []
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as package:
+        for name, headers, rows in sheets:
+            headers, rows = _with_headers(headers, rows)
+            if headers is None:
+                continue
+            names.append(name)
+            columns: List[str] = []
+            with package.open(f"xl/worksheets/sheet{len(names)}.xml", "w") as part:
+                part.write(f'{_XML_DECLARATION}<worksheet xmlns="{_MAIN_NS}"><sheetData>'.encode("utf-8"))
+                part.write(_row(1, headers, columns).encode("utf-8"))
+                for number, row in enumerate(rows, 2):
+                    part.write(_row(number, row, columns).encode("utf-8"))
+                    if sink.size >= chunk_bytes:
+                        yield sink.drain()
+                part.write(b"</sheetData></worksheet>")
+            yield sink.drain()
+        if not names:
+            names.append("Sheet1")
+            package.writestr(
+                "xl/worksheets/sheet1.xml", f'{_XML_DECLARATION}<worksheet xmlns="{_MAIN_NS}"><sheetData/></worksheet>'
+            )
+        for part_name, content in _package_parts(names).items():
+            package.writestr(part_name, content)
+    yield sink.drain()
+
+
+def export_response(sheets: Sequence[ExportSheet], file_name: str, export_format: str = "xlsx",
+                    headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """
+    ``StreamingResponse`` downloading ``sheets`` as ``file_name``, as xlsx or as
+    CSV (one sheet only). The rows are read on a replica session opened when the
+    body starts and closed when it ends.
+    """
+    if export_format == "csv" and len(sheets) != 1:
+        raise ValueError("A CSV export has exactly one sheet")
+
+    def body() -> Iterator[bytes]:
+        with ReadSessionLocal() as db:
+            try:
+                if export_format == "csv":
+                    yield from csv_chunks(sheets[0].headers, sheets[0].rows(db))
+                else:
+                    yield from xlsx_chunks((sheet.name, sheet.headers, sheet.rows(db)) for sheet in sheets)
+            except Exception as e:
+                # The status line is already sent; the client sees a truncated download
+                logger.error(f"Export {file_name} failed while streaming: {e}", exc_info=True)
+                raise
+
+    return StreamingResponse(
+        body(),
+        media_type=CSV_MEDIA_TYPE if export_format == "csv" else XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={file_name}", **(headers or {})},
+    )
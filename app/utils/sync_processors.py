@@ -8,7 +8,6 @@ from datetime import datetime
 from sqlalchemy import text
 import polars as pl
 import traceback
-from xlsx2csv import Xlsx2csv
 from dateutil import parser
 import re
 
@@ -23,20 +22,20 @@ from app.models import (
     TenantSubscription,
 )
 from app.utils.quality_checks import create_and_save_quality_issues
+from app.utils.ingest_formats import (
+    convert_to_csv,
+    detect_file_format,
+    iter_batches,
+    normalize_column_name,
+)
+from app.utils.ingest_templates import (
+    forget_ingest_template,
+    resolve_ingest_template,
+    schema_overrides,
+)
 
 logger = logging.getLogger(__name__)
 
-def excel_to_csv_task(excel_path: str) -> str:
-    """Helper to convert Excel file to CSV for memory-efficient streaming."""
-    fd, csv_path = tempfile.mkstemp(suffix=".csv", prefix="ingest_conv_")
-    os.close(fd) # Close file descriptor, xlsx2csv will open it
-    try:
-        Xlsx2csv(excel_path, skip_empty_lines=True).convert(csv_path)
-        return csv_path
-    except Exception as e:
-        if os.path.exists(csv_path): os.remove(csv_path)
-        raise e
-
 def parse_date_safe(date_str):
     """Robustly parse dates including formats like SEP2020"""
     if not date_str: return None
@@ -58,211 +57,371 @@ def parse_date_safe(date_str):
     except:
         return None
 
-async def process_loan_details_sync(file_path, portfolio_id, tenant_id, db):
-    """Chunked processing for loan details to minimize RAM usage."""
-    csv_path = None
+LOAN_TARGET_COLUMNS = {
+    "loan_no": "loan_no", "employee_id": "employee_id", "loan_amount": "loan_amount",
+    "loan_term": "loan_term", "monthly_installment": "monthly_installment",
+    "accumulated_arrears": "accumulated_arrears", "outstanding_loan_balance": "outstanding_loan_balance",
+    "loan_issue_date": "loan_issue_date", "deduction_start_period": "deduction_start_period",
+    "submission_period": "submission_period", "maturity_period": "maturity_period",
+    "theoretical_balance": "theoretical_balance"
+}
+
+LOAN_DATE_COLUMNS = ["deduction_start_period", "loan_issue_date", "submission_period", "maturity_period"]
+
+# Columns written to the loans table by COPY (only those present in the batch are used)
+LOAN_COPY_COLUMNS = ["portfolio_id", "tenant_id", "subscription_id", "loan_no", "employee_id",
+                     "loan_amount", "outstanding_loan_balance", "ndia", "monthly_installment",
+                     "accumulated_arrears", "loan_term", "deduction_start_period",
+                     "loan_issue_date", "submission_period", "maturity_period",
+                     "theoretical_balance", "balance_difference"]
+
+
+def normalize_columns(df: pl.DataFrame) -> pl.DataFrame:
+    """Lower-case headers and replace spaces/dots so they line up with model column names."""
+    df.columns = [normalize_column_name(c) for c in df.columns]
+    return df
+
+
+def get_portfolio_subscription_id(portfolio_id, db) -> int:
+    """Subscription that owns the portfolio's loans (0 when the portfolio has none)."""
+    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
+    return int(portfolio.subscription_id) if portfolio and portfolio.subscription_id else 0
+
+
+def transform_loan_batch(df: pl.DataFrame, portfolio_id, tenant_id, sub_id, date_formats=None) -> pl.DataFrame:
+    """
+    Rename, clean and enrich one batch of raw loan rows ready for COPY.
+    ``date_formats`` (column -> strptime format, from the ingestion template) parses
+    dates vectorised; values that do not match fall back to ``parse_date_safe``.
+    """
+    df = normalize_columns(df)
+
+    rename_map = {k: v for k, v in LOAN_TARGET_COLUMNS.items() if k in df.columns}
+    if rename_map: df = df.rename(rename_map)
+
+    # Numeric Conversion
+    num_cols = ["loan_amount", "loan_term", "monthly_installment", "accumulated_arrears", "outstanding_loan_balance", "theoretical_balance"]
+    for col in num_cols:
+        if col in df.columns:
+            if df[col].dtype.is_numeric():
+                # Typed sources (Parquet) need no text cleanup
+                df = df.with_columns(pl.col(col).cast(pl.Float64).fill_null(0.0))
+                continue
+            df = df.with_columns(
+                pl.col(col).cast(pl.Utf8).str.replace_all(r"[^\d\.\-]", "").cast(pl.Float64, strict=False).fill_null(0.0)
+            )
+
+    # Explicitly cast to Int for integer columns to avoid "66.0" format
+    int_cols = ["loan_term"]
+    for col in int_cols:
+        if col in df.columns:
+            df = df.with_columns(
+                pl.col(col).cast(pl.Int64, strict=False).fill_null(0)
+            )
+
+    # Date Parsing
+    for col in LOAN_DATE_COLUMNS:
+        if col in df.columns:
+            if df[col].dtype.is_temporal():
+                df = df.with_columns(pl.col(col).dt.strftime("%Y-%m-%d"))
+                continue
+            if date_formats and col in date_formats:
+                raw = pl.col(col).cast(pl.Utf8).str.strip_chars()
+                df = df.with_columns(
+                    raw.str.strptime(pl.Datetime, date_formats[col], strict=False)
+                    .dt.strftime("%Y-%m-%d").alias(f"{col}__parsed")
+                )
+                misses = df[f"{col}__parsed"].is_null() & df[col].is_not_null()
+                if not misses.any():
+                    df = df.drop(col).rename({f"{col}__parsed": col})
+                    continue
+                df = df.drop(f"{col}__parsed")
+            df = df.with_columns(
+                pl.col(col).map_elements(
+                    lambda x: parse_date_safe(x), return_dtype=pl.Utf8, skip_nulls=False
+                ).alias(col)
+            )
+
+    # NDIA Recalculation
+    if "monthly_installment" in df.columns and "accumulated_arrears" in df.columns:
+        df = df.with_columns([
+            pl.when(pl.col("monthly_installment") > 0)
+            .then((pl.col("accumulated_arrears") / pl.col("monthly_installment")) * 30)
+            .otherwise(0.0)
+            .alias("ndia")
+        ])
+    else:
+        df = df.with_columns(pl.lit(0.0).alias("ndia"))
+
+    # Calculate outstanding_balance (difference)
+    # outstanding_balance = (Outstanding balance) - (Theoritical balance + Accumulated arrears)
+    if "outstanding_loan_balance" in df.columns:
+        theo_bal = pl.col("theoretical_balance") if "theoretical_balance" in df.columns else pl.lit(0.0)
+        acc_arr = pl.col("accumulated_arrears") if "accumulated_arrears" in df.columns else pl.lit(0.0)
+        df = df.with_columns([
+            (pl.col("outstanding_loan_balance") - (theo_bal + acc_arr)).alias("balance_difference")
+        ])
+    else:
+        df = df.with_columns(pl.lit(0.0).alias("balance_difference"))
+
+    # Add metadata
+    df = df.with_columns([
+        pl.lit(portfolio_id).alias("portfolio_id"),
+        pl.lit(tenant_id).alias("tenant_id"),
+        pl.lit(sub_id).alias("subscription_id")
+    ])
+    return df
+
+
+def copy_loan_batch(df: pl.DataFrame, db, table: str = "loans") -> int:
+    """COPY a transformed loan batch into ``table`` (loans or its shadow) and commit. Returns rows written."""
+    connection = db.connection().connection
+    cursor = connection.cursor()
+
+    copy_cols = [c for c in LOAN_COPY_COLUMNS if c in df.columns]
+
+    # Format batch for COPY
+    rows_data = []
+    for row in df.select(copy_cols).to_dicts():
+        line = "\t".join(str(row.get(c, "")) for c in copy_cols)
+        rows_data.append(line)
+
+    if rows_data:
+        batch_buffer = io.StringIO("\n".join(rows_data) + "\n")
+        cursor.copy_from(batch_buffer, table, columns=copy_cols, sep="\t", null="")
+        db.commit()
+    return len(rows_data)
+
+
+def link_loans_to_clients(portfolio_id, db, loans_table="loans", clients_table="clients", clear_stale=False) -> int:
+    """
+    Set ``client_id`` on the portfolio's loans from clients sharing their employee_id,
+    in one set-based UPDATE in the caller's transaction. Duplicate employee ids resolve
+    to the lowest client id. ``clear_stale`` also unlinks loans whose client no longer
+    matches (only needed when rows are merged in place). Returns the loans linked.
+    """
+    params = {"portfolio_id": portfolio_id}
+    linked = db.execute(text(f"""
+        UPDATE {loans_table} SET client_id = c.id
+        FROM (
+            SELECT employee_id, min(id) AS id FROM {clients_table}
+            WHERE portfolio_id = :portfolio_id AND employee_id IS NOT NULL
+            GROUP BY employee_id
+        ) c
+        WHERE {loans_table}.portfolio_id = :portfolio_id
+          AND {loans_table}.employee_id = c.employee_id
+          AND {loans_table}.client_id IS DISTINCT FROM c.id
+    """), params).rowcount
+    if clear_stale:
+        db.execute(text(f"""
+            UPDATE {loans_table} SET client_id = NULL
+            WHERE portfolio_id = :portfolio_id AND client_id IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM {clients_table} c
+                  WHERE c.portfolio_id = :portfolio_id AND c.id = {loans_table}.client_id
+                    AND c.employee_id = {loans_table}.employee_id
+              )
+        """), params)
+    return linked
+
+
+def iter_templated_batches(source, columns, template, db):
+    """
+    Batches of ``source`` read with the template's explicit schema.
+
+    If a value no longer fits that schema the template is deleted (the next upload
+    re-infers it) and reading carries on as text from the first unread row.
+    """
+    rows_read = 0
     try:
-        # 1. Convert Excel to CSV for streaming
-        logger.info(f"Converting loan details Excel to CSV: {file_path}")
-        csv_path = excel_to_csv_task(file_path)
+        for batch in iter_batches(source, columns=columns, schema_overrides=schema_overrides(template)):
+            rows_read += batch.height
+            yield batch
+        return
+    except pl.exceptions.ComputeError as e:
+        if template is None:
+            raise
+        logger.warning(f"File no longer matches ingestion template {template.id}, reading as text from row {rows_read}: {e}")
+        forget_ingest_template(db, template)
 
-        # 2. Define schema and reader
-        # Note: We use polars batched reader to keep memory low
-        reader = pl.read_csv_batched(csv_path, infer_schema_length=10000, ignore_errors=True)
-        
-        # 3. Get subscription ID
-        portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-        sub_id = int(portfolio.subscription_id) if portfolio and portfolio.subscription_id else 0
-
-        # Mapping configuration
-        target_columns = {
-            "loan_no": "loan_no", "employee_id": "employee_id", "loan_amount": "loan_amount",
-            "outstanding_loan_balance": "outstanding_loan_balance", "deduction_start_period": "deduction_start_period",
-            "submission_period": "submission_period", "maturity_period": "maturity_period",
-            "loan_issue_date": "loan_issue_date", "monthly_installment": "monthly_installment",
-            "accumulated_arrears": "accumulated_arrears"
-        }
+    yield from iter_batches(source, columns=columns, infer_schema_length=0, skip_rows=rows_read)
 
-        total_processed = 0
-        batch_count = 0
-        
-        while (batches := reader.next_batches(1)): 
-            batch_count += 1
-            df = batches[0]
-            
-            # Normalize and rename columns
-            df.columns = [c.strip().lower().replace(".", "").replace(" ", "_") for c in df.columns]
-            
-            # Full Mapping
-            target_columns = {
-                "loan_no": "loan_no", "employee_id": "employee_id", "loan_amount": "loan_amount",
-                "loan_term": "loan_term", "monthly_installment": "monthly_installment",
-                "accumulated_arrears": "accumulated_arrears", "outstanding_loan_balance": "outstanding_loan_balance",
-                "loan_issue_date": "loan_issue_date", "deduction_start_period": "deduction_start_period",
-                "submission_period": "submission_period", "maturity_period": "maturity_period",
-                "theoretical_balance": "theoretical_balance"
-            }
-            rename_map = {k: v for k, v in target_columns.items() if k in df.columns}
-            if rename_map: df = df.rename(rename_map)
-
-            # Numeric Conversion
-            num_cols = ["loan_amount", "loan_term", "monthly_installment", "accumulated_arrears", "outstanding_loan_balance", "theoretical_balance"]
-            for col in num_cols:
-                if col in df.columns:
-                    df = df.with_columns(
-                        pl.col(col).cast(pl.Utf8).str.replace_all(r"[^\d\.\-]", "").cast(pl.Float64, strict=False).fill_null(0.0)
-                    )
-            
-            # Explicitly cast to Int for integer columns to avoid "66.0" format
-            int_cols = ["loan_term"]
-            for col in int_cols:
-                if col in df.columns:
-                     df = df.with_columns(
-                        pl.col(col).cast(pl.Int64, strict=False).fill_null(0)
-                     )
-
-                     df = df.with_columns(
-                        pl.col(col).cast(pl.Int64, strict=False).fill_null(0)
-                     )
-
-            # Date Parsing
-            date_cols = ["deduction_start_period", "loan_issue_date", "submission_period", "maturity_period"]
-            for col in date_cols:
-                if col in df.columns:
-                    df = df.with_columns(
-                        pl.col(col).map_elements(
-                            lambda x: parse_date_safe(x), return_dtype=pl.Utf8, skip_nulls=False
-                        ).alias(col)
-                    )
-
-            # NDIA Recalculation
-            if "monthly_installment" in df.columns and "accumulated_arrears" in df.columns:
-                df = df.with_columns([
-                    pl.when(pl.col("monthly_installment") > 0)
-                    .then((pl.col("accumulated_arrears") / pl.col("monthly_installment")) * 30)
-                    .otherwise(0.0)
-                    .alias("ndia")
-                ])
-            else:
-                df = df.with_columns(pl.lit(0.0).alias("ndia"))
-
-            # Calculate outstanding_balance (difference)
-            # outstanding_balance = (Outstanding balance) - (Theoritical balance + Accumulated arrears)
-            if "outstanding_loan_balance" in df.columns:
-                theo_bal = pl.col("theoretical_balance") if "theoretical_balance" in df.columns else pl.lit(0.0)
-                acc_arr = pl.col("accumulated_arrears") if "accumulated_arrears" in df.columns else pl.lit(0.0)
-                df = df.with_columns([
-                    (pl.col("outstanding_loan_balance") - (theo_bal + acc_arr)).alias("balance_difference")
-                ])
-            else:
-                df = df.with_columns(pl.lit(0.0).alias("balance_difference"))
-
-            # Add metadata
-            df = df.with_columns([
-                pl.lit(portfolio_id).alias("portfolio_id"),
-                pl.lit(tenant_id).alias("tenant_id"),
-                pl.lit(sub_id).alias("subscription_id")
-            ])
 
-            # Inject using COPY
-            connection = db.connection().connection
-            cursor = connection.cursor()
-            
-            # Define columns for COPY
-            copy_cols = ["portfolio_id", "tenant_id", "subscription_id", "loan_no", "employee_id", 
-                         "loan_amount", "outstanding_loan_balance", "ndia", "monthly_installment", 
-                         "accumulated_arrears", "loan_term", "deduction_start_period", 
-                         "loan_issue_date", "submission_period", "maturity_period",
-                         "theoretical_balance", "balance_difference"]
-            copy_cols = [c for c in copy_cols if c in df.columns]
-            
-            # Format batch for COPY
-            rows_data = []
-            for row in df.select(copy_cols).to_dicts():
-                line = "\t".join(str(row.get(c, "")) for c in copy_cols)
-                rows_data.append(line)
-            
-            if rows_data:
-                batch_buffer = io.StringIO("\n".join(rows_data) + "\n")
-                cursor.copy_from(batch_buffer, "loans", columns=copy_cols, sep="\t", null="")
-                connection.commit()
-                total_processed += len(rows_data)
-                logger.info(f"Processed batch {batch_count}: +{len(rows_data)} records (Total: {total_processed})")
+async def process_loan_details_sync(file_path, portfolio_id, tenant_id, db, table="loans"):
+    """Chunked processing for loan details (Excel, CSV, CSV.gz or Parquet) to minimize RAM usage."""
+    # Batched reader: Excel/CSV.gz are streamed through a temp CSV, Parquet is read
+    # directly with only the loan columns projected
+    logger.info(f"Reading loan details ({detect_file_format(file_path)}): {file_path}")
+
+    sub_id = get_portfolio_subscription_id(portfolio_id, db)
 
-        return {"processed": total_processed, "success": True}
+    total_processed = 0
+    batch_count = 0
 
+    csv_path = convert_to_csv(file_path)
+    try:
+        source = csv_path or file_path
+        # Known layouts reuse their mapping, schema and date formats
+        template = resolve_ingest_template(db, tenant_id, "loan_details", source,
+                                           LOAN_TARGET_COLUMNS.keys(), LOAN_DATE_COLUMNS)
+        date_formats = dict(template.date_formats or {}) if template else None
+
+        for batch in iter_templated_batches(source, LOAN_TARGET_COLUMNS.keys(), template, db):
+            batch_count += 1
+            df = transform_loan_batch(batch, portfolio_id, tenant_id, sub_id, date_formats)
+
+            # Inject using COPY
+            written = copy_loan_batch(df, db, table)
+            if written:
+                total_processed += written
+                logger.info(f"Processed batch {batch_count}: +{written} records (Total: {total_processed})")
     finally:
         if csv_path and os.path.exists(csv_path): os.remove(csv_path)
 
+    return {"processed": total_processed, "success": True}
+
 
+def _sink_csv_to_parquet(csv_path: str, parquet_path: str, chunk_rows: int, overrides=None) -> None:
+    """Stream a CSV into one Parquet file, with the template schema or all columns as text."""
+    if overrides:
+        frame = pl.scan_csv(csv_path, schema_overrides=overrides, infer_schema_length=0)
+    else:
+        frame = pl.scan_csv(csv_path, infer_schema_length=0)
+    frame.sink_parquet(parquet_path, row_group_size=chunk_rows)
 
-async def process_client_data_sync(file_path, portfolio_id, tenant_id, db):
-    """Chunked processing for client data to minimize RAM usage."""
+
+def file_to_parquet_chunks(file_path: str, chunk_rows: int, tenant_id=None, db=None) -> tuple:
+    """
+    Split a loan file into Parquet files of at most ``chunk_rows`` rows each.
+
+    Excel, CSV and CSV.gz inputs are streamed to CSV and sunk to a single Parquet
+    file without loading them into memory. With ``db`` the tenant's ingestion
+    template is resolved and its schema applied, as ``process_loan_details_sync``
+    reads the file (falling back to text, and dropping the template, when values
+    no longer fit it); otherwise every column is kept as text. Parquet inputs are
+    sliced directly.
+
+    Returns ``([(path, row_count), ...], date_formats)``, the template's date
+    formats for ``transform_loan_batch`` being None without a template.
+    """
+    chunks = []
     csv_path = None
+    parquet_path = None
     try:
-        # 1. Convert Excel to CSV
-        logger.info(f"Converting client data Excel to CSV: {file_path}")
-        csv_path = excel_to_csv_task(file_path)
+        csv_path = convert_to_csv(file_path)
+        source = csv_path or file_path
+        template = None
+        if db is not None:
+            template = resolve_ingest_template(db, tenant_id, "loan_details", source,
+                                               LOAN_TARGET_COLUMNS.keys(), LOAN_DATE_COLUMNS)
 
-        # 2. Batched reading
-        reader = pl.read_csv_batched(csv_path, infer_schema_length=10000, ignore_errors=True)
-        
-        target_mapping = {
-            "employee_id": "employee_id", "last_name": "last_name", "other_names": "other_names",
-            "residential_address": "residential_address", "phone_number": "phone_number",
-            "date_of_birth": "date_of_birth", "client_type": "client_type"
-        }
+        if detect_file_format(source) != "parquet":
+            fd, parquet_path = tempfile.mkstemp(suffix=".parquet", prefix="ingest_conv_")
+            os.close(fd)
+            try:
+                _sink_csv_to_parquet(source, parquet_path, chunk_rows, schema_overrides(template))
+            except pl.exceptions.ComputeError as e:
+                if template is None:
+                    raise
+                logger.warning(f"File no longer matches ingestion template {template.id}, reading as text: {e}")
+                forget_ingest_template(db, template)
+                template = None
+                _sink_csv_to_parquet(source, parquet_path, chunk_rows)
+            source = parquet_path
 
-        total_processed = 0
-        batch_count = 0
-        
-        while (batches := reader.next_batches(1)):
+        total_rows = pl.scan_parquet(source).select(pl.len()).collect().item()
+
+        for offset in range(0, total_rows, chunk_rows):
+            fd, chunk_path = tempfile.mkstemp(suffix=".parquet", prefix="ingest_chunk_")
+            os.close(fd)
+            chunk_df = pl.scan_parquet(source).slice(offset, chunk_rows).collect()
+            chunk_df.write_parquet(chunk_path)
+            chunks.append((chunk_path, chunk_df.height))
+        date_formats = dict(template.date_formats or {}) if template else None
+        return chunks, date_formats
+    except Exception:
+        for chunk_path, _ in chunks:
+            if os.path.exists(chunk_path): os.remove(chunk_path)
+        raise
+    finally:
+        if csv_path and os.path.exists(csv_path): os.remove(csv_path)
+        if parquet_path and os.path.exists(parquet_path): os.remove(parquet_path)
+
+
+async def process_loan_chunk_sync(parquet_path, portfolio_id, tenant_id, db, table="loans", date_formats=None):
+    """Transform and COPY one Parquet row range produced by ``file_to_parquet_chunks``."""
+    sub_id = get_portfolio_subscription_id(portfolio_id, db)
+    df = transform_loan_batch(pl.read_parquet(parquet_path), portfolio_id, tenant_id, sub_id, date_formats)
+    written = copy_loan_batch(df, db, table)
+    logger.info(f"Processed loan chunk {os.path.basename(parquet_path)}: {written} records")
+    return {"processed": written, "success": True}
+
+
+
+# Source columns read for clients, including the header variants handled below
+CLIENT_SOURCE_COLUMNS = [
+    "employee_id", "last_name", "lastname", "other_names", "othernames",
+    "residential_address", "phone_number", "date_of_birth",
+]
+
+# Columns written to the clients table by COPY, in client_copy_row order
+CLIENT_COPY_COLUMNS = ["portfolio_id", "tenant_id", "employee_id", "last_name", "other_names",
+                       "residential_address", "phone_number", "date_of_birth", "client_type"]
+
+
+def client_copy_row(row: dict, portfolio_id, tenant_id) -> dict:
+    """Map one normalized client record onto CLIENT_COPY_COLUMNS as COPY-ready strings."""
+    date_of_birth = row.get("date_of_birth")
+    return {
+        "portfolio_id": str(portfolio_id),
+        "tenant_id": str(tenant_id),
+        "employee_id": str(row.get("employee_id", "")),
+        "last_name": str(row.get("last_name", row.get("lastname", ""))),
+        "other_names": str(row.get("other_names", row.get("othernames", ""))),
+        "residential_address": str(row.get("residential_address", "") or ""),
+        "phone_number": str(row.get("phone_number", "") or ""),
+        # Empty string is NULL in the COPY stream; typed sources hand us date objects
+        "date_of_birth": date_of_birth.isoformat() if hasattr(date_of_birth, "isoformat") else str(date_of_birth or ""),
+        "client_type": "individual"
+    }
+
+
+async def process_client_data_sync(file_path, portfolio_id, tenant_id, db, table="clients"):
+    """Chunked processing for client data (Excel, CSV, CSV.gz or Parquet) to minimize RAM usage."""
+    logger.info(f"Reading client data ({detect_file_format(file_path)}): {file_path}")
+
+    total_processed = 0
+    batch_count = 0
+
+    csv_path = convert_to_csv(file_path)
+    try:
+        source = csv_path or file_path
+        template = resolve_ingest_template(db, tenant_id, "client_data", source, CLIENT_SOURCE_COLUMNS)
+
+        for batch in iter_templated_batches(source, CLIENT_SOURCE_COLUMNS, template, db):
             batch_count += 1
-            df = batches[0]
-            
-            # Normalize columns
-            df.columns = [c.strip().lower().replace(".", "").replace(" ", "_") for c in df.columns]
-            
-            # (Mapping logic for variants like 'lastname' -> 'last_name')
-            # ...
-            
-            df = df.with_columns([
-                pl.lit(portfolio_id).alias("portfolio_id"),
-                pl.lit(tenant_id).alias("tenant_id")
-            ])
+            df = normalize_columns(batch)
 
             # Inject using COPY
             connection = db.connection().connection
             cursor = connection.cursor()
-            
+
             rows_data = []
             for row in df.to_dicts():
-                processed_row = {
-                    "portfolio_id": str(portfolio_id),
-                    "tenant_id": str(tenant_id),
-                    "employee_id": str(row.get("employee_id", "")),
-                    "last_name": str(row.get("last_name", row.get("lastname", ""))),
-                    "other_names": str(row.get("other_names", row.get("othernames", ""))),
-                    "residential_address": str(row.get("residential_address", "") or ""),
-                    "phone_number": str(row.get("phone_number", "") or ""),
-                    "date_of_birth": row.get("date_of_birth") or None,  # keep as None so DB stores NULL cleanly
-                    "client_type": "individual"
-                }
-                line = "\t".join(processed_row.values())
+                line = "\t".join(client_copy_row(row, portfolio_id, tenant_id).values())
                 rows_data.append(line)
-            
+
             if rows_data:
                 batch_buffer = io.StringIO("\n".join(rows_data) + "\n")
-                cursor.copy_from(batch_buffer, "clients", columns=list(processed_row.keys()), sep="\t", null="")
-                connection.commit()
+                cursor.copy_from(batch_buffer, table, columns=CLIENT_COPY_COLUMNS, sep="\t", null="")
+                db.commit()
                 total_processed += len(rows_data)
                 logger.info(f"Processed client batch {batch_count}: +{len(rows_data)} records (Total: {total_processed})")
-
-        return {"processed": total_processed, "success": True}
-
     finally:
         if csv_path and os.path.exists(csv_path): os.remove(csv_path)
 
+    return {"processed": total_processed, "success": True}
+
 def run_quality_checks_sync(portfolio_id, db):
     """Synchronous function to run quality checks on portfolio data."""
     try:
@@ -0,0 +1,212 @@
+"""
+Constant-memory xlsx output for report workbooks.
+
+``open_report_workbook`` opens xlsxwriter in ``constant_memory`` mode: each row is
+flushed to a temp file as soon as a later row is written, so memory stays flat
+however many loans a report has. Rows must then be written top to bottom.
+
+Loan-level (detailed) reports are declared in ``DETAILED_REPORT_COLUMNS`` as
+``(header, SQL expression)`` pairs. ``write_detailed_rows`` selects exactly those
+expressions over a server-side cursor, with NULL handling and number/text
+conversion done by the database, and writes each result tuple unchanged with
+``write_row``.
+
+``start_report_sheet``, ``write_stage_summary`` and ``journal_entries`` lay out
+the other report types, so a report reads the same whether it was built on its
+own or as part of a report pack (``app.utils.report_pack``).
+"""
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import xlsxwriter
+from sqlalchemy import Float, Row, String, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.models import Client, Loan
+
+# Rows fetched per round trip of the server-side cursor
+DETAILED_REPORT_BATCH_ROWS = 5000
+
+
+def number_cell(column):
+    """The column as a float, NULL as 0."""
+    return cast(func.coalesce(column, 0), Float)
+
+
+def text_cell(column):
+    """The column as text, NULL left empty."""
+    return column if isinstance(column.type, String) else cast(column, String)
+
+
+def client_name_cell():
+    """The loan's own employee name, else the linked client's, else "Unknown"."""
+    client_name = func.trim(func.coalesce(Client.last_name, "") + " " + func.coalesce(Client.other_names, ""))
+    return func.coalesce(func.nullif(Loan.employee_name, ""), func.nullif(client_name, ""), "Unknown")
+
+
+DETAILED_REPORT_COLUMNS: Dict[str, List[Tuple[str, object]]] = {
+    "ecl_detailed_report": [
+        ("Loan No", Loan.loan_no),
+        ("Loan Issue Date", text_cell(Loan.loan_issue_date)),
+        ("Deduction Start Period", text_cell(Loan.deduction_start_period)),
+        ("Submission Period", text_cell(Loan.submission_period)),
+        ("Maturity Period", text_cell(Loan.maturity_period)),
+        ("Outsanding Loan Balance", number_cell(Loan.outstanding_loan_balance)),
+        ("Deduction Status", Loan.deduction_status),
+        ("Employee ID", Loan.employee_id),
+        ("Employee Name", client_name_cell()),
+        ("Loan Amount", number_cell(Loan.loan_amount)),
+        ("Theoretical Balance", number_cell(Loan.theoretical_balance)),
+        ("Oustanding balance", number_cell(Loan.balance_difference)),
+        ("Accumulated Arrears", number_cell(Loan.accumulated_arrears)),
+        ("NDIA", text_cell(Loan.ndia)),
+        ("Stage", Loan.ifrs9_stage),
+        ("EAD", number_cell(Loan.ead)),
+        ("LGD", number_cell(Loan.lgd)),
+        ("EIR", number_cell(Loan.eir)),
+        ("PD", number_cell(Loan.pd)),
+        ("ECL", number_cell(Loan.final_ecl)),
+    ],
+    "BOG_impairment_detailed_report": [
+        ("Loan No", Loan.loan_no),
+        ("Employee ID", Loan.employee_id),
+        ("Employee Name", client_name_cell()),
+        ("Loan Amount", number_cell(Loan.loan_amount)),
+        ("Theoretical Balance", number_cell(Loan.theoretical_balance)),
+        ("Oustanding balance", number_cell(Loan.balance_difference)),
+        ("Accumulated Arrears", number_cell(Loan.accumulated_arrears)),
+        ("NDIA", text_cell(Loan.ndia)),
+        ("Stage", Loan.bog_stage),
+        ("Provision rate %", number_cell(Loan.bog_prov_rate)),
+        ("Provision", number_cell(Loan.bog_provision)),
+    ],
+}
+
+
+def open_report_workbook(file_path: str) -> xlsxwriter.Workbook:
+    """Workbook writing rows straight to disk; write each sheet's rows in order."""
+    return xlsxwriter.Workbook(file_path, {"constant_memory": True})
+
+
+def detailed_report_headers(report_type: str) -> List[str]:
+    return [header for header, _ in DETAILED_REPORT_COLUMNS[report_type]]
+
+
+def detailed_report_query(report_type: str, portfolio_id: int):
+    """SELECT of the report's cell values for the portfolio's loans, in loan id order."""
+    expressions = [expression for _, expression in DETAILED_REPORT_COLUMNS[report_type]]
+    return (
+        select(*expressions)
+        .select_from(Loan)
+        .outerjoin(Loan.client)
+        .where(Loan.portfolio_id == portfolio_id)
+        .order_by(Loan.id)
+    )
+
+
+def stream_rows(db: Session, query, batch_size: int = DETAILED_REPORT_BATCH_ROWS) -> Iterator[Row]:
+    """Yield the query's rows, fetching ``batch_size`` at a time."""
+    # yield_per streams from a server-side cursor instead of buffering the result
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def write_rows(worksheet, rows: Iterable[Sequence], first_row: int) -> int:
+    """Write each row's values from column A, ``first_row`` down; returns the row after the last one."""
+    row_idx = first_row
+    for row in rows:
+        worksheet.write_row(row_idx, 0, row)
+        row_idx += 1
+    return row_idx
+
+
+def write_detailed_rows(worksheet, db: Session, report_type: str, portfolio_id: int, first_row: int,
+                        batch_size: int = DETAILED_REPORT_BATCH_ROWS) -> int:
+    """Write the report's loan rows from ``first_row`` down; returns the row after the last one."""
+    rows = stream_rows(db, detailed_report_query(report_type, portfolio_id), batch_size)
+    return write_rows(worksheet, rows, first_row)
+
+
+REPORT_TITLES = {
+    "ecl_detailed_report": "Detailed IFRS9 ECL report",
+    "BOG_impairment_detailed_report": "Detailed BOG impairment report",
+    "ecl_report_summarised_by_stages": "Summary IFRS 9 ECL report",
+    "BOG_impairmnt_summary_by_stages": "Summary BOG impairment report ",
+    "journals_report": "Journals report",
+}
+
+STAGE_SUMMARY_HEADERS = {
+    "ecl_report_summarised_by_stages": [
+        "Stages", "Loan value", "Outstanding loan balance", "Oustanding balance", "ECL", "Recovery rate %"
+    ],
+    "BOG_impairmnt_summary_by_stages": [
+        "Stages", "Loan value", "Outstanding loan balance", "Oustanding balance", "Provision", "Recovery rate %"
+    ],
+}
+
+JOURNAL_HEADERS = ["GL Account code", "Journal description", "Journal amount"]
+
+
+def start_report_sheet(workbook, worksheet, report_type: str, portfolio_name: str) -> int:
+    """Write the report's title block and table headers; returns the row its data starts on."""
+    bold_format = workbook.add_format({'bold': True})
+    bold_left_format = workbook.add_format({'bold': True, 'align': 'left'})
+    today = date.today().strftime('%Y-%m-%d')
+    worksheet.write('A1', "Dalex Finance", bold_format)
+    worksheet.write('A2', REPORT_TITLES[report_type], bold_format)
+    worksheet.write('A3', f"Portfolio: {portfolio_name}", bold_format)
+    worksheet.write('A4', f"Report date: {today}", bold_format)
+    worksheet.write('A5', f"Report extraction date: {today}", bold_format)
+
+    start_row = 7
+    match report_type:
+        case "ecl_detailed_report":
+            worksheet.write('A7', "Note that ECL calculation results are as at the report run date. ECLs are discounted at the effective interest rate to the calculation run date", workbook.add_format({'italic': True}))
+            start_row = 8
+            worksheet.write_row(start_row, 0, detailed_report_headers(report_type), bold_left_format)
+        case "BOG_impairment_detailed_report":
+            worksheet.write_row(start_row, 0, detailed_report_headers(report_type), workbook.add_format({'bold': True, 'align': 'center'}))
+        case "ecl_report_summarised_by_stages":
+            worksheet.write_row(start_row, 0, STAGE_SUMMARY_HEADERS[report_type], workbook.add_format({'bold': True, 'align': 'center'}))
+        case "BOG_impairmnt_summary_by_stages":
+            worksheet.write_row(start_row, 0, STAGE_SUMMARY_HEADERS[report_type], bold_format)
+        case "journals_report":
+            left_format = workbook.add_format({'align': 'left'})
+            for col, header in enumerate(JOURNAL_HEADERS):
+                worksheet.write(start_row, col, header, bold_left_format)
+                worksheet.set_column(col, col, max(len(header), 30), left_format)
+    return start_row + 1
+
+
+def write_stage_summary(worksheet, stages: Iterable[Sequence], first_row: int) -> int:
+    """
+    Write one row per stage from ``(stage, loan value, outstanding balance, balance
+    difference, ECL or provision)`` tuples; returns the row after the last one.
+    """
+    row_idx = first_row
+    for stage, loan_value, outstanding_balance, balance_difference, amount in stages:
+        loan_value, outstanding_balance = float(loan_value or 0), float(outstanding_balance or 0)
+        recovery_rate = outstanding_balance / loan_value * 100 if loan_value else 0
+        worksheet.write_row(row_idx, 0, [
+            stage,
+            round(loan_value, 2),
+            round(outstanding_balance, 2),
+            round(float(balance_difference or 0), 2),
+            round(float(amount or 0), 2),
+            round(recovery_rate, 2),
+        ])
+        row_idx += 1
+    return row_idx
+
+
+def journal_entries(portfolio, ecl_total, bog_total) -> List[Tuple[str, str, float]]:
+    """The journals report's rows: the ECL charge and the BOG top-up, each with its contra entry."""
+    ecl_total = float(ecl_total or 0)
+    bog_topup = float(bog_total or 0) - ecl_total
+    return [
+        (portfolio.ecl_impairment_account, "IFRS9 Impairment - P&L charge", ecl_total),
+        (portfolio.loan_assets, "IFRS9 Impairment - impact on loans", -ecl_total),
+        (portfolio.ecl_impairment_account, "Top up for BOG Impairment - P&L charge", bog_topup),
+        (portfolio.credit_risk_reserve, "Credit risk reserve", -bog_topup),
+    ]
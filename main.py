@@ -35,6 +35,7 @@ import pickle
 import numpy as np
 import asyncio
 from app.utils.billing import require_active_subscription
+from app.utils.minio_reports_factory import apply_report_retention
 from contextlib import asynccontextmanager
 from app.database import SessionLocal
 # from app.utils.seed_subscription_plans import seed_subscription_plans
@@ -125,6 +126,12 @@ async def lifespan(app):
     finally:
         db.close()
     
+    # Expire old report workbooks in MinIO; reused reports stay within the window
+    try:
+        apply_report_retention()
+    except Exception as e:
+        logger.warning(f"Could not apply report retention to MinIO: {e}")
+
     logger.info("=== Application Startup Complete ===")
     
     yield
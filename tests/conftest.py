@@ -1,10 +1,13 @@
 import os
 import tempfile
+from io import BytesIO
 
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from datetime import datetime, timedelta, timezone
 from app.models import (
     SubscriptionPlan,
@@ -21,6 +24,8 @@ from app.routes import reports
 TEST_DB_PATH = os.path.join(tempfile.gettempdir(), "ifrs9pro_test.db")
 TEST_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
 os.environ.setdefault("SQLALCHEMY_DATABASE_URL", TEST_DATABASE_URL)
+# No Redis in tests; tests of the response cache provide their own client
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
 
 # --- MOCK CELERY BEFORE APP IMPORT ---
 import sys
@@ -49,8 +54,8 @@ def mock_task_decorator(*args, **kwargs):
 mock_celery_app.task.side_effect = mock_task_decorator
 # -------------------------------------
 
-from app.database import Base, get_db
-from app.dependencies import get_tenant_db
+from app.database import Base, get_db, get_read_db, get_async_db, get_async_read_db
+from app.dependencies import get_tenant_db, get_tenant_read_db, get_tenant_async_db, get_tenant_async_read_db
 from app.models import User, UserRole
 from app.auth.utils import get_password_hash
 from main import app
@@ -64,6 +69,11 @@ os.environ.setdefault("INVITATION_EXPIRE_HOURS", "24")
 engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async routes get their own sessions on the same database file. NullPool because
+# the TestClient runs each request on its own event loop.
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 @pytest.fixture(scope="function")
 def db_session():
@@ -186,6 +196,10 @@ def client(db_session, admin_user, regular_user, admin_with_active_subscription,
         finally:
             pass
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
     # Dependency overrides to bypass auth in tests
     from app.auth import utils as auth_utils
 
@@ -197,6 +211,12 @@ def client(db_session, admin_user, regular_user, admin_with_active_subscription,
 
     app.dependency_overrides[get_db] = override_get_db
     app.dependency_overrides[get_tenant_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_tenant_read_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_tenant_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
+    app.dependency_overrides[get_tenant_async_read_db] = override_get_async_db
     app.dependency_overrides[auth_utils.get_current_active_user] = override_current_user
     app.dependency_overrides[auth_utils.is_admin] = override_admin_user
     
@@ -217,12 +237,9 @@ def client(db_session, admin_user, regular_user, admin_with_active_subscription,
     monkeypatch.setattr("app.utils.background_calculations.process_bog_impairment_calculation_sync", lambda *a, **k: {"status": "ok"})
     monkeypatch.setattr("app.utils.minio_reports_factory.run_and_save_report_task", lambda *a, **k: None)
     monkeypatch.setattr("app.utils.minio_reports_factory.generate_presigned_url_for_download", lambda *a, **k: "http://example.com")
-    monkeypatch.setattr("app.utils.minio_reports_factory.download_report", lambda *a, **k: b"data")
-    monkeypatch.setattr(
-        reports,
-        "run_and_save_report_task",
-        lambda *a, **k: None
-    )
+    # Streamed downloads read on their own session
+    monkeypatch.setattr("app.utils.streaming_export.ReadSessionLocal", TestingSessionLocal)
+    monkeypatch.setattr("app.utils.minio_reports_factory.open_report_object", lambda *a, **k: {"status": 200, "headers": {}, "body": BytesIO(b"data")})
 
     return TestClient(app)
 
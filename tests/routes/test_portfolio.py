@@ -358,4 +358,109 @@ async def test_stage_loans_local_success(client, db_session, regular_user, tenan
 async def test_stage_loans_local_portfolio_not_found(client, db_session, regular_user):
     response = client.post("/portfolios/999/stage-loans-local")  # non-existent portfolio
     assert response.status_code == status.HTTP_404_NOT_FOUND
-    assert response.json()["detail"] == "Portfolio not found"
\ No newline at end of file
+    assert response.json()["detail"] == "Portfolio not found"
+
+def test_stream_ingest_acknowledges_batches_with_cursor(client, db_session, regular_user, tenant, monkeypatch):
+    from app.config import settings
+
+    portfolio = Portfolio(
+        user_id=regular_user.id,
+        tenant_id=tenant.id,
+        name="LMS Feed",
+        data_source="connect to external application",
+    )
+    db_session.add(portfolio)
+    db_session.commit()
+
+    written = []
+
+    def fake_write(rows, record_type, portfolio_id, tenant_id, db, sub_id=0):
+        written.append([row["loan_no"] for row in rows])
+        return {"inserted": len(rows), "updated": 0}
+
+    monkeypatch.setattr("app.utils.stream_ingestion.write_stream_batch", fake_write)
+    monkeypatch.setattr(settings, "STREAM_INGEST_BATCH_ROWS", 2)
+
+    body = "\n".join([
+        '{"Loan No.": "L1", "Loan Amount": 100}',
+        '{"Loan No.": "L2", "Loan Amount": "2,000"}',
+        'not json',
+        '{"Loan No.": "L3"}',
+        '{"Loan Amount": 5}',
+    ])
+    resp = client.post(
+        f"/portfolios/{portfolio.id}/ingest/stream/loans?cursor=10",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert data["status"] == "completed"
+    assert data["cursor"] == 15
+    assert (data["received"], data["inserted"], data["rejected"]) == (5, 3, 2)
+    assert [b["cursor"] for b in data["batches"]] == [12, 14, 15]
+    assert data["batches"][1]["rejections"][0]["position"] == 12
+    assert written == [["L1", "L2"], ["L3"]]
+
+
+def test_stream_ingest_enforces_the_plan_loan_limit(client, db_session, regular_user, tenant, monkeypatch):
+    from app.config import settings
+    from app.models import SubscriptionPlan, TenantSubscription
+
+    subscription = db_session.query(TenantSubscription).filter(TenantSubscription.tenant_id == tenant.id).first()
+    db_session.query(SubscriptionPlan).filter(SubscriptionPlan.id == subscription.plan_id).update({"max_loan_data": 3})
+    portfolio = Portfolio(
+        user_id=regular_user.id,
+        tenant_id=tenant.id,
+        name="LMS Feed",
+        data_source="connect to external application",
+    )
+    db_session.add(portfolio)
+    db_session.flush()
+    db_session.add(Loan(loan_no="L1", loan_amount=100, portfolio_id=portfolio.id, tenant_id=tenant.id,
+                        subscription_id=subscription.id))
+    db_session.commit()
+
+    written = []
+
+    def fake_write(rows, record_type, portfolio_id, tenant_id, db, sub_id=0):
+        written.append([row["loan_no"] for row in rows])
+        return {"inserted": sum(row["loan_no"] != "L1" for row in rows), "updated": sum(row["loan_no"] == "L1" for row in rows)}
+
+    monkeypatch.setattr("app.utils.stream_ingestion.write_stream_batch", fake_write)
+    monkeypatch.setattr("app.routes.portfolio.recalculate_subscription_loan_usage", lambda *args: None)
+    monkeypatch.setattr(settings, "STREAM_INGEST_BATCH_ROWS", 2)
+
+    # L1 is already held, so the first batch adds one loan; the second would add two
+    body = "\n".join(f'{{"loan_no": "{loan_no}"}}' for loan_no in ["L1", "L2", "L3", "L4"])
+    resp = client.post(
+        f"/portfolios/{portfolio.id}/ingest/stream/loans",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert resp.status_code == status.HTTP_402_PAYMENT_REQUIRED, resp.text
+    data = resp.json()
+    assert data["status"] == "limit_exceeded"
+    assert (data["cursor"], data["inserted"], data["updated"]) == (2, 1, 1)
+    assert "allows 1 more" in data["error"]
+    assert written == [["L1", "L2"]]
+
+
+def test_stream_ingest_requires_external_application_source(client, db_session, regular_user, tenant):
+    portfolio = Portfolio(
+        user_id=regular_user.id,
+        tenant_id=tenant.id,
+        name="Uploads",
+        data_source="upload data",
+    )
+    db_session.add(portfolio)
+    db_session.commit()
+
+    resp = client.post(
+        f"/portfolios/{portfolio.id}/ingest/stream/loans",
+        content='{"loan_no": "L1"}',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert resp.status_code == 400
@@ -1,3 +1,6 @@
+from io import BytesIO
+
+import openpyxl
 import pytest
 from app.models import Portfolio, QualityIssue, QualityIssueComment
 
@@ -98,6 +101,12 @@ def test_download_all_quality_issues_with_comments(client, portfolio, quality_is
     )
     assert response.status_code == 200
 
+    workbook = openpyxl.load_workbook(BytesIO(response.content))
+    issues = list(workbook["Issues"].iter_rows(values_only=True))
+    assert issues[1][:5] == (quality_issue.id, "duplicate_customer_ids", "Test duplicate customer IDs found", "high", "open")
+    comments = list(workbook["Comments"].iter_rows(values_only=True))
+    assert comments[1][:2] == (quality_issue.id, quality_issue_comment.id)
+
 
 def test_download_all_quality_issues_with_filters(client, portfolio, quality_issue):
     """Test downloading quality issues with filters applied"""
@@ -224,6 +233,10 @@ def test_download_quality_issue_excel(client, portfolio, quality_issue):
     assert response.status_code == 200
     assert response.headers["content-type"] == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
+    workbook = openpyxl.load_workbook(BytesIO(response.content))
+    assert workbook.sheetnames == ["Issue", "Affected Records", "Comments"]
+    assert list(workbook["Affected Records"].iter_rows(values_only=True)) == [("customer_id", "count"), ("123", 2)]
+
 
 def test_download_quality_issue_without_comments(client, portfolio, quality_issue):
     """Test downloading a quality issue without comments"""
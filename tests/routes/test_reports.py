@@ -53,23 +53,57 @@ def test_delete_report(client, portfolio, report):
 
 def test_download_report_excel(client, portfolio, report, monkeypatch):
     """Test downloading a report as Excel"""
-    # Mock the download_report function to return fake Excel data
     from io import BytesIO
-    
-    def mock_download_report(bucket_name, object_name):
-        # Return a BytesIO object with fake Excel data
-        fake_excel_data = BytesIO(b"fake excel file content")
-        return fake_excel_data
-    
-    # Patch the download_report function
-    monkeypatch.setattr(
-        "app.routes.reports.download_report",
-        mock_download_report
-    )
-    
+
+    opened = {}
+
+    def mock_open_report_object(object_name, range_header=None, if_range=None):
+        opened.update(object_name=object_name, range_header=range_header, if_range=if_range)
+        headers = {"Accept-Ranges": "bytes", "Content-Length": "23", "ETag": '"abc"'}
+        return {"status": 200, "headers": headers, "body": BytesIO(b"fake excel file content")}
+
+    monkeypatch.setattr("app.routes.reports.open_report_object", mock_open_report_object)
+
     response = client.get(f"/reports/{portfolio.id}/report/{report.id}/download")
     assert response.status_code == 200
     assert response.headers["content-type"] == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    assert response.headers["etag"] == '"abc"'
+    assert response.content == b"fake excel file content"
+    assert opened["object_name"] == f"reports/{report.report_name}"
+
+
+def test_download_report_excel_range(client, portfolio, report, monkeypatch):
+    """Range and If-Range are passed to MinIO and the partial content streamed back"""
+    from io import BytesIO
+
+    opened = {}
+
+    def mock_open_report_object(object_name, range_header=None, if_range=None):
+        opened.update(range_header=range_header, if_range=if_range)
+        headers = {"Accept-Ranges": "bytes", "Content-Length": "5", "Content-Range": "bytes 5-9/23", "ETag": '"abc"'}
+        return {"status": 206, "headers": headers, "body": BytesIO(b"excel")}
+
+    monkeypatch.setattr("app.routes.reports.open_report_object", mock_open_report_object)
+
+    response = client.get(f"/reports/{portfolio.id}/report/{report.id}/download",
+                          headers={"Range": "bytes=5-9", "If-Range": '"abc"'})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 5-9/23"
+    assert response.content == b"excel"
+    assert opened == {"range_header": "bytes=5-9", "if_range": '"abc"'}
+
+
+def test_download_report_excel_redirect(client, portfolio, report, monkeypatch):
+    """With REPORT_DOWNLOAD_REDIRECT the client is sent to a presigned URL"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "REPORT_DOWNLOAD_REDIRECT", True)
+    monkeypatch.setattr("app.routes.reports.generate_presigned_url",
+                        lambda object_name, file_name=None, content_type=None: f"http://minio/{object_name}?signed")
+
+    response = client.get(f"/reports/{portfolio.id}/report/{report.id}/download", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == f"http://minio/reports/{report.report_name}?signed"
 
 
 def test_get_report_status(client, report):
@@ -123,8 +157,7 @@ def test_generate_report(client, db_session, regular_user, tenant):
         db_session.commit()
         
         # Mock any external services used in report generation
-        with patch("app.routes.reports.run_and_save_report_task") as mock_gen:
-            mock_gen.return_value = {"status": "success", "report_id": 1}
+        with patch("app.tasks.reports.run_report_task") as mock_task:
             
             resp = client.post(
                 f"/reports/{portfolio.id}/generate",
@@ -139,6 +172,8 @@ def test_generate_report(client, db_session, regular_user, tenant):
                 print(f"Error: {resp.json()}")
             
             assert resp.status_code == 200
+            mock_task.delay.assert_called_once()
+            assert mock_task.delay.call_args.kwargs["report_id"] == resp.json()["report_id"]
     finally:
         current_tenant_id.reset(token)
 
@@ -189,3 +224,83 @@ def test_generate_report_error_wrapping(client, portfolio, monkeypatch):
     assert resp.status_code == 500
     assert "Error generating report: Database fail" in resp.json()["detail"]
 
+
+
+def test_generate_report_pack(client, db_session, portfolio):
+    with patch("app.tasks.reports.run_report_pack_task") as mock_task:
+        resp = client.post(
+            f"/reports/{portfolio.id}/generate-pack",
+            json={"report_date": str(date.today())},
+        )
+
+    assert resp.status_code == 200
+    report_ids = resp.json()["report_ids"]
+    assert mock_task.delay.call_args.kwargs["report_ids"] == report_ids
+    reports = db_session.query(Report).filter(Report.id.in_(report_ids)).all()
+    assert sorted(report.report_type for report in reports) == sorted(
+        ["ecl_detailed_report", "ecl_report_summarised_by_stages", "BOG_impairment_detailed_report",
+         "BOG_impairmnt_summary_by_stages", "journals_report"]
+    )
+    assert {report.status for report in reports} == {"pending"}
+
+    assert client.post("/reports/99999/generate-pack", json={"report_date": str(date.today())}).status_code == 404
+
+
+def test_generate_report_reuses_matching_reports(client, db_session, portfolio):
+    from app.utils.data_versions import bump_data_version
+
+    body = {"report_type": "ecl_detailed_report", "report_date": str(date.today())}
+    with patch("app.tasks.reports.run_report_task") as mock_task:
+        first = client.post(f"/reports/{portfolio.id}/generate", json=body).json()
+        second = client.post(f"/reports/{portfolio.id}/generate", json=body).json()
+        assert (first["reused"], second["reused"]) == (False, True)
+        assert second["report_id"] == first["report_id"]
+        assert mock_task.delay.call_count == 1
+
+        # A pack attaches to the in-flight report and builds only the other types
+        with patch("app.tasks.reports.run_report_pack_task") as mock_pack:
+            pack = client.post(f"/reports/{portfolio.id}/generate-pack", json={"report_date": str(date.today())}).json()
+        assert pack["reused_report_ids"] == [first["report_id"]]
+        assert len(mock_pack.delay.call_args.kwargs["report_ids"]) == 4
+
+        # A failed report, or new loan data, is built again
+        db_session.query(Report).filter(Report.id == first["report_id"]).update({"status": "failed"})
+        db_session.commit()
+        third = client.post(f"/reports/{portfolio.id}/generate", json=body).json()
+        bump_data_version(portfolio.id, db_session)
+        db_session.commit()
+        fourth = client.post(f"/reports/{portfolio.id}/generate", json=body).json()
+
+    assert not third["reused"] and not fourth["reused"]
+    assert len({first["report_id"], third["report_id"], fourth["report_id"]}) == 3
+
+
+def test_export_loans(client, db_session, portfolio, monkeypatch):
+    import pyarrow as pa
+    from app.models import Loan
+    from app.utils import loan_export
+    from tests.conftest import TestingSessionLocal
+
+    db_session.add_all([
+        Loan(tenant_id=portfolio.tenant_id, portfolio_id=portfolio.id, loan_amount=100, loan_no="L1", ifrs9_stage="Stage 1", final_ecl=5),
+        Loan(tenant_id=portfolio.tenant_id, portfolio_id=portfolio.id, loan_amount=100, loan_no="L2", ifrs9_stage="Stage 3", final_ecl=80),
+    ])
+    db_session.commit()
+
+    with patch("app.tasks.reports.run_loan_export_task") as mock_task:
+        resp = client.post(f"/reports/{portfolio.id}/export", json={"columns": ["loan_no"], "ifrs9_stage": ["Stage 3"]})
+    assert resp.status_code == 200
+    report = db_session.get(Report, resp.json()["report_id"])
+    assert (report.report_type, report.status) == ("loan_export", "pending")
+    assert report.report_data["filters"]["ifrs9_stage"] == ["Stage 3"]
+    assert mock_task.delay.call_args.kwargs["report_id"] == report.id
+    assert client.post(f"/reports/{portfolio.id}/export", json={"columns": ["nope"]}).status_code == 400
+    assert client.post("/reports/99999/export", json={}).status_code == 404
+
+    monkeypatch.setattr(loan_export, "ReadSessionLocal", TestingSessionLocal)
+    resp = client.get(f"/reports/{portfolio.id}/export/arrow",
+                      params={"columns": ["loan_no", "final_ecl"], "min_ecl": 10})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(resp.content).read_all()
+    assert table.to_pydict() == {"loan_no": ["L2"], "final_ecl": [80.0]}
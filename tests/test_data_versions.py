@@ -0,0 +1,46 @@
+from app.models import Portfolio, QualityIssue
+from app.utils.portfolio_stats import refresh_portfolio_stats
+
+
+def _version(db_session, portfolio):
+    db_session.expire_all()
+    return db_session.get(Portfolio, portfolio.id).data_version
+
+
+def test_read_endpoints_answer_matching_etag_with_304(client, db_session, portfolio):
+    for path in ["/dashboard", f"/portfolios/{portfolio.id}", f"/portfolios/{portfolio.id}/quality-issues",
+                 f"/reports/{portfolio.id}/history"]:
+        first = client.get(path)
+        assert first.status_code == 200, path
+        etag = first.headers["etag"]
+
+        again = client.get(path, headers={"If-None-Match": etag})
+        assert again.status_code == 304, path
+        assert again.content == b""
+        assert again.headers["etag"] == etag
+
+        # Query strings and stale tags get a full response
+        assert client.get(f"{path}?skip=0", headers={"If-None-Match": etag}).status_code == 200
+        assert client.get(path, headers={"If-None-Match": 'W/"stale"'}).status_code == 200
+
+
+def test_writers_bump_data_version_and_change_etag(client, db_session, tenant, portfolio):
+    etag = client.get(f"/portfolios/{portfolio.id}").headers["etag"]
+    assert _version(db_session, portfolio) == 0
+
+    refresh_portfolio_stats(portfolio.id, db_session)
+    db_session.commit()
+    assert _version(db_session, portfolio) == 1
+
+    db_session.add(QualityIssue(tenant_id=tenant.id, portfolio_id=portfolio.id, issue_type="missing_dob",
+                                description="Client has no date of birth", affected_records=[], severity="medium"))
+    db_session.commit()
+    assert client.post(f"/portfolios/{portfolio.id}/approve-all-quality-issues").status_code == 200
+    assert _version(db_session, portfolio) == 2
+
+    assert client.put(f"/portfolios/{portfolio.id}", json={"name": "Renamed"}).status_code == 200
+    assert _version(db_session, portfolio) == 3
+
+    response = client.get(f"/portfolios/{portfolio.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
@@ -0,0 +1,110 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from sqlalchemy import select
+
+import app.database as database
+from app.database import (
+    Base, TenantMixin, async_database_url, current_tenant_id, engine_options, get_async_read_db,
+    get_read_db, set_tenant_context,
+)
+from app.dependencies import get_tenant_async_read_db, get_tenant_read_db
+from app.models import Portfolio
+from main import app
+from tests.conftest import TestingAsyncSessionLocal
+
+
+def test_engine_options_size_pool_except_for_sqlite():
+    postgres = engine_options("postgresql://u:p@db/ifrs9", pool_size=15, max_overflow=5)
+    assert postgres["pool_size"] == 15
+    assert postgres["max_overflow"] == 5
+    assert {"pool_timeout", "pool_recycle", "pool_pre_ping"} <= set(postgres)
+
+    # SQLite pools reject the sizing arguments
+    assert set(engine_options("sqlite:///test.db", pool_size=15, max_overflow=5)) == {"pool_pre_ping"}
+
+
+def test_read_only_routes_use_read_session(client, db_session, portfolio, monkeypatch):
+    used = []
+
+    def override_read_db():
+        used.append("sync")
+        yield db_session
+
+    async def override_async_read_db():
+        used.append("async")
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, override_read_db)
+    monkeypatch.setitem(app.dependency_overrides, get_tenant_read_db, override_read_db)
+    monkeypatch.setitem(app.dependency_overrides, get_async_read_db, override_async_read_db)
+    monkeypatch.setitem(app.dependency_overrides, get_tenant_async_read_db, override_async_read_db)
+
+    assert client.get("/dashboard").status_code == 200
+    assert client.get(f"/portfolios/{portfolio.id}").status_code == 200
+    assert client.get(f"/reports/{portfolio.id}/history").status_code == 200
+    assert used == ["sync", "async", "async"]
+
+
+def test_async_database_url_swaps_in_async_drivers():
+    assert async_database_url("postgresql://u:p@db/ifrs9") == "postgresql+asyncpg://u:p@db/ifrs9"
+    assert async_database_url("postgresql+psycopg2://u:p@db/ifrs9") == "postgresql+asyncpg://u:p@db/ifrs9"
+    assert async_database_url("sqlite:///test.db") == "sqlite+aiosqlite:///test.db"
+
+
+def test_async_session_applies_tenant_filter(db_session, tenant, portfolio):
+    other = Portfolio(name="Other tenant", user_id=portfolio.user_id, tenant_id=tenant.id + 1)
+    db_session.add(other)
+    db_session.commit()
+
+    async def visible_names():
+        async with TestingAsyncSessionLocal() as session:
+            return (await session.scalars(select(Portfolio.name).order_by(Portfolio.id))).all()
+
+    token = current_tenant_id.set(tenant.id)
+    try:
+        assert asyncio.run(visible_names()) == [portfolio.name]
+    finally:
+        current_tenant_id.reset(token)
+
+
+def test_rls_migration_covers_every_tenant_table():
+    path = next(Path("alembic/versions").glob("*_enable_tenant_row_level_security.py"))
+    spec = importlib.util.spec_from_file_location("rls_migration", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    tenant_tables = {m.class_.__tablename__ for m in Base.registry.mappers if issubclass(m.class_, TenantMixin)}
+    assert set(migration.TENANT_TABLES) == tenant_tables
+
+
+def test_rls_mode_replaces_orm_filter_with_tenant_setting(db_session, tenant, portfolio, monkeypatch):
+    other = Portfolio(name="Other tenant", user_id=portfolio.user_id, tenant_id=tenant.id + 1)
+    db_session.add(other)
+    db_session.commit()
+    # Begin before switching modes: SQLite has no set_config for after_begin to call
+    db_session.connection()
+    monkeypatch.setattr(database, "RLS_ENABLED", True)
+
+    with set_tenant_context(tenant.id):
+        # Filtering is left to Postgres, so SQLite sees both tenants
+        assert db_session.query(Portfolio).count() == 2
+
+        connection = MagicMock()
+        database.receive_after_begin(db_session, None, connection)
+        params = connection.execute.call_args.args[1]
+        assert params == {"name": "app.tenant_id", "value": str(tenant.id)}
+
+    # Without a tenant nothing is set, so the fail-closed policies hide every tenant row...
+    connection = MagicMock()
+    database.receive_after_begin(db_session, None, connection)
+    connection.execute.assert_not_called()
+
+    # ...unless the transaction switches to the bypass role
+    monkeypatch.setattr(database.settings, "RLS_BYPASS_ROLE", "ifrs9_rls_bypass")
+    connection = MagicMock(dialect=db_session.get_bind().dialect)
+    database.receive_after_begin(db_session, None, connection)
+    assert str(connection.execute.call_args.args[0]) == "SET LOCAL ROLE ifrs9_rls_bypass"
@@ -50,3 +50,222 @@ def test_quality_issue_tenant_id_population():
     
     assert issue.tenant_id == 999
     assert issue.portfolio_id == 1
+
+def test_file_to_parquet_chunks_splits_row_ranges(tmp_path):
+    import os
+    from app.utils.sync_processors import file_to_parquet_chunks, transform_loan_batch
+
+    excel_path = tmp_path / "loans.xlsx"
+    pd.DataFrame({
+        "Loan No.": [f"L{i:03d}" for i in range(25)],
+        "Loan Amount": [1000 + i for i in range(25)],
+        "Monthly Installment": [100] * 25,
+        "Accumulated Arrears": [200] * 25,
+    }).to_excel(excel_path, index=False)
+
+    chunks, date_formats = file_to_parquet_chunks(str(excel_path), 10)
+    try:
+        assert [rows for _, rows in chunks] == [10, 10, 5]
+        assert date_formats is None
+
+        # Every chunk goes through the same transform as the CSV batches
+        last = transform_loan_batch(pl.read_parquet(chunks[-1][0]), 1, 2, 0)
+        assert last["loan_no"].to_list() == [f"L{i:03d}" for i in range(20, 25)]
+        assert last["ndia"].to_list() == [60.0] * 5
+    finally:
+        for path, _ in chunks:
+            os.remove(path)
+
+def test_file_to_parquet_chunks_applies_the_ingest_template(tmp_path, db_session, tenant):
+    import os
+    from app.models import IngestionTemplate
+    from app.utils.ingest_formats import count_file_rows
+    from app.utils.sync_processors import file_to_parquet_chunks
+
+    csv_path = tmp_path / "loans.csv"
+    pl.DataFrame({
+        "Loan No.": [f"L{i:03d}" for i in range(12)],
+        "Loan Amount": [1000.0 + i for i in range(12)],
+        "Loan Issue Date": ["31/01/2024"] * 12,
+    }).write_csv(csv_path)
+    excel_path = tmp_path / "loans.xlsx"
+    pd.DataFrame({"Loan No.": ["L1", "L2", "L3"]}).to_excel(excel_path, index=False)
+    assert (count_file_rows(str(csv_path)), count_file_rows(str(excel_path))) == (12, 3)
+
+    chunks, date_formats = file_to_parquet_chunks(str(csv_path), 5, tenant.id, db_session)
+    try:
+        assert [rows for _, rows in chunks] == [5, 5, 2]
+        assert date_formats == {"loan_issue_date": "%d/%m/%Y"}
+        assert pl.read_parquet(chunks[0][0])["Loan Amount"].dtype == pl.Float64
+        assert db_session.query(IngestionTemplate).filter_by(tenant_id=tenant.id, file_type="loan_details").count() == 1
+    finally:
+        for path, _ in chunks:
+            os.remove(path)
+
+
+def test_ingest_formats_read_csv_gz_and_parquet(tmp_path):
+    import gzip
+    from app.utils.ingest_formats import describe_file, detect_file_format, iter_batches
+
+    df = pl.DataFrame({
+        "Loan No.": ["L001", "L002", "L003"],
+        "Loan Amount": [1000.0, 2000.0, 3000.0],
+        "Unused": ["a", "b", "c"],
+    })
+    parquet_path = tmp_path / "loans.parquet"
+    df.write_parquet(parquet_path)
+    csv_gz_path = tmp_path / "loans.csv.gz"
+    with gzip.open(csv_gz_path, "wb") as f:
+        df.write_csv(f)
+
+    assert detect_file_format("LOANS.CSV.GZ") == "csv.gz"
+    assert detect_file_format("loans.txt") is None
+
+    for path in (parquet_path, csv_gz_path):
+        headers, row_count = describe_file(str(path))
+        assert headers == ["Loan No.", "Loan Amount", "Unused"]
+        assert row_count == 3
+
+        # Only the requested columns are read
+        batch = pl.concat(list(iter_batches(str(path), columns=["loan_no", "loan_amount"])))
+        assert batch.columns == ["Loan No.", "Loan Amount"]
+        assert batch["Loan Amount"].to_list() == [1000.0, 2000.0, 3000.0]
+
+def test_swap_portfolio_data_keeps_previous_data_on_load_error():
+    from app.utils.background_ingestion import swap_portfolio_data
+    from app.utils.shadow_tables import shadow_table_name
+
+    assert shadow_table_name("loans", 7) == "loans_shadow_7"
+    with pytest.raises(ValueError):
+        shadow_table_name("reports", 7)
+
+    mock_db = MagicMock()
+    results = {"errors": ["Error processing loan details: bad file"]}
+
+    assert swap_portfolio_data(7, mock_db, results) is False
+    # Only the shadow tables are dropped; nothing touches the live rows
+    statements = [str(c.args[0]) for c in mock_db.execute.call_args_list]
+    assert statements == ["DROP TABLE IF EXISTS loans_shadow_7", "DROP TABLE IF EXISTS clients_shadow_7"]
+
+def test_ingest_template_reused_and_dropped_on_schema_drift(tmp_path, db_session, tenant, monkeypatch):
+    from app.models import IngestionTemplate
+    from app.utils import ingest_formats
+    from app.utils.ingest_templates import resolve_ingest_template
+    from app.utils.sync_processors import (
+        LOAN_DATE_COLUMNS, LOAN_TARGET_COLUMNS, iter_templated_batches, transform_loan_batch,
+    )
+
+    first = tmp_path / "march.csv"
+    first.write_text(
+        "Loan No.,Loan Amount,Loan Issue Date,Notes\n"
+        "001,100,05/01/2024,a\n"
+        "002,200,12/31/2023,b\n"
+    )
+    template = resolve_ingest_template(db_session, tenant.id, "loan_details", str(first),
+                                       LOAN_TARGET_COLUMNS.keys(), LOAN_DATE_COLUMNS)
+    assert template.column_mapping == {"Loan No.": "loan_no", "Loan Amount": "loan_amount",
+                                       "Loan Issue Date": "loan_issue_date"}
+    assert template.dtypes["Loan No."] == "Utf8"  # identifiers keep leading zeros
+    assert template.dtypes["Loan Amount"] == "Float64"
+    assert template.date_formats == {"loan_issue_date": "%m/%d/%Y"}
+
+    # Same layout next month: the stored template is reused
+    second = tmp_path / "april.csv"
+    second.write_text(
+        "Loan No.,Loan Amount,Loan Issue Date,Notes\n"
+        "003,300,02/01/2024,c\n"
+        "004,400,02/02/2024,d\n"
+        "005,n/a,02/03/2024,e\n"
+    )
+    again = resolve_ingest_template(db_session, tenant.id, "loan_details", str(second),
+                                    LOAN_TARGET_COLUMNS.keys(), LOAN_DATE_COLUMNS)
+    assert again.id == template.id
+    assert again.use_count == 2
+
+    df = transform_loan_batch(
+        pl.DataFrame({"Loan No.": ["003"], "Loan Issue Date": ["02/01/2024"]}), 1, 2, 0,
+        again.date_formats,
+    )
+    assert df["loan_issue_date"].to_list() == ["2024-02-01"]
+
+    # "n/a" does not fit Float64: the template is dropped and no row is lost
+    monkeypatch.setattr(ingest_formats, "CSV_BATCH_SIZE", 2)
+    batches = list(iter_templated_batches(str(second), LOAN_TARGET_COLUMNS.keys(), again, db_session))
+    loan_nos = [n for b in batches for n in b["Loan No."].to_list()]
+    assert loan_nos == ["003", "004", "005"]
+    assert db_session.query(IngestionTemplate).count() == 0
+
+def test_partition_exchange_detaches_old_partition_instead_of_deleting(db_session, monkeypatch):
+    from app.utils import partitions
+
+    # SQLite: nothing is partitioned, the helpers are no-ops
+    assert partitions.is_partitioned("loans", db_session) is False
+    partitions.ensure_portfolio_partitions(3, db_session)
+    assert partitions.partition_name("clients", 3) == "clients_p3"
+
+    mock_db = MagicMock()
+    monkeypatch.setattr(partitions, "partition_exists", lambda *a: True)
+    mock_db.execute.return_value.mappings.return_value.all.return_value = [
+        {"contype": "p", "constraint_def": "PRIMARY KEY (id, portfolio_id)", "indisunique": True,
+         "index_def": " USING btree (id, portfolio_id)"},
+        {"contype": None, "constraint_def": None, "indisunique": False,
+         "index_def": " USING btree (portfolio_id, ifrs9_stage)"},
+    ]
+    partitions.prepare_partition_replacement("loans", 3, "loans_shadow_3", mock_db)
+    statements = [str(c.args[0]) for c in mock_db.execute.call_args_list]
+    assert statements[0] == (
+        "ALTER TABLE loans_shadow_3 ADD CONSTRAINT loans_shadow_3_portfolio_check "
+        "CHECK (portfolio_id IS NOT NULL AND portfolio_id = 3)"
+    )
+    # The parent's primary key and indexes are built before the swap, not by ATTACH
+    assert statements[2:] == [
+        "ALTER TABLE loans_shadow_3 ADD PRIMARY KEY (id, portfolio_id)",
+        "CREATE INDEX ON loans_shadow_3 USING btree (portfolio_id, ifrs9_stage)",
+    ]
+
+    mock_db.reset_mock()
+    partitions.exchange_portfolio_partition("loans", 3, "loans_shadow_3", mock_db)
+    statements = [str(c.args[0]) for c in mock_db.execute.call_args_list]
+    assert statements == [
+        "ALTER TABLE loans DETACH PARTITION loans_p3",
+        "DROP TABLE loans_p3",
+        "ALTER TABLE loans_shadow_3 RENAME TO loans_p3",
+        "ALTER TABLE loans ATTACH PARTITION loans_p3 FOR VALUES IN (3)",
+        "ALTER TABLE loans_p3 DROP CONSTRAINT loans_shadow_3_portfolio_check",
+    ]
+    assert not any(s.startswith("DELETE") for s in statements)
+
+def test_link_loans_to_clients_materializes_client_id(db_session, tenant, portfolio):
+    from app.models import Client, Loan
+    from app.utils.sync_processors import link_loans_to_clients
+
+    first = Client(tenant_id=tenant.id, portfolio_id=portfolio.id, employee_id="E1", last_name="Mensah")
+    duplicate = Client(tenant_id=tenant.id, portfolio_id=portfolio.id, employee_id="E1", last_name="Later")
+    db_session.add_all([first, duplicate])
+    db_session.flush()
+    loans = [
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L1", employee_id="E1", loan_amount=100),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L2", employee_id="E9", loan_amount=100),
+    ]
+    db_session.add_all(loans)
+    db_session.commit()
+
+    assert link_loans_to_clients(portfolio.id, db_session) == 1
+    db_session.commit()
+    # Re-running is a no-op
+    assert link_loans_to_clients(portfolio.id, db_session) == 0
+
+    db_session.expire_all()
+    linked, unmatched = db_session.query(Loan).order_by(Loan.loan_no).all()
+    assert linked.client_id == first.id
+    assert linked.client.last_name == "Mensah"
+    assert unmatched.client_id is None and unmatched.client is None
+
+    # A client re-keyed in place leaves its loans unlinked once stale links are cleared
+    first.employee_id = "E2"
+    duplicate.employee_id = "E2"
+    db_session.commit()
+    link_loans_to_clients(portfolio.id, db_session, clear_stale=True)
+    db_session.commit()
+    db_session.expire_all()
+    assert db_session.get(Loan, linked.id).client_id is None
@@ -0,0 +1,124 @@
+from datetime import date, datetime, timedelta
+
+import openpyxl
+import pytest
+from sqlalchemy import event
+
+from app.models import CalculationResult, Portfolio, PortfolioStats, Report, Tenant
+from app.utils import minio_reports_factory
+from app.utils.report_generators import generate_journal_report
+from tests.conftest import TestingSessionLocal, engine
+
+ACCOUNTS = dict(ecl_impairment_account="5001", loan_assets="1001", credit_risk_reserve="3001")
+
+
+def _calculation(portfolio, calculation_type, provisions, created_at):
+    return CalculationResult(
+        portfolio_id=portfolio.id, calculation_type=calculation_type, config={}, total_provision=sum(provisions.values()),
+        provision_percentage=0, reporting_date=created_at.date(), created_at=created_at,
+        result_summary={category: {"provision_amount": amount} for category, amount in provisions.items()},
+    )
+
+
+@pytest.fixture
+def calculations(db_session, tenant, regular_user, portfolio):
+    other_tenant = Tenant(name="Other Tenant", slug="other-tenant")
+    db_session.add(other_tenant)
+    db_session.flush()
+    portfolio.name = "Alpha"
+    for key, value in ACCOUNTS.items():
+        setattr(portfolio, key, value)
+    beta = Portfolio(name="Beta", user_id=regular_user.id, tenant_id=tenant.id, **ACCOUNTS)
+    no_accounts = Portfolio(name="No accounts", user_id=regular_user.id, tenant_id=tenant.id)
+    elsewhere = Portfolio(name="Elsewhere", user_id=regular_user.id, tenant_id=other_tenant.id, **ACCOUNTS)
+    db_session.add_all([beta, no_accounts, elsewhere])
+    db_session.flush()
+
+    then, now = datetime(2025, 1, 1), datetime(2025, 2, 1)
+    db_session.add_all([
+        _calculation(portfolio, "ecl", {"Stage 1": 999}, then),
+        _calculation(portfolio, "ecl", {"Stage 1": 100, "Stage 3": 50}, now),
+        _calculation(portfolio, "local_impairment", {"Current": 120, "Loss": 80}, now),
+        _calculation(beta, "ecl", {"Stage 2": 300}, now),
+        _calculation(beta, "local_impairment", {"Current": 200}, now - timedelta(days=1)),
+        _calculation(no_accounts, "ecl", {"Stage 1": 10}, now),
+        _calculation(no_accounts, "local_impairment", {"Current": 10}, now),
+        _calculation(elsewhere, "ecl", {"Stage 1": 40}, now),
+        _calculation(elsewhere, "local_impairment", {"Current": 70}, now),
+    ])
+    db_session.commit()
+    return beta, elsewhere
+
+
+def test_journal_report_reads_latest_calculations_in_one_query(db_session, tenant, portfolio, calculations):
+    tenant_id = tenant.id
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        report = generate_journal_report(db_session, [], date(2025, 2, 28), tenant_id=tenant_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert len(statements) == 1
+    rows = {row["portfolio_name"]: row for row in report["portfolios"]}
+    assert list(rows) == ["Alpha", "Beta", "Summary"]
+    assert (rows["Alpha"]["total_ecl"], rows["Alpha"]["total_local_impairment"], rows["Alpha"]["risk_reserve"]) == (150, 200, 50)
+    assert (rows["Beta"]["total_ecl"], rows["Beta"]["risk_reserve"]) == (300, 0)
+    assert (rows["Summary"]["total_ecl"], rows["Summary"]["total_local_impairment"]) == (450, 400)
+
+    # Without a tenant every portfolio is included; portfolio ids narrow it down
+    everyone = generate_journal_report(db_session, [], date(2025, 2, 28))
+    assert [row["portfolio_name"] for row in everyone["portfolios"]] == ["Alpha", "Beta", "Elsewhere", "Summary"]
+    beta, elsewhere = calculations
+    only = generate_journal_report(db_session, [elsewhere.id], date(2025, 2, 28))
+    assert only["portfolios"][0]["total_local_impairment"] == 70
+
+
+def test_tenant_journal_endpoint_consolidates_the_tenants_portfolios(client, calculations):
+    beta, elsewhere = calculations
+    response = client.get("/reports/journal", params={"report_date": "2025-02-28"})
+
+    assert response.status_code == 200, response.text
+    journal = response.json()
+    assert journal["report_date"] == "2025-02-28"
+    assert [row["portfolio_name"] for row in journal["portfolios"]] == ["Alpha", "Beta", "Summary"]
+    assert journal["portfolios"][-1]["total_ecl"] == 450
+
+    # Another tenant's portfolio id does not widen the scope
+    response = client.get("/reports/journal", params={"portfolio_ids": [beta.id, elsewhere.id]})
+    assert [row["portfolio_name"] for row in response.json()["portfolios"]] == ["Beta", "Summary"]
+
+
+def test_journals_report_uses_maintained_portfolio_totals(tmp_path, monkeypatch, db_session, tenant, regular_user,
+                                                          portfolio):
+    uploads = {}
+
+    def upload(file_path, object_name):
+        uploads[object_name] = list(openpyxl.load_workbook(file_path, read_only=True).active.iter_rows(values_only=True))
+        return f"http://minio/reports/{object_name}"
+
+    monkeypatch.setattr(minio_reports_factory, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(minio_reports_factory, "ReadSessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(minio_reports_factory, "upload_file_to_minio", upload)
+
+    for key, value in ACCOUNTS.items():
+        setattr(portfolio, key, value)
+    db_session.add(PortfolioStats(portfolio_id=portfolio.id, total_final_ecl=120, total_bog_provision=200))
+    report = Report(tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=regular_user.id,
+                    report_type="journals_report", report_date=date.today(), report_name="journals_report_stats.xlsx",
+                    report_data={}, status="pending")
+    db_session.add(report)
+    db_session.commit()
+
+    minio_reports_factory.run_and_save_report_task(
+        report.id, report.report_type, str(tmp_path / report.report_name), portfolio.id, raise_errors=True
+    )
+
+    assert uploads["reports/journals_report_stats.xlsx"][-4:] == [
+        ("5001", "IFRS9 Impairment - P&L charge", 120), ("1001", "IFRS9 Impairment - impact on loans", -120),
+        ("5001", "Top up for BOG Impairment - P&L charge", 80), ("3001", "Credit risk reserve", -80),
+    ]
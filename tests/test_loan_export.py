@@ -0,0 +1,65 @@
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from app.models import Loan, Report
+from app.utils import loan_export, minio_reports_factory
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def loans(db_session, tenant, portfolio):
+    common = dict(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_issue_date=date(2024, 7, 1),
+                  loan_amount=1000)
+    db_session.add_all([
+        Loan(loan_no="L1", employer="GES", ifrs9_stage="Stage 1", bog_stage="Current", final_ecl=10, **common),
+        Loan(loan_no="L2", employer="GHS", ifrs9_stage="Stage 2", bog_stage="OLEM", final_ecl=250, **common),
+        Loan(loan_no="L3", employer="GES", ifrs9_stage="Stage 3", bog_stage="Loss", final_ecl=900, **common),
+    ])
+    db_session.commit()
+
+
+def test_loan_export_writes_filtered_parquet(db_session, tenant, regular_user, portfolio, loans, monkeypatch, tmp_path):
+    monkeypatch.setattr(minio_reports_factory, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(minio_reports_factory, "ReadSessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(minio_reports_factory, "upload_file_to_minio", lambda path, name: f"http://minio/b/{name}")
+
+    report = Report(
+        tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=regular_user.id,
+        report_type=loan_export.LOAN_EXPORT_REPORT_TYPE,
+        report_date=date.today(), report_name="loan_export_test.parquet", status="pending",
+        report_data={"filters": {"columns": ["loan_no", "final_ecl", "loan_issue_date"],
+                                 "employer": ["GES"], "min_ecl": 50}},
+    )
+    db_session.add(report)
+    db_session.commit()
+
+    file_path = str(tmp_path / report.report_name)
+    minio_reports_factory.run_and_save_loan_export_task(report.id, file_path)
+
+    table = pq.read_table(file_path)
+    assert table.schema.names == ["loan_no", "final_ecl", "loan_issue_date"]
+    assert table.schema.field("final_ecl").type == pa.float64()
+    assert table.schema.field("loan_issue_date").type == pa.date32()
+    assert table.to_pydict() == {"loan_no": ["L3"], "final_ecl": [900.0], "loan_issue_date": [date(2024, 7, 1)]}
+
+    db_session.expire_all()
+    report = db_session.get(Report, report.id)
+    assert report.status == "success"
+    assert report.file_path == "http://minio/b/reports/loan_export_test.parquet"
+    assert (report.report_data["rows"], report.report_data["columns"]) == (1, table.schema.names)
+
+
+def test_arrow_ipc_chunks_stream_one_batch_at_a_time(db_session, tenant, portfolio, loans):
+    query, schema = loan_export.loan_export_query(portfolio.id, tenant.id, columns=["loan_no", "ifrs9_stage"])
+    chunks = list(loan_export.arrow_ipc_chunks(loan_export.iter_record_batches(db_session, query, schema, 2), schema))
+
+    # Schema, two batches of at most two rows, end-of-stream marker
+    assert len(chunks) == 4
+    table = pa.ipc.open_stream(b"".join(chunks)).read_all()
+    assert table.column("loan_no").to_pylist() == ["L1", "L2", "L3"]
+
+    with pytest.raises(ValueError, match="Unknown loan columns: password"):
+        loan_export.loan_export_query(portfolio.id, tenant.id, columns=["loan_no", "password"])
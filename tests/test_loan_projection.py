@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+
+from app.models import Loan
+from app.utils.loan_projection import loan_columns, loan_rows
+from app.utils.report_generators import generate_repayment_summary
+
+
+@pytest.fixture
+def loans(db_session, tenant, portfolio):
+    rows = [
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L1", employee_id="E1",
+             loan_amount=1000, loan_term=12, outstanding_loan_balance=400, total_due=100, total_paid=50, ndia=0),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L2", employee_id="E2",
+             loan_amount=2000, outstanding_loan_balance=800, total_due=300, total_paid=150, ndia=45,
+             accumulated_arrears=90),
+    ]
+    db_session.add_all(rows)
+    db_session.commit()
+    return rows
+
+
+def test_loan_columns_dedupes_bundles_and_rejects_unknown():
+    columns = [c.key for c in loan_columns("repayment", "ecl_inputs")]
+    assert columns[0] == "id"
+    assert len(columns) == len(set(columns))
+    assert "final_ecl" not in columns
+    with pytest.raises(ValueError):
+        loan_columns("everything")
+
+
+def test_loan_rows_select_only_bundles(db_session, portfolio, loans):
+    rows = loan_rows(db_session, portfolio.id, "identity").all()
+    assert [r.loan_no for r in rows] == ["L1", "L2"]
+    assert "loan_amount" not in rows[0]._fields
+
+
+def test_repayment_summary_reads_projected_rows(db_session, portfolio, loans):
+    summary = generate_repayment_summary(db_session, portfolio.id, date(2025, 1, 31))
+    assert summary["total_loans"] == 2
+    assert summary["total_paid"] == 200
+    assert summary["delinquent_loans"] == 1
+    assert summary["top_arrears_loans"][0]["loan_no"] == "L2"
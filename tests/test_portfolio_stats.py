@@ -0,0 +1,81 @@
+from app.models import Client, Loan, PortfolioStats, QualityIssue
+from app.utils.portfolio_stats import portfolio_stats_for, refresh_portfolio_stats
+
+
+def _seed(db_session, tenant, portfolio):
+    db_session.add_all([
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L1", employee_id="E1", loan_amount=1000,
+             ead=1000, outstanding_loan_balance=900, final_ecl=50, bog_provision=0, ifrs9_stage="Stage 1", paid=False),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L2", employee_id="E2", loan_amount=3000,
+             ead=3000, outstanding_loan_balance=2500, final_ecl=150, bog_provision=0, ifrs9_stage="Stage 2", paid=True),
+        Client(tenant_id=tenant.id, portfolio_id=portfolio.id, employee_id="E1", client_type="individuals"),
+        Client(tenant_id=tenant.id, portfolio_id=portfolio.id, employee_id="E2", client_type="individuals"),
+        QualityIssue(tenant_id=tenant.id, portfolio_id=portfolio.id, issue_type="missing_dob",
+                     description="Client has no date of birth", affected_records=[], severity="medium"),
+    ])
+    db_session.commit()
+
+
+def test_refresh_portfolio_stats_aggregates_loans_clients_and_issues(db_session, tenant, portfolio):
+    _seed(db_session, tenant, portfolio)
+
+    stats = refresh_portfolio_stats(portfolio.id, db_session)
+    db_session.commit()
+
+    assert stats.total_loans == 2
+    assert float(stats.total_loan_value) == 4000
+    assert float(stats.total_outstanding_balance) == 3400
+    assert float(stats.total_final_ecl) == 200
+    assert stats.ifrs9_stages["Stage 2"] == {"num_loans": 1, "total_exposure": 3000.0, "provision_amount": 150.0}
+    assert stats.client_types == {"individuals": 2}
+    assert stats.active_customers == 1
+    assert stats.has_quality_issues and stats.has_open_quality_issues
+
+    # Issue-only refreshes leave the loan aggregates alone
+    db_session.query(QualityIssue).update({"status": "approved"})
+    db_session.query(Loan).update({"final_ecl": 0})
+    stats = refresh_portfolio_stats(portfolio.id, db_session, issues_only=True)
+    assert not stats.has_open_quality_issues
+    assert float(stats.total_final_ecl) == 200
+
+
+def test_portfolio_stats_for_computes_missing_rows_without_saving(db_session, tenant, portfolio):
+    _seed(db_session, tenant, portfolio)
+
+    stats = portfolio_stats_for(db_session, [portfolio.id])[portfolio.id]
+
+    assert stats.total_loans == 2
+    assert db_session.query(PortfolioStats).count() == 0
+
+
+def test_endpoints_read_maintained_stats(client, db_session, tenant, portfolio):
+    _seed(db_session, tenant, portfolio)
+    refresh_portfolio_stats(portfolio.id, db_session)
+    db_session.commit()
+    # Loans added without a refresh are not picked up until the next one
+    db_session.add(Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L3", loan_amount=500, ead=500))
+    db_session.commit()
+
+    listing = client.get("/portfolios/").json()["items"][0]
+    assert listing["has_ingested_data"] is True
+    assert listing["has_calculated_ecl"] is True
+    assert listing["has_all_issues_approved"] is False
+
+    detail = client.get(f"/portfolios/{portfolio.id}").json()
+    assert detail["overview"]["total_loans"] == 2
+    assert detail["calculation_summary"]["ecl"]["Stage 1"]["provision_amount"] == 50
+
+    dashboard = client.get("/dashboard").json()
+    assert dashboard["portfolio_overview"]["total_loans"] == 2
+    assert dashboard["portfolios"][0]["total_loan_value"] == 3400
+
+
+def test_approving_issues_refreshes_flags(client, db_session, tenant, portfolio):
+    _seed(db_session, tenant, portfolio)
+    refresh_portfolio_stats(portfolio.id, db_session)
+    db_session.commit()
+
+    assert client.post(f"/portfolios/{portfolio.id}/approve-all-quality-issues").status_code == 200
+
+    db_session.expire_all()
+    assert db_session.get(PortfolioStats, portfolio.id).has_open_quality_issues is False
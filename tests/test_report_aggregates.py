@@ -0,0 +1,115 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app.models import Client, Guarantee, Loan, Security
+from app.utils import report_generators
+from tests.conftest import engine
+
+ANALYTICAL_REPORTS = [
+    report_generators.generate_collateral_summary,
+    report_generators.generate_guarantee_summary,
+    report_generators.generate_interest_rate_summary,
+    report_generators.generate_repayment_summary,
+    report_generators.generate_assumptions_summary,
+    report_generators.generate_amortised_loan_balances,
+    report_generators.generate_probability_default_report,
+    report_generators.generate_exposure_default_report,
+    report_generators.generate_loss_given_default_report,
+]
+
+
+@pytest.fixture
+def book(db_session, tenant, portfolio):
+    clients = [
+        Client(tenant_id=tenant.id, portfolio_id=portfolio.id, employee_id=f"E{n}", last_name=f"Client {n}")
+        for n in range(1, 4)
+    ]
+    db_session.add_all(clients)
+    db_session.flush()
+    db_session.add_all([
+        Security(tenant_id=tenant.id, client_id=clients[0].id, collateral_value=500, cash_or_non_cash="cash"),
+        Security(tenant_id=tenant.id, client_id=clients[0].id, collateral_value=300, cash_or_non_cash="non_cash"),
+        Security(tenant_id=tenant.id, client_id=clients[1].id, collateral_value=1200, cash_or_non_cash="non_cash"),
+        Guarantee(tenant_id=tenant.id, portfolio_id=portfolio.id, guarantor="G1", pledged_amount=400),
+        Guarantee(tenant_id=tenant.id, portfolio_id=portfolio.id, guarantor="G2", pledged_amount=100),
+    ])
+    common = dict(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_term=12, monthly_installment=100,
+                  loan_issue_date=date(2024, 7, 1), loan_type="Personal")
+    db_session.add_all([
+        Loan(loan_no="L1", employee_id="E1", client_id=clients[0].id, loan_amount=1000, outstanding_loan_balance=900, eir=Decimal("0.12"),
+             pd=Decimal("0.05"), lgd=1, ead=900, ndia=0, accumulated_arrears=0, paid=True, **common),
+        Loan(loan_no="L2", employee_id="E2", client_id=clients[1].id, loan_amount=2000, outstanding_loan_balance=500, eir=Decimal("0.32"),
+             pd=Decimal("0.60"), lgd=Decimal("0.50"), ead=550, ndia=45, accumulated_arrears=50, paid=False, **common),
+        Loan(loan_no="L3", employee_id="E3", client_id=clients[2].id, loan_amount=1000, outstanding_loan_balance=100, eir=Decimal("0.07"),
+             pd=Decimal("0.20"), lgd=1, ead=100, ndia=400, accumulated_arrears=200, paid=False, **common),
+    ])
+    db_session.commit()
+
+
+def test_analytical_reports_aggregate_in_sql(db_session, portfolio, book):
+    report_date = date(2025, 1, 31)
+
+    collateral = report_generators.generate_collateral_summary(db_session, portfolio.id, report_date)
+    assert collateral["total_securities"] == 3
+    assert collateral["total_security_value"] == 2000
+    assert collateral["security_types"] == {"cash": 1, "non_cash": 2}
+    assert [s["security_value"] for s in collateral["top_securities"]] == [1200, 500, 300]
+    assert (collateral["clients_with_collateral"], collateral["clients_without_collateral"]) == (2, 1)
+    assert collateral["collateral_coverage_ratio"] == Decimal("1.33")
+
+    guarantees = report_generators.generate_guarantee_summary(db_session, portfolio.id, report_date)
+    assert guarantees["total_guarantees"] == 2
+    assert guarantees["top_guarantors"][0]["guarantor"] == "G1"
+
+    rates = report_generators.generate_interest_rate_summary(db_session, portfolio.id, report_date)
+    assert (rates["min_eir"], rates["median_eir"], rates["max_eir"]) == (7, 12, 32)
+    assert rates["eir_distribution"]["5-10%"] == 1 and rates["eir_distribution"]["30%+"] == 1
+    assert rates["loan_type_avg_eirs"] == {"Personal": 17}
+    assert rates["top_eir_loans"][0]["loan_no"] == "L2"
+
+    repayments = report_generators.generate_repayment_summary(db_session, portfolio.id, report_date)
+    assert (repayments["paid_loans"], repayments["unpaid_loans"], repayments["delinquent_loans"]) == (1, 2, 2)
+    assert list(repayments["ndia_distribution"].values()) == [1, 0, 1, 0, 0, 1]
+
+    amortised = report_generators.generate_amortised_loan_balances(db_session, portfolio.id, report_date)
+    assert amortised["amortisation_distribution"] == {"0-20%": 1, "21-40%": 0, "41-60%": 0, "61-80%": 1, "81-100%": 1}
+    assert [loan["loan_no"] for loan in amortised["loan_status"]] == ["L3", "L2", "L1"]
+    assert amortised["loan_status"][0]["expected_end_date"] == "2025-06-26"
+
+    pds = report_generators.generate_probability_default_report(db_session, portfolio.id, report_date)
+    assert pds["median_pd"] == Decimal("0.2")
+    assert pds["pd_distribution"]["0-10%"] == 1 and pds["pd_distribution"]["51-75%"] == 1
+    assert pds["high_risk_loans"][0]["loan_no"] == "L2"
+
+    eads = report_generators.generate_exposure_default_report(db_session, portfolio.id, report_date)
+    assert eads["total_ead"] == 1550
+    assert eads["ead_distribution"]["100%"] == 2 and eads["ead_distribution"]["100%+"] == 1
+
+    lgds = report_generators.generate_loss_given_default_report(db_session, portfolio.id, report_date)
+    assert lgds["total_expected_loss"] == 1250
+    assert [(l["loan_no"], l["security_value"]) for l in lgds["highest_loss_loans"]] == [
+        ("L1", 800), ("L2", 1200), ("L3", 0)
+    ]
+
+
+def test_analytical_reports_run_a_fixed_number_of_queries(db_session, portfolio, book):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    counts = {}
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for generate in ANALYTICAL_REPORTS:
+            statements.clear()
+            generate(db_session, portfolio.id, date(2025, 1, 31))
+            counts[generate.__name__] = len(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # A handful of aggregate queries per report, none issued per loan or client
+    assert max(counts.values()) <= 6, counts
@@ -0,0 +1,111 @@
+from datetime import date, datetime, timezone
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.config import settings
+from app.models import Report
+from app.utils import minio_reports_factory
+from app.utils.loan_export import LOAN_EXPORT_REPORT_TYPE
+
+CONTENT = b"0123456789abcdefghij"
+ETAG = '"v2"'
+
+
+class FakeS3:
+    """Serves one object, applying Range and the If-Match/If-Unmodified-Since conditions like S3."""
+
+    meta = SimpleNamespace(endpoint_url="http://minio")
+
+    def __init__(self, key="reports/r.xlsx"):
+        self.key = key
+        self.requests = []
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfUnmodifiedSince=None):
+        self.requests.append({"Range": Range, "IfMatch": IfMatch, "IfUnmodifiedSince": IfUnmodifiedSince})
+        if Key != self.key:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        if IfMatch and IfMatch != ETAG:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+        response = {"ETag": ETAG, "LastModified": datetime(2025, 3, 1, tzinfo=timezone.utc)}
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            if int(start) >= len(CONTENT):
+                raise ClientError({"Error": {"Code": "InvalidRange"}}, "GetObject")
+            end = min(int(end or len(CONTENT) - 1), len(CONTENT) - 1)
+            body = CONTENT[int(start):end + 1]
+            response["ContentRange"] = f"bytes {start}-{end}/{len(CONTENT)}"
+        else:
+            body = CONTENT
+        return {**response, "ContentLength": len(body), "Body": BytesIO(body)}
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(CONTENT)}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        self.requests.append(Params)
+        return f"http://minio/{Params['Key']}?signed"
+
+
+def _read(download):
+    return b"".join(minio_reports_factory.iter_object_chunks(download["body"], chunk_size=4))
+
+
+def test_open_report_object_streams_ranges(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(minio_reports_factory, "s3_client", s3)
+
+    full = minio_reports_factory.open_report_object("reports/r.xlsx")
+    assert full["status"] == 200 and _read(full) == CONTENT
+    assert full["headers"]["Content-Length"] == "20" and full["headers"]["ETag"] == ETAG
+    assert full["headers"]["Last-Modified"] == "Sat, 01 Mar 2025 00:00:00 GMT"
+
+    partial = minio_reports_factory.open_report_object("reports/r.xlsx", "bytes=10-", ETAG)
+    assert partial["status"] == 206 and _read(partial) == b"abcdefghij"
+    assert partial["headers"]["Content-Range"] == "bytes 10-19/20"
+    assert s3.requests[-1] == {"Range": "bytes=10-", "IfMatch": ETAG, "IfUnmodifiedSince": None}
+
+    # Several ranges are not forwarded; the whole object is sent instead
+    assert minio_reports_factory.open_report_object("reports/r.xlsx", "bytes=0-1,5-6")["status"] == 200
+
+    unsatisfiable = minio_reports_factory.open_report_object("reports/r.xlsx", "bytes=50-")
+    assert unsatisfiable == {"status": 416, "headers": {"Content-Range": "bytes */20"}, "body": None}
+
+
+def test_open_report_object_sends_everything_when_if_range_is_stale(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(minio_reports_factory, "s3_client", s3)
+
+    changed = minio_reports_factory.open_report_object("reports/r.xlsx", "bytes=10-", '"v1"')
+    assert changed["status"] == 200 and _read(changed) == CONTENT
+
+    weak = minio_reports_factory.open_report_object("reports/r.xlsx", "bytes=10-", 'W/"v2"')
+    assert weak["status"] == 200
+    assert s3.requests[-1]["Range"] is None
+
+    with pytest.raises(FileNotFoundError):
+        minio_reports_factory.open_report_object("reports/missing.xlsx")
+
+
+def test_loan_export_downloads_as_parquet(client, db_session, tenant, portfolio, regular_user, monkeypatch):
+    report = Report(tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=regular_user.id,
+                    report_type=LOAN_EXPORT_REPORT_TYPE, report_date=date.today(),
+                    report_name="loan_export_test.parquet", report_data={}, status="success")
+    db_session.add(report)
+    db_session.commit()
+    s3 = FakeS3("reports/loan_export_test.parquet")
+    monkeypatch.setattr(minio_reports_factory, "s3_client", s3)
+    monkeypatch.setattr(minio_reports_factory, "public_s3_client", s3)
+    url = f"/reports/{portfolio.id}/report/{report.id}/download"
+
+    streamed = client.get(url)
+    assert streamed.status_code == 200 and streamed.content == CONTENT
+    assert streamed.headers["content-type"] == "application/vnd.apache.parquet"
+
+    # Redirected downloads get the same Content-Type from MinIO
+    monkeypatch.setattr(settings, "REPORT_DOWNLOAD_REDIRECT", True)
+    redirected = client.get(url, follow_redirects=False)
+    assert redirected.status_code == 307
+    assert s3.requests[-1]["ResponseContentType"] == "application/vnd.apache.parquet"
@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.config import settings
+from app.models import Report
+from app.utils import minio_reports_factory
+from app.utils.report_keys import report_content_key
+
+
+class FakeS3:
+    def __init__(self, rules=None):
+        self.rules = rules
+
+    def get_bucket_lifecycle_configuration(self, Bucket):
+        if self.rules is None:
+            raise ClientError({"Error": {"Code": "NoSuchLifecycleConfiguration"}}, "GetBucketLifecycleConfiguration")
+        return {"Rules": self.rules}
+
+    def put_bucket_lifecycle_configuration(self, Bucket, LifecycleConfiguration):
+        self.rules = LifecycleConfiguration["Rules"]
+
+    def delete_bucket_lifecycle(self, Bucket):
+        self.rules = None
+
+
+def test_report_retention_rule_keeps_other_rules(monkeypatch):
+    uploads_rule = {"ID": "uploads", "Status": "Enabled", "Filter": {"Prefix": "portfolio/"}, "Expiration": {"Days": 7}}
+    s3 = FakeS3([uploads_rule])
+    monkeypatch.setattr(minio_reports_factory, "s3_client", s3)
+
+    minio_reports_factory.apply_report_retention(30)
+    minio_reports_factory.apply_report_retention(60)
+    assert s3.rules == [uploads_rule, {"ID": "report-retention", "Status": "Enabled",
+                                       "Filter": {"Prefix": "reports/"}, "Expiration": {"Days": 60}}]
+
+    minio_reports_factory.apply_report_retention(0)
+    assert s3.rules == [uploads_rule]
+
+
+def test_reports_past_retention_give_up_their_key(client, db_session, tenant, portfolio, regular_user):
+    content_key = report_content_key(portfolio.id, "journals_report", date.today(), portfolio.report_version)
+    expired = Report(tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=regular_user.id,
+                     report_type="journals_report", report_date=date.today(), report_name="journals_report_old.xlsx",
+                     report_data={}, status="success", content_key=content_key,
+                     created_at=datetime.utcnow() - timedelta(days=settings.REPORT_RETENTION_DAYS))
+    db_session.add(expired)
+    db_session.commit()
+
+    response = client.post(f"/reports/{portfolio.id}/generate",
+                           json={"report_type": "journals_report", "report_date": str(date.today())})
+
+    assert response.json()["reused"] is False
+    db_session.expire_all()
+    assert db_session.get(Report, expired.id).content_key is None
+    assert db_session.get(Report, response.json()["report_id"]).content_key == content_key
+
+
+def test_only_overdue_builds_give_up_their_key(client, db_session, tenant, portfolio, regular_user):
+    overdue = datetime.utcnow() - timedelta(seconds=settings.REPORT_SLOT_TIMEOUT + 60)
+    running_key = report_content_key(portfolio.id, "journals_report", date.today(), portfolio.report_version)
+    queued_key = report_content_key(portfolio.id, "ecl_detailed_report", date.today(), portfolio.report_version)
+    running = Report(tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=regular_user.id,
+                     report_type="journals_report", report_date=date.today(), report_name="journals_report.xlsx",
+                     report_data={}, status="running", content_key=running_key,
+                     created_at=overdue, started_at=overdue)
+    # Waiting on a tenant slot past REPORT_SLOT_TIMEOUT but within REPORT_QUEUE_TIMEOUT
+    queued = Report(tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=regular_user.id,
+                    report_type="ecl_detailed_report", report_date=date.today(), report_name="ecl_detailed_report.xlsx",
+                    report_data={}, status="pending", content_key=queued_key, created_at=overdue)
+    db_session.add_all([running, queued])
+    db_session.commit()
+
+    rebuilt = client.post(f"/reports/{portfolio.id}/generate",
+                          json={"report_type": "journals_report", "report_date": str(date.today())})
+    reused = client.post(f"/reports/{portfolio.id}/generate",
+                         json={"report_type": "ecl_detailed_report", "report_date": str(date.today())})
+
+    assert rebuilt.json()["reused"] is False
+    assert reused.json()["reused"] is True
+    assert reused.json()["report_id"] == queued.id
+    db_session.expire_all()
+    assert db_session.get(Report, running.id).content_key is None
+    assert db_session.get(Report, queued.id).content_key == queued_key
@@ -0,0 +1,91 @@
+from datetime import date
+
+import openpyxl
+import pytest
+from sqlalchemy import event
+
+from app.models import Loan, Report
+from app.utils import minio_reports_factory
+from app.utils.report_pack import PACK_REPORT_TYPES
+from tests.conftest import TestingSessionLocal, engine
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    uploads = {}
+
+    def upload(file_path, object_name):
+        uploads[object_name] = list(openpyxl.load_workbook(file_path, read_only=True).active.iter_rows(values_only=True))
+        return f"http://minio/reports/{object_name}"
+
+    monkeypatch.setattr(minio_reports_factory, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(minio_reports_factory, "ReadSessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(minio_reports_factory, "upload_file_to_minio", upload)
+    return uploads
+
+
+@pytest.fixture
+def loans(db_session, tenant, portfolio):
+    portfolio.ecl_impairment_account = "5001"
+    portfolio.loan_assets = "1001"
+    portfolio.credit_risk_reserve = "3001"
+    db_session.add_all([
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L1", employee_id="E1", loan_amount=1000, ead=900,
+             final_ecl=10, ifrs9_stage="Stage 1", bog_stage="Current", bog_provision=9),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L2", employee_id="E2", loan_amount=2000, ead=1500,
+             final_ecl=300, ifrs9_stage="Stage 2", bog_stage="OLEM", bog_provision=75),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L3", employee_id="E3", loan_amount=500, ead=500,
+             final_ecl=5, ifrs9_stage="Stage 1", bog_stage="Current", bog_provision=5),
+    ])
+    db_session.commit()
+
+
+def _reports(db_session, tenant, portfolio, user, suffix):
+    reports = [
+        Report(tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=user.id, report_type=report_type,
+               report_date=date.today(), report_name=f"{report_type}_{suffix}.xlsx", report_data={}, status="pending")
+        for report_type in PACK_REPORT_TYPES
+    ]
+    db_session.add_all(reports)
+    db_session.commit()
+    return reports
+
+
+def _count_loan_scans():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM loans" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", record)
+
+
+def test_report_pack_matches_single_reports_with_one_scan(tmp_path, uploads, loans, db_session, tenant, portfolio,
+                                                           regular_user):
+    for report in _reports(db_session, tenant, portfolio, regular_user, "single"):
+        minio_reports_factory.run_and_save_report_task(
+            report.id, report.report_type, str(tmp_path / report.report_name), portfolio.id, raise_errors=True
+        )
+
+    pack = _reports(db_session, tenant, portfolio, regular_user, "pack")
+    scans, stop = _count_loan_scans()
+    try:
+        minio_reports_factory.run_and_save_report_pack_task([report.id for report in pack], portfolio.id, str(tmp_path))
+    finally:
+        stop()
+
+    assert len(scans) == 1
+    for report_type in PACK_REPORT_TYPES:
+        assert uploads[f"reports/{report_type}_pack.xlsx"] == uploads[f"reports/{report_type}_single.xlsx"]
+
+    journal = uploads["reports/journals_report_pack.xlsx"]
+    assert journal[-4:] == [("5001", "IFRS9 Impairment - P&L charge", 315), ("1001", "IFRS9 Impairment - impact on loans", -315),
+                            ("5001", "Top up for BOG Impairment - P&L charge", -226), ("3001", "Credit risk reserve", 226)]
+
+    db_session.expire_all()
+    for report in pack:
+        report = db_session.get(Report, report.id)
+        assert report.status == "success"
+        assert report.file_path.endswith(report.report_name)
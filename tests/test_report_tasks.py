@@ -0,0 +1,134 @@
+from datetime import date
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import OperationalError
+
+from app.models import Report
+from app.tasks import reports as report_tasks
+from app.utils.minio_reports_factory import ReportUploadError
+from tests.conftest import TestingSessionLocal
+
+
+class Retry(Exception):
+    pass
+
+
+@pytest.fixture
+def report(db_session, tenant, regular_user, portfolio):
+    report = Report(tenant_id=tenant.id, portfolio_id=portfolio.id, created_by=regular_user.id,
+                    report_type="ecl_detailed_report", report_date=date.today(),
+                    report_name="ecl_detailed_report_abc.xlsx", report_data={}, status="pending")
+    db_session.add(report)
+    db_session.commit()
+    return report
+
+
+@pytest.fixture
+def task(monkeypatch):
+    monkeypatch.setattr(report_tasks, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(report_tasks, "acquire_tenant_slot", lambda tenant_id, holder: True)
+    monkeypatch.setattr(report_tasks, "release_tenant_slot", lambda tenant_id, holder: None)
+    task = MagicMock(max_retries=3)
+    task.request.id = "task-1"
+    task.request.retries = 0
+    task.retry.side_effect = lambda exc, countdown: Retry()
+    return task
+
+
+def _status(db_session, report):
+    db_session.expire_all()
+    return db_session.get(Report, report.id).status
+
+
+def test_report_task_runs_the_build_and_skips_finished_reports(task, monkeypatch, db_session, tenant, report):
+    builds = []
+
+    def build(report_id, report_type, file_path, portfolio_id, raise_errors):
+        builds.append(file_path)
+        assert _status(db_session, report) == "running"
+        db_session.query(Report).filter(Report.id == report_id).update({"status": "success"})
+        db_session.commit()
+
+    monkeypatch.setattr(report_tasks, "run_and_save_report_task", build)
+
+    args = (report.id, "ecl_detailed_report", report.portfolio_id, tenant.id)
+    assert report_tasks.run_report_task(task, *args)["status"] == "success"
+    assert builds[0].endswith("ecl_detailed_report_abc.xlsx")
+
+    # A redelivered task does not build the report again
+    report_tasks.run_report_task(task, *args)
+    assert len(builds) == 1
+
+
+def test_report_task_retries_transient_errors_then_fails(task, monkeypatch, db_session, tenant, report):
+    def build(*args, **kwargs):
+        raise OperationalError("SELECT 1", {}, Exception("server closed the connection"))
+
+    monkeypatch.setattr(report_tasks, "run_and_save_report_task", build)
+    args = (report.id, "ecl_detailed_report", report.portfolio_id, tenant.id)
+
+    with pytest.raises(Retry):
+        report_tasks.run_report_task(task, *args)
+    assert _status(db_session, report) == "retrying"
+
+    task.request.retries = 3
+    with pytest.raises(OperationalError):
+        report_tasks.run_report_task(task, *args)
+    assert _status(db_session, report) == "failed"
+
+
+def test_report_task_only_retries_failed_uploads(task, monkeypatch, db_session, tenant, report):
+    errors = [ReportUploadError(), HTTPException(status_code=404, detail="No loans found")]
+
+    def build(*args, **kwargs):
+        raise errors.pop(0)
+
+    monkeypatch.setattr(report_tasks, "run_and_save_report_task", build)
+    args = (report.id, "ecl_detailed_report", report.portfolio_id, tenant.id)
+
+    with pytest.raises(Retry):
+        report_tasks.run_report_task(task, *args)
+    assert _status(db_session, report) == "retrying"
+
+    with pytest.raises(HTTPException):
+        report_tasks.run_report_task(task, *args)
+    assert task.retry.call_count == 1
+    assert _status(db_session, report) == "failed"
+
+
+def test_report_task_waits_for_a_tenant_slot(task, monkeypatch, db_session, tenant, report):
+    build = MagicMock()
+    requeue = MagicMock()
+    monkeypatch.setattr(report_tasks, "run_and_save_report_task", build)
+    monkeypatch.setattr(report_tasks, "acquire_tenant_slot", lambda tenant_id, holder: False)
+    monkeypatch.setattr(report_tasks.run_report_task, "apply_async", requeue, raising=False)
+
+    result = report_tasks.run_report_task(task, report.id, "ecl_detailed_report", report.portfolio_id, tenant.id)
+
+    assert result["status"] == "pending"
+    build.assert_not_called()
+    assert requeue.call_args.kwargs["queue"] == "reports"
+    assert _status(db_session, report) == "pending"
+
+
+def test_report_pack_task_builds_only_unfinished_reports(task, monkeypatch, db_session, tenant, report, regular_user):
+    journals = Report(tenant_id=tenant.id, portfolio_id=report.portfolio_id, created_by=regular_user.id,
+                      report_type="journals_report", report_date=date.today(), report_name="journals_report_abc.xlsx",
+                      report_data={}, status="success")
+    db_session.add(journals)
+    db_session.commit()
+    builds = []
+
+    def build(report_ids, portfolio_id, directory):
+        builds.append(report_ids)
+        assert _status(db_session, report) == "running"
+
+    monkeypatch.setattr(report_tasks, "run_and_save_report_pack_task", build)
+
+    result = report_tasks.run_report_pack_task(task, [report.id, journals.id], report.portfolio_id, tenant.id)
+
+    assert result["status"] == "success"
+    assert builds == [[report.id]]
+    assert _status(db_session, journals) == "success"
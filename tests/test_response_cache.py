@@ -0,0 +1,124 @@
+import pytest
+import redis
+
+from app.auth.utils import get_current_active_user
+from app.config import settings
+from app.routes import dashboard
+from app.utils import response_cache
+from app.utils.portfolio_stats import refresh_portfolio_stats
+from main import app
+
+
+class FakeRedis:
+    """The handful of Redis commands the response cache uses, kept in a dict."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key.decode() if isinstance(key, bytes) else key, None)
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member.encode())
+
+    def smembers(self, key):
+        return self.data.get(key, set())
+
+    def expire(self, key, ttl):
+        pass
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        pass
+
+
+class BrokenRedis(FakeRedis):
+    def get(self, key):
+        raise redis.ConnectionError("connection refused")
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "_client", fake)
+    monkeypatch.setattr(response_cache, "_unavailable_until", 0.0)
+    return fake
+
+
+def _count_dashboard_builds(monkeypatch):
+    calls = []
+
+    def counting(db, portfolio_ids):
+        calls.append(list(portfolio_ids))
+        return original(db, portfolio_ids)
+
+    original = dashboard.portfolio_stats_for
+    monkeypatch.setattr(dashboard, "portfolio_stats_for", counting)
+    return calls
+
+
+def test_dashboard_is_built_once_per_tenant_and_data_version(client, cache, monkeypatch, db_session, portfolio,
+                                                              admin_user):
+    builds = _count_dashboard_builds(monkeypatch)
+
+    first = client.get("/dashboard")
+    assert first.status_code == 200
+    assert first.json()["name"] == "Test"
+
+    # Another user of the tenant gets the cached body with their own name
+    app.dependency_overrides[get_current_active_user] = lambda: admin_user
+    second = client.get("/dashboard")
+    assert second.json()["name"] == "Admin"
+    assert second.json()["portfolios"] == first.json()["portfolios"]
+    assert len(builds) == 1
+
+    # A write bumps the data_version, so the next load misses
+    refresh_portfolio_stats(portfolio.id, db_session)
+    db_session.commit()
+    client.get("/dashboard")
+    assert len(builds) == 2
+
+
+def test_cached_routes_keep_404s_and_etags(client, cache, portfolio):
+    assert client.get("/portfolios/999999").status_code == 404
+    assert client.get("/reports/999999/history").status_code == 404
+
+    path = f"/portfolios/{portfolio.id}/quality-issues"
+    first = client.get(path)
+    cached = client.get(path)
+    assert cached.json() == first.json()
+    assert cached.headers["etag"] == first.headers["etag"]
+    assert client.get(path, headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+
+def test_invalidate_portfolio_drops_its_entries(client, cache, portfolio):
+    assert client.get(f"/portfolios/{portfolio.id}").status_code == 200
+    assert client.get(f"/reports/{portfolio.id}/history").status_code == 200
+    entries = [key for key in cache.data if key.startswith("rc:") and not key.startswith("rc:index:")]
+    assert len(entries) == 2
+
+    response_cache.invalidate_portfolio(portfolio.id)
+
+    assert not any(key.startswith("rc:") for key in cache.data)
+
+
+def test_redis_errors_bypass_the_cache(client, monkeypatch, portfolio):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "_client", BrokenRedis())
+    monkeypatch.setattr(response_cache, "_unavailable_until", 0.0)
+
+    assert client.get(f"/portfolios/{portfolio.id}").status_code == 200
+    assert response_cache.get_cache_client() is None
@@ -0,0 +1,49 @@
+import anyio
+import pyarrow as pa
+
+from app.utils.stream_ingestion import _loan_copy_lines, iter_arrow_records
+
+
+def test_arrow_records_are_read_while_the_body_arrives():
+    sink = pa.BufferOutputStream()
+    schema = pa.schema([("loan_no", pa.string()), ("loan_amount", pa.int64())])
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for start in range(0, 300, 100):
+            writer.write_batch(pa.record_batch([[f"L{n}" for n in range(start, start + 100)],
+                                                list(range(start, start + 100))], schema=schema))
+    body = sink.getvalue().to_pybytes()
+    chunks = [body[offset:offset + 256] for offset in range(0, len(body), 256)]
+    sent = []
+
+    async def receive():
+        for chunk in chunks:
+            sent.append(chunk)
+            yield chunk
+
+    async def main():
+        records, received_at_first = [], None
+        async for record, error in iter_arrow_records(receive()):
+            assert error is None
+            if received_at_first is None:
+                received_at_first = len(sent)
+            records.append(record)
+        return records, received_at_first
+
+    records, received_at_first = anyio.run(main)
+
+    assert received_at_first < len(chunks)
+    assert len(records) == 300
+    assert records[-1] == {"loan_no": "L299", "loan_amount": 299}
+
+
+def test_derived_loan_columns_need_all_their_inputs_in_the_batch():
+    delta = [{"loan_no": "L1", "outstanding_loan_balance": "900"}]
+    columns, _ = _loan_copy_lines(delta, portfolio_id=1, tenant_id=1, sub_id=1)
+    assert "outstanding_loan_balance" in columns
+    assert "ndia" not in columns and "balance_difference" not in columns
+
+    full = [{"loan_no": "L1", "monthly_installment": "100", "accumulated_arrears": "200",
+             "outstanding_loan_balance": "900", "theoretical_balance": "600"}]
+    columns, lines = _loan_copy_lines(full, portfolio_id=1, tenant_id=1, sub_id=1)
+    row = dict(zip(columns, lines[0].split("\t")))
+    assert (float(row["ndia"]), float(row["balance_difference"])) == (60.0, 100.0)
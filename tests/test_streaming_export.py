@@ -0,0 +1,52 @@
+import csv
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+import openpyxl
+
+from app.utils.streaming_export import csv_chunks, xlsx_chunks
+
+
+def test_xlsx_chunks_stream_a_workbook_row_by_row():
+    def issues():
+        for n in range(1, 5001):
+            yield [n, f"Issue <{n}> & more", Decimal("1.50"), n % 2 == 0, datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc)]
+
+    sheets = [
+        ("Issues", ["ID", "Description", "Amount", "Open", "Created"], issues()),
+        ("Affected Records", None, iter([{"customer_id": "123", "count": 2}, {"customer_id": "456", "count": None}])),
+        ("Nothing", None, iter([])),
+        ("Dates", ["Day"], iter([[date(2024, 2, 29)], [None]])),
+    ]
+    chunks = list(xlsx_chunks(sheets, chunk_bytes=4096))
+
+    # Worksheet bytes leave while rows are still being written
+    assert len(chunks) > 3
+    workbook = openpyxl.load_workbook(BytesIO(b"".join(chunks)))
+    assert workbook.sheetnames == ["Issues", "Affected Records", "Dates"]
+
+    issues_sheet = list(workbook["Issues"].iter_rows(values_only=True))
+    assert len(issues_sheet) == 5001
+    assert issues_sheet[0] == ("ID", "Description", "Amount", "Open", "Created")
+    assert issues_sheet[2] == (2, "Issue <2> & more", 1.5, True, datetime(2025, 3, 1, 12, 30))
+
+    assert list(workbook["Affected Records"].iter_rows(values_only=True)) == [
+        ("customer_id", "count"), ("123", 2), ("456", None)
+    ]
+    assert workbook["Dates"]["A2"].value == datetime(2024, 2, 29)
+
+
+def test_xlsx_chunks_always_write_a_sheet():
+    workbook = openpyxl.load_workbook(BytesIO(b"".join(xlsx_chunks([("Empty", None, iter([]))]))))
+    assert workbook.sheetnames == ["Sheet1"]
+
+
+def test_csv_chunks_send_the_header_first():
+    rows = ([n, f"user{n}@example.com"] for n in range(1000))
+    chunks = list(csv_chunks(["ID", "Email"], rows, chunk_bytes=1024))
+
+    assert chunks[0] == b"ID,Email\r\n"
+    assert len(chunks) > 2
+    parsed = list(csv.reader(StringIO(b"".join(chunks).decode("utf-8"))))
+    assert len(parsed) == 1001 and parsed[-1] == ["999", "user999@example.com"]
@@ -0,0 +1,94 @@
+from datetime import date
+
+import openpyxl
+
+from app.models import Client, Loan
+from app.utils import report_generators
+from app.utils.xlsx_reports import (
+    detailed_report_headers,
+    detailed_report_query,
+    open_report_workbook,
+    write_detailed_rows,
+)
+
+
+def test_detailed_rows_stream_into_constant_memory_workbook(tmp_path, db_session, tenant, portfolio):
+    client = Client(tenant_id=tenant.id, portfolio_id=portfolio.id, employee_id="E2", client_type="individuals",
+                    last_name="Mensah", other_names="Ama")
+    db_session.add(client)
+    db_session.flush()
+    db_session.add_all([
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L1", employee_id="E1", employee_name="Kofi Boateng",
+             loan_amount=1000, loan_issue_date=date(2024, 1, 31), ead=900, final_ecl=12.5, ifrs9_stage="Stage 1"),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L2", employee_id="E2", client_id=client.id,
+             loan_amount=2000, ifrs9_stage="Stage 2"),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L3", employee_id="E3", loan_amount=500),
+    ])
+    db_session.commit()
+
+    path = tmp_path / "ecl.xlsx"
+    workbook = open_report_workbook(str(path))
+    worksheet = workbook.add_worksheet("ecl_detailed_report")
+    worksheet.write_row(0, 0, detailed_report_headers("ecl_detailed_report"))
+    next_row = write_detailed_rows(worksheet, db_session, "ecl_detailed_report", portfolio.id, 1, batch_size=2)
+    workbook.close()
+
+    assert next_row == 4
+    rows = list(openpyxl.load_workbook(path, read_only=True).active.iter_rows(values_only=True))
+    headers = rows[0]
+    first, second, third = (dict(zip(headers, row)) for row in rows[1:])
+    assert first["Loan Issue Date"] == "2024-01-31"
+    assert first["Employee Name"] == "Kofi Boateng"
+    assert first["ECL"] == 12.5
+    # Name falls back to the linked client, then to "Unknown"; missing amounts are 0
+    assert second["Employee Name"] == "Mensah Ama"
+    assert second["EAD"] == 0
+    assert third["Employee Name"] == "Unknown"
+
+
+def test_detailed_report_query_selects_only_report_columns():
+    for report_type in ("ecl_detailed_report", "BOG_impairment_detailed_report"):
+        query = detailed_report_query(report_type, 1)
+        assert len(query.selected_columns) == len(detailed_report_headers(report_type))
+
+
+def test_detailed_generators_upload_the_workbook_instead_of_embedding_it(tmp_path, monkeypatch, db_session, tenant,
+                                                                          portfolio):
+    db_session.add_all([
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L1", employee_id="E1", employee_name="Kofi Boateng",
+             loan_amount=1000, outstanding_loan_balance=800, ead=800, lgd=50, final_ecl=20, ifrs9_stage="Stage 1"),
+        Loan(tenant_id=tenant.id, portfolio_id=portfolio.id, loan_no="L2", employee_id="E2", loan_amount=2000,
+             outstanding_loan_balance=1500, ead=1500, lgd=10, final_ecl=30),
+    ])
+    db_session.commit()
+
+    uploads = {}
+
+    def upload(file_path, object_name):
+        uploads[object_name] = openpyxl.load_workbook(file_path).active
+        return f"http://minio/reports/{object_name}"
+
+    monkeypatch.setattr(report_generators, "upload_file_to_minio", upload)
+
+    ecl = report_generators.generate_ecl_detailed_report(db_session, portfolio.id, date(2024, 12, 31), portfolio)
+    local = report_generators.generate_local_impairment_details_report(db_session, portfolio.id, date(2024, 12, 31))
+
+    for report_data in (ecl, local):
+        assert "file" not in report_data
+        assert report_data["file_url"].endswith(report_data["object_name"])
+        assert report_data["object_name"].startswith(f"reports/{portfolio.id}/")
+
+    ecl_sheet = uploads[ecl["object_name"]]
+    assert ecl["total_ecl"] == ecl_sheet["B12"].value == 50
+    assert [cell.value for cell in ecl_sheet[15]][:3] == [db_session.query(Loan.id).filter_by(loan_no="L1").scalar(),
+                                                          "E1", "Kofi Boateng"]
+    # LGD is lgd * ead shown as a percentage
+    assert ecl_sheet["J15"].value == 400
+    assert ecl_sheet["J15"].number_format == "0.00%"
+    assert ecl_sheet["H16"].value == "Unknown"
+
+    local_sheet = uploads[local["object_name"]]
+    # Without staging results every loan is "Current" at the default 1% rate
+    assert local["total_loan_count"] == 2
+    assert local["total_provision"] == local_sheet["B12"].value == 23
+    assert [cell.value for cell in local_sheet[16]][7:10] == ["Current", 0.01, 15]